@@ -1,3 +1,5 @@
+__version__ = '0.1'
+
 import erdos.data_stream
 import erdos.data_streams
 import erdos.graph
@@ -0,0 +1,220 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+import time
+
+# Label setting the number of messages a receiver may have in flight on a
+# stream. 0 disables flow control.
+CREDITS_LABEL = 'credits'
+# Label setting what a sender does when a receiver has no credits left.
+BACKPRESSURE_LABEL = 'backpressure'
+
+# The sender waits until the receiver grants a credit.
+BLOCK = 'block'
+# The message is dropped.
+DROP = 'drop'
+# The sender keeps the latest message that found no credit. The message is
+# superseded by the next message that gets a credit, or is sent before the
+# next watermark.
+COALESCE = 'coalesce'
+POLICIES = (BLOCK, DROP, COALESCE)
+
+
+class CreditGate(object):
+    """Credits a receiver grants to a sender on a stream.
+
+    Sending a data message to the receiver consumes a credit, which the
+    receiver returns once it has run the callbacks for the message.
+    Watermarks do not consume credits, and are never dropped, because
+    they unblock completion callbacks downstream.
+
+    Attributes:
+        credits (int): Maximum number of messages in flight.
+        policy (str): What the sender does once the credits run out. Either
+            block, drop, or coalesce.
+        num_in_flight (int): Number of messages queued at the receiver, or
+            being processed by it.
+        max_in_flight (int): Highest number of messages in flight seen.
+        num_dropped (int): Number of messages dropped.
+        num_coalesced (int): Number of messages replaced by a later message
+            before they were sent.
+        blocked_time (float): Seconds the sender waited for credits.
+    """
+
+    def __init__(self, credits, policy=BLOCK):
+        assert credits > 0, 'Streams must grant at least one credit'
+        if policy not in POLICIES:
+            raise ValueError(
+                'Unexpected backpressure policy {}'.format(policy))
+        self.credits = credits
+        self.policy = policy
+        self.num_in_flight = 0
+        self.max_in_flight = 0
+        self.num_dropped = 0
+        self.num_coalesced = 0
+        self.blocked_time = 0
+        self._pending = None
+        self._cond = threading.Condition()
+
+    def acquire(self, msg):
+        """Consumes a credit to send msg.
+
+        Returns:
+            (bool): True if the message can be sent. Otherwise, the message
+            was dropped or coalesced, or, with the block policy, the sender
+            must wait for a credit and retry.
+        """
+        with self._cond:
+            if self.num_in_flight < self.credits:
+                if self._pending is not None:
+                    # msg supersedes the coalesced message.
+                    self._pending = None
+                    self.num_coalesced += 1
+                self._add_in_flight()
+                return True
+            if self.policy == DROP:
+                self.num_dropped += 1
+            elif self.policy == COALESCE:
+                if self._pending is not None:
+                    self.num_coalesced += 1
+                self._pending = msg
+            return False
+
+    def try_acquire(self):
+        """Consumes a credit if one is available, whatever the policy (e.g.,
+        for batches, which carry watermarks and are thus never dropped).
+
+        Returns:
+            (bool): True if a credit was consumed.
+        """
+        with self._cond:
+            if self.num_in_flight < self.credits:
+                self._add_in_flight()
+                return True
+            return False
+
+    def has_credit(self):
+        """Returns whether a message can be sent without waiting."""
+        with self._cond:
+            return self.num_in_flight < self.credits
+
+    def force_acquire(self):
+        """Consumes a credit even if none is available. Only senders that
+        must not block (e.g., local runtime workers) use it."""
+        with self._cond:
+            self._add_in_flight()
+
+    def take_pending(self):
+        """Returns the coalesced message, if any, which the sender must send
+        before its next watermark. The message consumes a credit."""
+        with self._cond:
+            msg = self._pending
+            if msg is not None:
+                self._pending = None
+                self._add_in_flight()
+            return msg
+
+    def release(self, num_credits=1):
+        """Returns credits once the receiver has processed messages."""
+        with self._cond:
+            self.num_in_flight -= num_credits
+            self._cond.notify_all()
+
+    def wait(self, timeout=None):
+        """Blocks until a credit is available.
+
+        Returns:
+            (bool): False if the timeout expired.
+        """
+        start_time = time.time()
+        with self._cond:
+            while self.num_in_flight >= self.credits:
+                if not self._cond.wait(timeout) and timeout is not None:
+                    break
+            self.blocked_time += time.time() - start_time
+            return self.num_in_flight < self.credits
+
+    def record_blocked_time(self, duration):
+        """Records time a sender waited for credits by other means than
+        `wait` (e.g., by waiting for the receiver's calls to complete)."""
+        with self._cond:
+            self.blocked_time += duration
+
+    def get_stats(self):
+        """Returns the queue depth and backpressure counters."""
+        with self._cond:
+            return {
+                'credits': self.credits,
+                'in_flight': self.num_in_flight,
+                'max_in_flight': self.max_in_flight,
+                'dropped': self.num_dropped,
+                'coalesced': self.num_coalesced,
+                'blocked_time': self.blocked_time,
+            }
+
+    def _add_in_flight(self):
+        self.num_in_flight += 1
+        if self.num_in_flight > self.max_in_flight:
+            self.max_in_flight = self.num_in_flight
+
+
+class DeferredCredit(object):
+    """Tracks the credit of a call whose messages the receiver processes
+    after the call returns (e.g., messages queued by an input queue, or
+    callbacks run by a parallel runner).
+
+    The receiver holds the credit once per message it defers, and marks
+    each deferred message done once its callbacks ran, or once it was
+    discarded. If the call returns while messages are deferred, on_release
+    is called once the last of them is done.
+
+    Args:
+        on_release (function): Returns the credit to the sender.
+    """
+
+    def __init__(self, on_release):
+        self._on_release = on_release
+        # The call itself holds the credit until it returns.
+        self._num_pending = 1
+        self._lock = threading.Lock()
+
+    def hold(self):
+        """Defers the release of the credit until a matching `done`."""
+        with self._lock:
+            self._num_pending += 1
+
+    def done(self):
+        """Marks a deferred message done."""
+        with self._lock:
+            self._num_pending -= 1
+            released = self._num_pending == 0
+        if released:
+            self._on_release()
+
+    def end_call(self):
+        """Marks the end of the call.
+
+        Returns:
+            (bool): True if the call's messages were all processed, in which
+            case the sender releases the credit once the call completes.
+            Otherwise, on_release is called later.
+        """
+        with self._lock:
+            self._num_pending -= 1
+            return self._num_pending == 0
+
+
+def create_credit_gates(labels, num_receivers):
+    """Creates a gate per receiver if the stream labels enable credits.
+
+    Returns:
+        (list of CreditGate): The gates, or None if flow control is
+        disabled on the stream.
+    """
+    credits = int(labels.get(CREDITS_LABEL, '0'))
+    if credits <= 0:
+        return None
+    policy = labels.get(BACKPRESSURE_LABEL, BLOCK)
+    return [CreditGate(credits, policy) for _ in range(num_receivers)]
@@ -0,0 +1,603 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from erdos.event_log import MAX_COORDS, EventLogReader
+from erdos.tracing import get_trace_parts
+
+# Events of data messages recorded by the executors.
+SEND = 0
+RECEIVE = 1
+DEQUEUE = 2
+CALLBACK = 3
+_CATEGORIES = {
+    'send': SEND,
+    'receive': RECEIVE,
+    'dequeue': DEQUEUE,
+    'callback': CALLBACK
+}
+
+PERCENTILES = (50, 99)
+COMPONENTS = ('transfer', 'queueing', 'processing', 'wait')
+
+
+class TraceEvents(object):
+    """Columns of the data message events of a trace.
+
+    Args:
+        events (iterable of dict): Chrome trace events, which are consumed
+            one at a time.
+
+    Attributes:
+        op_names (list of str): Operator names, indexed by op id.
+        stream_uids (list of str): Stream uids, indexed by stream id.
+        stream_names (list of str): Stream names, indexed by stream id.
+        num_timestamps (int): Number of distinct timestamps.
+        op (numpy.ndarray): Op id of each event.
+        category (numpy.ndarray): SEND, RECEIVE, DEQUEUE or CALLBACK.
+        stream (numpy.ndarray): Stream id of each event.
+        timestamp (numpy.ndarray): Timestamp id of each event.
+        start (numpy.ndarray): Start of each event, in microseconds since
+            the first event.
+        end (numpy.ndarray): End of each event. Instants end when they start.
+    """
+
+    def __init__(self, events):
+        if np is None:
+            raise ImportError('numpy is required to analyze traces')
+        # Processes may be named after their first events, so events refer
+        # to processes until all the events are read.
+        process_names = {}
+        pid_ids = {}
+        pids = []
+        stream_ids = {}
+        stream_uids = []
+        stream_names = []
+        timestamp_ids = {}
+        columns = (array('q'), array('b'), array('q'), array('q'), array('d'),
+                   array('d'))
+        for event in events:
+            if event.get('ph') == 'M':
+                process_names[event['pid']] = event['args']['name']
+                continue
+            category = _CATEGORIES.get(event.get('cat'))
+            if category is None:
+                continue
+            pid_id = pid_ids.get(event['pid'])
+            if pid_id is None:
+                pid_id = pid_ids[event['pid']] = len(pids)
+                pids.append(event['pid'])
+            stream_uid = event['args']['stream_uid']
+            stream_id = stream_ids.get(stream_uid)
+            if stream_id is None:
+                stream_id = stream_ids[stream_uid] = len(stream_uids)
+                stream_uids.append(stream_uid)
+                stream_names.append(event['name'][len(event['cat']) + 1:])
+            coordinates = tuple(event['args']['timestamp'])
+            timestamp_id = timestamp_ids.get(coordinates)
+            if timestamp_id is None:
+                timestamp_id = timestamp_ids[coordinates] = len(timestamp_ids)
+            columns[0].append(pid_id)
+            columns[1].append(category)
+            columns[2].append(stream_id)
+            columns[3].append(timestamp_id)
+            columns[4].append(event['ts'])
+            columns[5].append(event.get('dur', 0))
+        # Processes with the same name (e.g., restarted operators) are the
+        # same operator.
+        op_ids = {}
+        op_names = []
+        pid_op_ids = [
+            _get_id(op_ids, op_names, process_names.get(pid, str(pid)))
+            for pid in pids
+        ]
+        pid_ops = np.array(pid_op_ids, dtype=np.int64)
+        self._set_columns(op_names, stream_uids, stream_names,
+                          len(timestamp_ids),
+                          pid_ops[np.frombuffer(columns[0], dtype=np.int64)],
+                          np.frombuffer(columns[1], dtype=np.int8),
+                          np.frombuffer(columns[2], dtype=np.int64),
+                          np.frombuffer(columns[3], dtype=np.int64),
+                          np.frombuffer(columns[4], dtype=np.float64),
+                          np.frombuffer(columns[5], dtype=np.float64))
+
+    @classmethod
+    def from_event_logs(cls, prefixes):
+        """Reads the data message events of the `EventLog`s of operators
+        (e.g., of `LoggingOp`s, whose prefixes are their names) into numpy
+        arrays, without building a Python object per record.
+
+        Event logs record when messages are sent, and when their receivers
+        dequeue them, but not when they arrive or how long callbacks take.
+        The transfer time of a hop thus includes its queueing time, and a
+        callback is taken to last until its operator next sends a message
+        with the same timestamp (or to end at once if it sends none).
+        Streams are identified by their names, and messages without
+        timestamps are ignored.
+
+        Args:
+            prefixes (list of str): Path prefixes of the logs.
+        """
+        if np is None:
+            raise ImportError('numpy is required to analyze traces')
+        op_ids = {}
+        op_names = []
+        stream_ids = {}
+        stream_names = []
+        columns = ([], [], [], [], [])
+        for prefix in prefixes:
+            reader = EventLogReader(prefix)
+            records = reader.to_numpy()
+            op_lookup = np.array(
+                [_get_id(op_ids, op_names, name) for name in reader.op_names],
+                dtype=np.int64)
+            category_lookup = np.full(len(reader.event_names), -1, np.int8)
+            stream_lookup = np.full(len(reader.event_names), -1, np.int64)
+            for (event_id, name) in enumerate(reader.event_names):
+                (category, stream_name) = _parse_event_name(name)
+                if category is not None:
+                    category_lookup[event_id] = category
+                    stream_lookup[event_id] = _get_id(stream_ids, stream_names,
+                                                      stream_name)
+            event_ids = records['event_id']
+            records = records[(category_lookup[event_ids] >= 0)
+                              & (records['num_coords'] > 0)]
+            event_ids = records['event_id']
+            columns[0].append(op_lookup[records['op_id']])
+            columns[1].append(category_lookup[event_ids])
+            columns[2].append(stream_lookup[event_ids])
+            # Timestamps are identified by their number of coordinates and
+            # their stored coordinates.
+            columns[3].append(
+                np.column_stack((records['num_coords'].astype(np.int64),
+                                 records['coords'])))
+            columns[4].append(records['processing_time'] * 1e6)
+        if columns[0]:
+            (op, category, stream, coordinates,
+             start) = [np.concatenate(column) for column in columns]
+        else:
+            (op, category, stream, start) = (np.zeros(0, np.int64),
+                                             np.zeros(0, np.int8),
+                                             np.zeros(0,
+                                                      np.int64), np.zeros(0))
+            coordinates = np.zeros((0, MAX_COORDS + 1), np.int64)
+        (num_timestamps, timestamp) = _group_rows(coordinates)
+        # Receivers dequeue messages right before they run the callbacks.
+        receives = np.nonzero(category == RECEIVE)[0]
+        num_receives = len(receives)
+        duration = _time_until_send(timestamp * max(len(op_names), 1) + op,
+                                    category, start)[receives]
+        events = cls.__new__(cls)
+        events._set_columns(
+            op_names, stream_names, stream_names, num_timestamps,
+            np.concatenate((op, op[receives], op[receives])),
+            np.concatenate((category, np.full(num_receives, DEQUEUE, np.int8),
+                            np.full(num_receives, CALLBACK, np.int8))),
+            np.concatenate((stream, stream[receives], stream[receives])),
+            np.concatenate(
+                (timestamp, timestamp[receives], timestamp[receives])),
+            np.concatenate((start, start[receives], start[receives])),
+            np.concatenate((np.zeros(len(op) + num_receives), duration)))
+        return events
+
+    def _set_columns(self, op_names, stream_uids, stream_names, num_timestamps,
+                     op, category, stream, timestamp, start, duration):
+        self.op_names = op_names
+        self.stream_uids = stream_uids
+        self.stream_names = stream_names
+        self.num_timestamps = num_timestamps
+        self.op = op
+        self.category = category
+        self.stream = stream
+        self.timestamp = timestamp
+        start = start.astype(np.float64)
+        if len(start) > 0:
+            start -= start.min()
+        self.start = start
+        self.end = start + duration
+
+
+def load_trace(trace_file):
+    """Loads the events of a merged trace, or of the per-process files of a
+    trace that was not merged (e.g., of a Ray graph).
+
+    Returns:
+        (TraceEvents): The events.
+    """
+    if os.path.exists(trace_file):
+        with open(trace_file) as f:
+            events = json.load(f)
+        if isinstance(events, dict):
+            events = events['traceEvents']
+    else:
+        # The files hold an event per line, which are parsed one at a time.
+        events = _read_trace_parts(trace_file)
+    return TraceEvents(events)
+
+
+def _read_trace_parts(trace_file):
+    for path in get_trace_parts(trace_file):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class Hops(object):
+    """The deliveries of sampled messages from one operator to another.
+
+    A hop starts when the sender starts sending the message, and ends once
+    the receiver's callback for the message returns. Its transfer time
+    spans serialization and transport until the receiver's executor gets
+    the message, its queueing time spans the time the message waits in the
+    receiver's queue, and its processing time is the callback's duration.
+
+    Attributes:
+        timestamp, stream, sender, receiver (numpy.ndarray): Ids of the
+            message's timestamp and stream, and of the operators.
+        send_start, receive, dequeue, callback_start, callback_end
+            (numpy.ndarray): Times of the events of the hop, in
+            microseconds.
+    """
+
+    def __init__(self, events):
+        num_streams = max(len(events.stream_uids), 1)
+        num_ops = max(len(events.op_names), 1)
+        self.num_ops = num_ops
+        # Messages are keyed by (timestamp, stream), and deliveries by
+        # (timestamp, stream, receiver).
+        message_keys = events.timestamp * num_streams + events.stream
+        delivery_keys = message_keys * num_ops + events.op
+
+        (send_keys, sends) = _first_by_key(events, SEND, message_keys)
+        (receive_keys, receives) = _first_by_key(events, RECEIVE,
+                                                 delivery_keys)
+        (dequeue_keys, dequeues) = _first_by_key(events, DEQUEUE,
+                                                 delivery_keys)
+        (callback_keys, callbacks) = _first_by_key(events, CALLBACK,
+                                                   delivery_keys)
+        # Hops are only complete if every event of the message was
+        # recorded (e.g., messages discarded by input queues are never
+        # dequeued).
+        (dequeue_found, dequeue_pos) = _lookup(dequeue_keys, receive_keys)
+        (callback_found, callback_pos) = _lookup(callback_keys, receive_keys)
+        (send_found, send_pos) = _lookup(send_keys, receive_keys // num_ops)
+        found = dequeue_found & callback_found & send_found
+        keys = receive_keys[found]
+        sends = sends[send_pos[found]]
+        callbacks = callbacks[callback_pos[found]]
+
+        self.receiver = keys % num_ops
+        self.stream = (keys // num_ops) % num_streams
+        self.timestamp = keys // num_ops // num_streams
+        self.sender = events.op[sends]
+        self.send_start = events.start[sends]
+        self.receive = events.start[receives[found]]
+        self.dequeue = events.start[dequeues[dequeue_pos[found]]]
+        self.callback_start = events.start[callbacks]
+        self.callback_end = events.end[callbacks]
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    @property
+    def transfer(self):
+        return self.receive - self.send_start
+
+    @property
+    def queueing(self):
+        return self.dequeue - self.receive
+
+    @property
+    def processing(self):
+        return self.callback_end - self.callback_start
+
+
+class CriticalPaths(object):
+    """The critical path of every timestamp.
+
+    A timestamp's path ends with the hop whose callback finished last. It
+    is walked back from receiver to sender: the hop that precedes a hop is
+    the sender's hop for the same timestamp that was dequeued last before
+    the sender started sending. The path starts at an operator which did
+    not receive the timestamp (e.g., a source).
+
+    Each operator on the path is charged the transfer and queueing time of
+    the hop it received, the time from dequeueing the message until it
+    sent the next message on the path (or until its callback ended) as
+    processing, and the time between the end of the callback and the send
+    (e.g., waiting for a watermark) as wait. The charges of a path add up
+    to the timestamp's end-to-end latency.
+
+    Attributes:
+        latency (numpy.ndarray): End-to-end latency of each timestamp, in
+            microseconds, from the first send on its path to the end of its
+            last callback.
+        op (numpy.ndarray): Operator of each charge.
+        timestamp (numpy.ndarray): Timestamp of each charge.
+        transfer, queueing, processing, wait (numpy.ndarray): The charges.
+    """
+
+    def __init__(self, hops):
+        num_ops = hops.num_ops
+        columns = dict((name, []) for name in ('op', 'timestamp') + COMPONENTS)
+        if len(hops) == 0:
+            self.latency = np.zeros(0)
+            for (name, values) in columns.items():
+                setattr(self, name, np.zeros(0))
+            return
+        # The hop of each timestamp whose callback ended last.
+        order = np.lexsort((hops.callback_end, hops.timestamp))
+        is_last = np.r_[hops.timestamp[order][1:] !=
+                        hops.timestamp[order][:-1], True]
+        current = order[is_last]
+        end_time = hops.callback_end[current]
+        start_time = hops.send_start[current].copy()
+        self._charge(columns, hops, current,
+                     hops.callback_end[current] - hops.dequeue[current],
+                     np.zeros(len(current)))
+
+        # Sort the hops by (timestamp, receiver, dequeue time) to find the
+        # hop a sender dequeued last before sending.
+        groups = hops.timestamp * num_ops + hops.receiver
+        times = np.round(hops.dequeue).astype(np.int64)
+        group_bits = int(groups.max()).bit_length()
+        time_bits = max(int(times.max()).bit_length(), 1)
+        # Coarsen the times if the keys would not fit in 62 bits.
+        shift = max(0, group_bits + time_bits - 62)
+        time_bits -= shift
+        sort_keys = (groups << time_bits) | (times >> shift)
+        order = np.argsort(sort_keys, kind='mergesort')
+        sort_keys = sort_keys[order]
+        sorted_groups = groups[order]
+
+        path_index = np.arange(len(current))
+        # Paths cannot be longer than the number of operators, unless the
+        # graph has cycles.
+        for _ in range(num_ops):
+            query_groups = (hops.timestamp[current] * num_ops +
+                            hops.sender[current])
+            send_times = np.round(hops.send_start[current]).astype(
+                np.int64) >> shift
+            query_keys = (query_groups << time_bits) | np.clip(
+                send_times, 0, None)
+            pos = np.searchsorted(sort_keys, query_keys, side='right') - 1
+            found = pos >= 0
+            found[found] = sorted_groups[pos[found]] == query_groups[found]
+            if not found.any():
+                break
+            previous = order[pos[found]]
+            current = current[found]
+            path_index = path_index[found]
+            # The operator which received the previous hop sent the current
+            # hop.
+            send_start = hops.send_start[current]
+            processing = np.clip(
+                np.minimum(hops.callback_end[previous], send_start) -
+                hops.dequeue[previous], 0, None)
+            wait = np.clip(send_start - hops.dequeue[previous] - processing, 0,
+                           None)
+            self._charge(columns, hops, previous, processing, wait)
+            start_time[path_index] = hops.send_start[previous]
+            current = previous
+        self.latency = end_time - start_time
+        for (name, values) in columns.items():
+            setattr(self, name, np.concatenate(values))
+
+    def _charge(self, columns, hops, hop_indices, processing, wait):
+        columns['op'].append(hops.receiver[hop_indices])
+        columns['timestamp'].append(hops.timestamp[hop_indices])
+        columns['transfer'].append(hops.transfer[hop_indices])
+        columns['queueing'].append(hops.queueing[hop_indices])
+        columns['processing'].append(processing)
+        columns['wait'].append(wait)
+
+
+def analyze(events):
+    """Computes the latency breakdown of a trace.
+
+    Args:
+        events (TraceEvents): The events of the trace.
+
+    Returns:
+        (dict): The report. Times are in milliseconds.
+    """
+    hops = Hops(events)
+    paths = CriticalPaths(hops)
+    total_latency = paths.latency.sum()
+    operators = {}
+    contribution = paths.transfer + paths.queueing + paths.processing + \
+        paths.wait
+    for (op, indices) in _group(paths.op):
+        charges = contribution[indices]
+        stats = {
+            'on_critical_path': len(indices),
+            'contribution_ms': _percentiles(charges),
+            'latency_share': (float(charges.sum() / total_latency)
+                              if total_latency > 0 else 0.0),
+        }
+        for component in COMPONENTS:
+            stats['{}_ms'.format(component)] = _percentiles(
+                getattr(paths, component)[indices])
+        operators[events.op_names[op]] = stats
+
+    hop_stats = []
+    edges = (hops.sender * len(events.stream_uids) +
+             hops.stream) * hops.num_ops + hops.receiver
+    for (_, indices) in _group(edges):
+        first = indices[0]
+        hop_stats.append({
+            'sender': events.op_names[hops.sender[first]],
+            'stream': events.stream_names[hops.stream[first]],
+            'receiver': events.op_names[hops.receiver[first]],
+            'count': len(indices),
+            'transfer_ms': _percentiles(hops.transfer[indices]),
+            'queueing_ms': _percentiles(hops.queueing[indices]),
+            'processing_ms': _percentiles(hops.processing[indices]),
+        })
+    return {
+        'num_timestamps': len(paths.latency),
+        'latency_ms': _percentiles(paths.latency),
+        'operators': operators,
+        'hops': hop_stats,
+    }
+
+
+def format_report(report):
+    """Renders a report as text tables."""
+    lines = [
+        '{} timestamps, end-to-end latency p50 {:.3f} ms, p99 {:.3f} '
+        'ms'.format(report['num_timestamps'], report['latency_ms']['p50'],
+                    report['latency_ms']['p99'])
+    ]
+    lines.append('')
+    lines.append('Critical path (p50/p99 ms):')
+    header = '{:<30} {:>7} {:>6} {:>17}' + ' {:>17}' * len(COMPONENTS)
+    lines.append(
+        header.format('operator', 'on path', 'share', 'contribution',
+                      *COMPONENTS))
+    for (op_name, stats) in sorted(report['operators'].items(),
+                                   key=lambda item: -item[1]['latency_share']):
+        values = [_format_percentiles(stats['contribution_ms'])] + [
+            _format_percentiles(stats['{}_ms'.format(component)])
+            for component in COMPONENTS
+        ]
+        lines.append(
+            header.format(op_name, stats['on_critical_path'],
+                          '{:.1%}'.format(stats['latency_share']), *values))
+    lines.append('')
+    lines.append('Hops (p50/p99 ms):')
+    header = '{:<50} {:>7} {:>17} {:>17} {:>17}'
+    lines.append(
+        header.format('sender -> receiver (stream)', 'count', 'transfer',
+                      'queueing', 'processing'))
+    for hop in report['hops']:
+        lines.append(
+            header.format(
+                '{} -> {} ({})'.format(hop['sender'], hop['receiver'],
+                                       hop['stream']), hop['count'],
+                _format_percentiles(hop['transfer_ms']),
+                _format_percentiles(hop['queueing_ms']),
+                _format_percentiles(hop['processing_ms'])))
+    return '\n'.join(lines)
+
+
+def _get_id(ids, names, name):
+    entry_id = ids.get(name)
+    if entry_id is None:
+        entry_id = ids[name] = len(names)
+        names.append(name)
+    return entry_id
+
+
+def _parse_event_name(name):
+    """Returns the category and the stream name of an event logged by the
+    executors, or (None, None) if it is not an event of a data message."""
+    if name.startswith('send '):
+        return (SEND, name[len('send '):])
+    if (name.startswith('receive ')
+            and not name.startswith('receive watermark ')):
+        return (RECEIVE, name[len('receive '):])
+    return (None, None)
+
+
+def _time_until_send(keys, category, start):
+    """Returns the time from each event until the first send with the same
+    key that does not precede it, or 0 if there is none."""
+    num_events = len(keys)
+    is_send = category == SEND
+    # Sends sort after the other events of the same key and time.
+    order = np.lexsort((is_send, start, keys))
+    positions = np.where(is_send[order], np.arange(num_events), num_events)
+    # Position of the first send at or after each position.
+    next_send = np.minimum.accumulate(positions[::-1])[::-1]
+    found = next_send < num_events
+    found[found] = keys[order][next_send[found]] == keys[order][found]
+    durations = np.zeros(num_events)
+    sorted_durations = np.zeros(num_events)
+    sorted_durations[found] = (start[order][next_send[found]] -
+                               start[order][found])
+    durations[order] = sorted_durations
+    return durations
+
+
+def _group_rows(rows):
+    """Returns the number of distinct rows, and the id of each row's
+    group. Sorting the columns is much faster than np.unique(rows, axis=0),
+    which sorts the rows as opaque bytes."""
+    if len(rows) == 0:
+        return (0, np.zeros(0, dtype=np.int64))
+    order = np.lexsort(rows.T[::-1])
+    sorted_rows = rows[order]
+    is_first = np.r_[True, (sorted_rows[1:] != sorted_rows[:-1]).any(axis=1)]
+    group_ids = np.empty(len(rows), dtype=np.int64)
+    group_ids[order] = np.cumsum(is_first) - 1
+    return (int(is_first.sum()), group_ids)
+
+
+def _first_by_key(events, category, keys):
+    """Returns the sorted keys of the events of a category, and the index of
+    each key's earliest event."""
+    indices = np.nonzero(events.category == category)[0]
+    order = indices[np.lexsort((events.start[indices], keys[indices]))]
+    sorted_keys = keys[order]
+    is_first = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+    return (sorted_keys[is_first], order[is_first])
+
+
+def _lookup(sorted_keys, keys):
+    """Returns a mask of the keys found in sorted_keys, and their
+    positions."""
+    pos = np.searchsorted(sorted_keys, keys)
+    pos = np.minimum(pos, max(len(sorted_keys) - 1, 0))
+    if len(sorted_keys) == 0:
+        return (np.zeros(len(keys), dtype=bool), pos)
+    return (sorted_keys[pos] == keys, pos)
+
+
+def _group(values):
+    """Yields (value, indices) tuples for each distinct value."""
+    order = np.argsort(values, kind='mergesort')
+    sorted_values = values[order]
+    boundaries = np.nonzero(sorted_values[1:] != sorted_values[:-1])[0] + 1
+    for indices in np.split(order, boundaries):
+        if len(indices) > 0:
+            yield (values[indices[0]], indices)
+
+
+def _percentiles(values):
+    """Returns the percentiles of durations in microseconds, in ms."""
+    if len(values) == 0:
+        return dict(('p{}'.format(p), 0.0) for p in PERCENTILES)
+    return dict(
+        ('p{}'.format(p), float(value) / 1000)
+        for (p, value) in zip(PERCENTILES, np.percentile(values, PERCENTILES)))
+
+
+def _format_percentiles(percentiles):
+    return '{:.3f}/{:.3f}'.format(percentiles['p50'], percentiles['p99'])
+
+
+if __name__ == '__main__':
+    # Prints the report of a trace: python -m erdos.critical_path <trace>
+    # or of event logs: python -m erdos.critical_path --event_logs <prefix>...
+    # Pass --json to print the report as JSON.
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if '--event_logs' in sys.argv[1:]:
+        report = analyze(TraceEvents.from_event_logs(args))
+    else:
+        report = analyze(load_trace(args[0]))
+    if '--json' in sys.argv[1:]:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print(format_report(report))
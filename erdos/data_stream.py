@@ -6,6 +6,8 @@ class DataStream(object):
             ROS subscribers and publishers must specify a data type.
         name (str): A unique string naming the stream.
         labels (dict: str -> str): Describes properties of the data stream.
+        id (int): A small integer identifying the stream in the execution
+            graph. Messages carry it instead of the stream name and uid.
     """
 
     def __init__(self,
@@ -14,11 +16,13 @@ class DataStream(object):
                  labels=None,
                  callbacks=None,
                  completion_callbacks=None,
-                 uid=None):
+                 uid=None,
+                 id=None):
         self.name = name if name else "{0}_{1}".format(self.__class__.__name__,
                                                        hash(self))
         self.data_type = data_type
         self._uid = uid
+        self.id = id
 
         if labels:  # both keys and values in a label must be a single string
             for k, v in labels.items():
@@ -69,12 +73,12 @@ class DataStream(object):
 
     def _copy_stream(self):
         """Transforms the OutputStream into an InputStream"""
-        return DataStream(
-            data_type=self.data_type,
-            name=self.name,
-            labels=self.labels.copy(),
-            callbacks=self.callbacks.copy(),
-            uid=self.uid)
+        return DataStream(data_type=self.data_type,
+                          name=self.name,
+                          labels=self.labels.copy(),
+                          callbacks=self.callbacks.copy(),
+                          uid=self.uid,
+                          id=self.id)
 
     def __repr__(self):
         return self.__str__()
@@ -1,3 +1,6 @@
+from erdos.deadline_queue import LATENCY_BUDGET_LABEL
+
+
 class DataStreams(object):
     def __init__(self, streams):
         self._streams = streams
@@ -71,6 +74,23 @@ class DataStreams(object):
             stream.add_callback(callback_func)
         return self
 
+    def set_latency_budget(self, budget_ms):
+        """Sets the latency budget of the callbacks of all data streams.
+
+        Executors run the callbacks of operators whose input streams have
+        latency budgets in earliest deadline first order. A message's
+        deadline is its arrival time plus its stream's budget. Work without
+        a budget (e.g., periodic methods) runs once no message with a
+        budget is pending. Ray operators only reorder the messages they
+        receive in one call, i.e., the messages of a batch.
+
+        Returns:
+            (DataStreams): selected data streams.
+        """
+        for stream in self._streams:
+            stream.labels[LATENCY_BUDGET_LABEL] = str(budget_ms)
+        return self
+
     def add_completion_callback(self, callback_func):
         """ Registers the callback function to be called upon
             completion of a timestamp.
@@ -0,0 +1,88 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import heapq
+import itertools
+import time
+from collections import deque
+
+# Label setting the latency budget, in ms, of the callbacks of an input
+# stream. Operators whose input streams have budgets run their callbacks in
+# earliest deadline first order.
+LATENCY_BUDGET_LABEL = 'latency_budget_ms'
+
+
+class DeadlineQueue(object):
+    """Queue of an operator's pending work, ordered by earliest deadline.
+
+    Items are appended to lanes (e.g., one per input stream). Each item's
+    deadline is its arrival time plus the latency budget of its lane. Items
+    of a lane are popped in arrival order, so that the watermarks of a
+    stream never overtake its messages, while items of different lanes are
+    popped in deadline order.
+
+    The queue supports the subset of the deque interface executors use for
+    mailboxes, and is not thread-safe.
+    """
+
+    def __init__(self, latency_budgets, default_budget=float('inf')):
+        """
+        Args:
+            latency_budgets (dict of str -> float): The latency budget, in
+                seconds, of each lane.
+            default_budget (float): The latency budget, in seconds, of the
+                lanes without one (e.g., the lane None of periodic and
+                notification work). By default, their items run in arrival
+                order once no item with a budget is pending.
+        """
+        self._latency_budgets = latency_budgets
+        self._default_budget = default_budget
+        # Maps lanes to deques of (deadline, item) tuples.
+        self._lanes = {}
+        # Heap of (deadline, sequence number, lane) tuples, one for each
+        # lane that has items, keyed by the deadline of the lane's oldest
+        # item.
+        self._heap = []
+        self._counter = itertools.count()
+        self._len = 0
+
+    def append(self, item, lane=None):
+        deadline = time.time() + self._latency_budgets.get(
+            lane, self._default_budget)
+        items = self._lanes.get(lane)
+        if items is None:
+            items = deque()
+            self._lanes[lane] = items
+        if not items:
+            heapq.heappush(self._heap, (deadline, next(self._counter), lane))
+        items.append((deadline, item))
+        self._len += 1
+
+    def popleft(self):
+        """Pops the item with the earliest deadline."""
+        if not self._heap:
+            raise IndexError('pop from an empty DeadlineQueue')
+        (_, _, lane) = heapq.heappop(self._heap)
+        items = self._lanes[lane]
+        (_, item) = items.popleft()
+        if items:
+            heapq.heappush(self._heap,
+                           (items[0][0], next(self._counter), lane))
+        self._len -= 1
+        return item
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    __nonzero__ = __bool__
+
+
+def get_latency_budgets(streams):
+    """Returns the latency budgets, in seconds, of the streams that have one,
+    keyed by stream uid."""
+    return dict((stream.uid, float(stream.labels[LATENCY_BUDGET_LABEL]) / 1000)
+                for stream in streams if LATENCY_BUDGET_LABEL in stream.labels)
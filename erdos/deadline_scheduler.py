@@ -0,0 +1,138 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Cancelled timers are removed from the heap once they make up more than half
+# of it, and there are at least that many of them.
+_MIN_CANCELLED_TO_COMPACT = 64
+
+
+class DeadlineTimer(object):
+    """A deadline armed on a `DeadlineScheduler`.
+
+    Attributes:
+        deadline (float): Time, in seconds since the epoch, at which the
+            timer fires.
+        fired_time (float): Time at which the miss handler was invoked, or
+            None if the timer has not fired.
+    """
+    __slots__ = ('deadline', 'fired_time', '_callback', '_cancelled')
+
+    def __init__(self, deadline, callback):
+        self.deadline = deadline
+        self.fired_time = None
+        self._callback = callback
+        self._cancelled = False
+
+
+class DeadlineScheduler(object):
+    """Fires the deadlines of a process from a single thread.
+
+    Deadlines are kept in a heap ordered by time. Arming a deadline pushes a
+    timer on the heap, and cancelling it only marks the timer, which is
+    skipped once it reaches the top of the heap. The miss handlers run in
+    the scheduler's thread, and thus must return quickly.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._num_cancelled = 0
+        # Breaks ties between timers that have the same deadline.
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def arm(self, deadline, callback):
+        """Invokes callback at deadline, unless the timer is cancelled.
+
+        Returns:
+            (DeadlineTimer): The timer, which can be passed to `cancel`.
+        """
+        timer = DeadlineTimer(deadline, callback)
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            heapq.heappush(self._heap, (deadline, next(self._counter), timer))
+            # Wake up the thread only if the timer fires before the timer it
+            # waits for.
+            if self._heap[0][2] is timer:
+                self._cond.notify()
+        return timer
+
+    def cancel(self, timer):
+        """Cancels a timer.
+
+        Returns:
+            (bool): True if the timer was cancelled before it fired.
+        """
+        with self._cond:
+            if timer.fired_time is not None or timer._cancelled:
+                return False
+            timer._cancelled = True
+            self._num_cancelled += 1
+            if (self._num_cancelled >= _MIN_CANCELLED_TO_COMPACT
+                    and 2 * self._num_cancelled > len(self._heap)):
+                self._heap = [
+                    entry for entry in self._heap if not entry[2]._cancelled
+                ]
+                heapq.heapify(self._heap)
+                self._num_cancelled = 0
+            return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                timer = self._pop_expired()
+                if timer is None:
+                    continue
+                timer.fired_time = time.time()
+            try:
+                timer._callback()
+            except Exception:
+                logger.exception('Deadline miss handler failed')
+
+    def _pop_expired(self):
+        """Waits for the first timer to expire. Returns the timer, or None if
+        the thread must wait again."""
+        if not self._heap:
+            self._cond.wait()
+            return None
+        (deadline, _, timer) = self._heap[0]
+        if timer._cancelled:
+            heapq.heappop(self._heap)
+            self._num_cancelled -= 1
+            return None
+        wait_time = deadline - time.time()
+        if wait_time > 0:
+            self._cond.wait(wait_time)
+            return None
+        heapq.heappop(self._heap)
+        return timer
+
+
+_scheduler = None
+_scheduler_pid = None
+_scheduler_lock = threading.Lock()
+
+
+def get_deadline_scheduler():
+    """Returns the deadline scheduler of the process."""
+    global _scheduler, _scheduler_pid
+    with _scheduler_lock:
+        # The scheduler's thread does not survive a fork (e.g., ROS operators
+        # run in their own process).
+        if _scheduler is None or _scheduler_pid != os.getpid():
+            _scheduler = DeadlineScheduler()
+            _scheduler_pid = os.getpid()
+        return _scheduler
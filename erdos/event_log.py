@@ -0,0 +1,394 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import csv
+import glob
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from erdos.utils import (register_open_writer, unregister_open_writer,
+                         write_atomically)
+
+logger = logging.getLogger(__name__)
+
+FILE_MAGIC = b'ERDOSEV1'
+# Coordinates of a timestamp stored in a record. Only the first coordinates
+# of longer timestamps are stored, and their records keep the actual number
+# of coordinates, so that readers can tell they are truncated.
+MAX_COORDS = 4
+# Largest number of coordinates a record can count.
+_MAX_NUM_COORDS = 255
+# Records hold the op id, the event id, the number of coordinates, the
+# coordinates, the processing time passed by the caller, and the monotonic
+# time in nanoseconds at which the event was logged.
+RECORD = struct.Struct('<HIBx{}qdq'.format(MAX_COORDS))
+_HEADER = struct.Struct('<8sHB')
+_ZERO_COORDS = (0, ) * MAX_COORDS
+
+# Number of events queued before new events are dropped, and of records
+# written to disk per batch.
+DEFAULT_CAPACITY = 1 << 14
+# Seconds between the writer's flushes.
+DEFAULT_FLUSH_PERIOD = 0.1
+# Files are rotated once they grow larger than this.
+DEFAULT_MAX_FILE_BYTES = 64 << 20
+
+if hasattr(time, 'monotonic_ns'):
+    _monotonic_ns = time.monotonic_ns
+else:
+
+    def _monotonic_ns():
+        return int(time.time() * 1e9)
+
+
+class BackgroundWriter(object):
+    """Queues items, which a background thread writes to disk.
+
+    Queuing never blocks the caller. The thread writes the queued items
+    every flush_period seconds (None disables periodic writes), or once
+    capacity / 2 items are queued. Items are dropped, and counted in
+    `num_dropped`, if the writer falls behind and capacity items are queued,
+    so that the queue never grows without bound. Open writers are closed
+    by `erdos.utils.close_open_writers`.
+
+    Subclasses set up their files before they call this constructor, and
+    implement `_write_pending`, which writes the items of `_pending`, and
+    `_close_file`. Both are called with `_file_lock` held.
+
+    Attributes:
+        num_dropped (int): Number of items dropped.
+    """
+
+    def __init__(self, name, capacity, flush_period):
+        self.num_dropped = 0
+        self._capacity = capacity
+        self._flush_period = flush_period
+        # Appending to and popping from a deque are atomic, so producers
+        # do not need to take a lock.
+        self._pending = deque()
+        # Serializes the writes to disk between the writer and `flush`.
+        self._file_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+        register_open_writer(self)
+
+    def flush(self):
+        """Writes the queued items to disk."""
+        with self._file_lock:
+            self._write_pending()
+
+    def close(self):
+        """Stops the writer, and writes the queued items."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+        with self._file_lock:
+            self._close_file()
+        unregister_open_writer(self)
+        if self.num_dropped > 0:
+            logger.warning('{} dropped {} items'.format(
+                self._thread.name, self.num_dropped))
+
+    def _enqueue(self, item):
+        pending = self._pending
+        num_pending = len(pending)
+        if num_pending >= self._capacity:
+            self.num_dropped += 1
+            return
+        pending.append(item)
+        if num_pending >= self._capacity // 2 and not self._wake.is_set():
+            self._wake.set()
+
+    def _write_pending(self):
+        raise NotImplementedError()
+
+    def _close_file(self):
+        raise NotImplementedError()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self._flush_period)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('{} failed to write'.format(
+                    self._thread.name))
+
+
+class EventLog(BackgroundWriter):
+    """Binary log of the events of operators.
+
+    `append` only queues the event, so that logging costs callbacks a few
+    hundred nanoseconds. The `BackgroundWriter` thread packs the queued
+    events into fixed-size records in a preallocated buffer, and writes the
+    buffer to disk in batches, so logging never blocks callbacks. Callbacks
+    do not pack the records into the buffer themselves: claiming a slot of
+    a shared buffer takes a lock per event, whereas deque appends are atomic.
+    The queue is bounded by capacity, like the buffer.
+
+    Records refer to operators and events by id. The names are stored in
+    `<prefix>.names.json`, and the records in `<prefix>.<index>.evlog`
+    files, which are rotated once they exceed max_file_bytes. Logs with an
+    existing prefix are continued in a new file.
+
+    Attributes:
+        prefix (str): Path prefix of the log files.
+        num_truncated (int): Number of events whose timestamps have more
+            than MAX_COORDS coordinates.
+    """
+
+    def __init__(self,
+                 prefix,
+                 capacity=DEFAULT_CAPACITY,
+                 flush_period=DEFAULT_FLUSH_PERIOD,
+                 max_file_bytes=DEFAULT_MAX_FILE_BYTES):
+        self.prefix = prefix
+        self.num_truncated = 0
+        self._max_file_bytes = max_file_bytes
+        self._buffer = bytearray(capacity * RECORD.size)
+        self._names_lock = threading.Lock()
+        (self._op_names, self._event_names) = _load_names(prefix)
+        self._op_ids = dict(
+            (name, op_id) for (op_id, name) in enumerate(self._op_names))
+        self._event_ids = dict(
+            (name, event_id)
+            for (event_id, name) in enumerate(self._event_names))
+        self._num_names_written = None
+        self._file_index = len(get_log_files(prefix))
+        self._file = None
+        self._open_file()
+        super(EventLog, self).__init__('EventLog {}'.format(prefix), capacity,
+                                       flush_period)
+
+    def register_op(self, name):
+        """Returns the id of the operator in the records."""
+        with self._names_lock:
+            return self._register(name, self._op_ids, self._op_names)
+
+    def register_event(self, name):
+        """Returns the id of the event in the records."""
+        with self._names_lock:
+            return self._register(name, self._event_ids, self._event_names)
+
+    def append(self, op_id, event_id, coordinates, processing_time):
+        """Queues an event record.
+
+        Args:
+            op_id (int): The id returned by `register_op`.
+            event_id (int): The id returned by `register_event`.
+            coordinates (tuple of int): The coordinates of the timestamp of
+                the message.
+            processing_time (float): Time passed by the caller.
+        """
+        self._enqueue(
+            (op_id, event_id, coordinates, processing_time, _monotonic_ns()))
+
+    def _write_pending(self):
+        if self._file is None:
+            return
+        # Names are registered before the events that refer to them are
+        # queued, so the names are stored before the records.
+        with self._names_lock:
+            names = (list(self._op_names), list(self._event_names))
+        num_names = len(names[0]) + len(names[1])
+        if num_names != self._num_names_written:
+            _store_names(self.prefix, names)
+            self._num_names_written = num_names
+        num_records = self._pack_pending()
+        while num_records > 0:
+            self._file.write(
+                memoryview(self._buffer)[:num_records * RECORD.size])
+            num_records = self._pack_pending()
+        self._file.flush()
+        if self._file.tell() >= self._max_file_bytes:
+            self._file.close()
+            self._file_index += 1
+            self._open_file()
+
+    def _close_file(self):
+        self._file.close()
+        self._file = None
+
+    def _pack_pending(self):
+        """Packs up to capacity queued events into the buffer.
+
+        Returns:
+            (int): The number of records packed.
+        """
+        pending = self._pending
+        pack_into = RECORD.pack_into
+        buf = self._buffer
+        num_records = 0
+        while pending and num_records < self._capacity:
+            (op_id, event_id, coordinates, processing_time,
+             monotonic_ns) = pending.popleft()
+            num_coords = len(coordinates)
+            if num_coords < MAX_COORDS:
+                coordinates = tuple(coordinates) + _ZERO_COORDS[num_coords:]
+            elif num_coords > MAX_COORDS:
+                if self.num_truncated == 0:
+                    logger.warning(
+                        '{} only stores the first {} coordinates of '
+                        'timestamps, and flags the truncated records'.format(
+                            self._thread.name, MAX_COORDS))
+                self.num_truncated += 1
+                coordinates = tuple(coordinates[:MAX_COORDS])
+                num_coords = min(num_coords, _MAX_NUM_COORDS)
+            try:
+                pack_into(buf, num_records * RECORD.size, op_id, event_id,
+                          num_coords,
+                          *coordinates + (processing_time, monotonic_ns))
+            except struct.error:
+                # Coordinates are not ints (e.g., floats).
+                pack_into(
+                    buf, num_records * RECORD.size, op_id, event_id,
+                    num_coords,
+                    *tuple(int(c) for c in coordinates) +
+                    (processing_time, monotonic_ns))
+            num_records += 1
+        return num_records
+
+    def _register(self, name, ids, names):
+        entry_id = ids.get(name)
+        if entry_id is None:
+            entry_id = len(names)
+            names.append(name)
+            ids[name] = entry_id
+        return entry_id
+
+    def _open_file(self):
+        path = '{}.{}.evlog'.format(self.prefix, self._file_index)
+        self._file = open(path, 'wb')
+        self._file.write(_HEADER.pack(FILE_MAGIC, RECORD.size, MAX_COORDS))
+
+
+class EventLogReader(object):
+    """Reads the records written by an `EventLog`.
+
+    Attributes:
+        prefix (str): Path prefix of the log files.
+        op_names (list of str): Operator names, indexed by op id.
+        event_names (list of str): Event names, indexed by event id.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        (self.op_names, self.event_names) = _load_names(prefix)
+
+    def read(self):
+        """Yields the records in the order in which they were logged.
+
+        Returns:
+            (generator of tuple): (op name, event name, timestamp
+            coordinates, processing time, monotonic time in ns) tuples. The
+            coordinates of truncated timestamps end with an Ellipsis.
+        """
+        for path in get_log_files(self.prefix):
+            data = _read_records(path)
+            for offset in range(0, len(data), RECORD.size):
+                record = RECORD.unpack_from(data, offset)
+                coordinates = record[3:3 + min(record[2], MAX_COORDS)]
+                if record[2] > MAX_COORDS:
+                    coordinates += (Ellipsis, )
+                yield (self.op_names[record[0]], self.event_names[record[1]],
+                       coordinates, record[-2], record[-1])
+
+    def to_numpy(self):
+        """Returns the records as a numpy structured array, with op_id,
+        event_id, num_coords, coords, processing_time and monotonic_ns
+        fields. Timestamps are truncated if num_coords exceeds
+        MAX_COORDS."""
+        if np is None:
+            raise ImportError('numpy is required to read event logs as '
+                              'arrays')
+        dtype = np.dtype([('op_id', '<u2'), ('event_id', '<u4'),
+                          ('num_coords', 'u1'), ('pad', 'V1'),
+                          ('coords', '<i8', (MAX_COORDS, )),
+                          ('processing_time', '<f8'), ('monotonic_ns', '<i8')])
+        assert dtype.itemsize == RECORD.size
+        arrays = [
+            np.frombuffer(_read_records(path), dtype=dtype)
+            for path in get_log_files(self.prefix)
+        ]
+        if not arrays:
+            return np.zeros(0, dtype=dtype)
+        return np.concatenate(arrays)
+
+    def to_csv(self, csv_file):
+        """Writes the records as op, event, timestamp, processing_time and
+        monotonic_ns columns to a file object."""
+        writer = csv.writer(csv_file)
+        writer.writerow(
+            ['op', 'event', 'timestamp', 'processing_time', 'monotonic_ns'])
+        for (op_name, event_name, coordinates, processing_time,
+             monotonic_ns) in self.read():
+            writer.writerow([
+                op_name, event_name, '[{}]'.format(', '.join(
+                    '...' if coord is Ellipsis else str(coord)
+                    for coord in coordinates)), processing_time, monotonic_ns
+            ])
+
+
+def get_log_files(prefix):
+    """Returns the files of a log, ordered by their index."""
+    indexed_paths = []
+    for path in glob.glob('{}.*.evlog'.format(prefix)):
+        index = path[len(prefix) + 1:-len('.evlog')]
+        if index.isdigit():
+            indexed_paths.append((int(index), path))
+    return [path for (_, path) in sorted(indexed_paths)]
+
+
+def _read_records(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    (magic, record_size, max_coords) = _HEADER.unpack_from(data)
+    if (magic != FILE_MAGIC or record_size != RECORD.size
+            or max_coords != MAX_COORDS):
+        raise ValueError('{} is not an event log'.format(path))
+    # Ignore a partially written record at the end of the file.
+    end = _HEADER.size + (len(data) - _HEADER.size) // RECORD.size * \
+        RECORD.size
+    return data[_HEADER.size:end]
+
+
+def _load_names(prefix):
+    path = '{}.names.json'.format(prefix)
+    if not os.path.exists(path):
+        return ([], [])
+    with open(path) as f:
+        names = json.load(f)
+    return (names['ops'], names['events'])
+
+
+def _store_names(prefix, names):
+    write_atomically('{}.names.json'.format(prefix),
+                     json.dumps({
+                         'ops': names[0],
+                         'events': names[1]
+                     }))
+
+
+if __name__ == '__main__':
+    # Converts a log to CSV: python -m erdos.event_log <prefix>
+    EventLogReader(sys.argv[1]).to_csv(sys.stdout)
@@ -0,0 +1,165 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import time
+
+from erdos.data_stream import DataStream
+from erdos.message import WatermarkMessage
+from erdos.metrics import CallbackMetrics
+from erdos.op import Op
+from erdos.tracing import get_op_tracer
+
+
+class FusedOp(Op):
+    """Runs a linear chain of fused operators in a single executor.
+
+    The executor delivers the messages of the chain's input streams to the
+    first operator. The operators of the chain send messages to each other
+    on `FusedDataStream`s, which invoke the callbacks of the receiver
+    directly. The last operator publishes on the output streams of the
+    chain. Watermarks flow along the chain as they do between executors:
+    an operator's completion callbacks run once its low watermark advances,
+    and the watermark is forwarded if it has no completion callbacks.
+
+    Args:
+        op_handles (list of OpHandle): The handles of the fused operators,
+            ordered from the first to the last operator of the chain.
+    """
+
+    def __init__(self, name, op_handles):
+        super(FusedOp, self).__init__(name)
+        self._ops = []
+        # For each operator, dicts mapping stream uids to callbacks.
+        self._callbacks = []
+        self._completion_callbacks = []
+        # The callbacks are recorded for each fused operator, so that the
+        # bottlenecks of a chain remain visible.
+        self._callback_metrics = []
+        self._tracers = []
+        for op_handle in op_handles:
+            op = op_handle.op_cls(op_handle.name, **op_handle.init_args)
+            self._ops.append(op)
+            self._callback_metrics.append(CallbackMetrics(op_handle.name))
+            self._tracers.append(get_op_tracer(op_handle.name))
+            self._callbacks.append(
+                dict((stream.uid, list(stream.callbacks))
+                     for stream in op_handle.input_streams))
+            self._completion_callbacks.append(
+                dict((stream.uid, list(stream.completion_callbacks))
+                     for stream in op_handle.input_streams))
+        for index, op_handle in enumerate(op_handles[1:], 1):
+            self._ops[index]._add_input_streams(op_handle.input_streams)
+            self._ops[index - 1]._add_output_streams([
+                FusedDataStream(self, index, output_stream)
+                for output_stream in self._get_fused_streams(
+                    op_handles[index - 1], op_handle)
+            ])
+        # The last operator publishes on the streams of the executor.
+        self._ops[-1].output_streams = self.output_streams
+
+    def on_fused_msg(self, msg):
+        """Delivers a message received by the chain to the first operator."""
+        self._on_msg(0, msg)
+
+    def on_fused_watermark(self, msg):
+        """Delivers the low watermark of the chain to the first operator."""
+        self._on_low_watermark(0, msg)
+
+    def log_event(self, processing_time, timestamp, log_message=None):
+        self._ops[0].log_event(processing_time, timestamp, log_message)
+
+    def _get_fused_streams(self, sender_handle, receiver_handle):
+        # The receiver's input streams are copies of the sender's output
+        # streams, on which the receiver registered its callbacks.
+        output_stream_uids = set(stream.uid
+                                 for stream in sender_handle.output_streams)
+        return [
+            stream for stream in receiver_handle.input_streams
+            if stream.uid in output_stream_uids
+        ]
+
+    def _deliver(self, index, msg):
+        """Invoked by the fused streams to deliver a message to the index-th
+        operator of the chain."""
+        if isinstance(msg, WatermarkMessage):
+            new_msg = self._ops[index]._receive_watermark(msg)
+            if new_msg is None:
+                return
+            new_msg.stream_uid = msg.stream_uid
+            self._on_low_watermark(index, new_msg)
+        else:
+            self._on_msg(index, msg)
+
+    def _on_msg(self, index, msg):
+        op = self._ops[index]
+        start_time = time.time()
+        for cb in self._callbacks[index].get(msg.stream_uid, []):
+            cb(op, msg)
+        self._callback_metrics[index].record(msg.stream_name,
+                                             time.time() - start_time)
+        if self._tracers[index]:
+            self._tracers[index].span('callback', msg, start_time)
+
+    def _on_low_watermark(self, index, msg):
+        op = self._ops[index]
+        completion_callbacks = self._completion_callbacks[index].get(
+            msg.stream_uid, [])
+        start_time = time.time()
+        for cb in completion_callbacks:
+            cb(op, msg)
+        if completion_callbacks:
+            self._callback_metrics[index].record(msg.stream_name,
+                                                 time.time() - start_time,
+                                                 completion=True)
+            if self._tracers[index]:
+                self._tracers[index].span('completion callback', msg,
+                                          start_time)
+        # If no completion callbacks are found, let the watermarks flow
+        # automatically.
+        if not completion_callbacks:
+            for output_stream in op.output_streams.values():
+                output_stream.send(WatermarkMessage(msg.timestamp))
+
+    def _internal_setup_streams(self):
+        for op in self._ops:
+            op.framework = self.framework
+            op.progress_tracker = self.progress_tracker
+        # The executor tracks the watermarks of the chain's input streams.
+        self._ops[0].input_streams = self.input_streams
+        for op in self._ops[1:]:
+            for input_stream in op.input_streams:
+                op._watermark_tracker.add_stream(
+                    input_stream.name,
+                    input_stream.labels.get('no_watermark', 'false') == 'true')
+        super(FusedOp, self)._internal_setup_streams()
+
+
+class FusedDataStream(DataStream):
+    """Stream connecting two operators of a `FusedOp`.
+
+    Sending a message invokes the callbacks of the receiving operator in the
+    sender's thread, without serializing the message.
+    """
+
+    def __init__(self, fused_op, receiver_index, data_stream):
+        super(FusedDataStream, self).__init__(data_type=data_stream.data_type,
+                                              name=data_stream.name,
+                                              labels=data_stream.labels,
+                                              uid=data_stream.uid,
+                                              id=data_stream.id)
+        self._fused_op = fused_op
+        self._receiver_index = receiver_index
+
+    def send(self, msg):
+        # Senders may keep using the message after the send (e.g., to send
+        # it on other streams), so the receiver gets a shallow copy.
+        msg = copy.copy(msg)
+        msg.stream_name = self.name
+        msg.stream_uid = self.uid
+        msg.stream_id = self.id
+        self._fused_op._deliver(self._receiver_index, msg)
+
+    def setup(self):
+        pass
@@ -2,25 +2,109 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import inspect
+import logging
 import subprocess
 import time
+from collections import deque
 from absl import flags
 
 from erdos.op_handle import OpHandle
 from erdos.graph_handle import GraphHandle
 from erdos.data_streams import DataStreams
+from erdos.fusion import FusedOp
+from erdos.credits import CREDITS_LABEL
+from erdos.deadline_queue import LATENCY_BUDGET_LABEL
+from erdos.graph_plan_cache import (GraphPlanCache, attach_callbacks,
+                                    detach_callbacks)
+from erdos.input_queue import MAX_QUEUE_LABEL, QUEUE_POLICY_LABEL
 from erdos.local.local_executor import LocalExecutor
+from erdos.local.local_progress_tracker import LocalProgressTracker
+from erdos.local.local_runtime import LocalRuntime
+from erdos.metrics import MetricsExporter, get_registry
+from erdos.op import Op
+from erdos.tracing import get_tracer, merge_traces, remove_trace_parts
 from erdos.utils import log_graph_to_dot_file
 from erdos.operators import NoopOp
 
 FLAGS = flags.FLAGS
 flags.DEFINE_string('ray_redis_address', '', 'Address of the Ray redis master')
+flags.DEFINE_bool(
+    'ray_local_mode', False,
+    'Run the Ray actors serially in the driver process (e.g., to debug or '
+    'benchmark graphs without a Ray cluster)')
+flags.DEFINE_integer(
+    'ray_batch_size', 1,
+    'Default maximum number of messages Ray streams send in one call. '
+    'Streams with a batch_size label override it')
+flags.DEFINE_integer(
+    'ray_batch_timeout_ms', 1,
+    'Default time a message waits for a batch to fill up on Ray streams. '
+    'Streams with a batch_timeout_ms label override it')
+flags.DEFINE_integer(
+    'ray_put_min_bytes', 1048576,
+    'Ray streams put payloads larger than this in the object store once '
+    'instead of serializing them for each dependent operator. 0 disables it. '
+    'Streams with a put_min_bytes label override it')
+flags.DEFINE_integer(
+    'stream_credits', 0,
+    'Default number of messages a receiver may have in flight on a Ray or '
+    'local stream. 0 disables flow control. Streams with a credits label '
+    'override it')
+flags.DEFINE_enum(
+    'stream_backpressure', 'block', ['block', 'drop', 'coalesce'],
+    'Default action of senders once a receiver has no credits left. Streams '
+    'with a backpressure label override it')
 flags.DEFINE_bool('log_graph', False, 'True to enable graph dot file logging')
+flags.DEFINE_string(
+    'metrics_file', '',
+    'File to which the callback, stream and queue metrics are periodically '
+    'written as JSON. ROS operators write to <metrics_file>.<operator name>. '
+    'Empty disables it')
+flags.DEFINE_integer(
+    'metrics_port', 0,
+    'Port on which the driver serves the metrics of local and Ray graphs in '
+    'the Prometheus text format. 0 disables it')
+flags.DEFINE_integer('metrics_export_period', 5,
+                     'Seconds between two writes of the metrics file')
+flags.DEFINE_string(
+    'trace_file', '',
+    'File to which the send, receive, dequeue and callback events of '
+    'sampled timestamps are written in the Chrome trace format. Each process '
+    'records its events in <trace_file>.<pid>.jsonl, which local and ROS '
+    'drivers merge once the graph finishes, and Ray drivers once they are '
+    'interrupted. python -m erdos.tracing <trace_file> merges them manually. '
+    'Empty disables tracing')
+flags.DEFINE_float(
+    'trace_sample_rate', 0.01,
+    'Fraction of the timestamps that are traced if trace_file is set')
+flags.DEFINE_bool(
+    'fuse_operators', False,
+    'Run linear chains of operators connected by single-consumer streams in '
+    'a single executor, which calls the operators of a chain inline. Chains '
+    'are not fused if --stream_credits or --ray_batch_size apply. Operators '
+    'added with _fusible=False are never fused')
+flags.DEFINE_string(
+    'graph_cache_dir', '',
+    'Directory in which refined graphs are cached, so that later runs of an '
+    'unchanged graph skip stream refinement. Empty disables the cache')
 # XXX(ionel): We can't put ros_non_dropping in ros_input_data_stream because
 # the file is conditionally imported.
 flags.DEFINE_bool(
     'ros_non_dropping', True,
     'Use an infinite ROS receive buffer so that no messages are dropped')
+flags.DEFINE_bool(
+    'ros_shared_memory', False,
+    'Send large numpy message payloads between ROS operators through shared '
+    'memory. Requires all operators to run on the same machine')
+flags.DEFINE_integer('ros_shared_memory_min_bytes', 65536,
+                     'Minimum payload size sent through shared memory')
+flags.DEFINE_integer(
+    'ros_shared_memory_ring_size', 8,
+    'Number of shared memory slots per stream. Payloads are pickled while '
+    'the receivers have not processed the messages of all the slots')
+
+logger = logging.getLogger(__name__)
 
 
 class Graph(object):
@@ -40,6 +124,8 @@ class Graph(object):
             operators. Either ROS or Ray.
         parent (Graph): This graph's parent graph. None if this graph has no
             parent.
+        startup_timings (dict of str -> float): Duration in seconds of each
+            startup phase of the last `execute` call.
     """
 
     def __init__(self, name="default", parent=None):
@@ -49,13 +135,24 @@ class Graph(object):
         self.op_handles = {}
         self.graph_handles = {}
         self.output_stream_to_op_id_sinks = {}
+        # Maps stream uids to the ids of the operators that receive them.
+        self.stream_to_dependent_op_ids = {}
         self.framework = "ray"
+        self.startup_timings = {}
+        self._local_runtime = None
 
         # TODO(peter): fix this once the nested graph API switches to setup_streams
         self.input_op = self.add(NoopOp, name='input_op')
         self.output_op = self.add(NoopOp, name='output_op')
 
-    def add(self, op_cls, name="", init_args=None, setup_args=None, _resources=None):
+    def add(self,
+            op_cls,
+            name="",
+            init_args=None,
+            setup_args=None,
+            _resources=None,
+            _fusible=True,
+            _parallelism=1):
         """Adds an operator to the execution graph.
 
         Args:
@@ -66,6 +163,14 @@ class Graph(object):
                 method.
             setup_args (dict): Arguments passed to the operator's
                 `setup_streams` method.
+            _fusible (bool): False to always run the operator in its own
+                executor.
+            _parallelism (int): Number of threads running the operator's
+                callbacks for different timestamps concurrently. The
+                callbacks must be safe to run concurrently (e.g., the
+                operator is stateless). Messages are still sent in timestamp
+                order, and completion callbacks run once the callbacks of
+                all earlier timestamps have finished. Not supported on ROS.
 
         Returns:
             (str): Unique operator identifier.
@@ -74,8 +179,14 @@ class Graph(object):
             handle = GraphHandle(name, op_cls, init_args, setup_args,
                                  self.graph_name, self)
         else:
-            handle = OpHandle(name, op_cls, init_args, setup_args,
-                              self.graph_name, resources = _resources)
+            handle = OpHandle(name,
+                              op_cls,
+                              init_args,
+                              setup_args,
+                              self.graph_name,
+                              resources=_resources,
+                              fusible=_fusible,
+                              parallelism=_parallelism)
         op_id = handle.get_uid()
         assert (op_id not in self.op_handles), \
             'Duplicate operator name {}. Ensure name uniqueness ' \
@@ -136,27 +247,60 @@ class Graph(object):
         raise NotImplementedError(
             "setups_streams will be exposed after API changes.")
 
-    def execute(self, framework=None):
+    def execute(self, framework=None, timeout=None):
         """Execute the current graph.
 
         Args:
             framework (str): The name of the framework to use to execute the
-                operators. Either ROS or Ray.
+                operators. Either ROS, Ray, or local. Local graphs run in the
+                driver process, and execute returns once the graph is
+                quiescent, once `stop` is called, or once timeout expires.
+            timeout (float): Seconds after which a local graph is stopped
+                (e.g., graphs with periodic methods, which are never
+                quiescent). None runs the graph until it is quiescent or
+                stopped.
         """
+        self.startup_timings = {}
+        start_time = time.time()
         # 0. Setup subgraphs
         self._flatten_subgraphs()
-
-        # 1. Build refined stream graph.
-        self._build_refined_op_graph()
+        start_time = self._record_startup_timing('flatten', start_time)
+
+        # 1. Build refined stream graph, unless it is cached.
+        plan_cache = None
+        if FLAGS.graph_cache_dir:
+            plan_cache = GraphPlanCache(FLAGS.graph_cache_dir)
+            plan_key = plan_cache.get_key(self.op_handles)
+            if plan_key is None:
+                plan_cache = None
+        if plan_cache and self._load_plan(plan_cache.load(plan_key)):
+            start_time = self._record_startup_timing('load_plan', start_time)
+        else:
+            self._build_refined_op_graph()
+            start_time = self._record_startup_timing('refine', start_time)
+            if plan_cache and plan_cache.store(plan_key, self._get_plan()):
+                start_time = self._record_startup_timing(
+                    'store_plan', start_time)
+        if FLAGS.fuse_operators:
+            self._fuse_op_chains()
+            start_time = self._record_startup_timing('fuse', start_time)
 
         # 2. Initiate backend framework.
         if framework:
             self.framework = framework
         self._init_frameworks()
+        start_time = self._record_startup_timing('init_framework', start_time)
 
-        # 3. Set the execution framework on each operator handle.
+        # 3. Set the execution framework and the progress tracker on each
+        # operator handle.
+        progress_tracker = self._create_progress_tracker()
+        if FLAGS.trace_file:
+            remove_trace_parts(FLAGS.trace_file)
         for op_id, op_handle in self.op_handles.items():
             op_handle.framework = self.framework
+            op_handle.progress_tracker = progress_tracker
+            op_handle.trace_file = FLAGS.trace_file
+            op_handle.trace_sample_rate = FLAGS.trace_sample_rate
 
         # 4. Logging
         if FLAGS.log_graph:
@@ -169,6 +313,9 @@ class Graph(object):
         # 6. Setup the executors.
         for executor in executors:
             executor.setup()
+        if progress_tracker is not None:
+            self._register_progress_endpoints(progress_tracker)
+        start_time = self._record_startup_timing('setup_executors', start_time)
 
         # 7. Construct the graph of dependent operator handles.
         dependent_op_handles = self._build_dependent_op_handles()
@@ -178,6 +325,11 @@ class Graph(object):
             executor.op_handle._build_dependent_op_handles(
                 dependent_op_handles)
             executor.execute()
+        self._record_startup_timing('execute_executors', start_time)
+        logger.info('Graph {} startup timings: {}'.format(
+            self.graph_name,
+            ', '.join('{} {:.3f} s'.format(phase, duration)
+                      for phase, duration in self.startup_timings.items())))
 
         # 9. Keep driver running.
         if self.framework == "ros":
@@ -186,10 +338,47 @@ class Graph(object):
                 procs.append(op_handle.executor_handle)
             for p in procs:
                 p.join()
+            if FLAGS.trace_file:
+                merge_traces(FLAGS.trace_file)
+        elif self.framework == "local":
+            # Operators run in this process. Return once all operators have
+            # finished executing and all messages have been processed.
+            metrics_exporter = self._create_metrics_exporter(
+                get_registry().snapshot)
+            self._local_runtime.start()
+            if not self._local_runtime.wait(timeout):
+                logger.info('Stopping graph {} after {} s'.format(
+                    self.graph_name, timeout))
+            self._local_runtime.shutdown()
+            if metrics_exporter:
+                metrics_exporter.stop()
+            tracer = get_tracer()
+            if tracer is not None:
+                tracer.flush()
+                merge_traces(FLAGS.trace_file)
         else:
+            from erdos.ray.ray_executor import get_ray_metrics
+            self._create_metrics_exporter(
+                lambda: get_ray_metrics(self.op_handles.values()))
             # TODO(yika): FIX! Temporary solution to keep Ray master running.
-            while True:
-                time.sleep(5)
+            try:
+                while True:
+                    time.sleep(5)
+            finally:
+                # The driver runs until it is interrupted (e.g., with
+                # Ctrl-C). Actors write their events periodically, so the
+                # events of their last flush period may be missing.
+                if FLAGS.trace_file:
+                    merge_traces(FLAGS.trace_file)
+
+    def stop(self):
+        """Stops a local graph: `execute` returns once the callbacks that
+        are running complete. Can be called from operators."""
+        if self.framework != 'local' or self._local_runtime is None:
+            raise NotImplementedError(
+                'Only local graphs can be stopped, not {} graphs'.format(
+                    self.framework))
+        self._local_runtime.stop()
 
     def _flatten_subgraphs(self):
         """Set up subgraphs"""
@@ -207,69 +396,284 @@ class Graph(object):
     def _build_refined_op_graph(self):
         """Refines the operator graph.
 
-        Instantiates all data streams connecting operators. Repeatedly calls
-        each operator's `setup_streams` method until the data streams
-        converge.
+        Instantiates all data streams connecting operators. Calls each
+        operator's `setup_streams` method until the data streams converge.
+        Operators are evaluated from a worklist, which initially holds all
+        the operators in topological order. An operator is only evaluated
+        again if the uids of the streams its upstream operators publish on
+        change.
         """
-        not_converged = True
-        while not_converged:
-            not_converged = False
-            # If outputs of setup_streams() change, update output_streams.
-            for op_id, op_handle in self.op_handles.items():
-                current_input_streams = op_handle.input_streams
-                try:
-                    output_streams = op_handle.op_cls.setup_streams(
-                        DataStreams(current_input_streams),
-                        **op_handle.setup_args)
-                    for stream in output_streams:
-                        stream.uid = op_id
-                except TypeError as e:
-                    if len(e.args) > 0 and e.args[0].startswith(
-                            "setup_streams"):
-                        setup_streams_name = "{0}.setup_streams".format(
-                            op_handle.op_cls.__name__)
-                        first_arg = "{0}.{1}".format(op_handle.op_cls.__name__,
-                                                     e.args[0])
-                        e.args = (first_arg, ) + e.args[1:]
-                    raise
-                # Check if the returned output_streams has changed.
-                if self._different_output_streams(op_handle.output_streams,
-                                                  output_streams):
-                    not_converged = True
-                # Update output streams to reset registered sinks. Otherwise,
-                # we may end up with sinks that are added several times.
-                op_handle.output_streams = output_streams
-
-            # Empty input streams in order to ensure that we don't maintain
-            # inputs streams that are removed between iterations.
-            for op_id, op_handle in self.op_handles.items():
-                op_handle.input_streams = []
-            # We do this to break the reference cycle and ensure that the
-            # output data stream object of the upstream operator is different
-            # from the input data stream object of the downstream operator.
-            for op_id, op_handle in self.op_handles.items():
-                # Transform output streams into input streams.
-                for dependant_id in op_handle.dependant_ops:
-                    # Ensure that each operator receives a copy of the output
-                    # streams as input streams. Otherwise, two operators that
-                    # have the same output stream as input will work on a shared
-                    # object. This object will contain the callbacks both
-                    # operators register.
-                    input_streams = [
-                        out_stream._copy_stream()
-                        for out_stream in op_handle.output_streams
-                    ]
-                    self.op_handles[
-                        dependant_id].input_streams += input_streams
-
-        # We must call setup_streams again after convergence to ensure that the
-        # callbacks that are added in setup_streams are added on the latest copy
-        # of the data streams.
-        for op_id, op_handle in self.op_handles.items():
-            op_handle.op_cls.setup_streams(
-                DataStreams(op_handle.input_streams), **op_handle.setup_args)
+        upstream_op_ids = self._get_upstream_op_ids()
+        worklist = deque(self._get_topological_order())
+        queued = set(worklist)
+        # Operators whose input streams are copies of output streams that
+        # were replaced after the operator was last evaluated.
+        stale = set()
+        for op_handle in self.op_handles.values():
+            op_handle.input_streams = []
+        while worklist:
+            op_id = worklist.popleft()
+            queued.discard(op_id)
+            stale.discard(op_id)
+            op_handle = self.op_handles[op_id]
+            op_handle.input_streams = self._copy_input_streams(
+                upstream_op_ids[op_id])
+            output_streams = self._setup_op_streams(op_id, op_handle)
+            changed = self._different_output_streams(op_handle.output_streams,
+                                                     output_streams)
+            op_handle.output_streams = output_streams
+            for dependant_id in op_handle.dependant_ops:
+                stale.add(dependant_id)
+                if changed and dependant_id not in queued:
+                    worklist.append(dependant_id)
+                    queued.add(dependant_id)
+
+        # The callbacks that setup_streams adds must be registered on the
+        # copies of the latest output streams. Operators whose input streams
+        # were copied from the latest output streams already did so.
+        for op_id in self.op_handles:
+            if op_id in stale:
+                op_handle = self.op_handles[op_id]
+                op_handle.input_streams = self._copy_input_streams(
+                    upstream_op_ids[op_id])
+                op_handle.op_cls.setup_streams(
+                    DataStreams(op_handle.input_streams),
+                    **op_handle.setup_args)
+
+        self._assign_stream_ids()
+        self._build_output_stream_sinks_graph()
+        self._build_stream_dependents()
+
+    def _get_plan(self):
+        """Returns the refined graph, which the plan cache stores."""
+        return {
+            'streams': dict((op_id, (
+                detach_callbacks(op_handle.input_streams, op_handle.op_cls),
+                detach_callbacks(op_handle.output_streams, op_handle.op_cls)))
+                            for op_id, op_handle in self.op_handles.items()),
+            'sinks': self.output_stream_to_op_id_sinks,
+            'dependents': self.stream_to_dependent_op_ids,
+        }
+
+    def _load_plan(self, plan):
+        """Sets the streams of the operators from a cached plan.
 
+        Returns:
+            (bool): False if there is no plan matching the operators.
+        """
+        if plan is None or set(plan['streams']) != set(self.op_handles):
+            return False
+        for op_id, op_handle in self.op_handles.items():
+            (op_handle.input_streams,
+             op_handle.output_streams) = plan['streams'][op_id]
+            attach_callbacks(op_handle.input_streams)
+            attach_callbacks(op_handle.output_streams)
+        self.output_stream_to_op_id_sinks = plan['sinks']
+        self.stream_to_dependent_op_ids = plan['dependents']
+        return True
+
+    def _fuse_op_chains(self):
+        """Replaces linear chains of operators by `FusedOp`s.
+
+        An operator is fused with its downstream operator if the latter is
+        the only receiver of all its output streams, and only receives
+        streams from it. Both operators must be placed on the same machine,
+        require the same resources, and only run callbacks (i.e., they do
+        not override execute or on_notify, and do not checkpoint).
+        """
+        upstream_op_ids = self._get_upstream_op_ids()
+        next_op_ids = {}
+        for op_id, op_handle in self.op_handles.items():
+            receivers = set(
+                tuple(self.stream_to_dependent_op_ids.get(stream.uid, []))
+                for stream in op_handle.output_streams)
+            if len(receivers) != 1:
+                continue
+            receiver_ids = receivers.pop()
+            if len(receiver_ids) != 1 or receiver_ids[0] == op_id:
+                continue
+            receiver_id = receiver_ids[0]
+            if (upstream_op_ids[receiver_id] == [op_id] and self._can_fuse(
+                    op_handle, self.op_handles[receiver_id])):
+                next_op_ids[op_id] = receiver_id
+
+        chains = {}
+        fused_op_ids = set(next_op_ids.values())
+        for op_id in self.op_handles:
+            if op_id in next_op_ids and op_id not in fused_op_ids:
+                chain = [op_id]
+                while chain[-1] in next_op_ids:
+                    chain.append(next_op_ids[chain[-1]])
+                chains[op_id] = chain
+        if not chains:
+            return
+
+        # Replace the chains, and keep the insertion order of the operators.
+        fused_id_of = {}
+        op_handles = {}
+        for op_id, op_handle in self.op_handles.items():
+            if op_id in chains:
+                fused_handle = self._create_fused_handle(
+                    [self.op_handles[chain_id] for chain_id in chains[op_id]])
+                fused_id = fused_handle.get_uid()
+                op_handles[fused_id] = fused_handle
+                for chain_id in chains[op_id]:
+                    fused_id_of[chain_id] = fused_id
+            elif op_id not in fused_op_ids:
+                op_handles[op_id] = op_handle
+        for op_handle in op_handles.values():
+            op_handle.dependant_ops = [
+                fused_id_of.get(op_id, op_id)
+                for op_id in op_handle.dependant_ops
+            ]
+        self.op_handles = op_handles
+        self.output_stream_to_op_id_sinks = {}
         self._build_output_stream_sinks_graph()
+        self._build_stream_dependents()
+
+    def _can_fuse(self, op_handle, receiver_handle):
+        # Executors apply the default credits and batch size to every
+        # stream, which fused streams would bypass.
+        if FLAGS.stream_credits > 0 or FLAGS.ray_batch_size > 1:
+            return False
+        for handle in [op_handle, receiver_handle]:
+            if (not handle.fusible or handle.parallelism > 1
+                    or self._checkpoints(handle) or any(
+                        self._overrides(handle.op_cls, method)
+                        for method in ['execute', 'on_notify'])):
+                return False
+        # Fused streams invoke the receiver directly, and thus can neither
+        # queue, discard nor reorder messages.
+        output_stream_uids = set(stream.uid
+                                 for stream in op_handle.output_streams)
+        for stream in receiver_handle.input_streams:
+            if stream.uid in output_stream_uids and any(
+                    label in stream.labels for label in [
+                        QUEUE_POLICY_LABEL, MAX_QUEUE_LABEL, CREDITS_LABEL,
+                        LATENCY_BUDGET_LABEL
+                    ]):
+                return False
+        return (op_handle.machine == receiver_handle.machine
+                and op_handle.resources == receiver_handle.resources)
+
+    def _checkpoints(self, op_handle):
+        """Returns whether the operator checkpoints, either because its
+        init args enable it, or because its constructor does by default."""
+        if 'checkpoint_enable' in op_handle.init_args:
+            return bool(op_handle.init_args['checkpoint_enable'])
+        init = op_handle.op_cls.__init__
+        try:
+            parameter = inspect.signature(init).parameters.get(
+                'checkpoint_enable')
+            default = (None if parameter is None or parameter.default
+                       is parameter.empty else parameter.default)
+        except AttributeError:
+            # Python 2 has no inspect.signature.
+            spec = inspect.getargspec(init)
+            defaults = spec.defaults or ()
+            default = dict(
+                zip(spec.args[len(spec.args) - len(defaults):],
+                    defaults)).get('checkpoint_enable')
+        return bool(default)
+
+    def _create_fused_handle(self, chain_handles):
+        head = chain_handles[0]
+        tail = chain_handles[-1]
+        fused_handle = OpHandle('{}_fused'.format(head.name),
+                                FusedOp, {'op_handles': chain_handles}, {},
+                                head.graph_name,
+                                machine=head.machine,
+                                resources=head.resources)
+        # The executor delivers the messages of the chain's input streams to
+        # the fused operator, which dispatches them to the head's callbacks.
+        for stream in head.input_streams:
+            fused_stream = stream._copy_stream()
+            fused_stream.callbacks = set([FusedOp.on_fused_msg])
+            fused_stream.completion_callbacks = set(
+                [FusedOp.on_fused_watermark])
+            fused_handle.input_streams.append(fused_stream)
+        fused_handle.output_streams = tail.output_streams
+        fused_handle.dependant_ops = tail.dependant_ops
+        return fused_handle
+
+    def _record_startup_timing(self, phase, start_time):
+        """Records the duration of a startup phase, and returns the current
+        time."""
+        now = time.time()
+        self.startup_timings[phase] = now - start_time
+        return now
+
+    def _assign_stream_ids(self):
+        """Assigns a small integer id to each stream, which messages carry
+        instead of the stream name."""
+        stream_ids = {}
+        for op_handle in self.op_handles.values():
+            for stream in op_handle.output_streams:
+                stream.id = stream_ids.setdefault(stream.uid, len(stream_ids))
+        for op_handle in self.op_handles.values():
+            for stream in op_handle.input_streams:
+                stream.id = stream_ids[stream.uid]
+
+    def _setup_op_streams(self, op_id, op_handle):
+        """Calls the setup_streams method of an operator on its input
+        streams, and returns the output streams."""
+        try:
+            output_streams = op_handle.op_cls.setup_streams(
+                DataStreams(op_handle.input_streams), **op_handle.setup_args)
+            for stream in output_streams:
+                stream.uid = op_id
+        except TypeError as e:
+            if len(e.args) > 0 and e.args[0].startswith("setup_streams"):
+                first_arg = "{0}.{1}".format(op_handle.op_cls.__name__,
+                                             e.args[0])
+                e.args = (first_arg, ) + e.args[1:]
+            raise
+        return output_streams
+
+    def _copy_input_streams(self, upstream_op_ids):
+        """Returns copies of the output streams of the upstream operators.
+
+        Each operator receives copies of the output streams as input
+        streams. Otherwise, two operators that have the same output stream as
+        input would work on a shared object, which would contain the
+        callbacks both operators register.
+        """
+        return [
+            out_stream._copy_stream() for upstream_id in upstream_op_ids
+            for out_stream in self.op_handles[upstream_id].output_streams
+        ]
+
+    def _get_upstream_op_ids(self):
+        """Returns a dict mapping each operator id to the ids of the
+        operators it receives streams from."""
+        upstream_op_ids = dict((op_id, []) for op_id in self.op_handles)
+        for op_id, op_handle in self.op_handles.items():
+            for dependant_id in op_handle.dependant_ops:
+                upstream_op_ids[dependant_id].append(op_id)
+        return upstream_op_ids
+
+    def _get_topological_order(self):
+        """Returns the operator ids in topological order. Operators that are
+        part of cycles follow in insertion order."""
+        in_degree = dict((op_id, 0) for op_id in self.op_handles)
+        for op_handle in self.op_handles.values():
+            for dependant_id in op_handle.dependant_ops:
+                in_degree[dependant_id] += 1
+        ready = deque(op_id for op_id, degree in in_degree.items()
+                      if degree == 0)
+        order = []
+        while ready:
+            op_id = ready.popleft()
+            order.append(op_id)
+            for dependant_id in self.op_handles[op_id].dependant_ops:
+                in_degree[dependant_id] -= 1
+                if in_degree[dependant_id] == 0:
+                    ready.append(dependant_id)
+        if len(order) < len(self.op_handles):
+            ordered = set(order)
+            order.extend(op_id for op_id in self.op_handles
+                         if op_id not in ordered)
+        return order
 
     def _build_output_stream_sinks_graph(self):
         # Create sink graph using only op names
@@ -281,16 +685,20 @@ class Graph(object):
                 sinks.append(op_id)
                 self.output_stream_to_op_id_sinks[stream.uid] = sinks
 
-    def _build_dependent_op_handles(self):
-        dependent_op_handles = {}
+    def _build_stream_dependents(self):
+        self.stream_to_dependent_op_ids = {}
         for op_id, op_handle in self.op_handles.items():
             for stream in op_handle.input_streams:
-                exec_handles = dependent_op_handles.get(stream.uid, set([]))
-                exec_handles.add(op_handle.executor_handle)
-                dependent_op_handles[stream.uid] = exec_handles
-        for stream_name, handles in dependent_op_handles.items():
-            dependent_op_handles[stream_name] = list(handles)
-        return dependent_op_handles
+                op_ids = self.stream_to_dependent_op_ids.setdefault(
+                    stream.uid, [])
+                if op_id not in op_ids:
+                    op_ids.append(op_id)
+
+    def _build_dependent_op_handles(self):
+        return dict(
+            (stream_uid,
+             [self.op_handles[op_id].executor_handle for op_id in op_ids])
+            for stream_uid, op_ids in self.stream_to_dependent_op_ids.items())
 
     def _different_output_streams(self, output_stream1, output_stream2):
         if len(output_stream1) != len(output_stream2):
@@ -334,16 +742,82 @@ class Graph(object):
                 time.sleep(2)
         elif self.framework == "ray":
             self._init_ray()
+        elif self.framework == "local":
+            self._local_runtime = LocalRuntime(FLAGS.local_num_workers,
+                                               FLAGS.local_mailbox_size)
+
+    def _create_metrics_exporter(self, snapshot_fn):
+        """Starts exporting the metrics of the operators, if enabled."""
+        if not FLAGS.metrics_file and not FLAGS.metrics_port:
+            return None
+        metrics_exporter = MetricsExporter(snapshot_fn,
+                                           file_path=FLAGS.metrics_file
+                                           or None,
+                                           port=FLAGS.metrics_port or None,
+                                           period=FLAGS.metrics_export_period)
+        metrics_exporter.start()
+        return metrics_exporter
 
     def _init_ray(self):
         import ray
         if FLAGS.ray_redis_address == '':
-            ray.init()
+            ray.init(local_mode=FLAGS.ray_local_mode)
         else:
-            ray.init(
-                redis_address=FLAGS.ray_redis_address)
+            ray.init(redis_address=FLAGS.ray_redis_address,
+                     local_mode=FLAGS.ray_local_mode)
             time.sleep(2)
 
+    def _create_progress_tracker(self):
+        """Creates the tracker which delivers notifications to operators.
+
+        The tracker is only created if an operator overrides `on_notify`,
+        because the operators otherwise need not report their progress.
+
+        Raises:
+            NotImplementedError: If an operator overrides `on_notify` on
+                ROS, which does not support notifications.
+        """
+        notified_ops = [
+            op_handle.name for op_handle in self.op_handles.values()
+            if self._overrides(op_handle.op_cls, 'on_notify')
+        ]
+        if not notified_ops:
+            return None
+        if self.framework == 'ray':
+            from erdos.ray.ray_progress_tracker import RayProgressTracker
+            return RayProgressTracker.remote()
+        elif self.framework == 'local':
+            return LocalProgressTracker()
+        raise NotImplementedError(
+            'Operators {} override on_notify, but notifications are only '
+            'supported on Ray and local graphs'.format(', '.join(
+                sorted(notified_ops))))
+
+    def _overrides(self, op_cls, method_name):
+        return any(method_name in vars(cls) for cls in op_cls.__mro__
+                   if cls is not Op)
+
+    def _register_progress_endpoints(self, progress_tracker):
+        """Registers the executor handles as notification endpoints.
+
+        Operators that do not receive watermarks never complete a timestamp,
+        and thus must not hold back the frontier.
+        """
+        for op_handle in self.op_handles.values():
+            tracks_progress = any(
+                stream.labels.get('no_watermark', 'false') != 'true'
+                for stream in op_handle.input_streams)
+            if self.framework == 'ray':
+                import ray
+                ray.get(
+                    progress_tracker.register_endpoint.remote(
+                        op_handle.name, op_handle.executor_handle,
+                        tracks_progress))
+            else:
+                progress_tracker.register_endpoint(op_handle.name,
+                                                   op_handle.executor_handle,
+                                                   tracks_progress)
+
     def _create_executors(self):
         visited = set([])
         executors = []
@@ -380,7 +854,7 @@ class Graph(object):
             ray_executor = RayExecutor(op_handle)
             return ray_executor
         elif self.framework == 'local':
-            return LocalExecutor(op_handle.name)
+            return LocalExecutor(op_handle, self._local_runtime)
         else:
             raise Exception('Unexpected framework {}'.format(self.framework))
 
@@ -25,7 +25,7 @@ class GraphHandle(object):
         self.dependant_ops = []  # handle ids of dependant ops
         self.dependent_op_handles = {}
         self.executor_handle = None
-        self.progress_tracker = None  # Unused now
+        self.progress_tracker = None
         # Set up input and output ops
 
     def get_uid(self):
@@ -0,0 +1,219 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import hashlib
+import inspect
+import logging
+import numbers
+import os
+import pickle
+import sys
+
+import erdos
+from erdos.utils import write_atomically
+
+logger = logging.getLogger(__name__)
+
+# Bump the version whenever the contents of the plan change.
+PLAN_VERSION = 2
+
+
+class GraphPlanCache(object):
+    """On-disk cache of refined execution graphs.
+
+    A plan holds the streams of each operator once the graph has converged,
+    and the maps derived from them. Plans are keyed by a hash of the ERDOS
+    and plan versions, and of the graph definition: the operator ids in
+    insertion order, their classes, the source of their classes and base
+    classes, their setup arguments, and the operators they are connected
+    to. Graphs whose setup arguments have no stable representation (e.g.,
+    objects whose repr holds their memory address) are not cached.
+
+    Attributes:
+        cache_dir (str): Directory in which the plans are stored.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def get_key(self, op_handles):
+        """Returns the key of the graph made of the given operator handles.
+
+        Args:
+            op_handles (dict of str -> OpHandle): The flattened operator
+                handles of the graph.
+
+        Returns:
+            (str): The key, or None if the graph must not be cached.
+        """
+        digest = hashlib.sha1()
+        digest.update('{}:{}:{}'.format(erdos.__version__, PLAN_VERSION,
+                                        sys.version_info[:2]).encode('utf-8'))
+        sources = {}
+        for op_id, op_handle in op_handles.items():
+            op_cls = op_handle.op_cls
+            try:
+                setup_args = _stable_repr(op_handle.setup_args)
+            except ValueError as e:
+                logger.info('Not caching the graph plan, because the setup '
+                            'arguments of {} have no stable representation: '
+                            '{}'.format(op_id, e))
+                return None
+            definition = (op_id, op_cls.__module__,
+                          getattr(op_cls, '__qualname__', op_cls.__name__),
+                          setup_args, op_handle.dependant_ops)
+            digest.update(repr(definition).encode('utf-8'))
+            # Base classes may define setup_streams or the callbacks.
+            for cls in inspect.getmro(op_cls):
+                if cls not in sources:
+                    sources[cls] = _get_source(cls).encode('utf-8')
+                digest.update(sources[cls])
+        return digest.hexdigest()
+
+    def load(self, key):
+        """Returns the plan stored under key, or None if there is none."""
+        path = self._get_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                (version, plan) = pickle.load(f)
+        except Exception:
+            logger.warning('Could not load graph plan {}'.format(path),
+                           exc_info=True)
+            return None
+        if version != PLAN_VERSION:
+            return None
+        return plan
+
+    def store(self, key, plan):
+        """Stores a plan under key.
+
+        Returns:
+            (bool): False if the plan could not be serialized (e.g., the
+            streams have callbacks that cannot be pickled).
+        """
+        try:
+            data = pickle.dumps((PLAN_VERSION, plan), pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.info('Not caching the graph plan: {}'.format(e))
+            return False
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        # Concurrent runs never read a partial plan.
+        write_atomically(self._get_path(key), data, 'wb')
+        return True
+
+    def _get_path(self, key):
+        return os.path.join(self.cache_dir, 'plan-{}.pkl'.format(key))
+
+
+class CallbackRef(object):
+    """Reference to a callback method of an operator class.
+
+    Plans store references instead of the callbacks, because unbound methods
+    cannot be pickled on Python 2.
+
+    Attributes:
+        op_cls (type): The class defining the callback.
+        name (str): The name of the callback method.
+    """
+
+    __slots__ = ('op_cls', 'name')
+
+    def __init__(self, op_cls, name):
+        self.op_cls = op_cls
+        self.name = name
+
+    def __getstate__(self):
+        return (self.op_cls, self.name)
+
+    def __setstate__(self, state):
+        (self.op_cls, self.name) = state
+
+    def resolve(self):
+        """Returns the callback method."""
+        return getattr(self.op_cls, self.name)
+
+
+def detach_callbacks(streams, op_cls):
+    """Returns copies of streams whose callbacks that are methods of op_cls
+    are replaced by `CallbackRef`s."""
+    detached_streams = []
+    for stream in streams:
+        stream = copy.copy(stream)
+        stream.callbacks = set(
+            _get_callback_ref(callback, op_cls)
+            for callback in stream.callbacks)
+        stream.completion_callbacks = set(
+            _get_callback_ref(callback, op_cls)
+            for callback in stream.completion_callbacks)
+        detached_streams.append(stream)
+    return detached_streams
+
+
+def attach_callbacks(streams):
+    """Replaces the `CallbackRef`s of loaded streams by the callbacks."""
+    for stream in streams:
+        stream.callbacks = set(
+            _resolve(callback) for callback in stream.callbacks)
+        stream.completion_callbacks = set(
+            _resolve(callback) for callback in stream.completion_callbacks)
+
+
+def _get_callback_ref(callback, op_cls):
+    # Python 2 unbound methods know their class.
+    cls = getattr(callback, 'im_class', op_cls)
+    name = getattr(callback, '__name__', None)
+    if name is not None and _get_function(getattr(
+            cls, name, None)) is _get_function(callback):
+        return CallbackRef(cls, name)
+    # Other callbacks (e.g., functions) are pickled.
+    return callback
+
+
+def _get_function(method):
+    return getattr(method, '__func__', method)
+
+
+def _resolve(callback):
+    if isinstance(callback, CallbackRef):
+        return callback.resolve()
+    return callback
+
+
+def _stable_repr(value):
+    """Returns a representation of value that is the same in every process.
+
+    Raises:
+        ValueError: If value is not made of numbers, strings, containers,
+            classes and module-level functions.
+    """
+    if value is None or isinstance(value, (numbers.Number, bytes, type(u''))):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        return '{}[{}]'.format(
+            type(value).__name__,
+            ', '.join(_stable_repr(item) for item in value))
+    if isinstance(value, (set, frozenset)):
+        return '{}[{}]'.format(
+            type(value).__name__,
+            ', '.join(sorted(_stable_repr(item) for item in value)))
+    if isinstance(value, dict):
+        return 'dict[{}]'.format(', '.join(
+            sorted('{}: {}'.format(_stable_repr(key), _stable_repr(item))
+                   for key, item in value.items())))
+    if inspect.isclass(value) or inspect.isfunction(value):
+        name = getattr(value, '__qualname__', value.__name__)
+        if '<' not in name:
+            return '{}.{}'.format(value.__module__, name)
+    raise ValueError('{!r} has no stable representation'.format(value))
+
+
+def _get_source(obj):
+    try:
+        return inspect.getsource(obj)
+    except (IOError, TypeError):
+        return ''
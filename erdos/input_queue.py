@@ -0,0 +1,143 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+from collections import deque
+
+# Label selecting how an input stream discards stale messages.
+QUEUE_POLICY_LABEL = 'queue_policy'
+# Label bounding the number of data messages queued by the drop_oldest
+# policy.
+MAX_QUEUE_LABEL = 'max_queue'
+# Label setting the sampling rate of the every_nth policy.
+NTH_LABEL = 'nth'
+
+# Only the most recent data message is kept.
+LATEST = 'latest'
+# Up to max_queue data messages are kept, and the oldest is dropped once
+# the queue is full.
+DROP_OLDEST = 'drop_oldest'
+# One in nth data messages is kept.
+EVERY_NTH = 'every_nth'
+POLICIES = (LATEST, DROP_OLDEST, EVERY_NTH)
+
+
+class InputQueue(object):
+    """Queue of the messages an operator received on an input stream, but
+    has not processed yet.
+
+    The queue discards stale data messages according to the stream's policy
+    before the callbacks run. Watermarks are never discarded, and stay
+    ordered with respect to the data messages.
+
+    Attributes:
+        policy (str): Either latest, drop_oldest or every_nth.
+        max_queue (int): Maximum number of queued data messages, except for
+            the every_nth policy which does not bound the queue.
+        nth (int): The every_nth policy keeps one in nth messages.
+        num_received (int): Number of data messages received.
+        num_dropped (int): Number of data messages discarded.
+    """
+
+    def __init__(self, policy=DROP_OLDEST, max_queue=1, nth=1):
+        if policy not in POLICIES:
+            raise ValueError('Unexpected queue policy {}'.format(policy))
+        assert max_queue > 0 and nth > 0
+        self.policy = policy
+        self.max_queue = 1 if policy == LATEST else max_queue
+        self.nth = nth
+        self.num_received = 0
+        self.num_dropped = 0
+        # Deque of (item, is_watermark) tuples.
+        self._items = deque()
+        self._num_data_items = 0
+        self._num_drains = 0
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_labels(cls, labels):
+        """Returns a queue for a stream, or None if the stream does not have
+        a queue policy."""
+        if QUEUE_POLICY_LABEL not in labels and MAX_QUEUE_LABEL not in labels:
+            return None
+        return cls(labels.get(QUEUE_POLICY_LABEL, DROP_OLDEST),
+                   int(labels.get(MAX_QUEUE_LABEL, '1')),
+                   int(labels.get(NTH_LABEL, '1')))
+
+    def put(self, item, is_watermark=False):
+        """Queues a received message.
+
+        Returns:
+            (list): The data items that were discarded.
+        """
+        with self._cond:
+            dropped = []
+            if is_watermark:
+                self._items.append((item, True))
+            else:
+                self.num_received += 1
+                if self.policy == EVERY_NTH:
+                    if (self.num_received - 1) % self.nth != 0:
+                        self.num_dropped += 1
+                        return [item]
+                elif self._num_data_items >= self.max_queue:
+                    dropped.append(self._remove_oldest_data_item())
+                self._items.append((item, False))
+                self._num_data_items += 1
+            self._cond.notify()
+            return dropped
+
+    def pop(self, block=False):
+        """Returns the oldest (item, is_watermark) tuple, or None if the
+        queue is empty and block is False."""
+        with self._cond:
+            while not self._items:
+                if not block:
+                    return None
+                self._cond.wait()
+            (item, is_watermark) = self._items.popleft()
+            if not is_watermark:
+                self._num_data_items -= 1
+            return (item, is_watermark)
+
+    def schedule_drain(self):
+        """Executors that dispatch messages from a queue of tasks schedule
+        a drain task after each put. Drains are only scheduled if there are
+        more queued items than scheduled drains, so that the task queue does
+        not fill up with drains of messages that were discarded.
+
+        Returns:
+            (bool): True if the caller must schedule a drain task.
+        """
+        with self._cond:
+            if len(self._items) > self._num_drains:
+                self._num_drains += 1
+                return True
+            return False
+
+    def drain(self):
+        """Pops the oldest item in a scheduled drain task.
+
+        Returns:
+            (tuple): The (item, is_watermark) tuple, or None.
+        """
+        with self._cond:
+            self._num_drains -= 1
+        return self.pop()
+
+    def get_stats(self):
+        with self._cond:
+            return {
+                'received': self.num_received,
+                'dropped': self.num_dropped,
+                'queued': len(self._items),
+            }
+
+    def _remove_oldest_data_item(self):
+        for index, (item, is_watermark) in enumerate(self._items):
+            if not is_watermark:
+                del self._items[index]
+                self._num_data_items -= 1
+                self.num_dropped += 1
+                return item
@@ -1,7 +1,45 @@
-class LocalExecutor(object):
-    def __init__(self, op_name):
-        self.op_name = op_name
+import logging
+from absl import flags
+
+from erdos.credits import BACKPRESSURE_LABEL
+from erdos.credits import CREDITS_LABEL
+from erdos.executor import Executor
+from erdos.local.local_operator import LocalOperator
+
+FLAGS = flags.FLAGS
+
+logger = logging.getLogger(__name__)
+
+
+class LocalExecutor(Executor):
+    """Helper class to execute operators in the driver process.
+
+    Attributes:
+        runtime (LocalRuntime): The runtime which dispatches the callbacks of
+            the operators.
+    """
+
+    def __init__(self, op_handle, runtime):
+        super(LocalExecutor, self).__init__(op_handle)
+        self.runtime = runtime
+
+    def setup(self):
+        if FLAGS.stream_credits > 0:
+            for stream in self.op_handle.output_streams:
+                stream.labels.setdefault(CREDITS_LABEL,
+                                         str(FLAGS.stream_credits))
+                stream.labels.setdefault(BACKPRESSURE_LABEL,
+                                         FLAGS.stream_backpressure)
+        # Create the local actor wrapping the ERDOS operator.
+        self.op_handle.executor_handle = LocalOperator(self.op_handle,
+                                                       self.runtime)
 
     def execute(self):
-        # TODO(ionel): Implement!
-        pass
+        """Execute local operator."""
+        # Setup the input/output streams of the ERDOS operator.
+        self.op_handle.executor_handle.setup_streams(
+            self.op_handle.dependent_op_handles)
+        # The runtime runs the operator in its own thread once all the
+        # operators are set up.
+        logger.info('Executing {}'.format(self.op_handle.name))
+        self.runtime.submit(self.op_handle.executor_handle)
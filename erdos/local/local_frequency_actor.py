@@ -0,0 +1,33 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from erdos.periodic_scheduler import CATCH_UP, PeriodicTask
+from erdos.periodic_scheduler import get_periodic_scheduler
+
+
+class LocalFrequencyActor(object):
+    """Triggers the periodic methods of a local operator.
+
+    The ticks are fired by the periodic scheduler of the process, which
+    queues runs of the methods in the operator's mailbox. Hence, periodic
+    methods do not run concurrently with the operator's callbacks.
+    """
+
+    def __init__(self, local_op, runtime):
+        self._local_op = local_op
+        self._runtime = runtime
+
+    def set_frequency(self, rate, func, overrun=CATCH_UP):
+        task = PeriodicTask(func.__name__, rate, func, self._dispatch, overrun)
+        self._local_op._op.periodic_tasks[task.name] = task
+        self._runtime._periodic_task_added()
+        get_periodic_scheduler().add_task(task)
+
+    def _dispatch(self, task, scheduled_time):
+        if self._runtime.is_shutdown():
+            if not task._removed:
+                get_periodic_scheduler().remove_task(task)
+                self._runtime._periodic_task_done()
+            return
+        self._local_op.on_frequency(task, scheduled_time)
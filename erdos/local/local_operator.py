@@ -0,0 +1,344 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import logging
+import threading
+import time
+from collections import deque
+from functools import partial
+
+from erdos.deadline_queue import DeadlineQueue, get_latency_budgets
+from erdos.local.local_frequency_actor import LocalFrequencyActor
+from erdos.local.local_input_data_stream import LocalInputDataStream
+from erdos.local.local_output_data_stream import LocalOutputDataStream
+from erdos.message import WatermarkMessage
+from erdos.metrics import CallbackMetrics, get_registry
+from erdos.parallel_callbacks import ParallelCallbackRunner
+from erdos.tracing import configure_tracing, get_op_tracer
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of messages a worker dispatches to an operator before it
+# yields to other ready operators.
+DISPATCH_BATCH_SIZE = 64
+
+
+class LocalOperator(object):
+    """In-process actor used to wrap ERDOS operators.
+
+    Messages, watermarks, and periodic tasks destined to the operator are
+    queued in a mailbox, and are dispatched in order by the worker threads of
+    the `LocalRuntime`.
+
+       Attributes:
+           _op: The ERDOS operator, which the actor wraps.
+           _callbacks: A dict storing the callbacks associated to each stream.
+           _mailbox: Queue of (method, argument) tuples to dispatch. If input
+               streams have latency budgets, the queue is a DeadlineQueue
+               with a lane per input stream.
+    """
+
+    def __init__(self, op_handle, runtime):
+        configure_tracing(op_handle.trace_file, op_handle.trace_sample_rate)
+        # Init ERDOS operator.
+        try:
+            self._op = op_handle.op_cls(op_handle.name, **op_handle.init_args)
+            self._op.framework = op_handle.framework
+        except TypeError as e:
+            if len(e.args) > 0 and e.args[0].startswith("__init__"):
+                first_arg = "{0}.{1}".format(op_handle.op_cls.__name__,
+                                             e.args[0])
+                e.args = (first_arg, ) + e.args[1:]
+            raise
+        self._op.freq_actor = LocalFrequencyActor(self, runtime)
+        self._op.progress_tracker = op_handle.progress_tracker
+        self.name = op_handle.name
+        self._input_streams = op_handle.input_streams
+        self._output_streams = op_handle.output_streams
+        self._runtime = runtime
+        self._callbacks = {}
+        self._completion_callbacks = {}
+        self._input_queues = {}
+        self._stream_names = dict((input_stream.uid, input_stream.name)
+                                  for input_stream in self._input_streams)
+        self._callback_metrics = CallbackMetrics(self.name)
+        self._mailbox_depth = get_registry().gauge('erdos_mailbox_depth',
+                                                   op=self.name)
+        self._tracer = get_op_tracer(self.name)
+        latency_budgets = get_latency_budgets(self._input_streams)
+        self._edf = bool(latency_budgets)
+        if self._edf:
+            self._mailbox = DeadlineQueue(latency_budgets)
+        else:
+            self._mailbox = deque()
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._scheduled = False
+        # Runs the callbacks for different timestamps concurrently, if the
+        # operator's parallelism is greater than one.
+        self._parallel_runner = None
+        if op_handle.parallelism > 1:
+            self._parallel_runner = ParallelCallbackRunner(
+                self.name, op_handle.parallelism, runtime._task_added,
+                self._parallel_work_done)
+
+    def on_msg(self, msg, credit_gate=None):
+        """Queues a message for the callbacks of stream msg.stream_uid.
+
+        Args:
+            msg (Message): The message.
+            credit_gate (CreditGate): The gate whose credit the message
+                consumed, if the stream uses flow control. The credit is
+                released once the callbacks ran, or once the message is
+                discarded.
+        """
+        if self._tracer:
+            self._tracer.instant('receive', msg)
+        input_queue = self._input_queues.get(msg.stream_uid)
+        if input_queue is not None:
+            for (_, dropped_credit_gate) in input_queue.put(
+                (msg, credit_gate)):
+                if dropped_credit_gate is not None:
+                    dropped_credit_gate.release()
+            if input_queue.schedule_drain():
+                self._enqueue(self._on_queued_msg,
+                              input_queue,
+                              lane=msg.stream_uid)
+        elif credit_gate is None:
+            self._enqueue(self._on_msg, msg, lane=msg.stream_uid)
+        else:
+            self._enqueue(self._on_credited_msg, (msg, credit_gate),
+                          lane=msg.stream_uid)
+
+    def on_completion_msg(self, msg):
+        """Queues a watermark for the stream msg.stream_uid."""
+        if self._tracer:
+            self._tracer.instant('receive watermark', msg)
+        input_queue = self._input_queues.get(msg.stream_uid)
+        if input_queue is not None:
+            input_queue.put((msg, None), is_watermark=True)
+            if input_queue.schedule_drain():
+                self._enqueue(self._on_queued_msg,
+                              input_queue,
+                              lane=msg.stream_uid)
+        else:
+            self._enqueue(self._on_completion_msg, msg, lane=msg.stream_uid)
+
+    def on_frequency(self, task, scheduled_time):
+        """Queues a run of a periodic task."""
+        # The scheduler thread must not wait for space in the mailbox,
+        # because it fires the ticks of all the operators. The scheduler
+        # dispatches at most one unfinished run per task instead.
+        self._enqueue(self._on_frequency, (task, scheduled_time), block=False)
+
+    def on_notify_batch(self, timestamps):
+        """Queues notifications for completed timestamps."""
+        self._enqueue(self._on_notify_batch, timestamps)
+
+    def get_periodic_task_stats(self):
+        """Returns the run counters and jitter histograms of the periodic
+        methods."""
+        return dict((name, task.get_stats())
+                    for name, task in self._op.periodic_tasks.items())
+
+    def get_input_stream_stats(self):
+        """Returns the number of messages received and discarded on every
+        input stream that has a queue policy."""
+        return dict((input_stream.name,
+                     self._input_queues[input_stream.uid].get_stats())
+                    for input_stream in self._op.input_streams
+                    if input_stream.uid in self._input_queues)
+
+    def get_output_stream_stats(self):
+        """Returns the flow control counters of every output stream."""
+        return {
+            name: {
+                'credits': stream.get_credit_stats()
+            }
+            for name, stream in self._op.output_streams.items()
+        }
+
+    def may_block_sender(self):
+        """Returns True if the calling thread may wait for the operator to
+        process messages."""
+        return not self._runtime.is_worker_thread()
+
+    def register_callback(self, stream_uid, callback):
+        """Registers a callback for a given stream."""
+        cbs = self._callbacks.get(stream_uid, [])
+        self._callbacks[stream_uid] = cbs + [callback]
+
+    def register_input_queue(self, stream_uid, input_queue):
+        """Registers the queue which discards stale messages of a stream."""
+        self._input_queues[stream_uid] = input_queue
+
+    def register_completion_callback(self, stream_uid, callback):
+        """Registers a watermark completion callback for a given stream."""
+        cbs = self._completion_callbacks.get(stream_uid, [])
+        self._completion_callbacks[stream_uid] = cbs + [callback]
+
+    def setup_streams(self, dependant_op_handles):
+        """Wraps the operator streams in local data streams."""
+        local_input_streams = [
+            LocalInputDataStream(self, input_stream)
+            for input_stream in self._input_streams
+        ]
+        self._op._add_input_streams(local_input_streams)
+        local_output_streams = [
+            LocalOutputDataStream(
+                self._op, dependant_op_handles.get(output_stream.uid, []),
+                output_stream) for output_stream in self._output_streams
+        ]
+        self._op._add_output_streams(local_output_streams)
+        self._op._internal_setup_streams()
+        if self._parallel_runner is not None:
+            self._parallel_runner.resequence_output_streams(self._op)
+
+    def execute(self):
+        """Executes the operator."""
+        self._op.execute()
+
+    def _enqueue(self, method, arg, block=True, lane=None):
+        self._runtime._task_added()
+        # Only threads that are not owned by the runtime wait for space in
+        # the mailbox. Blocking a worker could deadlock the runtime because
+        # the receiver may need the same worker to drain its mailbox.
+        must_wait = (block and self._runtime.mailbox_size > 0
+                     and not self._runtime.is_worker_thread())
+        with self._lock:
+            while (must_wait
+                   and len(self._mailbox) >= self._runtime.mailbox_size):
+                self._not_full.wait()
+            if self._edf:
+                self._mailbox.append((method, arg), lane)
+            else:
+                self._mailbox.append((method, arg))
+            self._mailbox_depth.set(len(self._mailbox))
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._runtime.schedule(self)
+
+    def _dispatch_batch(self):
+        """Invoked by a runtime worker to dispatch queued messages."""
+        for _ in range(DISPATCH_BATCH_SIZE):
+            with self._lock:
+                if not self._mailbox:
+                    self._scheduled = False
+                    return
+                (method, arg) = self._mailbox.popleft()
+                self._mailbox_depth.set(len(self._mailbox))
+                self._not_full.notify()
+            try:
+                method(arg)
+            except Exception:
+                logger.exception('Operator {} failed to process {}'.format(
+                    self.name, arg))
+            finally:
+                self._runtime._task_done()
+        # Yield the worker to other operators, and continue later.
+        self._runtime.schedule(self)
+
+    def _on_msg(self, msg, credit_gate=None):
+        """Invokes corresponding callbacks for stream msg.stream_uid, and
+        then releases the message's credit."""
+        self._op.log_event(time.time(), msg.timestamp,
+                           'receive {}'.format(msg.stream_name))
+        if self._tracer:
+            self._tracer.instant('dequeue', msg)
+        if self._parallel_runner is None or msg.timestamp is None:
+            self._run_callbacks(msg, credit_gate)
+        else:
+            self._parallel_runner.submit(
+                msg.timestamp, partial(self._run_callbacks, msg, credit_gate))
+
+    def _run_callbacks(self, msg, credit_gate=None):
+        start_time = time.time()
+        try:
+            for cb in self._callbacks.get(msg.stream_uid, []):
+                cb(self._op, msg)
+        finally:
+            # Credits bound the messages whose callbacks have not completed.
+            if credit_gate is not None:
+                credit_gate.release()
+        self._callback_metrics.record(msg.stream_name,
+                                      time.time() - start_time)
+        if self._tracer:
+            self._tracer.span('callback', msg, start_time)
+
+    def _on_credited_msg(self, credited_msg):
+        (msg, credit_gate) = credited_msg
+        self._on_msg(msg, credit_gate)
+
+    def _on_queued_msg(self, input_queue):
+        """Dispatches the oldest message in an input queue."""
+        item = input_queue.drain()
+        if item is None:
+            return
+        ((msg, credit_gate), is_watermark) = item
+        if is_watermark:
+            self._on_completion_msg(msg)
+        elif credit_gate is None:
+            self._on_msg(msg)
+        else:
+            self._on_credited_msg((msg, credit_gate))
+
+    def _on_completion_msg(self, msg):
+        """Invokes corresponding completion callbacks once all the input
+        streams have reached the watermark."""
+        self._op.log_event(time.time(), msg.timestamp,
+                           'receive watermark {}'.format(msg.stream_name))
+        if self._tracer:
+            self._tracer.instant('dequeue watermark', msg)
+        # Flow the watermark only if it advances the low watermark across
+        # all the input streams.
+        new_msg = self._op._receive_watermark(msg)
+        if new_msg is None:
+            return
+        new_msg.stream_uid = msg.stream_uid
+        if self._parallel_runner is None:
+            self._on_low_watermark(new_msg)
+        else:
+            # The completion callbacks wait for the callbacks of earlier
+            # timestamps to finish.
+            self._parallel_runner.submit_watermark(
+                new_msg.timestamp, partial(self._on_low_watermark, new_msg))
+
+    def _on_low_watermark(self, new_msg):
+        # Call the required callbacks.
+        completion_callbacks = self._completion_callbacks.get(
+            new_msg.stream_uid, [])
+        start_time = time.time()
+        for cb in completion_callbacks:
+            cb(self._op, new_msg)
+        if completion_callbacks:
+            self._callback_metrics.record(self._stream_names.get(
+                new_msg.stream_uid),
+                                          time.time() - start_time,
+                                          completion=True)
+            if self._tracer:
+                self._tracer.span('completion callback', new_msg, start_time,
+                                  self._stream_names.get(new_msg.stream_uid))
+
+        # If no completion callbacks are found, let the watermarks flow
+        # automatically. If there is a completion callback, let the
+        # developer flow the watermarks.
+        if not completion_callbacks:
+            for output_stream in self._op.output_streams.values():
+                output_stream.send(WatermarkMessage(new_msg.timestamp))
+        self._op._complete_timestamp(new_msg.timestamp)
+
+    def _parallel_work_done(self, num_works):
+        for _ in range(num_works):
+            self._runtime._task_done()
+
+    def _on_notify_batch(self, timestamps):
+        """Notifies the operator of completed timestamps, in order."""
+        for timestamp in timestamps:
+            self._op.on_notify(timestamp)
+
+    def _on_frequency(self, periodic_run):
+        """Runs a periodic method of the operator."""
+        (task, scheduled_time) = periodic_run
+        task.run(scheduled_time)
@@ -0,0 +1,98 @@
+import copy
+import time
+
+from erdos.credits import BLOCK
+from erdos.credits import create_credit_gates
+from erdos.data_stream import DataStream
+from erdos.message import WatermarkMessage
+from erdos.metrics import SendMetrics
+from erdos.tracing import get_op_tracer
+
+
+class LocalOutputDataStream(DataStream):
+    """Local data stream on which an operator publishes.
+
+    Streams with a `credits` label bound the number of messages each sink
+    operator has queued or is processing. Once a sink has no credits left,
+    the `backpressure` label decides whether the sender blocks, drops the
+    message, or coalesces it with later messages. Runtime worker threads
+    never block, because the sink may need them to drain its mailbox.
+    """
+
+    def __init__(self, op, dependant_op_handles, data_stream):
+        super(LocalOutputDataStream,
+              self).__init__(data_type=data_stream.data_type,
+                             name=data_stream.name,
+                             labels=data_stream.labels,
+                             callbacks=data_stream.callbacks,
+                             uid=data_stream.uid,
+                             id=data_stream.id)
+        self._op = op
+        self._dependant_op_handles = dependant_op_handles
+        self._credit_gates = create_credit_gates(self.labels,
+                                                 len(dependant_op_handles))
+        self._send_metrics = SendMetrics(op.name, self.name)
+        self._tracer = get_op_tracer(op.name)
+
+    def send(self, msg):
+        """Send a message on the stream.
+        Queues the message in the mailboxes of the sink local operators.
+        """
+        # Messages are not serialized, so operators that forward a message
+        # they received (e.g., NoopOp) would otherwise rename the stream of
+        # a message that is still queued at other receivers. The copy is
+        # shallow, and thus the message data is not copied.
+        msg = copy.copy(msg)
+        msg.stream_name = self.name
+        msg.stream_uid = self.uid
+        msg.stream_id = self.id
+        if isinstance(msg, WatermarkMessage):
+            send_time = time.time()
+            self._op.log_event(send_time, msg.timestamp,
+                               'watermark send {}'.format(self.name))
+            for index, local_op in enumerate(self._dependant_op_handles):
+                if self._credit_gates:
+                    # Coalesced messages precede the watermark.
+                    gate = self._credit_gates[index]
+                    pending_msg = gate.take_pending()
+                    if pending_msg is not None:
+                        local_op.on_msg(pending_msg, gate)
+                local_op.on_completion_msg(msg)
+            if self._tracer:
+                self._tracer.span('send watermark', msg, send_time)
+        else:
+            send_time = time.time()
+            self._op.log_event(send_time, msg.timestamp,
+                               'send {}'.format(self.name))
+            for index, local_op in enumerate(self._dependant_op_handles):
+                if self._credit_gates:
+                    self._send_with_credit(local_op, self._credit_gates[index],
+                                           msg)
+                else:
+                    local_op.on_msg(msg)
+            self._send_metrics.record(time.time() - send_time)
+            if self._tracer:
+                self._tracer.span('send', msg, send_time)
+
+    def get_credit_stats(self):
+        """Returns the flow control counters of each sink operator."""
+        if not self._credit_gates:
+            return {}
+        return dict(
+            (local_op.name, gate.get_stats()) for local_op, gate in zip(
+                self._dependant_op_handles, self._credit_gates))
+
+    def setup(self):
+        """Local streams send directly to the sink operators' mailboxes."""
+        pass
+
+    def _send_with_credit(self, local_op, gate, msg):
+        while not gate.acquire(msg):
+            if gate.policy != BLOCK:
+                # The message was dropped or coalesced.
+                return
+            if not local_op.may_block_sender():
+                gate.force_acquire()
+                break
+            gate.wait()
+        local_op.on_msg(msg, gate)
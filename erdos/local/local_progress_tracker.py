@@ -0,0 +1,30 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+
+from erdos.progress_tracker import ProgressTracker
+
+
+class LocalProgressTracker(ProgressTracker):
+    """Progress tracker shared by the operators of a local graph.
+
+    Operators report progress from the runtime's worker threads, so the
+    tracker state is guarded by a lock. Notifications are delivered after
+    the lock is released, because queuing them may block on a full mailbox.
+    """
+
+    def __init__(self):
+        super(LocalProgressTracker, self).__init__()
+        self._lock = threading.Lock()
+
+    def notify_at(self, endpoint_name, timestamp):
+        with self._lock:
+            batches = self._notify_at(endpoint_name, timestamp)
+        self._deliver_batches(batches)
+
+    def complete_time(self, endpoint_name, timestamp):
+        with self._lock:
+            batches = self._complete_time(endpoint_name, timestamp)
+        self._deliver_batches(batches)
@@ -0,0 +1,204 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import logging
+import threading
+import time
+from absl import flags
+
+try:
+    import queue as queue
+except ImportError:
+    import Queue as queue
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('local_num_workers', 4,
+                     'Number of worker threads used by the local executor')
+flags.DEFINE_integer(
+    'local_mailbox_size', 1000,
+    'Maximum number of messages queued per operator by the local executor. '
+    '0 means that the mailboxes are unbounded')
+
+logger = logging.getLogger(__name__)
+
+# Seconds the driver blocks at a time while it waits for the graph, so that
+# it remains interruptible (e.g., Python 2 ignores KeyboardInterrupt during
+# untimed waits).
+_WAIT_SLICE = 0.1
+
+
+class LocalRuntime(object):
+    """In-process runtime that runs the operators of a local graph.
+
+    The runtime owns a pool of worker threads. Operators that have messages
+    in their mailbox are put on a ready queue, and a worker thread dispatches
+    a batch of their messages before moving on to the next ready operator.
+    An operator is on the ready queue at most once, so its callbacks never
+    run concurrently.
+
+    Attributes:
+        num_workers (int): Number of worker threads dispatching callbacks.
+        mailbox_size (int): Maximum number of messages queued per operator.
+            Threads that are not owned by the runtime (e.g., operator
+            `execute` threads) block when they send to a full mailbox.
+    """
+
+    def __init__(self, num_workers=4, mailbox_size=1000):
+        assert num_workers > 0, 'The local runtime requires a worker thread'
+        self.num_workers = num_workers
+        self.mailbox_size = mailbox_size
+        self._ready = queue.Queue()
+        self._workers = []
+        self._execute_threads = []
+        self._pending_ops = []
+        self._started = False
+        self._shutdown = threading.Event()
+        self._stop_requested = threading.Event()
+        self._thread_state = threading.local()
+        # Tracks the messages that are queued or being dispatched, and the
+        # periodic tasks that are running. The runtime is quiescent when
+        # both are zero and every execute thread has finished.
+        self._cond = threading.Condition()
+        self._num_in_flight = 0
+        self._num_periodic_tasks = 0
+
+    def submit(self, local_op):
+        """Registers an operator whose `execute` method the runtime runs.
+
+        Operators submitted before `start` are executed once all operators
+        are set up, so that receivers are ready before senders publish.
+        """
+        if self._started:
+            self._start_execute_thread(local_op)
+        else:
+            self._pending_ops.append(local_op)
+
+    def start(self):
+        """Starts the worker threads and executes the submitted operators."""
+        self._started = True
+        for index in range(self.num_workers):
+            worker = threading.Thread(
+                target=self._run_worker,
+                name='erdos-local-worker-{}'.format(index))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        for local_op in self._pending_ops:
+            self._start_execute_thread(local_op)
+        self._pending_ops = []
+
+    def wait(self, timeout=None):
+        """Blocks until the runtime is quiescent, or `stop` is called.
+
+        Graphs with periodic tasks are never quiescent, so they run until
+        they are stopped or the timeout expires.
+
+        Returns:
+            (bool): False if the timeout expired before all the operators
+            finished executing and all the messages were dispatched.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+
+        def wait_slice():
+            if self._stop_requested.is_set():
+                return None
+            if deadline is None:
+                return _WAIT_SLICE
+            remaining = deadline - time.time()
+            return min(_WAIT_SLICE, remaining) if remaining > 0 else 0
+
+        for thread in self._execute_threads:
+            while thread.is_alive():
+                slice_timeout = wait_slice()
+                if slice_timeout is None:
+                    return True
+                if slice_timeout == 0:
+                    return False
+                thread.join(slice_timeout)
+        with self._cond:
+            while self._num_in_flight > 0 or self._num_periodic_tasks > 0:
+                slice_timeout = wait_slice()
+                if slice_timeout is None:
+                    return True
+                if slice_timeout == 0:
+                    return False
+                self._cond.wait(slice_timeout)
+        return True
+
+    def stop(self):
+        """Makes `wait` return, even if the runtime is not quiescent. Can
+        be called from any thread, including the operators' threads."""
+        self._stop_requested.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def shutdown(self):
+        """Stops the periodic tasks and the worker threads."""
+        self._shutdown.set()
+        for _ in self._workers:
+            self._ready.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def is_shutdown(self):
+        return self._shutdown.is_set()
+
+    def is_worker_thread(self):
+        """Returns True if the calling thread is a runtime worker thread."""
+        return getattr(self._thread_state, 'is_worker', False)
+
+    def schedule(self, local_op):
+        """Puts an operator that has queued messages on the ready queue."""
+        self._ready.put(local_op)
+
+    def wait_for_shutdown(self, timeout):
+        """Sleeps for timeout seconds unless the runtime is shut down.
+
+        Returns:
+            (bool): True if the runtime was shut down.
+        """
+        return self._shutdown.wait(timeout)
+
+    def _task_added(self):
+        with self._cond:
+            self._num_in_flight += 1
+
+    def _task_done(self):
+        with self._cond:
+            self._num_in_flight -= 1
+            if self._num_in_flight == 0:
+                self._cond.notify_all()
+
+    def _periodic_task_added(self):
+        with self._cond:
+            self._num_periodic_tasks += 1
+
+    def _periodic_task_done(self):
+        with self._cond:
+            self._num_periodic_tasks -= 1
+            self._cond.notify_all()
+
+    def _start_execute_thread(self, local_op):
+        thread = threading.Thread(target=self._run_execute,
+                                  args=(local_op, ),
+                                  name='erdos-local-{}'.format(local_op.name))
+        thread.daemon = True
+        thread.start()
+        self._execute_threads.append(thread)
+
+    def _run_execute(self, local_op):
+        try:
+            local_op.execute()
+        except Exception:
+            logger.exception('Operator {} failed to execute'.format(
+                local_op.name))
+
+    def _run_worker(self):
+        self._thread_state.is_worker = True
+        while True:
+            local_op = self._ready.get()
+            if local_op is None:
+                return
+            local_op._dispatch_batch()
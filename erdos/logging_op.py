@@ -1,35 +1,40 @@
-try:
-    import queue as queue
-except ImportError:
-    import Queue as queue
-
+from erdos.event_log import DEFAULT_FLUSH_PERIOD, EventLog
 from erdos.op import Op
 
 
 class LoggingOp(Op):
+    """Operator which logs the messages it receives and sends.
+
+    The events are written to the binary `EventLog` with prefix name, which
+    `erdos.event_log.EventLogReader` converts to CSV or numpy arrays.
+
+    Args:
+        buffer_logs (bool): If True, the records are only written once the
+            log's buffer is half full, or when the operator is flushed.
+            Otherwise, they are written periodically.
+    """
+
     def __init__(self, name, buffer_logs=False):
         super(LoggingOp, self).__init__(name)
         self._buffer_logs = buffer_logs
-        self._event_log_buffer = queue.Queue()
-        self._log_file = open('{}.log'.format(self.name), 'a+')
+        self._event_log = EventLog(
+            self.name,
+            flush_period=None if buffer_logs else DEFAULT_FLUSH_PERIOD)
+        self._op_id = self._event_log.register_op(self.name)
+        self._event_ids = {}
 
     def __del__(self):
-        self.flush()
-        self._log_file.close()
+        self._event_log.close()
 
     def flush(self):
-        while not self._event_log_buffer.empty():
-            (name, processing_time, timestamp,
-             log_message) = self._event_log_buffer.get()
-            self._log_file.write(name + ',' + str(processing_time) + ',' +
-                                 str(timestamp) + ',' + str(log_message) +
-                                 '\n')
+        self._event_log.flush()
 
     def log_event(self, processing_time, timestamp, log_message=None):
-        if self._buffer_logs:
-            self._event_log_buffer.put((self.name, processing_time, timestamp,
-                                        log_message))
-        else:
-            self._log_file.write(self.name + ',' + str(processing_time) + ',' +
-                                 str(timestamp) + ',' + str(log_message) +
-                                 '\n')
+        event_id = self._event_ids.get(log_message)
+        if event_id is None:
+            event_id = self._event_log.register_event(str(log_message))
+            self._event_ids[log_message] = event_id
+        # Messages sent without a timestamp are logged without coordinates.
+        coordinates = () if timestamp is None else timestamp.coordinates
+        self._event_log.append(self._op_id, event_id, coordinates,
+                               processing_time)
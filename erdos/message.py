@@ -1,19 +1,111 @@
+import struct
+
+from erdos.timestamp import Timestamp
+
+# Binary header of serialized messages: the id of the stream the message
+# was sent on (-1 if unknown), followed by the number of timestamp
+# coordinates and the coordinates.
+_HEADER = struct.Struct('<iH')
+_NO_TIMESTAMP = 0xFFFF
+_MAX_COORDINATES = 0xFFFE
+
+
+class DeferredData(object):
+    """Base class of payloads that are fetched on the first access to the
+    data of the message carrying them (e.g., payloads stored elsewhere)."""
+
+    __slots__ = ()
+
+    def resolve(self):
+        """Returns the payload."""
+        raise NotImplementedError
+
+
 class Message(object):
     """Class used to wrap ERDOS message data.
 
+       Messages are serialized with a compact binary header that identifies
+       the stream by its integer id. The stream name and uid are therefore
+       only sent if the stream has no id, and are restored by the receiving
+       input stream.
+
        Attributes:
-           data: The data of the message.
+           data: The data of the message. `DeferredData` payloads are
+               resolved the first time the data is accessed.
            timestamp (Timestamp): The timestamp of the message.
+           stream_name (str): The name of the stream the message was sent on.
+           stream_uid (str): The uid of the stream the message was sent on.
+           stream_id (int): The id of the stream the message was sent on.
     """
 
+    __slots__ = ('_data', 'timestamp', 'stream_name', 'stream_uid',
+                 'stream_id')
+
     def __init__(self, data, timestamp, stream_name='default'):
         self.data = data
         self.timestamp = timestamp
         self.stream_name = stream_name
+        self.stream_uid = None
+        self.stream_id = None
+
+    @property
+    def data(self):
+        data = self._data
+        if isinstance(data, DeferredData):
+            data = self._data = data.resolve()
+        return data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+
+    def __copy__(self):
+        msg = self.__class__.__new__(self.__class__)
+        for slot in Message.__slots__:
+            setattr(msg, slot, getattr(self, slot))
+        if hasattr(self, '__dict__'):
+            msg.__dict__.update(self.__dict__)
+        return msg
+
+    def __reduce__(self):
+        stream_id = -1 if self.stream_id is None else self.stream_id
+        coordinates = () if self.timestamp is None else \
+            self.timestamp.coordinates
+        try:
+            if len(coordinates) > _MAX_COORDINATES:
+                raise struct.error('Too many coordinates')
+            num_coordinates = (_NO_TIMESTAMP
+                               if self.timestamp is None else len(coordinates))
+            header = (
+                _HEADER.pack(stream_id, num_coordinates) +
+                struct.pack('<{}q'.format(len(coordinates)), *coordinates))
+            timestamp = None
+        except struct.error:
+            # The coordinates are not 64-bit integers.
+            header = _HEADER.pack(stream_id, 0)
+            timestamp = self.timestamp
+        stream_name = self.stream_name if stream_id < 0 else None
+        # Attributes of subclasses that do not define __slots__.
+        state = getattr(self, '__dict__', None)
+        return (_restore_message, (self.__class__, header, self._data,
+                                   timestamp, stream_name, state))
+
+    def __setstate__(self, state):
+        # Messages pickled before they had a compact serialization (e.g., by
+        # the former RecordOp) hold their attributes in their __dict__.
+        state = dict(state)
+        self._data = state.pop('data', None)
+        self.timestamp = state.pop('timestamp', None)
+        self.stream_name = state.pop('stream_name', 'default')
+        self.stream_uid = None
+        self.stream_id = None
+        if state:
+            self.__dict__.update(state)
 
     def __str__(self):
         return '{{stream: {}, timestamp: {}, data: {}}}'.format(
-            self.stream_name, self.timestamp, self.data)
+            self.stream_name, self.timestamp, self._data)
+
 
 class WatermarkMessage(Message):
     """Class used to wrap ERDOS watermark message.
@@ -22,9 +114,28 @@ class WatermarkMessage(Message):
            timestamp (Timestamp): The timestamp for which this is a watermark.
     """
 
+    __slots__ = ()
+
     def __init__(self, timestamp, stream_name='default'):
         super(WatermarkMessage, self).__init__(None, timestamp, stream_name)
 
     def __str__(self):
         return '{{stream: {}, timestamp: {}, watermark: True}}'.format(
             self.stream_name, self.timestamp)
+
+
+def _restore_message(cls, header, data, timestamp, stream_name, state):
+    """Rebuilds a message serialized by `Message.__reduce__`."""
+    (stream_id, num_coordinates) = _HEADER.unpack_from(header)
+    if num_coordinates != _NO_TIMESTAMP and timestamp is None:
+        timestamp = Timestamp(coordinates=struct.unpack_from(
+            '<{}q'.format(num_coordinates), header, _HEADER.size))
+    msg = cls.__new__(cls)
+    msg._data = data
+    msg.timestamp = timestamp
+    msg.stream_name = stream_name
+    msg.stream_uid = None
+    msg.stream_id = None if stream_id < 0 else stream_id
+    if state:
+        msg.__dict__.update(state)
+    return msg
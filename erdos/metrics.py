@@ -0,0 +1,353 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import logging
+import math
+import os
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from erdos.utils import write_atomically
+
+logger = logging.getLogger(__name__)
+
+# Quantiles exported for each histogram.
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class Counter(object):
+    """A value that only increases (e.g., the number of messages sent)."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return {'type': 'counter', 'value': self.value}
+
+
+class Gauge(object):
+    """A value that goes up and down (e.g., a queue depth)."""
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return {'type': 'gauge', 'value': self.value}
+
+
+class Histogram(object):
+    """Histogram of positive values with a bounded relative error.
+
+    As in HDR histograms, each power of two is divided into sub-buckets of
+    equal width, so that the values a bucket counts are within
+    1 / sub_buckets of each other, whatever their magnitude.
+
+    Attributes:
+        sub_buckets (int): Number of buckets per power of two.
+        count (int): Number of recorded values.
+        sum (float): Sum of the recorded values.
+        min (float): Smallest recorded value.
+        max (float): Largest recorded value.
+    """
+
+    def __init__(self, sub_buckets=64):
+        self.sub_buckets = sub_buckets
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        # Maps bucket indices to counts.
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def record(self, value):
+        index = self._get_index(value)
+        with self._lock:
+            self._buckets[index] = self._buckets.get(index, 0) + 1
+            self.count += 1
+            self.sum += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def percentile(self, quantile):
+        """Returns an upper bound of the value at quantile (e.g., 0.99)."""
+        with self._lock:
+            return _get_percentile(self._buckets, self.count, quantile,
+                                   self.sub_buckets, self.max)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'type': 'histogram',
+                'count': self.count,
+                'sum': self.sum,
+                'min': self.min,
+                'max': self.max,
+                'sub_buckets': self.sub_buckets,
+                # JSON keys must be strings.
+                'buckets': dict((str(index), count)
+                                for index, count in self._buckets.items()),
+            }
+
+    def _get_index(self, value):
+        if value <= 0:
+            return None
+        (mantissa, exponent) = math.frexp(value)
+        # The mantissa is in [0.5, 1).
+        return (exponent * self.sub_buckets + int(
+            (mantissa - 0.5) * 2 * self.sub_buckets))
+
+
+def _get_bucket_upper_bound(index, sub_buckets):
+    if index is None:
+        return 0
+    (exponent, sub_bucket) = divmod(index, sub_buckets)
+    return math.ldexp(0.5 + (sub_bucket + 1) / (2.0 * sub_buckets), exponent)
+
+
+def _get_percentile(buckets, count, quantile, sub_buckets, max_value):
+    if count == 0:
+        return None
+    rank = quantile * count
+    seen = 0
+    # Values <= 0 are counted under None, which sorts first.
+    for index in sorted(buckets, key=lambda i: (i is not None, i)):
+        seen += buckets[index]
+        if seen >= rank:
+            return min(_get_bucket_upper_bound(index, sub_buckets), max_value)
+    return max_value
+
+
+class MetricsRegistry(object):
+    """The metrics of a process, keyed by name and labels."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, **labels):
+        return self._get_metric(Counter, name, labels)
+
+    def gauge(self, name, **labels):
+        return self._get_metric(Gauge, name, labels)
+
+    def histogram(self, name, **labels):
+        return self._get_metric(Histogram, name, labels)
+
+    def snapshot(self):
+        """Returns the values of the metrics as a list of JSON-serializable
+        dicts."""
+        with self._lock:
+            metrics = list(self._metrics.items())
+        snapshot = []
+        for ((name, labels), metric) in metrics:
+            metric_snapshot = metric.snapshot()
+            metric_snapshot['name'] = name
+            metric_snapshot['labels'] = dict(labels)
+            snapshot.append(metric_snapshot)
+        return snapshot
+
+    def _get_metric(self, metric_cls, name, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = metric_cls()
+                self._metrics[key] = metric
+            assert isinstance(metric, metric_cls), \
+                'Metric {} is a {}'.format(name, type(metric).__name__)
+            return metric
+
+
+_registry = None
+_registry_pid = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Returns the metrics registry of the process."""
+    global _registry, _registry_pid
+    with _registry_lock:
+        # Processes forked from the driver (e.g., ROS operators) do not
+        # report the driver's metrics.
+        if _registry is None or _registry_pid != os.getpid():
+            _registry = MetricsRegistry()
+            _registry_pid = os.getpid()
+        return _registry
+
+
+class CallbackMetrics(object):
+    """Records the callbacks an operator runs for each of its streams."""
+
+    def __init__(self, op_name, registry=None):
+        self._op_name = op_name
+        self._registry = registry if registry else get_registry()
+        # Maps (stream name, completion) to (counter, histogram) tuples.
+        self._metrics = {}
+
+    def record(self, stream_name, duration, completion=False):
+        """Records callbacks that ran for duration seconds."""
+        metrics = self._metrics.get((stream_name, completion))
+        if metrics is None:
+            kind = 'watermark' if completion else 'message'
+            metrics = (self._registry.counter('erdos_callbacks_total',
+                                              op=self._op_name,
+                                              stream=stream_name,
+                                              kind=kind),
+                       self._registry.histogram('erdos_callback_duration_ms',
+                                                op=self._op_name,
+                                                stream=stream_name,
+                                                kind=kind))
+            self._metrics[(stream_name, completion)] = metrics
+        metrics[0].inc()
+        metrics[1].record(duration * 1000)
+
+
+class SendMetrics(object):
+    """Records the messages an operator sends on a stream."""
+
+    def __init__(self, op_name, stream_name, registry=None):
+        registry = registry if registry else get_registry()
+        self._counter = registry.counter('erdos_messages_sent_total',
+                                         op=op_name,
+                                         stream=stream_name)
+        self._histogram = registry.histogram('erdos_send_duration_ms',
+                                             op=op_name,
+                                             stream=stream_name)
+
+    def record(self, duration):
+        """Records a send that took duration seconds (e.g., serializing the
+        message or waiting for flow control credits)."""
+        self._counter.inc()
+        self._histogram.record(duration * 1000)
+
+
+def to_prometheus_text(snapshot):
+    """Renders a snapshot in the Prometheus text exposition format.
+    Histograms are exported as summaries."""
+    lines = []
+    typed = set()
+    for metric in sorted(snapshot, key=lambda m: m['name']):
+        name = metric['name']
+        prometheus_type = ('summary' if metric['type'] == 'histogram' else
+                           metric['type'])
+        if name not in typed:
+            lines.append('# TYPE {} {}'.format(name, prometheus_type))
+            typed.add(name)
+        labels = metric['labels']
+        if metric['type'] == 'histogram':
+            buckets = dict((None if index == 'None' else int(index), count)
+                           for index, count in metric['buckets'].items())
+            for quantile in QUANTILES:
+                value = _get_percentile(buckets, metric['count'], quantile,
+                                        metric['sub_buckets'], metric['max'])
+                lines.append('{}{} {}'.format(
+                    name, _format_labels(dict(labels, quantile=str(quantile))),
+                    0 if value is None else value))
+            lines.append('{}_count{} {}'.format(name, _format_labels(labels),
+                                                metric['count']))
+            lines.append('{}_sum{} {}'.format(name, _format_labels(labels),
+                                              metric['sum']))
+        else:
+            lines.append('{}{} {}'.format(name, _format_labels(labels),
+                                          metric['value']))
+    return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(key,
+                         str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in sorted(labels.items())) + '}'
+
+
+class MetricsExporter(object):
+    """Exports metrics to a JSON file, and serves them over HTTP in the
+    Prometheus text format.
+
+    Args:
+        snapshot_fn (callable): Returns the snapshot to export.
+        file_path (str): File to which the snapshot is periodically written,
+            or None.
+        port (int): Port of the HTTP scrape endpoint, or None.
+        period (float): Seconds between two writes of the file.
+    """
+
+    def __init__(self, snapshot_fn, file_path=None, port=None, period=5):
+        self._snapshot_fn = snapshot_fn
+        self._file_path = file_path
+        self._port = port
+        self._period = period
+        self._stopped = threading.Event()
+        self._server = None
+
+    def start(self):
+        if self._file_path:
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+        if self._port:
+            self._server = HTTPServer(('', self._port),
+                                      self._create_handler_cls())
+            thread = threading.Thread(target=self._server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            logger.info('Serving metrics on port {}'.format(
+                self._server.server_port))
+
+    def stop(self):
+        """Writes the file a last time, and stops serving metrics."""
+        self._stopped.set()
+        if self._file_path:
+            self.write_file()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def write_file(self):
+        write_atomically(self._file_path,
+                         json.dumps(self._snapshot_fn(), sort_keys=True))
+
+    def _run(self):
+        while not self._stopped.wait(self._period):
+            try:
+                self.write_file()
+            except Exception:
+                logger.exception('Could not write metrics to {}'.format(
+                    self._file_path))
+
+    def _create_handler_cls(self):
+        snapshot_fn = self._snapshot_fn
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = to_prometheus_text(snapshot_fn()).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return MetricsHandler
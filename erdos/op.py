@@ -1,6 +1,8 @@
 import logging
 from collections import deque
-from time import sleep
+
+from erdos.message import WatermarkMessage
+from erdos.watermark_tracker import WatermarkTracker
 
 
 class Op(object):
@@ -22,7 +24,14 @@ class Op(object):
             is subscribed.
         output_streams (dict of str -> DataStream): Data streams on which the
             operator publishes. Mapping between name and data stream.
-        freq_actor: A Ray actor used for periodic tasks.
+        freq_actor: Triggers the periodic tasks.
+        periodic_tasks (dict of str -> PeriodicTask): The periodic methods
+            of the operator, by name.
+        progress_tracker: The tracker which delivers notifications, or None
+            if no operator of the graph overrides `on_notify`.
+        deadline_slacks (dict of str -> deque of float): The slack, in
+            seconds, of the recent invocations of each callback decorated
+            with `@deadline`.
     """
 
     def __init__(self, name, checkpoint_enable=False, checkpoint_freq=None):
@@ -32,8 +41,9 @@ class Op(object):
         self.freq_actor = None
         self.progress_tracker = None
         self.framework = None
-        self._stream_to_high_watermark = {}
-        self._stream_ignore_watermarks = set()  # input streams that do not send watermarks
+        self.deadline_slacks = {}
+        self.periodic_tasks = {}
+        self._watermark_tracker = WatermarkTracker()
 
         # Checkpoint variables
         self._checkpoint_enable = checkpoint_enable
@@ -47,8 +57,20 @@ class Op(object):
         return self.output_streams[name]
 
     def notify_at(self, timestamp):
-        """Subscribes the operator to receive a notification."""
-        self.progress_tracker.notify_at.remote(self.name, timestamp)
+        """Subscribes the operator to receive a notification.
+
+        `on_notify` is invoked once all the operators that receive
+        watermarks have completed the timestamp.
+        """
+        if self.progress_tracker is None:
+            raise Exception(
+                'Notifications are not enabled for operator {}. Operators '
+                'must override on_notify, and run on Ray or local'.format(
+                    self.name))
+        if self.framework == "ray":
+            self.progress_tracker.notify_at.remote(self.name, timestamp)
+        else:
+            self.progress_tracker.notify_at(self.name, timestamp)
 
     def on_notify(self, timestamp):
         """Called after a timestamp completes"""
@@ -85,10 +107,8 @@ class Op(object):
         if self.framework == "ros":
             import rospy
             rospy.spin()
-        elif self.framework == "local":
-            while True:
-                sleep(0.5)
-        elif self.framework == "ray":
+        elif self.framework == "ray" or self.framework == "local":
+            # Callbacks are dispatched by the framework's workers.
             pass
         else:
             logging.critical("Unexpected framework %s", self.framework)
@@ -151,9 +171,38 @@ class Op(object):
 
     def _reset_watermarks(self, timestamp):
         """ Reset the progress (watermark) of the operator """
-        for input_stream in self.input_streams:
-            if input_stream.name in self._stream_to_high_watermark:
-                self._stream_to_high_watermark[input_stream.name] = timestamp
+        self._watermark_tracker.reset(timestamp)
+
+    def _receive_watermark(self, msg):
+        """Records a watermark received on an input stream.
+
+        Checkpoints the operator if the low watermark across all input
+        streams advances, and it satisfies the checkpoint condition.
+
+        Returns:
+            (WatermarkMessage): A watermark for the new low watermark, or
+            None if the low watermark did not advance.
+        """
+        low_watermark = self._watermark_tracker.update(msg.stream_name,
+                                                       msg.timestamp)
+        if low_watermark is None:
+            return None
+        # Note: For correctness reasons, we can only flow watermarks after
+        # we checkpoint.
+        if (self._checkpoint_enable
+                and self.checkpoint_condition(low_watermark)):
+            self._checkpoint(low_watermark)
+        return WatermarkMessage(low_watermark, msg.stream_name)
+
+    def _complete_timestamp(self, timestamp):
+        """Reports to the progress tracker that the operator has processed
+        all the messages with timestamps up to timestamp."""
+        if self.progress_tracker is None:
+            return
+        if self.framework == "ray":
+            self.progress_tracker.complete_time.remote(self.name, timestamp)
+        else:
+            self.progress_tracker.complete_time(self.name, timestamp)
 
     def _add_input_streams(self, input_streams):
         """Setups and updates all input streams."""
@@ -172,6 +221,7 @@ class Op(object):
         for output_stream in self.output_streams.values():
             output_stream.setup()
         for input_stream in self.input_streams:
-            if input_stream.labels.get('no_watermark', 'false') == 'true':
-                self._stream_ignore_watermarks.add(input_stream.name)
+            self._watermark_tracker.add_stream(
+                input_stream.name,
+                input_stream.labels.get('no_watermark', 'false') == 'true')
             input_stream.setup()
@@ -7,7 +7,9 @@ class OpHandle(object):
                  graph_name,
                  framework='ray',
                  machine="",
-                 resources=None):
+                 resources=None,
+                 fusible=True,
+                 parallelism=1):
         # Ensure op name uniqueness
         self.name = name if name else "{0}_{1}".format(
             op_cls.__class__.__name__, hash(self))
@@ -22,10 +24,14 @@ class OpHandle(object):
         self.framework = framework
         self.machine = machine
         self.resources = {} if resources is None else resources
+        self.fusible = fusible
+        self.parallelism = parallelism
         self.dependant_ops = []  # handle ids of dependant ops
         self.dependent_op_handles = {}
         self.executor_handle = None
-        self.progress_tracker = None  # Unused now
+        self.progress_tracker = None
+        self.trace_file = ''
+        self.trace_sample_rate = 0
 
     def get_uid(self):
         # TODO(yika): return a better handle than graph_name/op_name
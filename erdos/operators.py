@@ -1,8 +1,8 @@
 import copy
 import heapq
 import logging
-import pickle
 import sys
+import threading
 import time
 from enum import Enum
 
@@ -10,6 +10,9 @@ from erdos.data_stream import DataStream
 from erdos.message import Message
 from erdos.message import WatermarkMessage
 from erdos.op import Op
+from erdos.periodic_scheduler import COALESCE
+from erdos.recording import DEFAULT_CHUNK_SIZE, DEFAULT_FLUSH_INTERVAL
+from erdos.recording import RecordingReader, RecordingWriter
 from erdos.timestamp import Timestamp
 from erdos.utils import frequency
 
@@ -79,82 +82,141 @@ class LogOp(Op):
 class RecordOp(Op):
     """Operator which saves serialized data from input streams to file.
 
+    Messages are written to an indexed, chunked recording (see
+    `erdos.recording.RecordingWriter`).
+
     Args:
         filename (str): path to file.
         input_streams (list): list of input streams from which to save data.
         name (str): unique name for this operator. Generated by default.
+        chunk_size (int): bytes of messages after which a chunk is written.
+        compress (bool): whether to compress chunks with zlib.
+        flush_interval (float): seconds after which received messages are
+            written, checked on every message and low watermark.
     """
 
-    def __init__(self, name, filename):
+    def __init__(self,
+                 name,
+                 filename,
+                 chunk_size=DEFAULT_CHUNK_SIZE,
+                 compress=False,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
         super(RecordOp, self).__init__(name)
         self.filename = filename
+        self._chunk_size = chunk_size
+        self._compress = compress
+        self._flush_interval = flush_interval
+        self._writer = None
+        self._writer_lock = threading.Lock()
 
     @staticmethod
     def setup_streams(input_streams, filter):
         if filter:
             input_streams = input_streams.filter_name(filter)
         input_streams.add_callback(RecordOp.record_data)
+        input_streams.add_completion_callback(RecordOp.on_watermark)
         return []
 
     def record_data(self, msg):
-        pickle.dump(msg, self._file)
+        # Serialized messages only carry the stream id, which is specific to
+        # the recorded graph, so the stream name is recorded as well.
+        self._get_writer().write(msg.stream_name, msg)
 
-    def execute(self):
-        self._file = open(self.filename, "wb")
+    def on_watermark(self, msg):
+        # Streams may stop sending messages, but keep sending watermarks.
+        if self._writer is not None:
+            self._writer.flush_if_due()
+
+    def __del__(self):
+        self.close()
+
+    def flush(self):
+        if self._writer is not None:
+            self._writer.flush()
 
-        # Write input stream info
-        input_stream_info = [(input_stream.data_type, input_stream.name)
-                             for input_stream in self.input_streams]
-        pickle.dump(input_stream_info, self._file)
+    def close(self):
+        """Writes the recording's footer. Recordings which are not closed
+        are closed when the process exits."""
+        if self._writer is not None:
+            self._writer.close()
+
+    def execute(self):
+        self._get_writer()
         self.spin()
 
+    def _get_writer(self):
+        # Messages may be delivered before the operator executes.
+        with self._writer_lock:
+            if self._writer is None:
+                input_stream_info = [(input_stream.data_type,
+                                      input_stream.name)
+                                     for input_stream in self.input_streams]
+                self._writer = RecordingWriter(
+                    self.filename,
+                    input_stream_info,
+                    self._chunk_size,
+                    self._compress,
+                    flush_interval=self._flush_interval)
+            return self._writer
+
 
 class ReplayOp(Op):
     """Operator which replays saved data from file to an output stream.
 
+    Only the chunks of the recording which hold selected messages are read.
+
     Args:
+        name (str): unique name for this operator.
         filename (str): path to file.
         frequency (int): rate at which the operator publishes data. If 0, the
             operator publishes data as soon as it is read from file.
-        name (str): unique name for this operator. Generated by default.
+        start_timestamp (Timestamp or list of int): if set, messages with
+            smaller timestamps are not replayed.
+        streams (list of str): if set, only the messages of these streams
+            are replayed. The same list must be passed to setup_streams.
     """
 
-    def __init__(self, filename, frequency=0, name="replay_op"):
+    def __init__(self,
+                 name,
+                 filename,
+                 frequency=0,
+                 start_timestamp=None,
+                 streams=None):
         super(ReplayOp, self).__init__(name)
         self.filename = filename
         self.frequency = frequency
+        self._start_timestamp = start_timestamp
+        self._streams = streams
+        self._messages = None
 
     @staticmethod
-    def setup_streams(input_streams, filename):
+    def setup_streams(input_streams, filename, streams=None):
         output_streams = []
-        with open(filename, "rb") as f:
-            stream_info = pickle.load(f)
-            for data_type, name in stream_info:
+        for data_type, name in RecordingReader(filename).streams:
+            if streams is None or name in streams:
                 output_streams.append(
                     DataStream(data_type=data_type, name=name))
         return output_streams
 
     def publish_data(self):
-        if self._file.closed:
+        if self._messages is None:
             return
         try:
-            msg = pickle.load(self._file)
-            self.get_output_stream(msg.stream_name).send(msg)
-        except EOFError:
-            logging.error("Reached end of input file: {0}".format(
+            (stream_name, msg) = next(self._messages)
+            self.get_output_stream(stream_name).send(msg)
+        except StopIteration:
+            logging.info("Reached end of input file: {0}".format(
                 self.filename))
-            self._file.close()
+            self._messages = None
 
     def execute(self):
-        self._file = open(self.filename, "rb")
-        pickle.load(self._file)  # Read past the stream names
+        self._messages = RecordingReader(self.filename).read(
+            self._start_timestamp, self._streams)
 
         if self.frequency:
-            publish_data = frequency(self.frequency)(self.publish_data)
-            publish_data()
-            self.spin()
+            frequency(self.frequency)(ReplayOp.publish_data)(self)
         else:
-            while True:
+            while self._messages is not None:
                 self.publish_data()
         self.spin()
 
@@ -570,7 +632,8 @@ class WindowOp(Op):
                 self.register_time_trigger(window.end_time, window)
             self.on_message_trigger(msg, window)
 
-    @frequency(100)
+    # Firing the triggers once covers all the ticks that overran.
+    @frequency(100, overrun=COALESCE)
     def fire_triggers(self):
         # TODO(ionel): There are more efficient ways to implement this. Fix!
         while (len(self._window_end_pqueue) > 0
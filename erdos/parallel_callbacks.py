@@ -0,0 +1,191 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import heapq
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class _TimestampWork(object):
+    """The callbacks of an operator for a timestamp, and the messages they
+    sent."""
+    __slots__ = ('timestamp', 'funcs', 'num_submitted', 'num_pending',
+                 'running', 'outputs')
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+        self.funcs = deque()
+        self.num_submitted = 0
+        # Number of callbacks that are queued or running.
+        self.num_pending = 0
+        self.running = False
+        # List of (stream, msg) tuples sent by the callbacks.
+        self.outputs = []
+
+
+class ParallelCallbackRunner(object):
+    """Runs the callbacks of an operator for different timestamps on a pool
+    of threads.
+
+    The callbacks for a timestamp run one at a time, in arrival order, while
+    the callbacks for different timestamps run concurrently. The messages
+    the callbacks send are buffered, and are sent in timestamp order: a
+    timestamp's messages are sent once its callbacks and the callbacks of
+    all earlier timestamps have finished. Watermark work (i.e., completion
+    callbacks and forwarded watermarks) runs once the messages of all the
+    timestamps up to the watermark have been sent.
+
+    Attributes:
+        parallelism (int): Number of threads running callbacks.
+
+    Args:
+        on_submit (callable): Called when work is submitted.
+        on_done (callable): Called with the number of submitted works that
+            completed, once they ran and their messages have been sent.
+    """
+
+    def __init__(self, name, parallelism, on_submit=None, on_done=None):
+        assert parallelism > 1, 'Parallel callbacks require several threads'
+        self.parallelism = parallelism
+        self._on_submit = on_submit
+        self._on_done = on_done
+        self._lock = threading.Lock()
+        self._work_available = threading.Condition(self._lock)
+        # Maps timestamps to their _TimestampWork.
+        self._work = {}
+        # Heap of the timestamps which have work.
+        self._timestamps = []
+        # Work which has queued callbacks, and is not running.
+        self._ready = deque()
+        # Queue of (timestamp, func) tuples of the received watermarks.
+        self._watermarks = deque()
+        # Only one thread at a time sends buffered messages and runs
+        # watermark work, so that they stay ordered.
+        self._flush_lock = threading.Lock()
+        self._thread_state = threading.local()
+        for index in range(parallelism):
+            thread = threading.Thread(target=self._run,
+                                      name='erdos-{}-callbacks-{}'.format(
+                                          name, index))
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, timestamp, func):
+        """Queues func, which runs callbacks for timestamp."""
+        if self._on_submit:
+            self._on_submit()
+        with self._lock:
+            work = self._work.get(timestamp)
+            if work is None:
+                work = _TimestampWork(timestamp)
+                self._work[timestamp] = work
+                heapq.heappush(self._timestamps, timestamp)
+            work.funcs.append(func)
+            work.num_submitted += 1
+            work.num_pending += 1
+            if not work.running and len(work.funcs) == 1:
+                self._ready.append(work)
+                self._work_available.notify()
+
+    def submit_watermark(self, timestamp, func):
+        """Queues func, which runs once the callbacks for the timestamps up
+        to timestamp have finished, and their messages have been sent."""
+        if self._on_submit:
+            self._on_submit()
+        with self._lock:
+            self._watermarks.append((timestamp, func))
+        self._flush()
+
+    def resequence_output_streams(self, op):
+        """Makes the output streams of op send through the runner."""
+        op.output_streams = dict((name, ResequencedDataStream(self, stream))
+                                 for name, stream in op.output_streams.items())
+
+    def send(self, stream, msg):
+        """Sends msg on stream, or buffers it if a callback sent it."""
+        work = getattr(self._thread_state, 'work', None)
+        if work is None:
+            stream.send(msg)
+        else:
+            # Only the thread running the work's callbacks appends to it.
+            work.outputs.append((stream, msg))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._ready:
+                    self._work_available.wait()
+                work = self._ready.popleft()
+                func = work.funcs.popleft()
+                work.running = True
+            self._thread_state.work = work
+            try:
+                func()
+            except Exception:
+                logger.exception('Callback for timestamp {} failed'.format(
+                    work.timestamp))
+            finally:
+                self._thread_state.work = None
+            with self._lock:
+                work.running = False
+                work.num_pending -= 1
+                if work.funcs:
+                    self._ready.append(work)
+                    self._work_available.notify()
+            self._flush()
+
+    def _flush(self):
+        with self._flush_lock:
+            while True:
+                work = None
+                watermark_func = None
+                with self._lock:
+                    watermark = self._watermarks[0] if self._watermarks \
+                        else None
+                    if self._timestamps and (watermark is None
+                                             or self._timestamps[0]
+                                             <= watermark[0]):
+                        work = self._work[self._timestamps[0]]
+                        if work.num_pending > 0:
+                            return
+                        heapq.heappop(self._timestamps)
+                        del self._work[work.timestamp]
+                    elif watermark is not None:
+                        self._watermarks.popleft()
+                        watermark_func = watermark[1]
+                    else:
+                        return
+                if work is not None:
+                    try:
+                        for (stream, msg) in work.outputs:
+                            stream.send(msg)
+                    finally:
+                        if self._on_done:
+                            self._on_done(work.num_submitted)
+                else:
+                    try:
+                        watermark_func()
+                    except Exception:
+                        logger.exception('Watermark work failed')
+                    finally:
+                        if self._on_done:
+                            self._on_done(1)
+
+
+class ResequencedDataStream(object):
+    """Output stream of an operator with parallel callbacks, which sends
+    the messages through the operator's `ParallelCallbackRunner`."""
+
+    def __init__(self, runner, data_stream):
+        self._runner = runner
+        self._data_stream = data_stream
+
+    def send(self, msg):
+        self._runner.send(self._data_stream, msg)
+
+    def __getattr__(self, name):
+        return getattr(self._data_stream, name)
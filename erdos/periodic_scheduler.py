@@ -0,0 +1,258 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Ticks that find the previous run unfinished are dropped.
+SKIP = 'skip'
+# Every tick runs the method. Ticks that find the previous run unfinished are
+# counted, and their runs start back to back once the previous run finishes.
+CATCH_UP = 'catch_up'
+# Ticks that find the previous run unfinished are merged into a single run,
+# which starts once the previous run finishes.
+COALESCE = 'coalesce'
+POLICIES = (SKIP, CATCH_UP, COALESCE)
+
+# Upper bounds, in ms, of the buckets of the jitter histograms. The last
+# bucket counts the runs whose jitter exceeds all the bounds.
+JITTER_BUCKETS_MS = (0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class PeriodicTask(object):
+    """A method that runs at a fixed rate.
+
+    The scheduler does not run the method itself. At each tick, it invokes
+    `dispatch(task, scheduled_time)`, and the executor of the operator calls
+    `run(scheduled_time)` when the operator is ready to run the method.
+
+    Attributes:
+        name (str): Name of the task, used in the stats.
+        rate (float): Number of runs per second.
+        period (float): Seconds between two ticks.
+        overrun (str): What happens to ticks that find the previous run
+            unfinished, or that the scheduler missed. Either skip, catch_up
+            or coalesce.
+        num_runs (int): Number of completed runs.
+        num_skipped (int): Number of ticks dropped.
+        num_coalesced (int): Number of ticks merged into another run.
+    """
+
+    def __init__(self, name, rate, func, dispatch, overrun=CATCH_UP):
+        assert rate > 0, 'Periodic tasks must have a positive rate'
+        if overrun not in POLICIES:
+            raise ValueError('Unexpected overrun policy {}'.format(overrun))
+        self.name = name
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.overrun = overrun
+        self.num_runs = 0
+        self.num_skipped = 0
+        self.num_coalesced = 0
+        self._func = func
+        self._dispatch = dispatch
+        self._scheduler = None
+        # The scheduled time of tick i is start_time + i * period, which
+        # prevents errors from accumulating.
+        self._start_time = None
+        self._tick = 0
+        self._running = False
+        # Scheduled time of the first tick whose run is pending, and the
+        # number of pending runs. Only catch_up has more than one, at
+        # consecutive ticks.
+        self._pending_time = None
+        self._num_pending = 0
+        self._removed = False
+        self._jitter_counts = [0] * (len(JITTER_BUCKETS_MS) + 1)
+        self._max_jitter = 0
+        self._lock = threading.Lock()
+
+    def run(self, scheduled_time):
+        """Runs the method for the tick scheduled at scheduled_time."""
+        jitter = time.time() - scheduled_time
+        with self._lock:
+            self._record_jitter(jitter)
+        try:
+            self._func()
+        finally:
+            with self._lock:
+                self.num_runs += 1
+            self._scheduler._run_finished(self)
+
+    def get_stats(self):
+        """Returns the run counters, and the histogram of the delays between
+        the ticks and the starts of the runs."""
+        with self._lock:
+            histogram = dict(
+                ('<={}ms'.format(bound), count) for bound, count in zip(
+                    JITTER_BUCKETS_MS, self._jitter_counts))
+            histogram['>{}ms'.format(
+                JITTER_BUCKETS_MS[-1])] = (self._jitter_counts[-1])
+            return {
+                'rate': self.rate,
+                'overrun': self.overrun,
+                'runs': self.num_runs,
+                'skipped': self.num_skipped,
+                'coalesced': self.num_coalesced,
+                'max_jitter_ms': self._max_jitter * 1000,
+                'jitter_histogram': histogram,
+            }
+
+    def _record_jitter(self, jitter):
+        jitter_ms = jitter * 1000
+        bucket = len(JITTER_BUCKETS_MS)
+        for index, bound in enumerate(JITTER_BUCKETS_MS):
+            if jitter_ms <= bound:
+                bucket = index
+                break
+        self._jitter_counts[bucket] += 1
+        self._max_jitter = max(self._max_jitter, jitter)
+
+
+class PeriodicScheduler(object):
+    """Fires the ticks of all the periodic tasks of a process from a single
+    thread.
+
+    Ticks are kept in a heap ordered by their absolute scheduled times, so
+    that late wake-ups do not delay later ticks.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def add_task(self, task):
+        """Schedules the first tick of a task one period from now."""
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            task._scheduler = self
+            task._start_time = time.time()
+            task._tick = 1
+            self._push(task)
+
+    def remove_task(self, task):
+        """Stops firing the ticks of a task."""
+        with self._cond:
+            task._removed = True
+
+    def _push(self, task):
+        scheduled_time = task._start_time + task._tick * task.period
+        heapq.heappush(self._heap, (scheduled_time, next(self._counter), task))
+        if self._heap[0][2] is task:
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                entry = self._pop_expired()
+                if entry is None:
+                    continue
+                (scheduled_time, _, task) = entry
+                dispatch_time = self._fire(task, scheduled_time)
+                self._push(task)
+            if dispatch_time is not None:
+                self._dispatch(task, dispatch_time)
+
+    def _pop_expired(self):
+        if not self._heap:
+            self._cond.wait()
+            return None
+        (scheduled_time, _, task) = self._heap[0]
+        if task._removed:
+            heapq.heappop(self._heap)
+            return None
+        wait_time = scheduled_time - time.time()
+        if wait_time > 0:
+            self._cond.wait(wait_time)
+            return None
+        return heapq.heappop(self._heap)
+
+    def _fire(self, task, scheduled_time):
+        """Advances a task to its next tick. At most one run of a task is
+        dispatched and not finished, so that overrunning tasks do not fill
+        the mailboxes of their operators.
+
+        Returns:
+            (float): The scheduled time of the run to dispatch, or None.
+        """
+        if task.overrun == CATCH_UP:
+            task._tick += 1
+            with task._lock:
+                if task._running:
+                    if task._pending_time is None:
+                        task._pending_time = scheduled_time
+                    task._num_pending += 1
+                    return None
+                task._running = True
+            return scheduled_time
+        # Ticks the scheduler missed are not run separately.
+        num_late = max(0, int((time.time() - scheduled_time) / task.period))
+        task._tick += 1 + num_late
+        latest_time = scheduled_time + num_late * task.period
+        with task._lock:
+            if task._running:
+                if task.overrun == SKIP:
+                    task.num_skipped += 1 + num_late
+                else:
+                    if task._pending_time is not None:
+                        task.num_coalesced += 1
+                    task.num_coalesced += num_late
+                    task._pending_time = latest_time
+                return None
+            if task.overrun == SKIP:
+                task.num_skipped += num_late
+            else:
+                task.num_coalesced += num_late
+            task._running = True
+        return latest_time
+
+    def _run_finished(self, task):
+        with task._lock:
+            task._running = False
+            scheduled_time = task._pending_time
+            if scheduled_time is None or task._removed:
+                return
+            if task._num_pending > 1:
+                task._num_pending -= 1
+                task._pending_time = scheduled_time + task.period
+            else:
+                task._num_pending = 0
+                task._pending_time = None
+            task._running = True
+        self._dispatch(task, scheduled_time)
+
+    def _dispatch(self, task, scheduled_time):
+        try:
+            task._dispatch(task, scheduled_time)
+        except Exception:
+            logger.exception('Could not dispatch periodic task {}'.format(
+                task.name))
+
+
+_scheduler = None
+_scheduler_pid = None
+_scheduler_lock = threading.Lock()
+
+
+def get_periodic_scheduler():
+    """Returns the periodic scheduler of the process."""
+    global _scheduler, _scheduler_pid
+    with _scheduler_lock:
+        # The scheduler's thread does not survive a fork (e.g., ROS operators
+        # run in their own process).
+        if _scheduler is None or _scheduler_pid != os.getpid():
+            _scheduler = PeriodicScheduler()
+            _scheduler_pid = os.getpid()
+        return _scheduler
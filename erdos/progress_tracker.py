@@ -2,38 +2,97 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import ray
+import heapq
+
+from erdos.watermark_tracker import WatermarkTracker
 
 
-@ray.remote
 class ProgressTracker(object):
+    """Notifies operators once a timestamp is complete across the graph.
+
+    Every operator that receives watermarks reports the timestamps it
+    completes. The frontier is the minimum of the timestamps completed by
+    these operators, and a timestamp is complete once the frontier reaches
+    it. Pending notifications are kept in a heap ordered by timestamp, so
+    that all the notifications satisfied by an advance of the frontier are
+    popped in one pass. The notifications destined to an endpoint are then
+    delivered in a single `on_notify_batch` call.
+
+    The class is not thread-safe. Frameworks wrap it in an actor, or guard
+    it with a lock.
+    """
+
     def __init__(self):
-        self._notif_time_endpoints = {}
         self._endpoints = {}
-        self._completed_times = {}
+        self._frontier = WatermarkTracker()
+        # Heap of (coordinates, endpoint name, timestamp) tuples.
+        self._pending = []
+        self._pending_notifications = set()
 
-    def register_endpoint(self, endpoint_name, notif_actor):
-        self._endpoints[endpoint_name] = notif_actor
+    def register_endpoint(self, endpoint_name, endpoint, tracks_progress=True):
+        """Registers an endpoint to which notifications are delivered.
 
-    def notify_at(self, endpoint_name, time):
+        Args:
+            endpoint_name (str): The name of the operator.
+            endpoint: Object exposing `on_notify_batch(timestamps)`.
+            tracks_progress (bool): True if the operator reports completed
+                timestamps, and thus holds back the frontier.
+        """
+        self._endpoints[endpoint_name] = endpoint
+        self._frontier.add_stream(endpoint_name,
+                                  ignore_watermarks=not tracks_progress)
+
+    def get_frontier(self):
+        return self._frontier.low_watermark
+
+    def notify_at(self, endpoint_name, timestamp):
         """Called when an endpoint registers for a notification."""
-        if time not in self._notif_time_endpoints:
-            self._notif_time_endpoints[time] = [endpoint_name]
-        else:
-            self._notif_time_endpoints[time].append(enpoint)
-
-    def complete_time(self, endpoint_name, time):
-        """Called when an endpoint completes a time."""
-        if time not in self._completed_times:
-            self._completed_times[time] = 1
-        else:
-            self._completed_times[time] += 1
-
-        if self._completed_times[time]:
-            self.notify(time)
-
-    def notify(self, time):
-        """Send notifications to endpoints."""
-        for endpoint_name in self._notif_time_endpoints[time]:
-            self._endpoint[endpoint_name].on_notify.remote(time)
-        del self._notif_time_endpoints[time]
+        self._deliver_batches(self._notify_at(endpoint_name, timestamp))
+
+    def complete_time(self, endpoint_name, timestamp):
+        """Called when an endpoint completes a timestamp."""
+        self._deliver_batches(self._complete_time(endpoint_name, timestamp))
+
+    def _notify_at(self, endpoint_name, timestamp):
+        frontier = self._frontier.low_watermark
+        if frontier is not None and timestamp <= frontier:
+            # The timestamp is already complete.
+            return {endpoint_name: [timestamp]}
+        if (endpoint_name, timestamp) not in self._pending_notifications:
+            self._pending_notifications.add((endpoint_name, timestamp))
+            heapq.heappush(self._pending,
+                           (timestamp.coordinates, endpoint_name, timestamp))
+        return {}
+
+    def _complete_time(self, endpoint_name, timestamp):
+        if self._frontier.is_ignored(endpoint_name):
+            return {}
+        high_watermark = self._frontier.get_high_watermark(endpoint_name)
+        if high_watermark is not None and timestamp <= high_watermark:
+            # Completions may be reported again after a rollback.
+            return {}
+        frontier = self._frontier.update(endpoint_name, timestamp)
+        if frontier is None:
+            return {}
+        return self._pop_satisfied(frontier)
+
+    def _pop_satisfied(self, frontier):
+        """Pops the notifications whose timestamp is at most the frontier.
+
+        Returns:
+            (dict of str -> list of Timestamp): The timestamps to notify,
+            in increasing order, grouped by endpoint name.
+        """
+        batches = {}
+        while self._pending and self._pending[0][0] <= frontier.coordinates:
+            (_, endpoint_name, timestamp) = heapq.heappop(self._pending)
+            self._pending_notifications.discard((endpoint_name, timestamp))
+            batches.setdefault(endpoint_name, []).append(timestamp)
+        return batches
+
+    def _deliver_batches(self, batches):
+        for endpoint_name, timestamps in batches.items():
+            self._deliver(self._endpoints[endpoint_name], timestamps)
+
+    def _deliver(self, endpoint, timestamps):
+        endpoint.on_notify_batch(timestamps)
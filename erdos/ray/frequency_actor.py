@@ -2,26 +2,32 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import logging
-import time
+from erdos.periodic_scheduler import CATCH_UP, PeriodicTask
+from erdos.periodic_scheduler import get_periodic_scheduler
 
-import ray
 
-
-@ray.remote
 class FrequencyActor(object):
-    def __init__(self, ray_op):
-        self.ray_op = ray_op
+    """Triggers the periodic methods of a Ray operator.
+
+    The ticks are fired by the periodic scheduler of the operator's process,
+    which calls the operator's actor to run the methods. Hence, periodic
+    methods do not run concurrently with the operator's callbacks.
+    """
+
+    def __init__(self, op, ray_op):
+        self._op = op
+        self._ray_op = ray_op
+        self._tasks = []
+
+    def set_frequency(self, rate, func, overrun=CATCH_UP):
+        task_id = len(self._tasks)
+        task = PeriodicTask(
+            func.__name__, rate, func,
+            lambda task, scheduled_time: self._ray_op.on_frequency.remote(
+                task_id, scheduled_time), overrun)
+        self._tasks.append(task)
+        self._op.periodic_tasks[task.name] = task
+        get_periodic_scheduler().add_task(task)
 
-    def set_frequency(self, rate, func_name, *args):
-        period = 1 / rate
-        trigger_at = time.time() + period
-        while True:
-            time_until_trigger = trigger_at - time.time()
-            if time_until_trigger > 0:
-                time.sleep(time_until_trigger)
-            else:
-                logging.warning('Cannot run {} at desired rate {}'.format(
-                    func_name, rate))
-            self.ray_op.on_frequency.remote(func_name, *args)
-            trigger_at += period
+    def run(self, task_id, scheduled_time):
+        self._tasks[task_id].run(scheduled_time)
@@ -0,0 +1,45 @@
+import numbers
+
+import ray
+
+from erdos.message import DeferredData
+
+
+class PayloadRef(DeferredData):
+    """Reference to a message payload stored in the Ray object store.
+
+    Output streams with several dependent operators put large payloads in
+    the object store once, and send the reference to every dependent
+    operator instead of serializing the payload for each of them. Receivers
+    fetch the payload the first time the message data is accessed.
+
+    Attributes:
+        object_id (ray.ObjectID): The id of the payload in the object store.
+        size (int): The size of the payload in bytes.
+    """
+
+    __slots__ = ('object_id', 'size')
+
+    def __init__(self, object_id, size):
+        self.object_id = object_id
+        self.size = size
+
+    def __getstate__(self):
+        return (self.object_id, self.size)
+
+    def __setstate__(self, state):
+        (self.object_id, self.size) = state
+
+    def resolve(self):
+        """Fetches the payload from the object store."""
+        return ray.get(self.object_id)
+
+
+def payload_size(data):
+    """Returns the size in bytes of payloads whose size is cheap to compute,
+    and 0 otherwise."""
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    # numpy arrays, and array-like types.
+    size = getattr(data, 'nbytes', 0)
+    return size if isinstance(size, numbers.Integral) else 0
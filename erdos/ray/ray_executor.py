@@ -1,8 +1,17 @@
 import logging
 import ray
+from absl import flags
 
+from erdos.credits import BACKPRESSURE_LABEL
+from erdos.credits import CREDITS_LABEL
 from erdos.executor import Executor
+from erdos.metrics import get_registry
 from erdos.ray.ray_operator import RayOperator
+from erdos.ray.ray_output_data_stream import BATCH_SIZE_LABEL
+from erdos.ray.ray_output_data_stream import BATCH_TIMEOUT_LABEL
+from erdos.ray.ray_output_data_stream import PUT_MIN_BYTES_LABEL
+
+FLAGS = flags.FLAGS
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +41,20 @@ class RayExecutor(Executor):
             stream.callbacks = set([f.__name__ for f in stream.callbacks])
             stream.completion_callbacks = set(
                              [f.__name__ for f in stream.completion_callbacks])
+            # Flags are not parsed in the actor processes, so the defaults
+            # are passed to the output streams as labels.
+            stream.labels.setdefault(PUT_MIN_BYTES_LABEL,
+                                     str(FLAGS.ray_put_min_bytes))
+            if FLAGS.stream_credits > 0:
+                stream.labels.setdefault(CREDITS_LABEL,
+                                         str(FLAGS.stream_credits))
+                stream.labels.setdefault(BACKPRESSURE_LABEL,
+                                         FLAGS.stream_backpressure)
+            if FLAGS.ray_batch_size > 1:
+                stream.labels.setdefault(BATCH_SIZE_LABEL,
+                                         str(FLAGS.ray_batch_size))
+                stream.labels.setdefault(BATCH_TIMEOUT_LABEL,
+                                         str(FLAGS.ray_batch_timeout_ms))
 
         # Create the Ray actor wrapping the ERDOS operator.
         ray_op = RayOperator._remote([self.op_handle], {}, num_cpus, num_gpus,
@@ -52,3 +75,14 @@ class RayExecutor(Executor):
         # would block until the operator completes.
         logger.info('Executing {}'.format(self.op_handle.name))
         self.op_handle.executor_handle.execute.remote()
+
+
+def get_ray_metrics(op_handles):
+    """Returns the metrics of the driver and of the operator actors."""
+    snapshot = get_registry().snapshot()
+    for actor_snapshot in ray.get([
+            op_handle.executor_handle.get_metrics.remote()
+            for op_handle in op_handles
+    ]):
+        snapshot.extend(actor_snapshot)
+    return snapshot
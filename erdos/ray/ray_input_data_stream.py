@@ -9,14 +9,15 @@ class RayInputDataStream(DataStream):
             labels=data_stream.labels,
             callbacks=data_stream.callbacks,
             completion_callbacks=data_stream.completion_callbacks,
-            uid=data_stream.uid)
+            uid=data_stream.uid,
+            id=data_stream.id)
         self._actor_handle = actor_handle
 
     def setup(self):
         for on_msg_callback in self.callbacks:
             self._actor_handle.register_callback.remote(
                 self.uid, on_msg_callback)
- 
+
         for on_watermark_callback in self.completion_callbacks:
             self._actor_handle.register_completion_callback.remote(
                 self.uid, on_watermark_callback)
@@ -2,13 +2,21 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import threading
 import time
+from functools import partial
 
 import ray
 
+from erdos.credits import DeferredCredit
+from erdos.deadline_queue import DeadlineQueue, get_latency_budgets
+from erdos.input_queue import InputQueue
+from erdos.metrics import CallbackMetrics, get_registry
+from erdos.parallel_callbacks import ParallelCallbackRunner
 from erdos.ray.frequency_actor import FrequencyActor
 from erdos.ray.ray_input_data_stream import RayInputDataStream
 from erdos.ray.ray_output_data_stream import RayOutputDataStream
+from erdos.tracing import configure_tracing, get_op_tracer
 from erdos.utils import setup_logging
 from erdos.message import WatermarkMessage
 
@@ -20,10 +28,11 @@ class RayOperator(object):
        Attributes:
            _op_handle: Handle to the ERDOS operator, which the actor wraps.
            _callbacks: A dict storing the callbacks associated to each stream.
-           _op_freq_actor: A Ray actor used to trigger periodic tasks/methods.
+           _op_freq_actor: Triggers periodic tasks/methods.
     """
 
     def __init__(self, op_handle):
+        configure_tracing(op_handle.trace_file, op_handle.trace_sample_rate)
         # Init ERDOS operator.
         try:
             self._op = op_handle.op_cls(op_handle.name, **op_handle.init_args)
@@ -34,67 +43,195 @@ class RayOperator(object):
                                              e.args[0])
                 e.args = (first_arg, ) + e.args[1:]
             raise
+        self._op.progress_tracker = op_handle.progress_tracker
         self._input_streams = op_handle.input_streams
         self._output_streams = op_handle.output_streams
         # Handle to the actor
         self._handle = None
         self._callbacks = {}
         self._completion_callbacks = {}
+        # Maps the uids of the streams that have a queue policy to their
+        # input queues.
+        self._input_queues = {}
+        # Messages waiting to be processed in earliest deadline first order,
+        # or None if the input streams do not have latency budgets.
+        self._deadline_queue = None
+        # Maps stream ids to (stream uid, stream name) tuples.
+        self._stream_ids = {}
+        # Maps stream uids to the number of credits of calls whose messages
+        # were processed after the calls returned.
+        self._released_credits = {}
+        self._released_credits_lock = threading.Lock()
+        self._callback_metrics = CallbackMetrics(op_handle.name)
+        self._tracer = get_op_tracer(op_handle.name)
+        # Runs the callbacks for different timestamps concurrently, if the
+        # operator's parallelism is greater than one.
+        self._parallel_runner = None
+        if op_handle.parallelism > 1:
+            self._parallel_runner = ParallelCallbackRunner(
+                op_handle.name, op_handle.parallelism)
 
-    def on_msg(self, msg):
-        """Invokes corresponding callback for stream stream_name."""
+    def on_msg(self, msg, credited=False):
+        """Invokes corresponding callback for stream stream_name.
+
+        Args:
+            msg (Message): The message.
+            credited (bool): Whether the message consumed a credit of the
+                sender.
+
+        Returns:
+            (bool): False if the callbacks run after the call returns (e.g.,
+            if the message is queued), in which case the credit of the
+            message is returned by `get_released_credits`.
+        """
+        credit = self._create_credit(msg) if credited else None
+        self._receive_msg(msg, credit)
+        self._drain_deadline_queue()
+        return credit is None or credit.end_call()
+
+    def _receive_msg(self, msg, credit=None):
+        self._restore_stream(msg)
+        if self._tracer:
+            self._tracer.instant('receive', msg)
+        if credit is not None:
+            # Released once the callbacks ran, or once the message is
+            # discarded.
+            credit.hold()
+        input_queue = self._input_queues.get(msg.stream_uid)
+        if input_queue is None:
+            if credit is None:
+                self._dispatch(self._on_msg, msg)
+            else:
+                self._dispatch(partial(self._on_msg, credit=credit), msg)
+        else:
+            # The payloads of discarded messages are never fetched.
+            for (_, dropped_credit) in input_queue.put((msg, credit)):
+                if dropped_credit is not None:
+                    dropped_credit.done()
+            self._schedule_drain(msg.stream_uid, input_queue)
+
+    def _on_msg(self, msg, credit=None):
         self._op.log_event(time.time(), msg.timestamp,
                            'receive {}'.format(msg.stream_name))
-        for cb in self._callbacks.get(msg.stream_uid, []):
-            cb(msg)
+        if self._tracer:
+            self._tracer.instant('dequeue', msg)
+        # A `PayloadRef` is only fetched if a callback accesses msg.data.
+        callbacks = self._callbacks.get(msg.stream_uid, [])
+        if self._parallel_runner is None or msg.timestamp is None:
+            self._run_callbacks(callbacks, msg, credit)
+        else:
+            self._parallel_runner.submit(
+                msg.timestamp,
+                partial(self._run_callbacks, callbacks, msg, credit))
+
+    def _run_callbacks(self, callbacks, msg, credit=None):
+        start_time = time.time()
+        try:
+            for cb in callbacks:
+                cb(msg)
+        finally:
+            if credit is not None:
+                credit.done()
+        self._callback_metrics.record(msg.stream_name,
+                                      time.time() - start_time)
+        if self._tracer:
+            self._tracer.span('callback', msg, start_time)
+
+    def on_msg_batch(self, msgs, credited=False):
+        """Invokes the callbacks for a batch of messages, in order, or in
+        earliest deadline first order if the streams have latency budgets.
+        A credited batch consumed a single credit of the sender, and returns
+        as `on_msg` does."""
+        credit = self._create_credit(msgs[0]) if credited else None
+        for msg in msgs:
+            if isinstance(msg, WatermarkMessage):
+                self._receive_completion_msg(msg)
+            else:
+                self._receive_msg(msg, credit)
+        self._drain_deadline_queue()
+        return credit is None or credit.end_call()
+
+    def get_released_credits(self, stream_uid):
+        """Returns the number of credits of calls on a stream whose messages
+        were processed after the calls returned. Called by the sender of the
+        stream once it runs out of credits."""
+        with self._released_credits_lock:
+            return self._released_credits.get(stream_uid, 0)
+
+    def _create_credit(self, msg):
+        self._restore_stream(msg)
+        return DeferredCredit(partial(self._release_credit, msg.stream_uid))
+
+    def _release_credit(self, stream_uid):
+        with self._released_credits_lock:
+            self._released_credits[stream_uid] = (
+                self._released_credits.get(stream_uid, 0) + 1)
 
     def on_completion_msg(self, msg):
         """Invokes corresponding callback for stream stream_name."""
+        self._receive_completion_msg(msg)
+        self._drain_deadline_queue()
+
+    def _receive_completion_msg(self, msg):
+        self._restore_stream(msg)
+        if self._tracer:
+            self._tracer.instant('receive watermark', msg)
+        input_queue = self._input_queues.get(msg.stream_uid)
+        if input_queue is None:
+            self._dispatch(self._on_completion_msg, msg)
+        else:
+            input_queue.put((msg, None), is_watermark=True)
+            self._schedule_drain(msg.stream_uid, input_queue)
+
+    def on_queued_msg(self, stream_uid):
+        """Processes the oldest message in the input queue of a stream.
+        Method is called by the actor itself once per queued message, after
+        the messages the actor received before.
+        """
+        item = self._input_queues[stream_uid].drain()
+        if item is None:
+            return
+        ((msg, credit), is_watermark) = item
+        if is_watermark:
+            self._on_completion_msg(msg)
+        else:
+            self._on_msg(msg, credit)
+
+    def _on_completion_msg(self, msg):
         self._op.log_event(time.time(), msg.timestamp,
                            'receive watermark {}'.format(msg.stream_name))
+        if self._tracer:
+            self._tracer.instant('dequeue watermark', msg)
 
-        # Ensure that the watermark is monotonically increasing.
-        high_watermark = self._op._stream_to_high_watermark[msg.stream_name]
-        if not high_watermark:
-            # The first watermark, just set the dictionary with the value.
-            self._op._stream_to_high_watermark[
-                msg.stream_name] = msg.timestamp
-        else:
-            if high_watermark >= msg.timestamp:
-                raise Exception(
-                    "The watermark received in the msg {} is not "
-                    "higher than the watermark previously received "
-                    "on the same stream: {}".format(msg, high_watermark))
-            else:
-                self._op._stream_to_high_watermark[msg.stream_name] = \
-                        msg.timestamp
-
-        # Now check if all other streams have a higher or equal watermark.
-        # If yes, flow this watermark. If not, return from this function
-        # Also, maintain the lowest watermark observed.
-        low_watermark = msg.timestamp
-        for stream, watermark in self._op._stream_to_high_watermark.items():
-            # TODO(yika): big HACK on ignoring watermark sent on stream
-            # with label 'no_watermark' = true
-            if (stream not in self._op._stream_ignore_watermarks and
-                stream != msg.stream_name):
-                if not watermark or watermark < msg.timestamp:
-                    return
-                if low_watermark > watermark:
-                    low_watermark = watermark
-        new_msg = WatermarkMessage(low_watermark)
+        # Flow the watermark only if it advances the low watermark across
+        # all the input streams.
+        new_msg = self._op._receive_watermark(msg)
+        if new_msg is None:
+            return
         new_msg.stream_uid = msg.stream_uid
+        if self._parallel_runner is None:
+            self._on_low_watermark(new_msg, msg.stream_name)
+        else:
+            # The completion callbacks wait for the callbacks of earlier
+            # timestamps to finish.
+            self._parallel_runner.submit_watermark(
+                new_msg.timestamp,
+                partial(self._on_low_watermark, new_msg, msg.stream_name))
 
-        # Checkpoint.
-        # Note: For correctness reasons, we can only flow watermarks after
-        # we checkpoint.
-        if (self._op._checkpoint_enable and
-            self._op.checkpoint_condition(msg.timestamp)):
-            self._op._checkpoint(msg.timestamp)
-
+    def _on_low_watermark(self, new_msg, stream_name):
         # Call the required callbacks.
-        for cb in self._completion_callbacks.get(new_msg.stream_uid, []):
+        completion_callbacks = self._completion_callbacks.get(
+            new_msg.stream_uid, [])
+        start_time = time.time()
+        for cb in completion_callbacks:
             cb(new_msg)
+        if completion_callbacks:
+            self._callback_metrics.record(stream_name,
+                                          time.time() - start_time,
+                                          completion=True)
+            if self._tracer:
+                self._tracer.span('completion callback', new_msg, start_time,
+                                  stream_name)
 
         # Finished calling the required callbacks. Send the watermark forward
         # to the dependent operators.
@@ -102,9 +239,42 @@ class RayOperator(object):
         # TODO (sukritk) :: Same issue as erdos/ros/ros_input_data_stream.py
         # TODO (sukritk) FIX (Ray Issue #4463): Remove when Ray issue is fixed.
         if not self._completion_callbacks.get(new_msg.stream_uid):
-            watermark_msg = WatermarkMessage(msg.timestamp, msg.stream_name)
+            watermark_msg = WatermarkMessage(new_msg.timestamp, stream_name)
             for output_stream in self._op.output_streams.values():
                 output_stream.send(watermark_msg)
+        self._op._complete_timestamp(new_msg.timestamp)
+
+    def on_notify_batch(self, timestamps):
+        """Notifies the operator of completed timestamps, in order.
+        Method is called by the progress tracker.
+        """
+        for timestamp in timestamps:
+            self._op.on_notify(timestamp)
+
+    def get_input_stream_stats(self):
+        """Returns the number of messages received and discarded on every
+        input stream that has a queue policy."""
+        return dict((self._stream_ids[input_stream.id][1],
+                     self._input_queues[input_stream.uid].get_stats())
+                    for input_stream in self._input_streams
+                    if input_stream.uid in self._input_queues)
+
+    def get_metrics(self):
+        """Returns a snapshot of the metrics of the actor's process."""
+        return get_registry().snapshot()
+
+    def get_output_stream_stats(self):
+        """Returns the number of messages sent by reference, the bytes
+        saved by doing so, and the flow control counters for every output
+        stream."""
+        return {
+            name: {
+                'num_refs_sent': stream.num_refs_sent,
+                'bytes_saved': stream.bytes_saved,
+                'credits': stream.get_credit_stats()
+            }
+            for name, stream in self._op.output_streams.items()
+        }
 
     def register_callback(self, stream_uid, callback_name):
         """Registers a callback for a given stream."""
@@ -114,31 +284,45 @@ class RayOperator(object):
     def register_completion_callback(self, stream_uid, callback_name):
         """Registers a watermark completion callback for a given stream."""
         callbacks = self._completion_callbacks.get(stream_uid, [])
-        self._completion_callbacks[stream_uid] = callbacks + [getattr(self._op, callback_name)]
+        self._completion_callbacks[stream_uid] = callbacks + [
+            getattr(self._op, callback_name)
+        ]
 
-    def on_frequency(self, func_name, *args):
-        """Invokes operator func_name.
-        Method is called by the frequency actor when a periodic task/method
-        must run.
+    def on_frequency(self, task_id, scheduled_time):
+        """Runs a periodic task/method of the operator.
+        Method is called by the periodic scheduler when a periodic
+        task/method must run.
         """
-        callback = getattr(self._op, func_name)
-        callback(*args)
+        self._op.freq_actor.run(task_id, scheduled_time)
+
+    def get_periodic_task_stats(self):
+        """Returns the run counters and jitter histograms of the periodic
+        methods."""
+        return dict((name, task.get_stats())
+                    for name, task in self._op.periodic_tasks.items())
 
     def set_handle(self, handle):
         self._handle = handle
 
     def setup_frequency_actor(self):
-        """Creates a Ray frequency actor.
-        Each Ray operator has a Ray frequency actor associated with it. The
-        actor call on_frequency when periodic methods must execute.
+        """Creates the frequency actor of the operator, which calls
+        on_frequency when periodic methods must execute.
         """
-        self._op.freq_actor = FrequencyActor.remote(self._handle)
+        self._op.freq_actor = FrequencyActor(self._op, self._handle)
 
     def setup_streams(self, dependant_ops_handles):
         """Sets the input_stream.ray_sink to the Ray operator."""
-        # Populate the map with the correct stream names.
+        # Populate the map with the correct stream ids.
         for input_stream in self._input_streams:
-            self._op._stream_to_high_watermark[input_stream.name] = None
+            self._stream_ids[input_stream.id] = (input_stream.uid,
+                                                 input_stream.name)
+            input_queue = InputQueue.from_labels(input_stream.labels)
+            if input_queue is not None:
+                self._input_queues[input_stream.uid] = input_queue
+
+        latency_budgets = get_latency_budgets(self._input_streams)
+        if latency_budgets:
+            self._deadline_queue = DeadlineQueue(latency_budgets)
 
         # Wrap input streams in Ray data streams.
         ray_input_streams = [
@@ -155,7 +339,34 @@ class RayOperator(object):
         ]
         self._op._add_output_streams(ray_output_streams)
         self._op._internal_setup_streams()
+        if self._parallel_runner is not None:
+            self._parallel_runner.resequence_output_streams(self._op)
 
     def execute(self):
         """Executes the operator."""
         self._op.execute()
+
+    def _dispatch(self, method, msg):
+        if self._deadline_queue is None:
+            method(msg)
+        else:
+            self._deadline_queue.append((method, msg), msg.stream_uid)
+
+    def _drain_deadline_queue(self):
+        """Processes the messages the current call received in earliest
+        deadline first order. Ray delivers calls in arrival order, so only
+        the messages of a call (e.g., of a batch) are reordered."""
+        if self._deadline_queue is None:
+            return
+        while self._deadline_queue:
+            (method, msg) = self._deadline_queue.popleft()
+            method(msg)
+
+    def _schedule_drain(self, stream_uid, input_queue):
+        if input_queue.schedule_drain():
+            self._handle.on_queued_msg.remote(stream_uid)
+
+    def _restore_stream(self, msg):
+        """Sets the stream uid and name of a message from its stream id."""
+        if msg.stream_uid is None:
+            (msg.stream_uid, msg.stream_name) = self._stream_ids[msg.stream_id]
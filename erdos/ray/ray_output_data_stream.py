@@ -1,21 +1,96 @@
+import copy
+import threading
 import time
 
+import ray
+
+from erdos.credits import BLOCK
+from erdos.credits import create_credit_gates
 from erdos.data_stream import DataStream
 from erdos.message import WatermarkMessage
+from erdos.metrics import SendMetrics
+from erdos.tracing import get_op_tracer
+from erdos.ray.payload_ref import PayloadRef, payload_size
+
+# Labels that enable batching of the messages sent on a stream.
+BATCH_SIZE_LABEL = 'batch_size'
+BATCH_TIMEOUT_LABEL = 'batch_timeout_ms'
+# Label setting the size above which payloads sent to several dependent
+# operators are put in the object store once. 0 disables it.
+PUT_MIN_BYTES_LABEL = 'put_min_bytes'
+# Seconds between two polls of the credits a receiver released once its
+# deferred callbacks ran, while the sender waits for credits.
+DEFERRED_CREDIT_POLL_PERIOD = 0.001
 
 
 class RayOutputDataStream(DataStream):
+    """Ray data stream on which an operator publishes.
+
+    Streams with a `batch_size` label greater than 1 group messages into a
+    single `on_msg_batch` call per dependent operator. A batch is sent once
+    it holds `batch_size` messages, once it contains a watermark, or
+    `batch_timeout_ms` (default 1 ms) after its first message was queued.
+    Batches hold shallow copies of the messages, so payloads must not be
+    modified after they are sent on a batched stream.
+
+    When the stream has several dependent operators, payloads larger than
+    the `put_min_bytes` label are put in the object store once, and the
+    dependent operators receive a `PayloadRef` which is resolved when a
+    callback first accesses the message data.
+
+    Streams with a `credits` label bound the number of messages each
+    dependent operator has not processed yet. A credit returns once the
+    remote call completes if the call ran the callbacks. Otherwise (e.g.,
+    if the receiver queued the message, or runs its callbacks in parallel),
+    the receiver counts the credit once the callbacks ran, and the sender
+    collects it with `get_released_credits` once it runs out of credits.
+    Once a dependent operator has no credits left, the `backpressure` label
+    decides whether the sender blocks, drops the message, or coalesces it
+    with later messages. On batched streams a credit covers a batch, and
+    the sender always blocks because batches carry watermarks.
+
+    Attributes:
+        num_refs_sent (int): Number of messages sent by reference.
+        bytes_saved (int): Payload bytes that were not serialized because
+            messages were sent by reference.
+    """
+
     def __init__(self, op, dependant_op_handles, data_stream):
-        super(RayOutputDataStream, self).__init__(
-            data_type=data_stream.data_type,
-            name=data_stream.name,
-            labels=data_stream.labels,
-            callbacks=data_stream.callbacks,
-            uid=data_stream.uid)
+        super(RayOutputDataStream,
+              self).__init__(data_type=data_stream.data_type,
+                             name=data_stream.name,
+                             labels=data_stream.labels,
+                             callbacks=data_stream.callbacks,
+                             uid=data_stream.uid,
+                             id=data_stream.id)
         self._op = op
         self._dependant_op_handles = dependant_op_handles
         self._dependant_op_on_msg = None
         self._dependant_op_on_completion = None
+        self._dependant_op_on_msg_batch = None
+        self._batch_size = int(self.labels.get(BATCH_SIZE_LABEL, '1'))
+        self._batch_timeout = float(self.labels.get(BATCH_TIMEOUT_LABEL,
+                                                    '1')) / 1000
+        self._batch = []
+        self._batch_deadline = None
+        self._batch_cond = threading.Condition()
+        self._flusher = None
+        self._put_min_bytes = int(self.labels.get(PUT_MIN_BYTES_LABEL, '0'))
+        self.num_refs_sent = 0
+        self.bytes_saved = 0
+        self._credit_gates = create_credit_gates(self.labels,
+                                                 len(dependant_op_handles))
+        # The object ids of the calls in flight to each dependent operator.
+        self._in_flight_calls = [[] for _ in dependant_op_handles]
+        # Number of credits of completed calls that each dependent operator
+        # has not released yet, because it processes their messages later.
+        self._num_deferred = [0 for _ in dependant_op_handles]
+        # Number of deferred credits each dependent operator released, and
+        # the object id of the pending `get_released_credits` call.
+        self._num_released = [0 for _ in dependant_op_handles]
+        self._release_polls = [None for _ in dependant_op_handles]
+        self._send_metrics = SendMetrics(op.name, self.name)
+        self._tracer = get_op_tracer(op.name)
 
     def send(self, msg):
         """Send a message on the stream.
@@ -23,16 +98,55 @@ class RayOutputDataStream(DataStream):
         """
         msg.stream_name = self.name
         msg.stream_uid = self.uid
+        msg.stream_id = self.id
         if isinstance(msg, WatermarkMessage):
-            self._op.log_event(time.time(), msg.timestamp,
-                           'watermark send {}'.format(self.name))
-            for on_completion_func in self._dependant_op_on_completion:
-                on_completion_func.remote(msg)
+            send_time = time.time()
+            self._op.log_event(send_time, msg.timestamp,
+                               'watermark send {}'.format(self.name))
+            if self._batch_size > 1:
+                self._add_to_batch(msg)
+            else:
+                for index, on_completion_func in enumerate(
+                        self._dependant_op_on_completion):
+                    if self._credit_gates:
+                        # Coalesced messages precede the watermark.
+                        pending_msg = self._credit_gates[index].take_pending()
+                        if pending_msg is not None:
+                            self._in_flight_calls[index].append(
+                                self._dependant_op_on_msg[index].remote(
+                                    pending_msg, True))
+                    on_completion_func.remote(msg)
+            if self._tracer:
+                self._tracer.span('send watermark', msg, send_time)
         else:
-            self._op.log_event(time.time(), msg.timestamp,
+            send_time = time.time()
+            self._op.log_event(send_time, msg.timestamp,
                                'send {}'.format(self.name))
-            for on_msg_func in self._dependant_op_on_msg:
-                on_msg_func.remote(msg)
+            msg = self._maybe_send_by_reference(msg)
+            if self._batch_size > 1:
+                self._add_to_batch(msg)
+            else:
+                for index, on_msg_func in enumerate(self._dependant_op_on_msg):
+                    if self._credit_gates:
+                        self._send_with_credit(index, on_msg_func, msg)
+                    else:
+                        on_msg_func.remote(msg)
+            self._send_metrics.record(time.time() - send_time)
+            if self._tracer:
+                self._tracer.span('send', msg, send_time)
+
+    def get_credit_stats(self):
+        """Returns the flow control counters of each dependent operator,
+        keyed by the operator's position."""
+        if not self._credit_gates:
+            return {}
+        return dict((str(index), gate.get_stats())
+                    for index, gate in enumerate(self._credit_gates))
+
+    def flush(self):
+        """Sends the messages that are waiting in the current batch."""
+        with self._batch_cond:
+            self._flush_batch()
 
     def setup(self):
         """Setup dependant operator on_msg methods.
@@ -47,3 +161,132 @@ class RayOutputDataStream(DataStream):
             getattr(actor_handle, "on_completion_msg")
             for actor_handle in self._dependant_op_handles
         ]
+        self._dependant_op_on_msg_batch = [
+            getattr(actor_handle, "on_msg_batch")
+            for actor_handle in self._dependant_op_handles
+        ]
+
+    def _maybe_send_by_reference(self, msg):
+        """Puts large payloads in the object store if they would otherwise
+        be serialized once per dependent operator."""
+        num_dependants = len(self._dependant_op_handles)
+        if self._put_min_bytes <= 0 or num_dependants < 2:
+            return msg
+        size = payload_size(msg.data)
+        if size < self._put_min_bytes:
+            return msg
+        # Do not modify the message the operator sent.
+        ref_msg = copy.copy(msg)
+        ref_msg.data = PayloadRef(ray.put(msg.data), size)
+        self.num_refs_sent += 1
+        self.bytes_saved += (num_dependants - 1) * size
+        return ref_msg
+
+    def _add_to_batch(self, msg):
+        # Operators may reuse the message before the batch is sent.
+        msg = copy.copy(msg)
+        with self._batch_cond:
+            self._batch.append(msg)
+            # Watermarks are not delayed because they unblock completion
+            # callbacks downstream.
+            if (len(self._batch) >= self._batch_size
+                    or isinstance(msg, WatermarkMessage)):
+                self._flush_batch()
+            elif len(self._batch) == 1:
+                self._batch_deadline = time.time() + self._batch_timeout
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._run_flusher)
+                    self._flusher.daemon = True
+                    self._flusher.start()
+                self._batch_cond.notify()
+
+    def _flush_batch(self):
+        """Sends the current batch. Must hold the batch lock, which ensures
+        that batches are sent in order."""
+        if not self._batch:
+            return
+        batch = self._batch
+        self._batch = []
+        for index, on_msg_batch_func in enumerate(
+                self._dependant_op_on_msg_batch):
+            if self._credit_gates:
+                gate = self._credit_gates[index]
+                if not gate.has_credit():
+                    self._reclaim_credits(index)
+                while not gate.try_acquire():
+                    self._wait_for_credit(index)
+                self._in_flight_calls[index].append(
+                    on_msg_batch_func.remote(batch, True))
+            else:
+                on_msg_batch_func.remote(batch)
+
+    def _send_with_credit(self, index, on_msg_func, msg):
+        gate = self._credit_gates[index]
+        # Completed calls are only checked once the credits run out.
+        if not gate.has_credit():
+            self._reclaim_credits(index)
+        while not gate.acquire(msg):
+            if gate.policy != BLOCK:
+                # The message was dropped or coalesced.
+                return
+            self._wait_for_credit(index)
+        self._in_flight_calls[index].append(on_msg_func.remote(msg, True))
+
+    def _reclaim_credits(self, index):
+        """Returns the credits of the completed calls that ran their
+        callbacks, and the deferred credits the receiver released."""
+        gate = self._credit_gates[index]
+        calls = self._in_flight_calls[index]
+        if calls:
+            (done, not_done) = ray.wait(calls,
+                                        num_returns=len(calls),
+                                        timeout=0)
+            if done:
+                self._in_flight_calls[index] = not_done
+                try:
+                    results = ray.get(done)
+                except Exception:
+                    # The calls that failed do not run callbacks later.
+                    results = [True] * len(done)
+                num_processed = sum(1 for processed in results if processed)
+                gate.release(num_processed)
+                self._num_deferred[index] += len(done) - num_processed
+        if self._num_deferred[index] and self._release_polls[index] is None:
+            self._release_polls[index] = self._dependant_op_handles[
+                index].get_released_credits.remote(self.uid)
+        poll = self._release_polls[index]
+        if poll is not None and ray.wait([poll], timeout=0)[0]:
+            self._release_polls[index] = None
+            num_released = ray.get(poll) - self._num_released[index]
+            self._num_released[index] += num_released
+            self._num_deferred[index] -= num_released
+            gate.release(num_released)
+
+    def _wait_for_credit(self, index):
+        start_time = time.time()
+        waiting = list(self._in_flight_calls[index])
+        if self._release_polls[index] is not None:
+            waiting.append(self._release_polls[index])
+        if waiting:
+            ray.wait(waiting, num_returns=1)
+        if (not self._in_flight_calls[index]
+                and self._release_polls[index] is not None
+                and ray.wait([self._release_polls[index]], timeout=0)[0]):
+            # Deferred callbacks are still running. Poll the receiver
+            # again after a while.
+            time.sleep(DEFERRED_CREDIT_POLL_PERIOD)
+        self._credit_gates[index].record_blocked_time(time.time() - start_time)
+        self._reclaim_credits(index)
+
+    def _run_flusher(self):
+        """Sends batches that have not filled up before their deadline."""
+        with self._batch_cond:
+            while True:
+                if not self._batch:
+                    self._batch_cond.wait()
+                    continue
+                time_until_deadline = self._batch_deadline - time.time()
+                if time_until_deadline > 0:
+                    self._batch_cond.wait(time_until_deadline)
+                else:
+                    self._flush_batch()
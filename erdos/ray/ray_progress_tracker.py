@@ -0,0 +1,19 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ray
+
+from erdos.progress_tracker import ProgressTracker
+
+
+@ray.remote
+class RayProgressTracker(ProgressTracker):
+    """Ray actor which tracks the progress of the Ray operators.
+
+    The endpoints are `RayOperator` actor handles, and each batch of
+    notifications is delivered with a single remote call.
+    """
+
+    def _deliver(self, endpoint, timestamps):
+        endpoint.on_notify_batch.remote(timestamps)
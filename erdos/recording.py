@@ -0,0 +1,389 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import logging
+import os
+import pickle
+import struct
+import sys
+import threading
+import time
+import zlib
+
+from erdos.utils import register_open_writer, unregister_open_writer
+
+logger = logging.getLogger(__name__)
+
+FILE_MAGIC = b'ERDOSREC'
+FORMAT_VERSION = 1
+_FILE_HEADER = struct.Struct('<8sH')
+# Blocks hold their kind, flags, and their size before and after
+# compression.
+_BLOCK_HEADER = struct.Struct('<4sBII')
+# The trailer holds the offset of the footer block.
+_TRAILER = struct.Struct('<Q8s')
+TRAILER_MAGIC = b'ERDOSEND'
+
+STREAMS_BLOCK = b'STRM'
+DATA_BLOCK = b'DATA'
+INDEX_BLOCK = b'INDX'
+FOOTER_BLOCK = b'FOOT'
+_COMPRESSED = 1
+
+# Chunks are written once their messages take this many bytes.
+DEFAULT_CHUNK_SIZE = 1 << 20
+DEFAULT_COMPRESSION_LEVEL = 6
+# Chunks are also written once their first message is this many seconds old.
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+class ChunkInfo(object):
+    """Summary of a chunk, which readers use to skip chunks.
+
+    Attributes:
+        data_offset (int): Offset of the chunk's data block.
+        index_offset (int): Offset of the chunk's index block.
+        num_messages (int): Number of messages in the chunk.
+        min_coordinates, max_coordinates (tuple of int): Smallest and
+            largest timestamp coordinates of the chunk's messages. Messages
+            without timestamp have empty coordinates.
+        streams (frozenset of int): Indices of the chunk's streams.
+    """
+
+    __slots__ = ('data_offset', 'index_offset', 'num_messages',
+                 'min_coordinates', 'max_coordinates', 'streams')
+
+    def __init__(self, data_offset, index_offset, num_messages,
+                 min_coordinates, max_coordinates, streams):
+        self.data_offset = data_offset
+        self.index_offset = index_offset
+        self.num_messages = num_messages
+        self.min_coordinates = min_coordinates
+        self.max_coordinates = max_coordinates
+        self.streams = frozenset(streams)
+
+    def to_tuple(self):
+        return (self.data_offset, self.index_offset, self.num_messages,
+                self.min_coordinates, self.max_coordinates,
+                tuple(sorted(self.streams)))
+
+
+class RecordingWriter(object):
+    """Writes messages to an indexed, chunked recording.
+
+    A recording starts with the recorded streams, followed by chunks. A
+    chunk's data block holds pickled messages, optionally compressed with
+    zlib, and its index block lists the (timestamp coordinates, stream
+    index, offset, size) of every message in the data block. Closing the
+    writer appends a footer which summarizes the chunks, so that readers
+    only read the chunks they need. Recordings whose writer did not close
+    are read by scanning their chunks.
+
+    Args:
+        path (str): Path of the recording.
+        streams (list of (type, str)): The data type and name of the
+            recorded streams.
+        chunk_size (int): Bytes of pickled messages after which a chunk is
+            written.
+        compress (bool): Whether to compress data blocks.
+        compression_level (int): zlib compression level.
+        flush_interval (float): Seconds after which buffered messages are
+            written as a chunk, even if the chunk is smaller than
+            chunk_size. None to only write full chunks.
+    """
+
+    def __init__(self,
+                 path,
+                 streams,
+                 chunk_size=DEFAULT_CHUNK_SIZE,
+                 compress=False,
+                 compression_level=DEFAULT_COMPRESSION_LEVEL,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self._stream_indices = dict(
+            (name, index) for (index, (_, name)) in enumerate(streams))
+        self._chunk_size = chunk_size
+        self._compress = compress
+        self._compression_level = compression_level
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._chunks = []
+        self._buffer = []
+        self._buffer_size = 0
+        self._buffer_time = None
+        self._index = []
+        self._file = open(path, 'wb')
+        self._file.write(_FILE_HEADER.pack(FILE_MAGIC, FORMAT_VERSION))
+        self._write_block(STREAMS_BLOCK,
+                          pickle.dumps(list(streams), pickle.HIGHEST_PROTOCOL))
+        # Readers of the recording may start before the first chunk.
+        self._file.flush()
+        register_open_writer(self)
+
+    def write(self, stream_name, msg):
+        """Appends a message received on the stream named stream_name."""
+        data = pickle.dumps(msg, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if self._file is None:
+                raise ValueError('Recording {} is closed'.format(self.path))
+            coordinates = () if msg.timestamp is None else tuple(
+                msg.timestamp.coordinates)
+            self._index.append((coordinates, self._stream_indices[stream_name],
+                                self._buffer_size, len(data)))
+            if not self._buffer:
+                self._buffer_time = time.time()
+            self._buffer.append(data)
+            self._buffer_size += len(data)
+            if self._buffer_size >= self._chunk_size:
+                self._write_chunk()
+            elif self._flush_due():
+                self._write_chunk()
+                self._file.flush()
+
+    def flush(self):
+        """Writes the buffered messages as a chunk."""
+        with self._lock:
+            if self._file is not None:
+                self._write_chunk()
+                self._file.flush()
+
+    def flush_if_due(self):
+        """Writes the buffered messages as a chunk if the oldest of them
+        was buffered flush_interval seconds ago."""
+        with self._lock:
+            if self._file is not None and self._flush_due():
+                self._write_chunk()
+                self._file.flush()
+
+    def close(self):
+        """Writes the buffered messages and the footer."""
+        with self._lock:
+            if self._file is None:
+                return
+            self._write_chunk()
+            footer_offset = self._file.tell()
+            self._write_block(
+                FOOTER_BLOCK,
+                pickle.dumps([chunk.to_tuple() for chunk in self._chunks],
+                             pickle.HIGHEST_PROTOCOL))
+            self._file.write(_TRAILER.pack(footer_offset, TRAILER_MAGIC))
+            self._file.close()
+            self._file = None
+        unregister_open_writer(self)
+
+    def _flush_due(self):
+        return (self._buffer and self._flush_interval is not None
+                and time.time() - self._buffer_time >= self._flush_interval)
+
+    def _write_chunk(self):
+        if not self._buffer:
+            return
+        data_offset = self._write_block(DATA_BLOCK, b''.join(self._buffer),
+                                        self._compress)
+        index_offset = self._write_block(
+            INDEX_BLOCK, pickle.dumps(self._index, pickle.HIGHEST_PROTOCOL))
+        coordinates = [entry[0] for entry in self._index]
+        self._chunks.append(
+            ChunkInfo(data_offset, index_offset, len(self._index),
+                      min(coordinates), max(coordinates),
+                      set(entry[1] for entry in self._index)))
+        self._buffer = []
+        self._buffer_size = 0
+        self._index = []
+
+    def _write_block(self, kind, data, compress=False):
+        offset = self._file.tell()
+        flags = 0
+        raw_size = len(data)
+        if compress:
+            data = zlib.compress(data, self._compression_level)
+            flags |= _COMPRESSED
+        self._file.write(_BLOCK_HEADER.pack(kind, flags, raw_size, len(data)))
+        self._file.write(data)
+        return offset
+
+
+class RecordingReader(object):
+    """Reads the messages of a recording.
+
+    Recordings written by `RecordingWriter` are read chunk by chunk, and
+    only the chunks and messages selected by `read` are decompressed and
+    unpickled. Recordings in the former formats, a sequence of pickled
+    messages or of pickled (stream name, message) tuples, are read
+    sequentially.
+
+    Attributes:
+        path (str): Path of the recording.
+        streams (list of (type, str)): The data type and name of the
+            recorded streams.
+        chunks (list of ChunkInfo): The chunks of the recording, or None
+            for recordings in the former format.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.chunks = None
+        with open(path, 'rb') as f:
+            header = f.read(_FILE_HEADER.size)
+            if (len(header) < _FILE_HEADER.size
+                    or _FILE_HEADER.unpack(header)[0] != FILE_MAGIC):
+                f.seek(0)
+                self.streams = pickle.load(f)
+                return
+            version = _FILE_HEADER.unpack(header)[1]
+            if version > FORMAT_VERSION:
+                raise ValueError(
+                    'Recording {} has unsupported version {}'.format(
+                        path, version))
+            (kind, data) = _read_block(f)
+            assert kind == STREAMS_BLOCK, 'Recording has no streams'
+            self.streams = pickle.loads(data)
+            self.chunks = self._read_footer(f)
+            if self.chunks is None:
+                logger.warning(
+                    'Recording {} was not closed, scanning its chunks'.format(
+                        path))
+                self.chunks = self._scan_chunks(f)
+
+    @property
+    def num_messages(self):
+        if self.chunks is None:
+            return sum(1 for _ in self.read())
+        return sum(chunk.num_messages for chunk in self.chunks)
+
+    def read(self, start_timestamp=None, stream_names=None):
+        """Yields the (stream name, message) tuples of the recording, in the
+        order in which they were recorded.
+
+        Args:
+            start_timestamp (Timestamp or list of int): If set, messages
+                with smaller timestamps, and messages without timestamp,
+                are skipped.
+            stream_names (list of str): If set, only the messages of these
+                streams are read.
+        """
+        start = None
+        if start_timestamp is not None:
+            start = tuple(
+                getattr(start_timestamp, 'coordinates', start_timestamp))
+        names = [name for (_, name) in self.streams]
+        selected = set(range(len(names)))
+        if stream_names is not None:
+            selected = set(index for (index, name) in enumerate(names)
+                           if name in stream_names)
+        if self.chunks is None:
+            for (stream_name, msg) in self._read_former_format():
+                if ((stream_names is None or stream_name in stream_names)
+                        and (start is None or
+                             (msg.timestamp is not None
+                              and tuple(msg.timestamp.coordinates) >= start))):
+                    yield (stream_name, msg)
+            return
+        with open(self.path, 'rb') as f:
+            for chunk in self.chunks:
+                if ((start is not None and chunk.max_coordinates < start)
+                        or not chunk.streams & selected):
+                    continue
+                f.seek(chunk.index_offset)
+                index = pickle.loads(_read_block(f)[1])
+                entries = [
+                    entry for entry in index if entry[1] in selected and (
+                        start is None or entry[0] >= start)
+                ]
+                if not entries:
+                    continue
+                f.seek(chunk.data_offset)
+                data = _read_block(f)[1]
+                for (_, stream, offset, size) in entries:
+                    yield (names[stream],
+                           pickle.loads(data[offset:offset + size]))
+
+    def _read_footer(self, f):
+        f.seek(0, os.SEEK_END)
+        file_size = f.tell()
+        if file_size < _TRAILER.size:
+            return None
+        f.seek(file_size - _TRAILER.size)
+        (footer_offset, magic) = _TRAILER.unpack(f.read(_TRAILER.size))
+        if magic != TRAILER_MAGIC:
+            return None
+        f.seek(footer_offset)
+        (kind, data) = _read_block(f)
+        assert kind == FOOTER_BLOCK, 'Recording has a corrupted footer'
+        return [ChunkInfo(*chunk) for chunk in pickle.loads(data)]
+
+    def _scan_chunks(self, f):
+        """Rebuilds the chunk summaries of a recording without footer. The
+        last chunk may be truncated, and is then ignored."""
+        chunks = []
+        f.seek(_FILE_HEADER.size)
+        _read_block(f)
+        while True:
+            data_offset = f.tell()
+            header = f.read(_BLOCK_HEADER.size)
+            if len(header) < _BLOCK_HEADER.size:
+                break
+            (kind, _, _, stored_size) = _BLOCK_HEADER.unpack(header)
+            if kind != DATA_BLOCK:
+                break
+            f.seek(stored_size, os.SEEK_CUR)
+            index_offset = f.tell()
+            try:
+                (kind, data) = _read_block(f)
+            except (EOFError, zlib.error):
+                break
+            if kind != INDEX_BLOCK:
+                break
+            index = pickle.loads(data)
+            coordinates = [entry[0] for entry in index]
+            chunks.append(
+                ChunkInfo(data_offset, index_offset, len(index),
+                          min(coordinates), max(coordinates),
+                          set(entry[1] for entry in index)))
+        return chunks
+
+    def _read_former_format(self):
+        with open(self.path, 'rb') as f:
+            pickle.load(f)  # Read past the stream names
+            while True:
+                try:
+                    record = pickle.load(f)
+                except EOFError:
+                    return
+                if isinstance(record, tuple):
+                    yield record
+                else:
+                    # The first format held messages, which carry the name
+                    # of their stream.
+                    yield (record.stream_name, record)
+
+
+def _read_block(f):
+    header = f.read(_BLOCK_HEADER.size)
+    if len(header) < _BLOCK_HEADER.size:
+        raise EOFError('Truncated recording block')
+    (kind, flags, raw_size, stored_size) = _BLOCK_HEADER.unpack(header)
+    data = f.read(stored_size)
+    if len(data) < stored_size:
+        raise EOFError('Truncated recording block')
+    if flags & _COMPRESSED:
+        data = zlib.decompress(data)
+    assert len(data) == raw_size, 'Recording block has a corrupted size'
+    return (kind, data)
+
+
+if __name__ == '__main__':
+    # Summarizes a recording: python -m erdos.recording <path>
+    reader = RecordingReader(sys.argv[1])
+    print('Streams: {}'.format(', '.join(name
+                                         for (_, name) in reader.streams)))
+    if reader.chunks is None:
+        print('Former format, {} messages'.format(reader.num_messages))
+    else:
+        print('{} chunks, {} messages'.format(len(reader.chunks),
+                                              reader.num_messages))
+        for chunk in reader.chunks:
+            print('  offset {}: {} messages, timestamps {} to {}'.format(
+                chunk.data_offset, chunk.num_messages,
+                list(chunk.min_coordinates), list(chunk.max_coordinates)))
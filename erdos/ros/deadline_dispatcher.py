@@ -0,0 +1,42 @@
+import logging
+import threading
+
+from erdos.deadline_queue import DeadlineQueue
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineDispatcher(object):
+    """Runs the callbacks of a ROS operator in earliest deadline first order.
+
+    The subscriber threads of the operator's input streams only queue the
+    messages, and a single dispatcher thread processes them. Hence, the
+    callbacks of operators whose input streams have latency budgets do not
+    run concurrently.
+    """
+
+    def __init__(self, latency_budgets):
+        self._queue = DeadlineQueue(latency_budgets)
+        self._cond = threading.Condition()
+
+    def start(self):
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def put(self, method, msg):
+        """Queues a call of method(msg)."""
+        with self._cond:
+            self._queue.append((method, msg), msg.stream_uid)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                (method, msg) = self._queue.popleft()
+            try:
+                method(msg)
+            except Exception:
+                logger.exception('Failed to process {}'.format(msg))
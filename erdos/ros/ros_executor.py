@@ -1,9 +1,17 @@
 from multiprocessing import Process
 import rospy
+from absl import flags
 
+from erdos.deadline_queue import get_latency_budgets
 from erdos.executor import Executor
+from erdos.metrics import MetricsExporter, get_registry
+from erdos.ros.deadline_dispatcher import DeadlineDispatcher
 from erdos.ros.ros_input_data_stream import ROSInputDataStream
 from erdos.ros.ros_output_data_stream import ROSOutputDataStream
+from erdos.tracing import configure_tracing
+from erdos.utils import close_open_writers
+
+FLAGS = flags.FLAGS
 
 
 class ROSExecutor(Executor):
@@ -25,10 +33,26 @@ class ROSExecutor(Executor):
         self.op_handle.executor_handle = proc
 
     def _execute_helper(self):
+        configure_tracing(self.op_handle.trace_file,
+                          self.op_handle.trace_sample_rate)
         op = self._init_operator()
         rospy.init_node(op.name, anonymous=True)
-        op._internal_setup_streams()
-        op.execute()
+        # Operator processes exit with os._exit, which skips the atexit
+        # handlers. The tracer, event logs and recordings are closed when
+        # the node shuts down, or once the operator returns.
+        rospy.on_shutdown(close_open_writers)
+        try:
+            op._internal_setup_streams()
+            if FLAGS.metrics_file:
+                # Each operator runs in its own process, and thus writes its
+                # own metrics file.
+                MetricsExporter(get_registry().snapshot,
+                                file_path='{}.{}'.format(
+                                    FLAGS.metrics_file, op.name),
+                                period=FLAGS.metrics_export_period).start()
+            op.execute()
+        finally:
+            close_open_writers()
 
     def _init_operator(self):
         """
@@ -47,8 +71,13 @@ class ROSExecutor(Executor):
             raise
 
         # Set input/output streams
+        latency_budgets = get_latency_budgets(self.op_handle.input_streams)
+        dispatcher = None
+        if latency_budgets:
+            dispatcher = DeadlineDispatcher(latency_budgets)
+            dispatcher.start()
         ros_input_streams = [
-            ROSInputDataStream(op, input_stream)
+            ROSInputDataStream(op, input_stream, dispatcher)
             for input_stream in self.op_handle.input_streams
         ]
         ros_output_streams = [
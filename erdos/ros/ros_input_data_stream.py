@@ -1,5 +1,6 @@
 import logging
 import pickle
+import threading
 import time
 from absl import flags
 
@@ -7,7 +8,11 @@ import rospy
 from std_msgs.msg import String
 
 from erdos.data_stream import DataStream
+from erdos.input_queue import InputQueue
 from erdos.message import WatermarkMessage
+from erdos.metrics import CallbackMetrics
+from erdos.ros.shared_memory import SharedMemoryHandle, SharedMemoryReader
+from erdos.tracing import get_op_tracer
 
 FLAGS = flags.FLAGS
 
@@ -15,22 +20,27 @@ logger = logging.getLogger(__name__)
 
 
 class ROSInputDataStream(DataStream):
-    def __init__(self, op, data_stream):
+
+    def __init__(self, op, data_stream, dispatcher=None):
         super(ROSInputDataStream, self).__init__(
             data_type=data_stream.data_type,
             name=data_stream.name,
             labels=data_stream.labels,
             callbacks=data_stream.callbacks,
             completion_callbacks=data_stream.completion_callbacks,
-            uid=data_stream.uid)
+            uid=data_stream.uid,
+            id=data_stream.id)
         self.op = op
+        self._shm_reader = SharedMemoryReader()
+        self._input_queue = InputQueue.from_labels(self.labels)
+        # Runs the callbacks in earliest deadline first order, if the
+        # operator's input streams have latency budgets.
+        self._dispatcher = dispatcher
+        self._callback_metrics = CallbackMetrics(op.name)
+        self._tracer = get_op_tracer(op.name)
 
     def setup(self):
         """Initializes a ROS subscriber."""
-        # Populate the map with the correct stream names.
-        for input_stream in self.op.input_streams:
-            self.op._stream_to_high_watermark[input_stream.name] = None
-
         data_type = self.data_type if self.data_type else String
         # TODO(ionel): We currently transform messages to Strings because
         # we want to pass timestamp and stream info along with the message.
@@ -47,58 +57,94 @@ class ROSInputDataStream(DataStream):
                 callback=self._on_msg,
                 queue_size=100,
                 buff_size=314572800)  # 100 x avg message size (assumed 3MB)
+        if self._input_queue is not None:
+            # The subscriber thread only queues the messages. The callbacks
+            # run in a worker thread, which skips the discarded messages.
+            worker = threading.Thread(target=self._process_queue)
+            worker.daemon = True
+            worker.start()
+
+    def get_stats(self):
+        """Returns the number of messages received and discarded, or None if
+        the stream does not have a queue policy."""
+        if self._input_queue is None:
+            return None
+        return self._input_queue.get_stats()
 
     def _on_msg(self, msg):
         #data = msg if self.data_type else pickle.loads(msg.data)
         msg = pickle.loads(msg.data)
+        # Messages only carry the stream id on the wire.
+        msg.stream_name = self.name
+        msg.stream_uid = self.uid
+        if self._tracer:
+            self._tracer.instant(
+                'receive watermark'
+                if isinstance(msg, WatermarkMessage) else 'receive', msg)
+        if self._input_queue is not None:
+            # Payloads sent through shared memory are only read if the
+            # message is not discarded.
+            discarded = self._input_queue.put(msg,
+                                              is_watermark=isinstance(
+                                                  msg, WatermarkMessage))
+            for discarded_msg in discarded:
+                if isinstance(discarded_msg.data, SharedMemoryHandle):
+                    self._shm_reader.discard(discarded_msg.data)
+        else:
+            self._dispatch(msg)
+
+    def _process_queue(self):
+        while True:
+            (msg, _) = self._input_queue.pop(block=True)
+            self._dispatch(msg)
+
+    def _dispatch(self, msg):
+        if self._dispatcher is None:
+            self._process_msg(msg)
+        else:
+            self._dispatcher.put(self._process_msg, msg)
+
+    def _process_msg(self, msg):
+        if not isinstance(msg.data, SharedMemoryHandle):
+            self._handle_msg(msg)
+            return
+        # The payload was sent through shared memory. The callbacks get a
+        # read-only view of it, and the sender does not reuse its slot until
+        # they return.
+        handle = msg.data
+        msg = self._shm_reader.read(msg)
+        if msg is None:
+            return
+        try:
+            self._handle_msg(msg)
+        finally:
+            self._shm_reader.release(handle)
+
+    def _handle_msg(self, msg):
         self.op.log_event(time.time(), msg.timestamp,
                           'receive {}'.format(self.name))
+        if self._tracer:
+            self._tracer.instant(
+                'dequeue watermark'
+                if isinstance(msg, WatermarkMessage) else 'dequeue', msg)
         if isinstance(msg, WatermarkMessage):
-            if msg.stream_name in self.op._stream_ignore_watermarks:
-                # TODO(yika): big HACK on ignoring watermark sent on stream
-                # with label 'no_watermark' = true
+            # Flow the watermark only if it advances the low watermark across
+            # all the input streams.
+            msg = self.op._receive_watermark(msg)
+            if msg is None:
                 return
-            # Ensure that the watermark is monotonically increasing.
-            high_watermark = self.op._stream_to_high_watermark[msg.stream_name]
-            if not high_watermark:
-                # The first watermark, just set the dictionary with the value.
-                self.op._stream_to_high_watermark[
-                    msg.stream_name] = msg.timestamp
-            else:
-                if high_watermark >= msg.timestamp:
-                    raise Exception(
-                        "The watermark received in the msg {} is not "
-                        "higher than the watermark previously received "
-                        "on the same stream: {}".format(msg, high_watermark))
-                else:
-                    self.op._stream_to_high_watermark[msg.stream_name] = \
-                            msg.timestamp
-
-            # Now check if all other streams have a higher or equal watermark.
-            # If yes, flow this watermark. If not, return from this function
-            # Also, maintain the lowest watermark observed.
-            low_watermark = msg.timestamp
-            for stream, watermark in self.op._stream_to_high_watermark.items():
-                # TODO(yika): big HACK on ignoring watermark sent on stream
-                # with label 'no_watermark' = true
-                if (stream not in self.op._stream_ignore_watermarks and
-                    stream != msg.stream_name):
-                    if not watermark or watermark < msg.timestamp:
-                        return
-                    if low_watermark > watermark:
-                        low_watermark = watermark
-            msg = WatermarkMessage(low_watermark)
-
-            # Checkpoint.
-            # Note: For correctness reasons, we can only flow watermarks after
-            # we checkpoint.
-            if (self.op._checkpoint_enable and
-                self.op.checkpoint_condition(msg.timestamp)):
-                self.op._checkpoint(msg.timestamp)
 
             # Call the required callbacks.
+            start_time = time.time()
             for on_watermark_callback in self.completion_callbacks:
                 on_watermark_callback(self.op, msg)
+            if self.completion_callbacks:
+                self._callback_metrics.record(self.name,
+                                              time.time() - start_time,
+                                              completion=True)
+                if self._tracer:
+                    self._tracer.span('completion callback', msg, start_time,
+                                      self.name)
 
             # If no completion callbacks are found, let the watermarks flow
             # automatically. If there is a completion callback, let the
@@ -110,5 +156,9 @@ class ROSInputDataStream(DataStream):
                 for output_stream in self.op.output_streams.values():
                     output_stream.send(msg)
         else:
+            start_time = time.time()
             for on_msg_callback in self.callbacks:
                 on_msg_callback(self.op, msg)
+            self._callback_metrics.record(self.name, time.time() - start_time)
+            if self._tracer:
+                self._tracer.span('callback', msg, start_time)
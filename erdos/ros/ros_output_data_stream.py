@@ -3,31 +3,61 @@ import pickle
 import time
 
 import rospy
+from absl import flags
 from std_msgs.msg import String
 
 from erdos.data_stream import DataStream
+from erdos.message import WatermarkMessage
+from erdos.metrics import SendMetrics
+from erdos.ros.shared_memory import SharedMemoryWriter
+from erdos.tracing import get_op_tracer
+
+FLAGS = flags.FLAGS
 
 logger = logging.getLogger(__name__)
 
 
 class ROSOutputDataStream(DataStream):
     def __init__(self, op, data_stream):
-        super(ROSOutputDataStream, self).__init__(
-            data_type=data_stream.data_type,
-            name=data_stream.name,
-            labels=data_stream.labels,
-            callbacks=data_stream.callbacks,
-            uid=data_stream.uid)
+        super(ROSOutputDataStream,
+              self).__init__(data_type=data_stream.data_type,
+                             name=data_stream.name,
+                             labels=data_stream.labels,
+                             callbacks=data_stream.callbacks,
+                             uid=data_stream.uid,
+                             id=data_stream.id)
         self.op = op
         self.publisher = None
+        self._shm_writer = None
+        self._send_metrics = SendMetrics(op.name, self.name)
+        self._tracer = get_op_tracer(op.name)
 
     def send(self, msg):
         """Sending a message on a ROS stream (i.e., publishes it)."""
-        self.op.log_event(time.time(), msg.timestamp,
+        send_time = time.time()
+        self.op.log_event(send_time, msg.timestamp,
                           'send {}'.format(self.name))
         msg.stream_name = self.name
+        msg.stream_id = self.id
+        is_watermark = isinstance(msg, WatermarkMessage)
+        sent_msg = msg
+        num_receivers = 0
+        if self._shm_writer and self._shm_writer.can_write(msg):
+            num_receivers = self.publisher.get_num_connections()
+        if num_receivers > 0:
+            # Only a small header is published on the topic, unless the
+            # receivers have not processed the messages of all the slots.
+            header_msg = self._shm_writer.write(msg, num_receivers)
+            if header_msg is not None:
+                msg = header_msg
         msg = pickle.dumps(msg, protocol=pickle.HIGHEST_PROTOCOL)
         self.publisher.publish(msg)
+        if not is_watermark:
+            self._send_metrics.record(time.time() - send_time)
+        if self._tracer:
+            # Messages only carry the stream id on the wire.
+            self._tracer.span('send watermark' if is_watermark else 'send',
+                              sent_msg, send_time, self.name, self.uid)
 
     def setup(self):
         """Setups the source operator as a publisher."""
@@ -41,6 +71,10 @@ class ROSOutputDataStream(DataStream):
         # it can be serialized and sent over the network).
         self.publisher = rospy.Publisher(
             self.uid, String, latch=True, queue_size=None)
+        if FLAGS.ros_shared_memory:
+            self._shm_writer = SharedMemoryWriter(
+                self.uid, FLAGS.ros_shared_memory_ring_size,
+                FLAGS.ros_shared_memory_min_bytes)
         # TODO(yika): hacky way to stall generator publisher in order to wait
         # for all other processes finish initiating
         time.sleep(1)
@@ -0,0 +1,338 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import atexit
+import copy
+import errno
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+SHM_DIR = '/dev/shm'
+# Each slot starts with the sequence number of the message it stores, or 0
+# while the message is written, followed by the number of receivers that have
+# not processed the message yet.
+_SLOT_HEADER = struct.Struct('<QQ')
+_UNREAD = struct.Struct('<Q')
+_UNREAD_OFFSET = 8
+# Serializes the updates of unread counts between the readers of a process.
+# Record locks only exclude other processes.
+_unread_lock = threading.Lock()
+
+
+class SharedMemoryHandle(object):
+    """Small header sent in place of a numpy payload written to a slot.
+
+    Attributes:
+        path (str): Path of the shared memory segment storing the payload.
+        seq (int): Sequence number of the message written to the segment.
+        dtype (str): The numpy dtype string of the payload.
+        shape (tuple of int): The shape of the payload.
+    """
+
+    __slots__ = ('path', 'seq', 'dtype', 'shape')
+
+    def __init__(self, path, seq, dtype, shape):
+        self.path = path
+        self.seq = seq
+        self.dtype = dtype
+        self.shape = shape
+
+    def __getstate__(self):
+        return (self.path, self.seq, self.dtype, self.shape)
+
+    def __setstate__(self, state):
+        (self.path, self.seq, self.dtype, self.shape) = state
+
+    def __str__(self):
+        return '{{shm: {}, seq: {}, dtype: {}, shape: {}}}'.format(
+            self.path, self.seq, self.dtype, self.shape)
+
+
+class SharedMemoryWriter(object):
+    """Writes large numpy message payloads to a ring of shared memory slots.
+
+    Every output stream owns a ring of slots, which are reused in a round
+    robin fashion. Receivers hold a shared lock on a slot while they use its
+    payload, and every slot counts the receivers that have not processed its
+    message yet. The writer skips slots that are locked or unread, and
+    pickles the payload as usual if no slot is free, so that messages in
+    flight are never overwritten. Slots are only overwritten under an
+    exclusive lock, so receivers never see torn payloads.
+
+    Attributes:
+        stream_uid (str): The uid of the stream the writer belongs to.
+        ring_size (int): Number of slots in the ring.
+        min_bytes (int): Payloads smaller than this are pickled as usual.
+    """
+
+    def __init__(self, stream_uid, ring_size=8, min_bytes=65536):
+        assert ring_size > 0, 'The shared memory ring must have a slot'
+        self.stream_uid = stream_uid
+        self.ring_size = ring_size
+        self.min_bytes = min_bytes
+        prefix = 'erdos-{}-{}'.format(os.getpid(),
+                                      stream_uid.replace('/', '_'))
+        self._paths = [
+            os.path.join(SHM_DIR, '{}-{}'.format(prefix, index))
+            for index in range(ring_size)
+        ]
+        self._fds = [None] * ring_size
+        self._maps = [None] * ring_size
+        self._index = 0
+        self._seq = 0
+        atexit.register(self.close)
+
+    def can_write(self, msg):
+        """Returns True if the message payload should use shared memory."""
+        return (np is not None and isinstance(msg.data, np.ndarray)
+                and msg.data.nbytes >= self.min_bytes
+                and not msg.data.dtype.hasobject)
+
+    def write(self, msg, num_receivers=1):
+        """Copies the payload to the next slot that no receiver uses.
+
+        Args:
+            msg (Message): The message whose payload to write.
+            num_receivers (int): Number of receivers the message is sent to.
+                The slot is not reused until all of them processed or
+                discarded the message.
+
+        Returns:
+            (Message): A shallow copy of msg whose data is a
+            `SharedMemoryHandle` to the payload, or None if receivers use
+            all the slots.
+        """
+        data = msg.data
+        for _ in range(self.ring_size):
+            self._index = (self._index + 1) % self.ring_size
+            fd = self._get_fd(self._index)
+            if not _try_lock(fd, fcntl.LOCK_EX):
+                continue
+            if self._is_unread(self._index):
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                continue
+            try:
+                self._seq += 1
+                slot = self._get_slot(self._index,
+                                      _SLOT_HEADER.size + data.nbytes)
+                _SLOT_HEADER.pack_into(slot, 0, 0, 0)
+                view = np.frombuffer(slot,
+                                     dtype=data.dtype,
+                                     count=data.size,
+                                     offset=_SLOT_HEADER.size).reshape(
+                                         data.shape)
+                view[...] = data
+                # The sequence number is written last, so that a slot whose
+                # write was interrupted is never read.
+                _SLOT_HEADER.pack_into(slot, 0, self._seq, num_receivers)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            header_msg = copy.copy(msg)
+            header_msg.data = SharedMemoryHandle(self._paths[self._index],
+                                                 self._seq, data.dtype.str,
+                                                 data.shape)
+            return header_msg
+        logger.warning('Receivers use all the shared memory slots of {}, '
+                       'pickling the payload'.format(self.stream_uid))
+        return None
+
+    def close(self):
+        """Releases and removes the slots of the ring."""
+        for index, slot in enumerate(self._maps):
+            if slot is not None:
+                slot.close()
+                self._maps[index] = None
+        for index, fd in enumerate(self._fds):
+            if fd is not None:
+                os.close(fd)
+                self._fds[index] = None
+        for path in self._paths:
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def _get_fd(self, index):
+        if self._fds[index] is None:
+            self._fds[index] = os.open(self._paths[index],
+                                       os.O_CREAT | os.O_RDWR, 0o600)
+        return self._fds[index]
+
+    def _is_unread(self, index):
+        slot = self._maps[index]
+        return (slot is not None
+                and _UNREAD.unpack_from(slot, _UNREAD_OFFSET)[0] > 0)
+
+    def _get_slot(self, index, size):
+        slot = self._maps[index]
+        if slot is not None and len(slot) >= size:
+            return slot
+        if slot is not None:
+            slot.close()
+        # Segments only grow, so that receivers can keep using mappings of
+        # previous payloads.
+        os.ftruncate(self._fds[index], size)
+        slot = mmap.mmap(self._fds[index], size)
+        self._maps[index] = slot
+        return slot
+
+
+class SharedMemoryReader(object):
+    """Maps shared memory slots and returns read-only views of payloads.
+
+    A view is valid until the message is released, and callbacks that keep
+    a payload must copy it. Messages that are not read must be discarded,
+    so that the writer can reuse their slots.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fds = {}
+        self._maps = {}
+        # Number of unreleased messages of every locked slot.
+        self._leases = {}
+
+    def read(self, msg):
+        """Locks the slot of the payload, and replaces the handle in msg.data
+        with a view of the payload. The slot must be released with `release`
+        once the message is processed.
+
+        Returns:
+            (Message): The message, or None if the slot has been reused or
+            removed since the message was sent.
+        """
+        handle = msg.data
+        dtype = np.dtype(handle.dtype)
+        count = 1
+        for dim in handle.shape:
+            count *= dim
+        if not self._acquire(handle.path):
+            logger.warning('Dropping message {} because its shared memory '
+                           'slot has been removed'.format(handle))
+            return None
+        slot = self._get_slot(handle.path,
+                              _SLOT_HEADER.size + count * dtype.itemsize)
+        if _SLOT_HEADER.unpack_from(slot, 0)[0] != handle.seq:
+            self._unlock(handle.path)
+            logger.warning('Dropping message {} because its shared memory '
+                           'slot has been reused'.format(handle))
+            return None
+        view = np.frombuffer(slot,
+                             dtype=dtype,
+                             count=count,
+                             offset=_SLOT_HEADER.size).reshape(handle.shape)
+        view.flags.writeable = False
+        msg.data = view
+        return msg
+
+    def release(self, handle):
+        """Marks the message of handle as processed, and lets the writer
+        reuse its slot once no other message read from it is in use."""
+        self._mark_read(handle)
+        self._unlock(handle.path)
+
+    def discard(self, handle):
+        """Marks the message of handle as processed without reading it."""
+        with self._lock:
+            if not self._open(handle.path):
+                return
+        self._mark_read(handle)
+
+    def _unlock(self, path):
+        with self._lock:
+            self._leases[path] -= 1
+            if self._leases[path] == 0:
+                del self._leases[path]
+                fcntl.flock(self._fds[path], fcntl.LOCK_UN)
+
+    def _mark_read(self, handle):
+        slot = self._get_slot(handle.path, _SLOT_HEADER.size)
+        fd = self._fds[handle.path]
+        with _unread_lock:
+            fcntl.lockf(fd, fcntl.LOCK_EX, _UNREAD.size, _UNREAD_OFFSET)
+            try:
+                (seq, unread) = _SLOT_HEADER.unpack_from(slot, 0)
+                # The writer only reuses slots without unread messages, so
+                # a slot that holds another message is not counted.
+                if seq == handle.seq and unread > 0:
+                    _UNREAD.pack_into(slot, _UNREAD_OFFSET, unread - 1)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, _UNREAD.size, _UNREAD_OFFSET)
+
+    def close(self):
+        self._leases[handle.path] -= 1
+        if self._leases[handle.path] == 0:
+            del self._leases[handle.path]
+            fcntl.flock(self._fds[handle.path], fcntl.LOCK_UN)
+
+    def close(self):
+        with self._lock:
+            for slot in self._maps.values():
+                try:
+                    slot.close()
+                except BufferError:
+                    # Views handed to callbacks are still alive. The mapping
+                    # is released once they are garbage collected.
+                    pass
+            for fd in self._fds.values():
+                os.close(fd)
+            self._maps = {}
+            self._fds = {}
+            self._leases = {}
+
+    def _open(self, path):
+        """Returns False if the writer removed the segment."""
+        if path not in self._fds:
+            try:
+                self._fds[path] = os.open(path, os.O_RDWR)
+            except (IOError, OSError) as e:
+                if e.errno == errno.ENOENT:
+                    return False
+                raise
+        return True
+
+    def _acquire(self, path):
+        """Returns False if the writer removed the segment."""
+        with self._lock:
+            if not self._open(path):
+                return False
+            if path not in self._leases:
+                # Waits for the writer to finish writing the slot.
+                fcntl.flock(self._fds[path], fcntl.LOCK_SH)
+                self._leases[path] = 0
+            self._leases[path] += 1
+            return True
+
+    def _get_slot(self, path, size):
+        with self._lock:
+            slot = self._maps.get(path)
+            if slot is not None and len(slot) >= size:
+                return slot
+            # The sender grew the segment. Views of previous payloads keep
+            # the old mapping alive. The mapping is writable to update the
+            # unread counts, but the views are read-only.
+            fd = self._fds[path]
+            slot = mmap.mmap(fd, os.fstat(fd).st_size)
+            self._maps[path] = slot
+            return slot
+
+
+def _try_lock(fd, operation):
+    """Returns False if the lock is held by another file description."""
+    try:
+        fcntl.flock(fd, operation | fcntl.LOCK_NB)
+        return True
+    except (IOError, OSError) as e:
+        if e.errno in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK):
+            return False
+        raise
@@ -1,60 +1,98 @@
+import threading
+from collections import OrderedDict
+
+
 class Timestamp(object):
     """A ERDOS timestamp.
 
-       The timestamp can consist of one or more coordinates.
+       The timestamp can consist of one or more coordinates. Timestamps are
+       immutable, and are ordered lexicographically by their coordinates.
 
        Attributes:
            timestamp (Timestamp): For the copy constructor.
-           coordinates (list of int): An array of coordinates.
+           coordinates (tuple of int): The coordinates of the timestamp.
     """
 
+    __slots__ = ('_coordinates', '_hash')
+
+    # Timestamps returned by `Timestamp.intern`, keyed by class and
+    # coordinates, from the least to the most recently used.
+    _interned = OrderedDict()
+    _interned_lock = threading.Lock()
+    _max_interned = 4096
+
     def __init__(self, timestamp=None, coordinates=None):
         if timestamp is None:
             assert coordinates is not None, 'Timestamp has empty coordinates'
-            self.coordinates = coordinates
+            coordinates = tuple(coordinates)
+            object.__setattr__(self, '_coordinates', coordinates)
+            object.__setattr__(self, '_hash', hash(coordinates))
         else:
-            self.coordinates = timestamp.coordinates
+            object.__setattr__(self, '_coordinates', timestamp._coordinates)
+            object.__setattr__(self, '_hash', timestamp._hash)
+
+    @classmethod
+    def intern(cls, coordinates):
+        """Returns a shared timestamp with the given coordinates.
+
+        Interning avoids allocating timestamps for values that are created
+        repeatedly (e.g., the timestamps of watermarks). The least recently
+        used timestamps are evicted once `_max_interned` are interned.
+        """
+        key = (cls, tuple(coordinates))
+        interned = Timestamp._interned
+        with Timestamp._interned_lock:
+            # Reinserting the timestamp marks it as the most recently used.
+            timestamp = interned.pop(key, None)
+            if timestamp is None:
+                timestamp = cls(coordinates=key[1])
+                if len(interned) >= cls._max_interned:
+                    interned.popitem(last=False)
+            interned[key] = timestamp
+        return timestamp
+
+    @property
+    def coordinates(self):
+        return self._coordinates
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Timestamp is immutable')
+
+    def __reduce__(self):
+        return (self.__class__, (None, self._coordinates))
+
+    def __setstate__(self, state):
+        # Timestamps pickled before they were immutable (e.g., in former
+        # recordings) hold their coordinates in their __dict__.
+        coordinates = tuple(state['coordinates'])
+        object.__setattr__(self, '_coordinates', coordinates)
+        object.__setattr__(self, '_hash', hash(coordinates))
 
     def __repr__(self):
-        return str(self.coordinates)
+        return str(list(self._coordinates))
 
     def __str__(self):
         return self.__repr__()
 
     def __eq__(self, timestamp):
-        if len(self.coordinates) != len(timestamp.coordinates):
-            return False
-        for coord, other_coord in zip(self.coordinates, timestamp.coordinates):
-            if coord != other_coord:
-                return False
-        return True
+        return self._coordinates == timestamp._coordinates
 
     def __ne__(self, timestamp):
-        return not self.__eq__(timestamp)
+        return self._coordinates != timestamp._coordinates
 
     def __lt__(self, timestamp):
-        if len(self.coordinates) != len(timestamp.coordinates):
+        if len(self._coordinates) != len(timestamp._coordinates):
             raise Exception(
                 'Cannot compare timestamps of different size {} and {}'.format(
                     self, timestamp))
-        for coord, other_coord in zip(self.coordinates, timestamp.coordinates):
-            if coord > other_coord:
-                return False
-            elif coord < other_coord:
-                return True
-        return False
+        return self._coordinates < timestamp._coordinates
 
     def __le__(self, timestamp):
-        if len(self.coordinates) != len(timestamp.coordinates):
+        if len(self._coordinates) != len(timestamp._coordinates):
             raise Exception(
                 'Cannot compare timestamps of different size {} and {}'.format(
                     self, timestamp))
-        for coord, other_coord in zip(self.coordinates, timestamp.coordinates):
-            if coord > other_coord:
-                return False
-            elif coord < other_coord:
-                return True
-        return True
+        return self._coordinates <= timestamp._coordinates
 
     def __gt__(self, timestamp):
         return not self.__le__(timestamp)
@@ -63,4 +101,4 @@ class Timestamp(object):
         return not self.__lt__(timestamp)
 
     def __hash__(self):
-        return hash(tuple(self.coordinates))
+        return self._hash
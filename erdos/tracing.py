@@ -0,0 +1,221 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import glob
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+
+from erdos.event_log import BackgroundWriter
+
+# Seconds between two writes of the events recorded by a process.
+FLUSH_PERIOD = 1
+
+# Events a process keeps before it drops new events, if the writer falls
+# behind.
+MAX_PENDING_EVENTS = 1 << 16
+
+# (trace_file, sample_rate) of the process.
+_config = ('', 0)
+_tracer = None
+_tracer_pid = None
+_tracer_lock = threading.Lock()
+
+
+def configure_tracing(trace_file, sample_rate):
+    """Enables tracing in the process, or disables it if trace_file is
+    empty. Executors call it with the settings of their operator handle."""
+    global _config
+    with _tracer_lock:
+        if _config != (trace_file, sample_rate):
+            _config = (trace_file, sample_rate)
+            if _tracer is not None:
+                _tracer.close()
+                _set_tracer(None)
+
+
+def get_tracer():
+    """Returns the tracer of the process, or None if tracing is disabled."""
+    with _tracer_lock:
+        (trace_file, sample_rate) = _config
+        if not trace_file or sample_rate <= 0:
+            return None
+        # Processes forked from the driver (e.g., ROS operators) write
+        # their own events.
+        if _tracer is None or _tracer_pid != os.getpid():
+            _set_tracer(Tracer(trace_file, sample_rate))
+        return _tracer
+
+
+def _set_tracer(tracer):
+    global _tracer, _tracer_pid
+    _tracer = tracer
+    _tracer_pid = os.getpid()
+
+
+def get_op_tracer(op_name):
+    """Returns the `OpTracer` of an operator, or None if tracing is
+    disabled."""
+    tracer = get_tracer()
+    if tracer is None:
+        return None
+    return OpTracer(tracer, op_name)
+
+
+class Tracer(BackgroundWriter):
+    """Records the lifecycle of sampled messages in the Chrome trace event
+    format.
+
+    Timestamps are sampled by a hash of their coordinates, so every process
+    traces the same timestamps, and a sampled timestamp can be followed
+    across operators. Each process appends its events to
+    `<trace_file>.<pid>.jsonl` from a `BackgroundWriter` thread, and
+    `merge_traces` combines the files into a trace that can be loaded in
+    chrome://tracing or Perfetto.
+
+    Attributes:
+        trace_file (str): Path of the merged trace.
+        sample_rate (float): Fraction of the timestamps that are traced.
+    """
+
+    def __init__(self, trace_file, sample_rate, flush_period=FLUSH_PERIOD):
+        self.trace_file = trace_file
+        self.sample_rate = sample_rate
+        self._threshold = int(min(sample_rate, 1) * (1 << 32))
+        self._path = '{}.{}.jsonl'.format(trace_file, os.getpid())
+        super(Tracer, self).__init__('Tracer {}'.format(trace_file),
+                                     MAX_PENDING_EVENTS, flush_period)
+
+    def is_sampled(self, timestamp):
+        if timestamp is None:
+            return False
+        return (zlib.crc32(repr(timestamp.coordinates).encode('utf-8'))
+                & 0xffffffff) < self._threshold
+
+    def add_event(self, event):
+        self._enqueue(event)
+
+    def _write_pending(self):
+        if not self._pending:
+            return
+        # The file is reopened on every write, so that the driver may
+        # remove the files of earlier runs.
+        with open(self._path, 'a') as f:
+            while self._pending:
+                f.write(json.dumps(self._pending.popleft()))
+                f.write('\n')
+
+    def _close_file(self):
+        pass
+
+
+class OpTracer(object):
+    """Records the send, receive, dequeue and callback events of an
+    operator.
+
+    Each operator is shown as a process in the trace, and the threads that
+    run its callbacks as the process' threads.
+    """
+
+    def __init__(self, tracer, op_name):
+        self._tracer = tracer
+        self._op_name = op_name
+        self._pid = zlib.crc32(op_name.encode('utf-8')) & 0x7fffffff
+        tracer.add_event({
+            'name': 'process_name',
+            'ph': 'M',
+            'pid': self._pid,
+            'args': {
+                'name': op_name
+            }
+        })
+
+    def instant(self, event, msg):
+        """Records an event (e.g., the receipt of a message)."""
+        if not self._tracer.is_sampled(msg.timestamp):
+            return
+        self._tracer.add_event(
+            self._make_event(event, msg, msg.stream_name, 'i', time.time()))
+
+    def span(self, event, msg, start_time, stream_name=None, stream_uid=None):
+        """Records an event which started at start_time, and ends now.
+        The stream defaults to the message's stream."""
+        if not self._tracer.is_sampled(msg.timestamp):
+            return
+        end_time = time.time()
+        trace_event = self._make_event(event, msg, stream_name
+                                       or msg.stream_name, 'X', start_time,
+                                       stream_uid)
+        trace_event['dur'] = (end_time - start_time) * 1e6
+        self._tracer.add_event(trace_event)
+
+    def _make_event(self,
+                    event,
+                    msg,
+                    stream_name,
+                    phase,
+                    event_time,
+                    stream_uid=None):
+        trace_event = {
+            'name': '{} {}'.format(event, stream_name),
+            'cat': event,
+            'ph': phase,
+            'ts': event_time * 1e6,
+            'pid': self._pid,
+            'tid': threading.current_thread().ident,
+            'args': {
+                'timestamp': list(msg.timestamp.coordinates),
+                'stream_uid': stream_uid or msg.stream_uid,
+            }
+        }
+        if phase == 'i':
+            trace_event['s'] = 't'
+        return trace_event
+
+
+def get_trace_parts(trace_file):
+    """Returns the files in which processes recorded events for a trace."""
+    return glob.glob('{}.*.jsonl'.format(trace_file))
+
+
+def remove_trace_parts(trace_file):
+    """Removes the events recorded by earlier runs."""
+    for path in get_trace_parts(trace_file):
+        os.remove(path)
+
+
+def merge_traces(trace_file):
+    """Merges the events recorded by all the processes into trace_file.
+
+    Returns:
+        (int): The number of events in the trace.
+    """
+    events = []
+    seen_metadata = set()
+    for path in get_trace_parts(trace_file):
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if event['ph'] == 'M':
+                    # Operators of a fused chain, or restarted operators,
+                    # may name their process more than once.
+                    key = (event['pid'], event['name'])
+                    if key in seen_metadata:
+                        continue
+                    seen_metadata.add(key)
+                events.append(event)
+    with open(trace_file, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return len(events)
+
+
+if __name__ == '__main__':
+    # Merges the events of a trace: python -m erdos.tracing <trace_file>
+    print('Merged {} events into {}'.format(merge_traces(sys.argv[1]),
+                                            sys.argv[1]))
@@ -1,77 +1,153 @@
+import atexit
 import logging
+import os
+import tempfile
 import time
-from functools import wraps
-from threading import Thread, Condition
+import weakref
+from collections import deque
+from functools import partial, update_wrapper, wraps
 
-_freq_called = set([])
+try:
+    import queue as queue
+except ImportError:
+    import Queue as queue
+
+from erdos.deadline_scheduler import get_deadline_scheduler
+from erdos.periodic_scheduler import CATCH_UP, PeriodicTask
+from erdos.periodic_scheduler import get_periodic_scheduler
+
+# Number of deadline slacks kept for each callback.
+MAX_DEADLINE_SLACKS = 1000
+# Seconds between the checks for ROS shutdown of periodic methods.
+ROS_SHUTDOWN_CHECK_PERIOD = 0.1
+
+# Maps the writers (e.g., event logs and recordings) that are still open,
+# and are closed when the process exits, to the pid of their process.
+_open_writers = weakref.WeakKeyDictionary()
 
 
 def deadline(*expected_args):
     """
     Deadline decorator to be used for restraining computation latency.
     Takes in computation's duration constrain in ms and
-    the name of the function to call when the deadline is missed
+    the name of the function to call when the deadline is missed.
+
+    The deadlines of all the callbacks of a process are fired by a single
+    scheduler thread. The slack of each invocation (i.e., the time left
+    until the deadline once the callback returned, negative if the deadline
+    was missed) is recorded in the operator's deadline_slacks.
     """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-
-            condition = Condition()
-
-            def check_deadline(end_time):
-                with condition:
-                    condition.wait(timeout=end_time - time.time())
-                if time.time() >= end_time:
-                    getattr(args[0], expected_args[1])()
-
+            op = args[0]
+            scheduler = get_deadline_scheduler()
             deadline_time = time.time() + expected_args[0] / 1000.0
-            check_thread = Thread(target=check_deadline, args=(deadline_time,))
-            check_thread.start()
-            func(*args, **kwargs)  # Execute callback function
-            with condition:
-                condition.notify()
-            check_thread.join()
+            timer = scheduler.arm(deadline_time, getattr(op, expected_args[1]))
+            try:
+                return func(*args, **kwargs)  # Execute callback function
+            finally:
+                end_time = time.time()
+                scheduler.cancel(timer)
+                slacks = op.deadline_slacks.get(func.__name__)
+                if slacks is None:
+                    slacks = deque(maxlen=MAX_DEADLINE_SLACKS)
+                    op.deadline_slacks[func.__name__] = slacks
+                slacks.append(deadline_time - end_time)
         return wrapper
 
     return decorator
 
 
-def frequency(*expected_args):
-    """ Frequency decorator to be used for periodic tasks (i.e., methods)."""
+def frequency(*expected_args, **expected_kwargs):
+    """ Frequency decorator to be used for periodic tasks (i.e., methods).
+
+    Takes in the rate in Hz, and optionally the overrun policy (skip,
+    catch_up or coalesce) applied to the ticks that find the previous run
+    unfinished. The ticks of all the periodic methods of a process are
+    fired by a single scheduler, at absolute times which do not drift.
+    """
+    overrun = expected_kwargs.get('overrun', CATCH_UP)
 
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            framework = args[0].framework
-            if framework == "ros":
-                import rospy
-                rate = rospy.Rate(expected_args[0])
-                while not rospy.is_shutdown():
-                    func(*args, **kwargs)
-                    rate.sleep()
-            elif framework == "ray":
-                # XXX(ionel): Hack to avoid recursive calls. frequency()
-                # method is called upon each func invocation, thus without the
-                # _freq_called check the func would be called infinitely. The
-                # fix is a hack because set_frequency is first called from main
-                # thread, and once from the actor worker thread because
-                # _freq_called is local.
-                func_id = (args[0].name, func.__name__)
-                if func_id not in _freq_called:
-                    _freq_called.add(func_id)
-                    # Remove reference to self because is added again when
-                    # the callback is invoked.
-                    method_args = args[1:]
-                    args[0].freq_actor.set_frequency.remote(
-                        expected_args[0], func.__name__, *method_args)
-                else:
-                    func(*args, **kwargs)
+            op = args[0]
+            run = partial(func, *args, **kwargs)
+            update_wrapper(run, func)
+            if op.framework == "ros":
+                _run_periodic_on_thread(op, expected_args[0], run, overrun)
+            elif op.framework == "ray" or op.framework == "local":
+                # The frequency actor runs the undecorated method, so there
+                # are no recursive calls.
+                op.freq_actor.set_frequency(expected_args[0], run, overrun)
 
         return wrapper
 
     return decorator
 
 
+def _run_periodic_on_thread(op, rate, func, overrun):
+    """Runs a periodic method on the calling thread until ROS shuts down."""
+    import rospy
+    ready = queue.Queue()
+    task = PeriodicTask(func.__name__, rate, func,
+                        lambda task, scheduled_time: ready.put(scheduled_time),
+                        overrun)
+    op.periodic_tasks[task.name] = task
+    scheduler = get_periodic_scheduler()
+    scheduler.add_task(task)
+    try:
+        while not rospy.is_shutdown():
+            try:
+                scheduled_time = ready.get(timeout=ROS_SHUTDOWN_CHECK_PERIOD)
+            except queue.Empty:
+                continue
+            task.run(scheduled_time)
+    finally:
+        scheduler.remove_task(task)
+
+
+def write_atomically(path, data, mode='w'):
+    """Writes data to path through a temporary file in the same directory,
+    so that readers never see a partial file."""
+    (fd,
+     tmp_path) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                  suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def register_open_writer(writer):
+    """Closes writer when the process exits, unless it is closed before.
+
+    Writers must implement an idempotent `close` method, and are not kept
+    alive by the registration.
+    """
+    _open_writers[writer] = os.getpid()
+
+
+def unregister_open_writer(writer):
+    _open_writers.pop(writer, None)
+
+
+@atexit.register
+def close_open_writers():
+    """Closes the registered writers. Processes that do not exit normally
+    (e.g., ROS operator processes, which exit with os._exit) must call it
+    before they exit. Writers inherited from the parent of a forked process
+    are left to the parent."""
+    pid = os.getpid()
+    for (writer, writer_pid) in list(_open_writers.items()):
+        if writer_pid == pid:
+            writer.close()
+
+
 def setup_logging(name, log_file=None):
     if log_file is None:
         handler = logging.StreamHandler()
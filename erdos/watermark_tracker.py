@@ -0,0 +1,108 @@
+import heapq
+
+
+class WatermarkTracker(object):
+    """Maintains the low watermark across the input streams of an operator.
+
+    The low watermark is the minimum of the high watermarks received on the
+    input streams. Updates push the new high watermark of a stream on a heap,
+    and entries that are no longer a stream's high watermark are discarded
+    once they reach the top. Hence, an update costs O(log n) amortized time
+    for n input streams.
+
+    Attributes:
+        low_watermark (Timestamp): The low watermark across all the streams,
+            or None if a stream has not received a watermark yet.
+    """
+
+    def __init__(self):
+        self._high_watermarks = {}
+        self._ignored_streams = set()
+        self._heap = []
+        self._num_streams_without_watermark = 0
+        self.low_watermark = None
+
+    def add_stream(self, stream_name, ignore_watermarks=False):
+        """Registers an input stream.
+
+        Args:
+            stream_name (str): The name of the stream.
+            ignore_watermarks (bool): True if the stream does not send
+                watermarks (i.e., it has the label 'no_watermark'), in which
+                case it does not hold back the low watermark.
+        """
+        if (stream_name in self._high_watermarks
+                or stream_name in self._ignored_streams):
+            return
+        if ignore_watermarks:
+            self._ignored_streams.add(stream_name)
+        else:
+            self._high_watermarks[stream_name] = None
+            self._num_streams_without_watermark += 1
+
+    def is_ignored(self, stream_name):
+        return stream_name in self._ignored_streams
+
+    def get_high_watermark(self, stream_name):
+        return self._high_watermarks.get(stream_name)
+
+    def update(self, stream_name, timestamp):
+        """Records a watermark received on a stream.
+
+        Returns:
+            (Timestamp): The new low watermark if the watermark advanced it,
+            None otherwise.
+        """
+        if stream_name in self._ignored_streams:
+            return None
+        high_watermark = self._high_watermarks[stream_name]
+        if high_watermark is None:
+            self._num_streams_without_watermark -= 1
+        elif high_watermark >= timestamp:
+            raise Exception(
+                "The watermark {} received on stream {} is not higher than "
+                "the watermark previously received on the same stream: "
+                "{}".format(timestamp, stream_name, high_watermark))
+        self._high_watermarks[stream_name] = timestamp
+        # Heap entries are keyed by the coordinates because native tuple
+        # comparisons are cheaper than Timestamp comparisons.
+        heapq.heappush(self._heap, (timestamp.coordinates, stream_name))
+        if len(self._heap) > 2 * len(self._high_watermarks) + 16:
+            # Drop the stale entries which are held back by a stream that
+            # advances slowly.
+            self._rebuild_heap()
+        if self._num_streams_without_watermark > 0:
+            return None
+        if (self.low_watermark is not None
+                and high_watermark != self.low_watermark):
+            # The stream was not holding back the low watermark.
+            return None
+        # Discard the entries that are no longer a high watermark. Watermarks
+        # strictly increase, so a stream's older entries differ from its
+        # current high watermark.
+        while (self._high_watermarks[self._heap[0][1]].coordinates
+               != self._heap[0][0]):
+            heapq.heappop(self._heap)
+        low_watermark = self._high_watermarks[self._heap[0][1]]
+        if self.low_watermark is not None and \
+                low_watermark <= self.low_watermark:
+            return None
+        self.low_watermark = low_watermark
+        return low_watermark
+
+    def reset(self, timestamp):
+        """Sets the high watermark of all streams to timestamp (e.g., upon
+        rollback to a checkpoint)."""
+        for stream_name in self._high_watermarks:
+            self._high_watermarks[stream_name] = timestamp
+        self._num_streams_without_watermark = 0
+        self._rebuild_heap()
+        self.low_watermark = timestamp if self._high_watermarks else None
+
+    def _rebuild_heap(self):
+        self._heap = [
+            (watermark.coordinates, stream_name)
+            for stream_name, watermark in self._high_watermarks.items()
+            if watermark is not None
+        ]
+        heapq.heapify(self._heap)
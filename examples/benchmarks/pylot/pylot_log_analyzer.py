@@ -1,10 +1,10 @@
-import csv
 from absl import app
 from absl import flags
 
 import erdos.graph
 from erdos.operators import CountWindowTrigger, FileWriterOp, WindowOp, Window, WindowAssigner, WindowProcessor
 from erdos.data_stream import DataStream
+from erdos.event_log import EventLogReader
 from erdos.message import Message
 from erdos.op import Op
 from erdos.timestamp import Timestamp
@@ -18,10 +18,11 @@ flags.DEFINE_string('front_camera_locations',
 
 
 class LogReaderOp(Op):
-    def __init__(self, name, output_name, log_file_name):
+
+    def __init__(self, name, output_name, log_prefix):
         super(LogReaderOp, self).__init__(name)
         self._output_name = output_name
-        self._log_file_name = log_file_name
+        self._log_prefix = log_prefix
 
     @staticmethod
     def setup_streams(input_streams, output_name):
@@ -29,17 +30,11 @@ class LogReaderOp(Op):
 
     def execute(self):
         output_stream = self.get_output_stream(self._output_name)
-        with open(self._log_file_name, 'r') as log_file:
-            csv_reader = csv.reader(log_file)
-            for row in csv_reader:
-                name = row[0]
-                processing_time = float(row[1])
-                coordinates = [
-                    int(val) for val in row[2].strip('[]').split(',')
-                ]
-                output_msg = Message((name, processing_time),
-                                     Timestamp(coordinates=coordinates))
-                output_stream.send(output_msg)
+        for (name, _, coordinates, processing_time,
+             _) in EventLogReader(self._log_prefix).read():
+            output_msg = Message((name, processing_time),
+                                 Timestamp(coordinates=coordinates))
+            output_stream.send(output_msg)
 
 
 class SliddingCountWindowAssigner(WindowAssigner):
@@ -64,15 +59,14 @@ class FrequencyMissProcessor(WindowProcessor):
         return [Message(msgs[1].data[1] - msgs[0].data[1], msgs[1].timestamp)]
 
 
-def analyze_frequency(graph, file_name, output_file_name):
-    log_reader_op = graph.add(
-        LogReaderOp,
-        'log_reader',
-        init_args={
-            'output_name': 'log_reader',
-            'log_file_name': file_name
-        },
-        setup_args={'output_name': 'log_reader'})
+def analyze_frequency(graph, log_prefix, output_file_name):
+    log_reader_op = graph.add(LogReaderOp,
+                              'log_reader',
+                              init_args={
+                                  'output_name': 'log_reader',
+                                  'log_prefix': log_prefix
+                              },
+                              setup_args={'output_name': 'log_reader'})
     frequency_jitter_op = graph.add(
         WindowOp,
         name='frequency_jitter_op',
@@ -97,7 +91,7 @@ def main(argv):
     front_locations = FLAGS.front_camera_locations.split(',')
 
     for location in front_locations:
-        analyze_frequency(graph, 'camera_' + location + '.log',
+        analyze_frequency(graph, 'camera_' + location,
                           'jitter_camera_' + location + '.log')
 
     graph.execute(FLAGS.framework)
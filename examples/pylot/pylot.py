@@ -181,11 +181,10 @@ def add_segmented_video_op(graph, carla_op):
 
 
 def add_record_op(graph, carla_op, name, filename, filter_name):
-    record_op = graph.add(
-        RecordOp,
-        name=name,
-        init_args={'filename': filename},
-        setup_args={'filter_name': filter_name})
+    record_op = graph.add(RecordOp,
+                          name=name,
+                          init_args={'filename': filename},
+                          setup_args={'filter': filter_name})
     graph.connect([carla_op], [record_op])
     return record_op
 
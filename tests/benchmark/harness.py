@@ -0,0 +1,280 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from absl import flags
+
+import numpy as np
+
+from erdos.critical_path import CriticalPaths, Hops, load_trace
+from erdos.graph import Graph
+from erdos.tracing import merge_traces, remove_trace_parts
+from erdos.utils import close_open_writers, write_atomically
+from tests.benchmark.result_store import save_report
+
+FLAGS = flags.FLAGS
+flags.DEFINE_string(
+    'benchmark_output', '',
+    'File to which the JSON results are written. Empty '
+    'writes them to stdout.')
+flags.DEFINE_bool('save_benchmark_results', False,
+                  'Also store the results in --benchmark_results_dir.')
+
+# Version of the JSON documents written by `write_report`.
+SCHEMA_VERSION = 1
+# Maximum number of samples kept per metric in the report.
+MAX_SAMPLES = 1000
+
+
+def run_graph(build_graph, framework, num_results, timeout=120):
+    """Executes a benchmark graph, and returns the results its operators
+    wrote with `write_result`.
+
+    Local graphs run in the calling process, and return once quiescent.
+    Ray graphs never return, so they run in a child process, which is
+    terminated once all the results are written.
+
+    Args:
+        build_graph (callable): Invoked with the graph and the directory
+            where the operators write their results.
+        framework (str): Either local or ray.
+        num_results (int): Number of results the operators write.
+        timeout (float): Seconds to wait for the results.
+
+    Returns:
+        (dict of str -> dict): The results, keyed by the names under which
+        they were written.
+    """
+    result_dir = tempfile.mkdtemp(prefix='erdos-benchmark-')
+    try:
+        if framework == 'local':
+            _execute(build_graph, framework, result_dir)
+        else:
+            process = multiprocessing.Process(target=_execute,
+                                              args=(build_graph, framework,
+                                                    result_dir))
+            process.daemon = True
+            process.start()
+            try:
+                _wait_for_results(result_dir, num_results, timeout, process)
+            finally:
+                process.terminate()
+                process.join()
+        results = _read_results(result_dir)
+        if len(results) < num_results:
+            raise RuntimeError(
+                'Benchmark wrote {} results instead of {}'.format(
+                    len(results), num_results))
+        return results
+    finally:
+        shutil.rmtree(result_dir)
+
+
+def run_graph_for(build_graph, framework, duration, trace_file):
+    """Executes a graph which never completes for duration seconds with
+    every timestamp traced, and returns the merged trace.
+
+    The graph runs in a child process group, which is interrupted once the
+    duration elapsed, so that the operators' processes write their events.
+
+    Args:
+        build_graph (callable): Invoked with the graph.
+        framework (str): The framework which executes the graph.
+        duration (float): Seconds during which the graph runs.
+        trace_file (str): Path of the merged trace.
+
+    Returns:
+        (dict): The trace events, as returned by
+        `erdos.critical_path.load_trace`.
+    """
+    remove_trace_parts(trace_file)
+    process = multiprocessing.Process(target=_execute_traced,
+                                      args=(build_graph, framework,
+                                            trace_file))
+    process.start()
+    try:
+        process.join(duration)
+    finally:
+        _stop_process_group(process)
+    merge_traces(trace_file)
+    return load_trace(trace_file)
+
+
+def trace_result(benchmark, framework, params, trace_events):
+    """Returns a result entry with the end-to-end latencies of the
+    timestamps of a trace, as computed by `erdos.critical_path`, and the
+    callback durations of each operator, in `<op>_processing_us`."""
+    hops = Hops(trace_events)
+    latencies = CriticalPaths(hops).latency
+    metrics = summarize(latencies, 'latency_us')
+    samples = {'latency_us': latencies}
+    for op in np.unique(hops.receiver):
+        name = '{}_processing_us'.format(trace_events.op_names[op])
+        samples[name] = hops.processing[hops.receiver == op]
+        metrics.update(summarize(samples[name], name))
+    return make_result(benchmark, framework, params, metrics, samples)
+
+
+def write_result(result_dir, name, result):
+    """Records the result of an operator. Results are written atomically,
+    so that the driver never reads partial results."""
+    write_atomically(os.path.join(result_dir, '{}.json'.format(name)),
+                     json.dumps(result))
+
+
+def summarize(samples, prefix, scale=1):
+    """Returns the mean, p50, p99 and max of samples, scaled by scale, in
+    metrics named `<prefix>_<statistic>`."""
+    values = np.asarray(samples, dtype=np.float64) * scale
+    return {
+        '{}_mean'.format(prefix): float(values.mean()),
+        '{}_p50'.format(prefix): float(np.percentile(values, 50)),
+        '{}_p99'.format(prefix): float(np.percentile(values, 99)),
+        '{}_max'.format(prefix): float(values.max()),
+    }
+
+
+def make_result(benchmark, framework, params, metrics, samples):
+    """Returns a result entry of the report.
+
+    Args:
+        benchmark (str): Name of the benchmark.
+        framework (str): Framework which ran the benchmark.
+        params (dict): The parameters of the run.
+        metrics (dict of str -> float): Summary metrics. Names end with
+            their unit.
+        samples (dict of str -> list of float): Raw samples of the metrics,
+            which comparisons of runs test for significance.
+    """
+    return {
+        'benchmark': benchmark,
+        'framework': framework,
+        'params': params,
+        'metrics': metrics,
+        'samples': dict((name, [float(v) for v in values[:MAX_SAMPLES]])
+                        for (name, values) in samples.items()),
+    }
+
+
+def get_environment():
+    """Describes the machine and the code that ran the benchmarks."""
+    environment = {
+        'hostname': socket.gethostname(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'num_cpus': multiprocessing.cpu_count(),
+    }
+    try:
+        environment['git_commit'] = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.STDOUT).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return environment
+
+
+def write_report(results, output_path):
+    """Writes the results as JSON to output_path, or to stdout if the path
+    is empty."""
+    report = {
+        'schema_version': SCHEMA_VERSION,
+        'created_at': datetime.datetime.utcnow().isoformat() + 'Z',
+        'environment': get_environment(),
+        'results': results,
+    }
+    report['environment']['frameworks'] = sorted(
+        set(result['framework'] for result in results))
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    return report
+
+
+def output_report(results):
+    """Writes the results to --benchmark_output, and stores them if
+    --save_benchmark_results is set."""
+    report = write_report(results, FLAGS.benchmark_output)
+    if FLAGS.save_benchmark_results:
+        run_id = save_report(report)
+        sys.stderr.write('Stored benchmark run {}\n'.format(run_id))
+    return report
+
+
+def _execute(build_graph, framework, result_dir):
+    graph = Graph(name='benchmark')
+    build_graph(graph, result_dir)
+    graph.execute(framework)
+
+
+def _execute_traced(build_graph, framework, trace_file):
+    # Leads a process group, so that the processes of the graph's operators
+    # are stopped with it.
+    os.setpgrp()
+    FLAGS.trace_file = trace_file
+    FLAGS.trace_sample_rate = 1
+    graph = Graph(name='benchmark')
+    build_graph(graph)
+    try:
+        graph.execute(framework)
+    finally:
+        # The process exits with os._exit, which skips the atexit handlers.
+        close_open_writers()
+
+
+def _stop_process_group(process, grace_period=5):
+    try:
+        # SIGINT shuts down the driver and the ROS nodes, which close their
+        # tracers before they exit. Processes which do not exit within the
+        # grace period are killed, and lose their unwritten events.
+        os.killpg(process.pid, signal.SIGINT)
+    except OSError:
+        # The process has not become the group leader yet.
+        process.terminate()
+    process.join(grace_period)
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    if process.is_alive():
+        process.terminate()
+    process.join()
+
+
+def _wait_for_results(result_dir, num_results, timeout, process):
+    deadline = time.time() + timeout
+    while len(_get_result_files(result_dir)) < num_results:
+        if not process.is_alive():
+            raise RuntimeError('Benchmark process exited with code {}'.format(
+                process.exitcode))
+        if time.time() > deadline:
+            raise RuntimeError(
+                'Benchmark timed out after {} s'.format(timeout))
+        time.sleep(0.01)
+
+
+def _get_result_files(result_dir):
+    return [name for name in os.listdir(result_dir) if name.endswith('.json')]
+
+
+def _read_results(result_dir):
+    results = {}
+    for file_name in _get_result_files(result_dir):
+        with open(os.path.join(result_dir, file_name)) as f:
+            results[file_name[:-len('.json')]] = json.load(f)
+    return results
@@ -1,5 +1,6 @@
 import os
 import sys
+import tempfile
 from absl import app
 from absl import flags
 
@@ -15,17 +16,20 @@ from examples.benchmarks.pylot.slam_operator import SLAMOperator
 from examples.benchmarks.pylot.tracker_operator import TrackerOperator
 
 import erdos.graph
+from tests.benchmark.harness import output_report, run_graph_for
+from tests.benchmark.harness import trace_result
 
 FLAGS = flags.FLAGS
 flags.DEFINE_string('framework', 'ros',
                     'Execution framework to use: ros | ray.')
+flags.DEFINE_integer(
+    'benchmark_duration', 0,
+    'Seconds after which the benchmark stops, and writes '
+    'the latencies of the traced timestamps as JSON. 0 runs '
+    'the graph until it is interrupted.')
 
 
-def main(argv):
-
-    # Set up graph
-    graph = erdos.graph.get_current_graph()
-
+def build_graph(graph):
     # Add operators
     camera = graph.add(
         CameraOperator, name='camera', setup_args={'op_name': 'camera'})
@@ -73,6 +77,23 @@ def main(argv):
     graph.connect([camera, detector], [tracker])
     graph.connect([lidar, tracker], [slam])
 
+
+def main(argv):
+    if FLAGS.benchmark_duration > 0:
+        trace_file = os.path.join(tempfile.mkdtemp(), 'pylot_trace.json')
+        trace_events = run_graph_for(build_graph, FLAGS.framework,
+                                     FLAGS.benchmark_duration, trace_file)
+        output_report([
+            trace_result('pylot', FLAGS.framework,
+                         {'duration_s': FLAGS.benchmark_duration},
+                         trace_events)
+        ])
+        return
+
+    # Set up graph
+    graph = erdos.graph.get_current_graph()
+    build_graph(graph)
+
     # Execute graph
     graph.execute(FLAGS.framework)
 
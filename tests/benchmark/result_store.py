@@ -0,0 +1,352 @@
+"""Stores benchmark reports, and compares runs to detect regressions.
+
+    python tests/benchmark/result_store.py save report.json --label=master
+    python tests/benchmark/result_store.py list
+    python tests/benchmark/result_store.py compare <baseline> <candidate>
+
+Runs are named by a run id (as printed by list), a report path, or latest.
+compare exits with status 1 if a metric regressed, and with status 2 if
+some metrics have too few samples for their change to be significant.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import datetime
+import json
+import math
+import os
+import re
+import sys
+from absl import app
+from absl import flags
+
+import numpy as np
+
+FLAGS = flags.FLAGS
+flags.DEFINE_string('benchmark_results_dir', 'benchmark_results',
+                    'Directory in which benchmark runs are stored.')
+flags.DEFINE_string('benchmark_label', '',
+                    'Label of the stored run (e.g., the branch name).')
+flags.DEFINE_float(
+    'regression_threshold', 0.05,
+    'Relative change of the median above which a '
+    'significant change is reported.')
+flags.DEFINE_list(
+    'metric_thresholds', [], 'Per metric thresholds which override '
+    '--regression_threshold, as <metric>=<threshold> pairs.')
+flags.DEFINE_float('significance_level', 0.05,
+                   'p-value below which a change is significant.')
+
+# Up to this many samples per run, Mann-Whitney p-values are computed
+# exactly rather than with the normal approximation.
+EXACT_MAX_SAMPLES = 20
+
+REGRESSION = 'regression'
+IMPROVEMENT = 'improvement'
+UNCHANGED = 'unchanged'
+# Runs have too few samples for any change to be significant.
+INSUFFICIENT = 'insufficient'
+
+
+class ResultStore(object):
+    """Directory of benchmark reports, as written by
+    `tests.benchmark.harness.write_report`.
+
+    Args:
+        results_dir (str): Directory of the reports. It is created on the
+            first save.
+    """
+
+    def __init__(self, results_dir):
+        self._results_dir = results_dir
+
+    def save(self, report, label=''):
+        """Stores a report, and returns its run id."""
+        created_at = datetime.datetime.utcnow()
+        run_id = created_at.strftime('%Y%m%d-%H%M%S')
+        if label:
+            run_id = '{}-{}'.format(run_id, re.sub(r'[^\w.-]', '_', label))
+        if not os.path.exists(self._results_dir):
+            os.makedirs(self._results_dir)
+        # Runs saved within a second keep distinct ids.
+        suffix = 1
+        unique_run_id = run_id
+        while os.path.exists(self._path(unique_run_id)):
+            suffix += 1
+            unique_run_id = '{}.{}'.format(run_id, suffix)
+        report = dict(report)
+        report['run_id'] = unique_run_id
+        report['label'] = label
+        with open(self._path(unique_run_id), 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        return unique_run_id
+
+    def list_runs(self):
+        """Returns the run ids, from the oldest to the latest."""
+        if not os.path.isdir(self._results_dir):
+            return []
+        return sorted(name[:-len('.json')]
+                      for name in os.listdir(self._results_dir)
+                      if name.endswith('.json'))
+
+    def load(self, run):
+        """Returns the report of a run id, a report path, or latest."""
+        if run == 'latest':
+            run_ids = self.list_runs()
+            if not run_ids:
+                raise ValueError('No runs stored in {}'.format(
+                    self._results_dir))
+            run = run_ids[-1]
+        path = run if os.path.isfile(run) else self._path(run)
+        if not os.path.isfile(path):
+            raise ValueError('Unknown run {}'.format(run))
+        with open(path) as f:
+            return json.load(f)
+
+    def _path(self, run_id):
+        return os.path.join(self._results_dir, '{}.json'.format(run_id))
+
+
+def save_report(report):
+    """Stores a report in --benchmark_results_dir with --benchmark_label,
+    and returns its run id."""
+    return ResultStore(FLAGS.benchmark_results_dir).save(
+        report, FLAGS.benchmark_label)
+
+
+def mann_whitney_u(x, y):
+    """Two-sided Mann-Whitney U test of whether samples x and y come from
+    the same distribution.
+
+    The p-value is exact for small samples without ties, and otherwise uses
+    the normal approximation with tie and continuity corrections.
+
+    Returns:
+        (float, float): The U statistic of x, and the p-value.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    (n1, n2) = (len(x), len(y))
+    if n1 == 0 or n2 == 0:
+        raise ValueError('Samples must not be empty')
+    values = np.concatenate([x, y])
+    (ranks, tie_sizes) = _rank(values)
+    u = float(ranks[:n1].sum() - n1 * (n1 + 1) / 2.0)
+    mean = n1 * n2 / 2.0
+    if max(n1, n2) <= EXACT_MAX_SAMPLES and (tie_sizes == 1).all():
+        counts = _u_distribution(n1, n2)
+        # P(U <= min(u, n1 * n2 - u)), doubled as the distribution is
+        # symmetric.
+        tail = counts[:int(min(u, n1 * n2 - u)) + 1].sum() / counts.sum()
+        return (u, float(min(1.0, 2 * tail)))
+    n = n1 + n2
+    tie_correction = (tie_sizes**3 - tie_sizes).sum() / float(n * (n - 1))
+    variance = n1 * n2 / 12.0 * (n + 1 - tie_correction)
+    if variance <= 0:
+        # All the samples are equal.
+        return (u, 1.0)
+    z = (abs(u - mean) - 0.5) / math.sqrt(variance)
+    return (u, float(min(1.0, math.erfc(max(z, 0) / math.sqrt(2)))))
+
+
+def min_p_value(n1, n2):
+    """Returns the smallest p-value the test can report for samples of
+    sizes n1 and n2."""
+    return mann_whitney_u(np.arange(n1), np.arange(n1, n1 + n2))[1]
+
+
+def _rank(values):
+    """Returns the ranks of values, averaged over ties, and the sizes of the
+    groups of equal values."""
+    order = np.argsort(values, kind='mergesort')
+    sorted_values = values[order]
+    (_, starts, tie_sizes) = np.unique(sorted_values,
+                                       return_index=True,
+                                       return_counts=True)
+    average_ranks = starts + (tie_sizes + 1) / 2.0
+    ranks = np.empty(len(values), dtype=np.float64)
+    ranks[order] = np.repeat(average_ranks, tie_sizes)
+    return (ranks, tie_sizes)
+
+
+def _u_distribution(n1, n2):
+    """Returns the number of orderings of n1 and n2 distinct samples for
+    each value of U."""
+    # counts[j] is the distribution for i samples of x and j samples of y.
+    counts = [np.ones(1) for _ in range(n2 + 1)]
+    for i in range(1, n1 + 1):
+        next_counts = [np.ones(1)]
+        for j in range(1, n2 + 1):
+            # The largest sample belongs either to x, which adds j to U, or
+            # to y.
+            distribution = np.zeros(i * j + 1)
+            distribution[j:j + len(counts[j])] += counts[j]
+            distribution[:len(next_counts[j - 1])] += next_counts[j - 1]
+            next_counts.append(distribution)
+        counts = next_counts
+    return counts[n2]
+
+
+def higher_is_better(metric):
+    """Whether a metric, named with its unit, measures a rate."""
+    return '_per_s' in metric
+
+
+def compare(baseline,
+            candidate,
+            threshold=0.05,
+            metric_thresholds=None,
+            significance_level=0.05):
+    """Compares the samples of the benchmarks two reports have in common.
+
+    A metric regressed or improved if its median changed by more than its
+    threshold, and the change is significant according to the Mann-Whitney
+    U test.
+
+    Args:
+        baseline (dict): Report of the baseline run.
+        candidate (dict): Report of the candidate run.
+        threshold (float): Relative change of the median below which metrics
+            are unchanged.
+        metric_thresholds (dict of str -> float): Thresholds which override
+            threshold for some metrics.
+        significance_level (float): p-value below which a change is
+            significant.
+
+    Returns:
+        (list of dict): A row for each benchmark configuration and metric,
+        with the medians, the relative change, the p-value and the status.
+    """
+    metric_thresholds = metric_thresholds or {}
+    baseline_results = _index_results(baseline)
+    rows = []
+    for result in candidate['results']:
+        key = _result_key(result)
+        if key not in baseline_results:
+            continue
+        baseline_result = baseline_results[key]
+        for (metric, samples) in sorted(result['samples'].items()):
+            baseline_samples = baseline_result['samples'].get(metric)
+            if not samples or not baseline_samples:
+                continue
+            baseline_median = float(np.median(baseline_samples))
+            candidate_median = float(np.median(samples))
+            if baseline_median != 0:
+                change = (candidate_median -
+                          baseline_median) / abs(baseline_median)
+            else:
+                change = 0.0 if candidate_median == 0 else float('inf')
+            p_value = mann_whitney_u(baseline_samples, samples)[1]
+            worse = -change if higher_is_better(metric) else change
+            if worse > metric_thresholds.get(metric, threshold):
+                status = REGRESSION
+            elif -worse > metric_thresholds.get(metric, threshold):
+                status = IMPROVEMENT
+            else:
+                status = UNCHANGED
+            if status != UNCHANGED and p_value >= significance_level:
+                if min_p_value(len(baseline_samples),
+                               len(samples)) >= significance_level:
+                    status = INSUFFICIENT
+                else:
+                    status = UNCHANGED
+            rows.append({
+                'benchmark': result['benchmark'],
+                'framework': result['framework'],
+                'params': result['params'],
+                'metric': metric,
+                'baseline_median': baseline_median,
+                'candidate_median': candidate_median,
+                'change': change,
+                'p_value': p_value,
+                'status': status,
+            })
+    return rows
+
+
+def format_comparison(rows):
+    """Formats the rows returned by `compare` as a table."""
+    header = ('benchmark', 'framework', 'params', 'metric', 'baseline',
+              'candidate', 'change', 'p-value', 'status')
+    lines = [header]
+    for row in rows:
+        lines.append(
+            (row['benchmark'], row['framework'],
+             ','.join('{}={}'.format(name, value)
+                      for (name, value) in sorted(row['params'].items())),
+             row['metric'], '{:.4g}'.format(row['baseline_median']),
+             '{:.4g}'.format(row['candidate_median']),
+             '{:+.1%}'.format(row['change']), '{:.3f}'.format(row['p_value']),
+             row['status']))
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    return '\n'.join('  '.join(
+        value.ljust(width) for (value, width) in zip(line, widths)).rstrip()
+                     for line in lines)
+
+
+def comparison_status(rows):
+    """Returns the exit status of a comparison: 1 if a metric regressed,
+    2 if a metric changed but its runs have too few samples to tell whether
+    the change is significant, and 0 otherwise."""
+    statuses = set(row['status'] for row in rows)
+    if REGRESSION in statuses:
+        return 1
+    if INSUFFICIENT in statuses:
+        return 2
+    return 0
+
+
+def _result_key(result):
+    return (result['benchmark'], result['framework'],
+            json.dumps(result['params'], sort_keys=True))
+
+
+def _index_results(report):
+    return dict((_result_key(result), result) for result in report['results'])
+
+
+def _parse_metric_thresholds(pairs):
+    thresholds = {}
+    for pair in pairs:
+        (metric, threshold) = pair.split('=')
+        thresholds[metric] = float(threshold)
+    return thresholds
+
+
+def main(argv):
+    store = ResultStore(FLAGS.benchmark_results_dir)
+    command = argv[1] if len(argv) > 1 else 'list'
+    if command == 'save' and len(argv) == 3:
+        with open(argv[2]) as f:
+            print(store.save(json.load(f), FLAGS.benchmark_label))
+    elif command == 'list' and len(argv) <= 2:
+        for run_id in store.list_runs():
+            environment = store.load(run_id)['environment']
+            print('{}  commit={} python={} cpus={} frameworks={}'.format(
+                run_id,
+                environment.get('git_commit', '?')[:10],
+                environment.get('python'), environment.get('num_cpus'),
+                ','.join(environment.get('frameworks', []))))
+    elif command == 'compare' and len(argv) == 4:
+        rows = compare(store.load(argv[2]), store.load(argv[3]),
+                       FLAGS.regression_threshold,
+                       _parse_metric_thresholds(FLAGS.metric_thresholds),
+                       FLAGS.significance_level)
+        print(format_comparison(rows))
+        insufficient = [row for row in rows if row['status'] == INSUFFICIENT]
+        if insufficient:
+            print('WARNING: {} metrics changed, but their runs have too few '
+                  'samples for the change to be significant. Rerun the '
+                  'benchmarks with more repetitions.'.format(
+                      len(insufficient)),
+                  file=sys.stderr)
+        status = comparison_status(rows)
+        if status:
+            sys.exit(status)
+    else:
+        raise app.UsageError(__doc__)
+
+
+if __name__ == '__main__':
+    app.run(main)
@@ -0,0 +1,939 @@
+"""Microbenchmarks of the ERDOS runtime.
+
+Runs on the local executor and on Ray in local mode, and writes the results
+as JSON, which tests/benchmark/result_store.py stores and compares:
+
+    python tests/benchmark/runtime_benchmark.py --benchmark_output=out.json
+    python tests/benchmark/runtime_benchmark.py --save_benchmark_results
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import heapq
+import logging
+import os
+import pickle
+import sys
+import time
+from absl import app
+from absl import flags
+
+import numpy as np
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))))
+
+from erdos.data_stream import DataStream
+from erdos.data_streams import DataStreams
+from erdos.graph import Graph
+from erdos.message import Message, WatermarkMessage
+from erdos.op import Op
+from erdos.operators import NoopOp
+from erdos.timestamp import Timestamp
+from erdos.watermark_tracker import WatermarkTracker
+from tests.benchmark.harness import make_result, output_report, run_graph
+from tests.benchmark.harness import summarize, write_result
+
+FLAGS = flags.FLAGS
+flags.DEFINE_list('benchmark_frameworks', ['local', 'ray'],
+                  'Frameworks on which the benchmarks run.')
+flags.DEFINE_list('benchmarks', [
+    'single_hop_latency', 'fan_out_throughput', 'fan_in_throughput',
+    'watermark_cost', 'ping_pong', 'payload_bandwidth', 'graph_build',
+    'watermark_tracker', 'timestamp_workload', 'edf_latency',
+    'batched_throughput'
+], 'Benchmarks to run.')
+flags.DEFINE_integer(
+    'benchmark_repetitions', 5,
+    'Number of runs of the throughput benchmarks. Below 4, '
+    'comparisons of runs can never find a significant '
+    'change.')
+flags.DEFINE_integer('benchmark_messages', 1000,
+                     'Number of messages sent by each source.')
+flags.DEFINE_float('latency_interval_ms', 0.5,
+                   'Time between two messages of the latency benchmark.')
+flags.DEFINE_list(
+    'fan_degrees', ['2', '8'],
+    'Numbers of sinks and sources of the fan-out and fan-in '
+    'benchmarks.')
+flags.DEFINE_list('watermark_streams', ['1', '2', '4', '8', '16'],
+                  'Numbers of input streams of the watermark benchmark.')
+flags.DEFINE_integer('ping_pong_iterations', 200,
+                     'Number of round trips of the ping-pong benchmark.')
+flags.DEFINE_list('payload_mb', ['1', '16'],
+                  'Payload sizes of the bandwidth benchmark, in MB.')
+flags.DEFINE_integer('payload_messages', 20,
+                     'Number of messages of the bandwidth benchmark.')
+flags.DEFINE_list('graph_sizes', ['100', '1000', '10000'],
+                  'Numbers of operators of the graph build benchmark.')
+flags.DEFINE_bool(
+    'compare_legacy_refinement', True,
+    'Also time the graph build with the refinement that '
+    'evaluates every operator until no output changes.')
+flags.DEFINE_integer(
+    'tracker_watermarks', 2000,
+    'Number of watermarks per stream of the watermark '
+    'tracker benchmark.')
+flags.DEFINE_integer('timestamp_streams', 12,
+                     'Number of input streams of the timestamp benchmark.')
+flags.DEFINE_integer(
+    'timestamp_watermarks', 2000,
+    'Number of watermarks per stream of the timestamp '
+    'benchmark.')
+flags.DEFINE_integer('edf_ticks', 200,
+                     'Number of control ticks of the EDF benchmark.')
+flags.DEFINE_list('batch_sizes', ['1', '32'],
+                  'Ray batch sizes of the batched throughput benchmark.')
+flags.DEFINE_integer('benchmark_timeout', 120,
+                     'Seconds after which a benchmark run fails.')
+
+logger = logging.getLogger(__name__)
+
+# With fewer samples per run, the smallest p-value of the comparisons is
+# above their 0.05 significance level.
+MIN_REPETITIONS = 4
+
+
+class SourceOp(Op):
+    """Sends messages carrying their send time, and a watermark after each
+    message.
+
+    Args:
+        num_msgs (int): Number of timestamps to send.
+        interval (float): Seconds between two timestamps.
+        payload_bytes (int): Size of the numpy payload of each message.
+        send_data (bool): False to only send watermarks.
+        batch_size (int): If set, the batch size label of the stream.
+    """
+
+    def __init__(self,
+                 name,
+                 result_dir,
+                 num_msgs,
+                 interval=0,
+                 payload_bytes=0,
+                 send_data=True):
+        super(SourceOp, self).__init__(name)
+        self._result_dir = result_dir
+        self._num_msgs = num_msgs
+        self._interval = interval
+        self._payload_bytes = payload_bytes
+        self._send_data = send_data
+
+    @staticmethod
+    def setup_streams(input_streams, stream_name, batch_size=None):
+        labels = {}
+        if batch_size is not None:
+            labels['batch_size'] = str(batch_size)
+        return [DataStream(name=stream_name, labels=labels)]
+
+    def execute(self):
+        (output_stream, ) = self.output_streams.values()
+        payload = None
+        if self._payload_bytes > 0:
+            payload = np.ones(self._payload_bytes, dtype=np.uint8)
+        start_time = time.time()
+        for index in range(self._num_msgs):
+            timestamp = Timestamp(coordinates=[index])
+            if self._send_data:
+                output_stream.send(Message((time.time(), payload), timestamp))
+            output_stream.send(WatermarkMessage(timestamp))
+            if self._interval > 0:
+                time.sleep(self._interval)
+        write_result(self._result_dir, self.name, {
+            'start_time': start_time,
+            'end_time': time.time()
+        })
+
+
+class SinkOp(Op):
+    """Records the latency of the messages it receives, and the time at
+    which it received the last message or watermark.
+
+    Args:
+        num_msgs (int): Number of messages after which the result is
+            written.
+        num_watermarks (int): Number of low watermarks after which the
+            result is written, if num_msgs is 0.
+    """
+
+    def __init__(self, name, result_dir, num_msgs, num_watermarks=0):
+        super(SinkOp, self).__init__(name)
+        self._result_dir = result_dir
+        self._num_msgs = num_msgs
+        self._num_watermarks = num_watermarks
+        self._latencies = []
+        self._first_send_time = None
+        self._num_received = 0
+        self._num_low_watermarks = 0
+
+    @staticmethod
+    def setup_streams(input_streams):
+        input_streams.add_callback(SinkOp.on_msg)
+        input_streams.add_completion_callback(SinkOp.on_watermark)
+        return []
+
+    def on_msg(self, msg):
+        receive_time = time.time()
+        send_time = msg.data[0]
+        self._latencies.append(receive_time - send_time)
+        if self._first_send_time is None:
+            self._first_send_time = send_time
+        self._num_received += 1
+        if self._num_received == self._num_msgs:
+            self._write_result(receive_time)
+
+    def on_watermark(self, msg):
+        self._num_low_watermarks += 1
+        if (self._num_msgs == 0
+                and self._num_low_watermarks == self._num_watermarks):
+            self._write_result(time.time())
+
+    def _write_result(self, end_time):
+        write_result(
+            self._result_dir, self.name, {
+                'latencies': self._latencies,
+                'first_send_time': self._first_send_time,
+                'end_time': end_time,
+                'num_received': self._num_received,
+            })
+
+
+class PingOp(Op):
+    """Sends a ping, and a new one whenever it receives a pong, until it
+    completed num_iterations round trips."""
+
+    def __init__(self, name, result_dir, num_iterations):
+        super(PingOp, self).__init__(name)
+        self._result_dir = result_dir
+        self._num_iterations = num_iterations
+        self._round_trips = []
+        self._send_time = None
+
+    @staticmethod
+    def setup_streams(input_streams):
+        input_streams.add_callback(PingOp.on_pong)
+        return [DataStream(name='ping')]
+
+    def execute(self):
+        self._send_ping(0)
+
+    def on_pong(self, msg):
+        self._round_trips.append(time.time() - self._send_time)
+        iteration = msg.timestamp.coordinates[0] + 1
+        if iteration < self._num_iterations:
+            self._send_ping(iteration)
+        else:
+            write_result(self._result_dir, self.name,
+                         {'round_trips': self._round_trips})
+
+    def _send_ping(self, iteration):
+        self._send_time = time.time()
+        self.get_output_stream('ping').send(
+            Message(iteration, Timestamp(coordinates=[iteration])))
+
+
+class PongOp(Op):
+    """Answers pings."""
+
+    @staticmethod
+    def setup_streams(input_streams):
+        input_streams.add_callback(PongOp.on_ping)
+        return [DataStream(name='pong')]
+
+    def on_ping(self, msg):
+        self.get_output_stream('pong').send(Message(msg.data, msg.timestamp))
+
+
+class SensorsOp(Op):
+    """Sends control updates at control_rate, and bursts of camera frames
+    at camera_rate. Messages carry their send time."""
+
+    def __init__(self, name, num_ticks, control_rate, ticks_per_frame,
+                 frames_per_tick):
+        super(SensorsOp, self).__init__(name)
+        self._num_ticks = num_ticks
+        self._control_rate = control_rate
+        self._ticks_per_frame = ticks_per_frame
+        self._frames_per_tick = frames_per_tick
+
+    @staticmethod
+    def setup_streams(input_streams):
+        return [
+            DataStream(data_type=float, name='camera'),
+            DataStream(data_type=float, name='control')
+        ]
+
+    def execute(self):
+        control_stream = self.get_output_stream('control')
+        camera_stream = self.get_output_stream('camera')
+        start_time = time.time()
+        for tick in range(self._num_ticks):
+            # Sleep until the tick, without accumulating drift.
+            time.sleep(
+                max(0, start_time + tick / self._control_rate - time.time()))
+            timestamp = Timestamp(coordinates=[tick])
+            if tick % self._ticks_per_frame == 0:
+                for _ in range(self._frames_per_tick):
+                    camera_stream.send(Message(time.time(), timestamp))
+            control_stream.send(Message(time.time(), timestamp))
+            camera_stream.send(WatermarkMessage(timestamp))
+            control_stream.send(WatermarkMessage(timestamp))
+
+
+class AgentOp(Op):
+    """Processes camera frames slowly, and records the latency of the
+    camera frames and of the control updates.
+
+    Args:
+        num_controls (int): Number of control updates to receive.
+        num_frames (int): Number of camera frames to receive.
+        frame_processing_ms (float): Time the agent takes to process a
+            camera frame.
+    """
+
+    def __init__(self, name, result_dir, num_controls, num_frames,
+                 frame_processing_ms):
+        super(AgentOp, self).__init__(name)
+        self._result_dir = result_dir
+        self._num_controls = num_controls
+        self._num_frames = num_frames
+        self._frame_processing_ms = frame_processing_ms
+        self._control_latencies = []
+        self._frame_latencies = []
+
+    @staticmethod
+    def setup_streams(input_streams, camera_budget_ms, control_budget_ms):
+        camera_streams = input_streams.filter_name('camera')
+        control_streams = input_streams.filter_name('control')
+        if camera_budget_ms is not None:
+            camera_streams.set_latency_budget(camera_budget_ms)
+            control_streams.set_latency_budget(control_budget_ms)
+        camera_streams.add_callback(AgentOp.on_camera_frame)
+        control_streams.add_callback(AgentOp.on_control_update)
+        return []
+
+    def on_camera_frame(self, msg):
+        time.sleep(self._frame_processing_ms / 1000.0)
+        self._frame_latencies.append(time.time() - msg.data)
+        self._maybe_write_result()
+
+    def on_control_update(self, msg):
+        self._control_latencies.append(time.time() - msg.data)
+        self._maybe_write_result()
+
+    def _maybe_write_result(self):
+        if (len(self._control_latencies) == self._num_controls
+                and len(self._frame_latencies) == self._num_frames):
+            write_result(
+                self._result_dir, self.name, {
+                    'control_latencies': self._control_latencies,
+                    'frame_latencies': self._frame_latencies
+                })
+
+
+def _add_source(graph, result_dir, name, num_msgs, batch_size=None, **kwargs):
+    init_args = {'result_dir': result_dir, 'num_msgs': num_msgs}
+    init_args.update(kwargs)
+    # Operators are not fused, so that every benchmark crosses executors.
+    return graph.add(SourceOp,
+                     name=name,
+                     init_args=init_args,
+                     setup_args={
+                         'stream_name': name,
+                         'batch_size': batch_size
+                     },
+                     _fusible=False)
+
+
+def _add_sink(graph, result_dir, name, num_msgs, num_watermarks=0):
+    return graph.add(SinkOp,
+                     name=name,
+                     init_args={
+                         'result_dir': result_dir,
+                         'num_msgs': num_msgs,
+                         'num_watermarks': num_watermarks
+                     },
+                     _fusible=False)
+
+
+def _throughput(results, num_msgs):
+    """Returns the messages per second delivered from the first send to the
+    last receive."""
+    start_time = min(result['start_time'] if 'start_time' in
+                     result else result['first_send_time']
+                     for result in results.values())
+    end_time = max(result['end_time'] for result in results.values()
+                   if 'latencies' in result)
+    return num_msgs / (end_time - start_time)
+
+
+def single_hop_latency(framework, num_msgs, interval, timeout=120):
+    """Latency of messages sent at a low rate from a source to a sink."""
+
+    def build_graph(graph, result_dir):
+        source = _add_source(graph,
+                             result_dir,
+                             'source',
+                             num_msgs,
+                             interval=interval)
+        sink = _add_sink(graph, result_dir, 'sink', num_msgs)
+        graph.connect([source], [sink])
+
+    results = run_graph(build_graph, framework, 2, timeout)
+    latencies = results['sink']['latencies']
+    return [
+        make_result('single_hop_latency', framework, {
+            'num_msgs': num_msgs,
+            'interval_ms': interval * 1000
+        }, summarize(latencies, 'latency_us', 1e6),
+                    {'latency_us': [latency * 1e6 for latency in latencies]})
+    ]
+
+
+def fan_out_throughput(framework, num_msgs, degrees, repetitions, timeout=120):
+    """Messages per second a source delivers to several sinks."""
+    results = []
+    for degree in degrees:
+
+        def build_graph(graph, result_dir):
+            source = _add_source(graph, result_dir, 'source', num_msgs)
+            sinks = [
+                _add_sink(graph, result_dir, 'sink_{}'.format(index), num_msgs)
+                for index in range(degree)
+            ]
+            graph.connect([source], sinks)
+
+        throughputs = [
+            _throughput(run_graph(build_graph, framework, degree + 1, timeout),
+                        num_msgs * degree) for _ in range(repetitions)
+        ]
+        results.append(
+            make_result('fan_out_throughput', framework, {
+                'num_msgs': num_msgs,
+                'num_sinks': degree
+            }, summarize(throughputs, 'msgs_per_s'),
+                        {'msgs_per_s': throughputs}))
+    return results
+
+
+def fan_in_throughput(framework, num_msgs, degrees, repetitions, timeout=120):
+    """Messages per second several sources deliver to a sink."""
+    results = []
+    for degree in degrees:
+
+        def build_graph(graph, result_dir):
+            sources = [
+                _add_source(graph, result_dir, 'source_{}'.format(index),
+                            num_msgs) for index in range(degree)
+            ]
+            sink = _add_sink(graph, result_dir, 'sink', num_msgs * degree)
+            graph.connect(sources, [sink])
+
+        throughputs = [
+            _throughput(run_graph(build_graph, framework, degree + 1, timeout),
+                        num_msgs * degree) for _ in range(repetitions)
+        ]
+        results.append(
+            make_result('fan_in_throughput', framework, {
+                'num_msgs': num_msgs,
+                'num_sources': degree
+            }, summarize(throughputs, 'msgs_per_s'),
+                        {'msgs_per_s': throughputs}))
+    return results
+
+
+def watermark_cost(framework,
+                   num_timestamps,
+                   num_streams_list,
+                   repetitions,
+                   timeout=120):
+    """Time a sink takes to complete a timestamp, depending on the number
+    of input streams which carry its watermarks."""
+    results = []
+    for num_streams in num_streams_list:
+
+        def build_graph(graph, result_dir):
+            sources = [
+                _add_source(graph,
+                            result_dir,
+                            'source_{}'.format(index),
+                            num_timestamps,
+                            send_data=False) for index in range(num_streams)
+            ]
+            sink = _add_sink(graph,
+                             result_dir,
+                             'sink',
+                             0,
+                             num_watermarks=num_timestamps)
+            graph.connect(sources, [sink])
+
+        costs = []
+        for _ in range(repetitions):
+            run_results = run_graph(build_graph, framework, num_streams + 1,
+                                    timeout)
+            start_time = min(result['start_time']
+                             for (name, result) in run_results.items()
+                             if name != 'sink')
+            costs.append((run_results['sink']['end_time'] - start_time) /
+                         num_timestamps * 1e6)
+        results.append(
+            make_result('watermark_cost', framework, {
+                'num_timestamps': num_timestamps,
+                'num_streams': num_streams
+            }, summarize(costs, 'us_per_timestamp'),
+                        {'us_per_timestamp': costs}))
+    return results
+
+
+def ping_pong(framework, num_iterations, timeout=120):
+    """Round trip time of a message sent around a two operator loop."""
+
+    def build_graph(graph, result_dir):
+        ping = graph.add(PingOp,
+                         name='ping',
+                         init_args={
+                             'result_dir': result_dir,
+                             'num_iterations': num_iterations
+                         },
+                         _fusible=False)
+        pong = graph.add(PongOp, name='pong', _fusible=False)
+        graph.connect([ping], [pong])
+        graph.connect([pong], [ping])
+
+    round_trips = run_graph(build_graph, framework, 1,
+                            timeout)['ping']['round_trips']
+    return [
+        make_result('ping_pong', framework, {'num_iterations': num_iterations},
+                    summarize(round_trips, 'round_trip_us', 1e6), {
+                        'round_trip_us': [
+                            round_trip * 1e6 for round_trip in round_trips
+                        ]
+                    })
+    ]
+
+
+def payload_bandwidth(framework,
+                      num_msgs,
+                      payload_mbs,
+                      repetitions,
+                      timeout=120):
+    """Megabytes per second delivered by messages with large numpy
+    payloads."""
+    results = []
+    for payload_mb in payload_mbs:
+        payload_bytes = int(payload_mb * (1 << 20))
+
+        def build_graph(graph, result_dir):
+            source = _add_source(graph,
+                                 result_dir,
+                                 'source',
+                                 num_msgs,
+                                 payload_bytes=payload_bytes)
+            sink = _add_sink(graph, result_dir, 'sink', num_msgs)
+            graph.connect([source], [sink])
+
+        bandwidths = [
+            _throughput(run_graph(build_graph, framework, 2, timeout),
+                        num_msgs) * payload_mb for _ in range(repetitions)
+        ]
+        results.append(
+            make_result('payload_bandwidth', framework, {
+                'num_msgs': num_msgs,
+                'payload_mb': payload_mb
+            }, summarize(bandwidths, 'mb_per_s'), {'mb_per_s': bandwidths}))
+    return results
+
+
+class ListTimestamp(object):
+    """The list-backed timestamp ERDOS used before, kept as a baseline."""
+
+    def __init__(self, timestamp=None, coordinates=None):
+        if timestamp is None:
+            self.coordinates = coordinates
+        else:
+            self.coordinates = timestamp.coordinates
+
+    def __eq__(self, timestamp):
+        if len(self.coordinates) != len(timestamp.coordinates):
+            return False
+        for coord, other_coord in zip(self.coordinates, timestamp.coordinates):
+            if coord != other_coord:
+                return False
+        return True
+
+    def __ne__(self, timestamp):
+        return not self.__eq__(timestamp)
+
+    def __lt__(self, timestamp):
+        for coord, other_coord in zip(self.coordinates, timestamp.coordinates):
+            if coord > other_coord:
+                return False
+            elif coord < other_coord:
+                return True
+        return False
+
+    def __le__(self, timestamp):
+        for coord, other_coord in zip(self.coordinates, timestamp.coordinates):
+            if coord > other_coord:
+                return False
+            elif coord < other_coord:
+                return True
+        return True
+
+    def __gt__(self, timestamp):
+        return not self.__le__(timestamp)
+
+    def __ge__(self, timestamp):
+        return not self.__lt__(timestamp)
+
+    def __hash__(self):
+        return hash(tuple(self.coordinates))
+
+
+def legacy_build_refined_op_graph(graph):
+    """The refinement Graph used before, kept as a baseline. It evaluates
+    every operator and copies every stream on each iteration."""
+    not_converged = True
+    while not_converged:
+        not_converged = False
+        for op_id, op_handle in graph.op_handles.items():
+            output_streams = op_handle.op_cls.setup_streams(
+                DataStreams(op_handle.input_streams), **op_handle.setup_args)
+            for stream in output_streams:
+                stream.uid = op_id
+            if graph._different_output_streams(op_handle.output_streams,
+                                               output_streams):
+                not_converged = True
+            op_handle.output_streams = output_streams
+        for op_handle in graph.op_handles.values():
+            op_handle.input_streams = []
+        for op_handle in graph.op_handles.values():
+            for dependant_id in op_handle.dependant_ops:
+                graph.op_handles[dependant_id].input_streams += [
+                    out_stream._copy_stream()
+                    for out_stream in op_handle.output_streams
+                ]
+    for op_handle in graph.op_handles.values():
+        op_handle.op_cls.setup_streams(DataStreams(op_handle.input_streams),
+                                       **op_handle.setup_args)
+    graph._assign_stream_ids()
+    graph._build_output_stream_sinks_graph()
+    graph._build_stream_dependents()
+
+
+def _input_stream_uids(graph):
+    return dict((op_id, sorted(stream.uid for stream in handle.input_streams))
+                for op_id, handle in graph.op_handles.items())
+
+
+def graph_build(graph_sizes, repetitions, depth=10, compare_legacy=False):
+    """Time to add, connect and refine graphs of camera chains which feed a
+    single operator. The benchmark does not depend on the framework.
+
+    Args:
+        compare_legacy (bool): Also time the graphs refined by
+            `legacy_build_refined_op_graph`.
+    """
+    refinements = [('worklist', Graph._build_refined_op_graph)]
+    if compare_legacy:
+        refinements.append(('legacy', legacy_build_refined_op_graph))
+    results = []
+    for num_ops in graph_sizes:
+        input_stream_uids = {}
+        for (refinement, refine) in refinements:
+            durations = []
+            for _ in range(repetitions):
+                start_time = time.time()
+                graph = Graph(name='graph_build')
+                sink = graph.add(NoopOp, name='sink')
+                for chain in range(max(1, num_ops // (depth + 1))):
+                    previous = graph.add(NoopOp,
+                                         name='camera_{}'.format(chain))
+                    for index in range(depth):
+                        op_id = graph.add(NoopOp,
+                                          name='forward_{}_{}'.format(
+                                              chain, index))
+                        graph.connect([previous], [op_id])
+                        previous = op_id
+                    graph.connect([previous], [sink])
+                refine(graph)
+                graph._fuse_op_chains()
+                durations.append(time.time() - start_time)
+            # Both refinements must produce the same graph.
+            input_stream_uids[refinement] = _input_stream_uids(graph)
+            assert input_stream_uids[refinement] == (
+                input_stream_uids['worklist'])
+            results.append(
+                make_result('graph_build', 'none', {
+                    'num_ops': num_ops,
+                    'refinement': refinement
+                }, summarize(durations, 'ms', 1e3),
+                            {'ms': [duration * 1e3
+                                    for duration in durations]}))
+    return results
+
+
+def batched_throughput(framework,
+                       num_msgs,
+                       batch_sizes,
+                       repetitions,
+                       timeout=120):
+    """Messages per second a source delivers to a sink when its stream
+    batches sends. Only Ray executors batch, other frameworks ignore the
+    batch size."""
+    results = []
+    for batch_size in batch_sizes:
+
+        def build_graph(graph, result_dir):
+            source = _add_source(graph,
+                                 result_dir,
+                                 'source',
+                                 num_msgs,
+                                 batch_size=batch_size)
+            sink = _add_sink(graph, result_dir, 'sink', num_msgs)
+            graph.connect([source], [sink])
+
+        throughputs = [
+            _throughput(run_graph(build_graph, framework, 2, timeout),
+                        num_msgs) for _ in range(repetitions)
+        ]
+        results.append(
+            make_result('batched_throughput', framework, {
+                'num_msgs': num_msgs,
+                'batch_size': batch_size
+            }, summarize(throughputs, 'msgs_per_s'),
+                        {'msgs_per_s': throughputs}))
+    return results
+
+
+def edf_latency(framework,
+                num_ticks,
+                control_rate=200,
+                camera_rate=30,
+                frames_per_tick=8,
+                frame_processing_ms=3,
+                control_budget_ms=5,
+                camera_budget_ms=200,
+                timeout=120):
+    """Latency of control updates which share an operator with bursts of
+    slow camera frames, when the operator runs callbacks in arrival order
+    and when it runs them by earliest deadline."""
+    ticks_per_frame = max(1, control_rate // camera_rate)
+    num_frames = ((num_ticks + ticks_per_frame - 1) // ticks_per_frame *
+                  frames_per_tick)
+    results = []
+    for edf in [False, True]:
+
+        def build_graph(graph, result_dir):
+            sensors = graph.add(SensorsOp,
+                                name='sensors',
+                                init_args={
+                                    'num_ticks': num_ticks,
+                                    'control_rate': control_rate,
+                                    'ticks_per_frame': ticks_per_frame,
+                                    'frames_per_tick': frames_per_tick
+                                },
+                                _fusible=False)
+            agent = graph.add(
+                AgentOp,
+                name='agent',
+                init_args={
+                    'result_dir': result_dir,
+                    'num_controls': num_ticks,
+                    'num_frames': num_frames,
+                    'frame_processing_ms': frame_processing_ms
+                },
+                setup_args={
+                    'camera_budget_ms': camera_budget_ms if edf else None,
+                    'control_budget_ms': control_budget_ms if edf else None
+                },
+                _fusible=False)
+            graph.connect([sensors], [agent])
+
+        result = run_graph(build_graph, framework, 1, timeout)['agent']
+        control_latencies = result['control_latencies']
+        frame_latencies = result['frame_latencies']
+        metrics = summarize(control_latencies, 'control_latency_us', 1e6)
+        metrics.update(summarize(frame_latencies, 'camera_latency_us', 1e6))
+        results.append(
+            make_result('edf_latency', framework, {
+                'num_ticks': num_ticks,
+                'edf': edf
+            }, metrics, {
+                'control_latency_us': [
+                    latency * 1e6 for latency in control_latencies
+                ],
+                'camera_latency_us': [
+                    latency * 1e6 for latency in frame_latencies
+                ]
+            }))
+    return results
+
+
+def watermark_tracker(num_streams_list, num_watermarks, repetitions):
+    """Time the watermark tracker takes to update the low watermark of an
+    operator, depending on its number of input streams. The benchmark does
+    not depend on the framework."""
+    results = []
+    for num_streams in num_streams_list:
+        streams = ['stream_{}'.format(index) for index in range(num_streams)]
+        watermarks = [(stream, Timestamp(coordinates=[coordinate]))
+                      for coordinate in range(1, num_watermarks + 1)
+                      for stream in streams]
+        costs = []
+        for _ in range(repetitions):
+            tracker = WatermarkTracker()
+            for stream in streams:
+                tracker.add_stream(stream)
+            start_time = time.time()
+            for (stream, timestamp) in watermarks:
+                tracker.update(stream, timestamp)
+            costs.append((time.time() - start_time) / len(watermarks) * 1e9)
+        results.append(
+            make_result('watermark_tracker', 'none', {
+                'num_streams': num_streams,
+                'num_watermarks': num_watermarks
+            }, summarize(costs, 'ns_per_watermark'),
+                        {'ns_per_watermark': costs}))
+    return results
+
+
+def timestamp_workload(num_streams, num_watermarks, repetitions):
+    """Time an operator takes to receive a watermark on one of its input
+    streams, with `Timestamp` and with the `ListTimestamp` baseline. Each
+    watermark updates the stream's high watermark, computes the low watermark
+    across all streams, and releases the per-timestamp state kept in a dict
+    and a heap. The benchmark does not depend on the framework."""
+    streams = list(range(num_streams))
+    order = [(coord, stream) for coord in range(1, num_watermarks + 1)
+             for stream in streams]
+    results = []
+    for name, timestamp_cls in [('list', ListTimestamp), ('tuple', Timestamp)]:
+        costs = []
+        for _ in range(repetitions):
+            high_watermarks = dict((stream, None) for stream in streams)
+            state = {}
+            pending = []
+            start_time = time.time()
+            for coord, stream in order:
+                timestamp = timestamp_cls(coordinates=[coord, 0])
+                state[timestamp] = state.get(timestamp, 0) + 1
+                if state[timestamp] == 1:
+                    heapq.heappush(pending, timestamp)
+                high_watermarks[stream] = timestamp
+                low_watermark = timestamp
+                for watermark in high_watermarks.values():
+                    if watermark is None or watermark < timestamp:
+                        low_watermark = None
+                        break
+                    if low_watermark > watermark:
+                        low_watermark = watermark
+                if low_watermark is None:
+                    continue
+                while pending and pending[0] <= low_watermark:
+                    del state[heapq.heappop(pending)]
+            costs.append((time.time() - start_time) / len(order) * 1e9)
+        metrics = summarize(costs, 'ns_per_watermark')
+        metrics['pickled_bytes'] = len(
+            pickle.dumps(timestamp_cls(coordinates=[1, 2]),
+                         pickle.HIGHEST_PROTOCOL))
+        results.append(
+            make_result(
+                'timestamp_workload', 'none', {
+                    'timestamp': name,
+                    'num_streams': num_streams,
+                    'num_watermarks': num_watermarks
+                }, metrics, {'ns_per_watermark': costs}))
+    return results
+
+
+def run_benchmarks(framework, names):
+    """Runs the named benchmarks on a framework with the flag values."""
+    repetitions = FLAGS.benchmark_repetitions
+    timeout = FLAGS.benchmark_timeout
+    degrees = [int(degree) for degree in FLAGS.fan_degrees]
+    benchmarks = {
+        'single_hop_latency': lambda: single_hop_latency(
+            framework, FLAGS.benchmark_messages, FLAGS.latency_interval_ms /
+            1000, timeout),
+        'fan_out_throughput': lambda: fan_out_throughput(
+            framework, FLAGS.benchmark_messages, degrees, repetitions, timeout
+        ),
+        'fan_in_throughput': lambda: fan_in_throughput(
+            framework, FLAGS.benchmark_messages, degrees, repetitions, timeout
+        ),
+        'watermark_cost': lambda: watermark_cost(
+            framework, FLAGS.benchmark_messages, [
+                int(num_streams) for num_streams in FLAGS.watermark_streams
+            ], repetitions, timeout),
+        'ping_pong': lambda: ping_pong(framework, FLAGS.ping_pong_iterations,
+                                       timeout),
+        'payload_bandwidth': lambda: payload_bandwidth(
+            framework, FLAGS.payload_messages,
+            [float(payload_mb)
+             for payload_mb in FLAGS.payload_mb], repetitions, timeout),
+        'edf_latency': lambda: edf_latency(
+            framework, FLAGS.edf_ticks, timeout=timeout),
+    }
+    if framework == 'ray':
+        benchmarks['batched_throughput'] = lambda: batched_throughput(
+            framework, FLAGS.benchmark_messages,
+            [int(batch_size)
+             for batch_size in FLAGS.batch_sizes], repetitions, timeout)
+    results = []
+    for name in names:
+        if name in benchmarks:
+            logger.info('Running {} on {}'.format(name, framework))
+            results.extend(benchmarks[name]())
+    return results
+
+
+def main(argv):
+    if FLAGS.benchmark_repetitions < MIN_REPETITIONS:
+        logger.warning(
+            '--benchmark_repetitions={} gives too few samples for '
+            'comparisons of the throughput benchmarks to be significant, '
+            'use at least {}'.format(FLAGS.benchmark_repetitions,
+                                     MIN_REPETITIONS))
+    unknown = set(FLAGS.benchmarks) - set([
+        'single_hop_latency', 'fan_out_throughput', 'fan_in_throughput',
+        'watermark_cost', 'ping_pong', 'payload_bandwidth', 'graph_build',
+        'watermark_tracker', 'timestamp_workload', 'edf_latency',
+        'batched_throughput'
+    ])
+    if unknown:
+        raise ValueError('Unknown benchmarks {}'.format(sorted(unknown)))
+    results = []
+    if 'graph_build' in FLAGS.benchmarks:
+        results.extend(
+            graph_build([int(size) for size in FLAGS.graph_sizes],
+                        FLAGS.benchmark_repetitions,
+                        compare_legacy=FLAGS.compare_legacy_refinement))
+    if 'watermark_tracker' in FLAGS.benchmarks:
+        results.extend(
+            watermark_tracker(
+                [int(num_streams) for num_streams in FLAGS.watermark_streams],
+                FLAGS.tracker_watermarks, FLAGS.benchmark_repetitions))
+    if 'timestamp_workload' in FLAGS.benchmarks:
+        results.extend(
+            timestamp_workload(FLAGS.timestamp_streams,
+                               FLAGS.timestamp_watermarks,
+                               FLAGS.benchmark_repetitions))
+    for framework in FLAGS.benchmark_frameworks:
+        if framework == 'ray':
+            try:
+                import ray  # noqa: F401
+            except ImportError:
+                logger.warning('Ray is not installed, skipping the Ray runs')
+                continue
+            # The actors run in the process of the graph's driver.
+            FLAGS.ray_local_mode = True
+        results.extend(run_benchmarks(framework, FLAGS.benchmarks))
+    output_report(results)
+
+
+if __name__ == '__main__':
+    app.run(main)
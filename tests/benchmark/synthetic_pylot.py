@@ -0,0 +1,536 @@
+"""Synthetic load generator with the topology of the pylot benchmark.
+
+Sensors send numpy payloads of configurable shapes at configurable rates,
+and every operator spends a service time drawn from a distribution instead
+of running a model, so the graph runs on any executor without CARLA, ROS or
+images. The motion planner records the end-to-end latency of every
+timestamp, and the report gives the fraction of timestamps that missed the
+deadline, for each scale of the service times:
+
+    python tests/benchmark/synthetic_pylot.py --framework=local \\
+        --load_profile=profile.json --load_scales=1,2,4
+
+The load profile is a JSON file which overrides entries of DEFAULT_PROFILE.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import json
+import logging
+import os
+import sys
+import time
+import zlib
+from absl import app
+from absl import flags
+
+import numpy as np
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))))
+
+from erdos.data_stream import DataStream
+from erdos.message import Message, WatermarkMessage
+from erdos.op import Op
+from erdos.timestamp import Timestamp
+from tests.benchmark.harness import make_result, output_report, run_graph
+from tests.benchmark.harness import summarize, write_result
+
+FLAGS = flags.FLAGS
+flags.DEFINE_string('framework', 'local',
+                    'Execution framework to use: local | ray.')
+flags.DEFINE_string(
+    'load_profile', '',
+    'JSON file which overrides entries of the default load '
+    'profile.')
+flags.DEFINE_list(
+    'load_scales', ['1'], 'Factors by which the service times are scaled. The '
+    'graph runs once per factor.')
+
+logger = logging.getLogger(__name__)
+
+# Rates are in Hz, and service times in milliseconds. Every sensor sends a
+# watermark at the base rate, and data at its own rate, which must divide
+# the base rate.
+DEFAULT_PROFILE = {
+    'base_rate_hz': 20,
+    'duration_s': 10,
+    # Seconds the sensors wait before their first frame, for the operators
+    # to start.
+    'startup_s': 1,
+    'deadline_ms': 100,
+    'seed': 0,
+    # Busy wait during service times, as models use the CPU. Otherwise,
+    # sleep.
+    'busy_wait': True,
+    'front_cameras': ['front_left', 'front_center', 'front_right'],
+    'side_cameras': [],
+    'rear_cameras': [],
+    'sensors': {
+        'camera': {
+            'rate_hz': 10,
+            'shape': [720, 1280, 3],
+            'dtype': 'uint8'
+        },
+        'depth_camera': {
+            'rate_hz': 10,
+            'shape': [720, 1280],
+            'dtype': 'float32'
+        },
+        'lidar': {
+            'rate_hz': 10,
+            'shape': [100000, 3],
+            'dtype': 'uint16'
+        },
+        'radar': {
+            'rate_hz': 20,
+            'shape': [64, 4],
+            'dtype': 'float32'
+        },
+        'gps': {
+            'rate_hz': 20,
+            'shape': [3],
+            'dtype': 'float64'
+        },
+        'imu': {
+            'rate_hz': 20,
+            'shape': [6],
+            'dtype': 'float64'
+        },
+    },
+    'operators': {
+        'obj_det': {
+            'distribution': 'lognormal',
+            'mean_ms': 5,
+            'stddev_ms': 1
+        },
+        'segmentation': {
+            'distribution': 'lognormal',
+            'mean_ms': 4,
+            'stddev_ms': 1
+        },
+        'traffic_light_det': {
+            'distribution': 'uniform',
+            'min_ms': 0.5,
+            'max_ms': 1.5
+        },
+        'traffic_sign_det': {
+            'distribution': 'uniform',
+            'min_ms': 0.5,
+            'max_ms': 1.5
+        },
+        'intersection_det': {
+            'distribution': 'uniform',
+            'min_ms': 0.5,
+            'max_ms': 1.5
+        },
+        'lane_det': {
+            'distribution': 'normal',
+            'mean_ms': 1,
+            'stddev_ms': 0.2
+        },
+        'obj_tracker': {
+            'distribution': 'exponential',
+            'mean_ms': 1
+        },
+        'slam': {
+            'distribution': 'normal',
+            'mean_ms': 2,
+            'stddev_ms': 0.5
+        },
+        'fusion': {
+            'distribution': 'normal',
+            'mean_ms': 2,
+            'stddev_ms': 0.5
+        },
+        'prediction': {
+            'distribution': 'constant',
+            'mean_ms': 1
+        },
+        'mission_planner': {
+            'distribution': 'constant',
+            'mean_ms': 0.5
+        },
+        'motion_planner': {
+            'distribution': 'constant',
+            'mean_ms': 1
+        },
+    },
+}
+
+
+class ServiceTime(object):
+    """Distribution of the time an operator takes to process a timestamp.
+
+    Args:
+        spec (dict): The distribution, and its parameters in milliseconds:
+            constant (mean_ms), uniform (min_ms, max_ms), normal (mean_ms,
+            stddev_ms), lognormal (mean_ms, stddev_ms) or exponential
+            (mean_ms).
+        scale (float): Factor by which samples are multiplied.
+        seed (int): Seed of the samples.
+    """
+
+    def __init__(self, spec, scale=1, seed=0):
+        self._scale = scale
+        self._random = np.random.RandomState(seed)
+        distribution = spec.get('distribution', 'constant')
+        if distribution == 'lognormal':
+            variance = np.log(1 + (spec['stddev_ms'] / spec['mean_ms'])**2)
+            mean = np.log(spec['mean_ms']) - variance / 2
+            self._sample = lambda: self._random.lognormal(
+                mean, np.sqrt(variance))
+        elif distribution == 'normal':
+            self._sample = lambda: max(
+                0.0, self._random.normal(spec['mean_ms'], spec['stddev_ms']))
+        elif distribution == 'uniform':
+            self._sample = lambda: self._random.uniform(
+                spec['min_ms'], spec['max_ms'])
+        elif distribution == 'exponential':
+            self._sample = lambda: self._random.exponential(spec['mean_ms'])
+        elif distribution == 'constant':
+            self._sample = lambda: spec['mean_ms']
+        else:
+            raise ValueError(
+                'Unknown service time distribution {}'.format(distribution))
+
+    def sample(self):
+        """Returns a service time, in seconds."""
+        return self._sample() * self._scale / 1000.0
+
+
+class SyntheticSensorOp(Op):
+    """Sends a payload every 1 / rate_hz seconds, and a watermark every base
+    tick. Messages carry the time at which their payload was captured, and
+    are timestamped with the index of the base tick.
+
+    Args:
+        start_time (float): Time of the first tick.
+        base_rate_hz (float): Rate of the watermarks.
+        num_ticks (int): Number of base ticks after which the sensor stops.
+        rate_hz (float): Rate of the payloads.
+        shape (list of int): Shape of the payloads.
+        dtype (str): numpy data type of the payloads.
+    """
+
+    def __init__(self, name, start_time, base_rate_hz, num_ticks, rate_hz,
+                 shape, dtype):
+        super(SyntheticSensorOp, self).__init__(name)
+        self._start_time = start_time
+        self._base_period = 1.0 / base_rate_hz
+        self._num_ticks = num_ticks
+        self._ticks_per_frame = max(1, int(round(base_rate_hz / rate_hz)))
+        self._payload = np.ones(shape, dtype=dtype)
+
+    @staticmethod
+    def setup_streams(input_streams, op_name):
+        return [DataStream(name='{}_output'.format(op_name))]
+
+    def execute(self):
+        (output_stream, ) = self.output_streams.values()
+        for tick in range(self._num_ticks):
+            capture_time = self._start_time + tick * self._base_period
+            wait = capture_time - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            timestamp = Timestamp(coordinates=[tick])
+            if tick % self._ticks_per_frame == 0:
+                output_stream.send(
+                    Message((capture_time, self._payload), timestamp))
+            output_stream.send(WatermarkMessage(timestamp))
+
+
+class SyntheticOp(Op):
+    """Processes a timestamp once the watermarks of all its input streams
+    completed it, by spending a sampled service time, and sending a payload
+    captured at the earliest capture time of its inputs.
+
+    Timestamps for which the operator received no payload are only
+    forwarded as watermarks.
+
+    Args:
+        service_time (dict): Specification of the `ServiceTime`.
+        scale (float): Factor by which service times are scaled.
+        seed (int): Seed of the service times.
+        busy_wait (bool): Whether service times use the CPU.
+        output_bytes (int): Size of the payloads the operator sends.
+    """
+
+    def __init__(self,
+                 name,
+                 service_time,
+                 scale=1,
+                 seed=0,
+                 busy_wait=True,
+                 output_bytes=1024):
+        super(SyntheticOp, self).__init__(name)
+        self._service_time = ServiceTime(service_time, scale,
+                                         seed ^ zlib.crc32(name.encode()))
+        self._busy_wait = busy_wait
+        self._payload = np.ones(output_bytes, dtype=np.uint8)
+        self._capture_times = {}
+
+    @staticmethod
+    def setup_streams(input_streams, op_name):
+        input_streams.add_callback(SyntheticOp.on_msg)
+        input_streams.add_completion_callback(SyntheticOp.on_watermark)
+        return [DataStream(name='{}_output'.format(op_name))]
+
+    def on_msg(self, msg):
+        capture_time = self._capture_times.get(msg.timestamp)
+        if capture_time is None or msg.data[0] < capture_time:
+            self._capture_times[msg.timestamp] = msg.data[0]
+
+    def on_watermark(self, msg):
+        for timestamp in sorted(t for t in self._capture_times
+                                if t <= msg.timestamp):
+            capture_time = self._capture_times.pop(timestamp)
+            self._serve()
+            self.process(capture_time, timestamp)
+        for output_stream in self.output_streams.values():
+            output_stream.send(WatermarkMessage(msg.timestamp))
+
+    def process(self, capture_time, timestamp):
+        for output_stream in self.output_streams.values():
+            output_stream.send(
+                Message((capture_time, self._payload), timestamp))
+
+    def _serve(self):
+        service_time = self._service_time.sample()
+        if not self._busy_wait:
+            time.sleep(service_time)
+            return
+        end_time = time.time() + service_time
+        while time.time() < end_time:
+            pass
+
+
+class SyntheticPlannerOp(SyntheticOp):
+    """Motion planner, which records the end-to-end latency of the
+    timestamps it processes, and writes them once it completed the last
+    tick."""
+
+    def __init__(self, name, result_dir, num_ticks, **kwargs):
+        super(SyntheticPlannerOp, self).__init__(name, **kwargs)
+        self._result_dir = result_dir
+        self._last_timestamp = Timestamp(coordinates=[num_ticks - 1])
+        self._latencies = []
+        self._ticks = []
+
+    @staticmethod
+    def setup_streams(input_streams, op_name):
+        input_streams.add_callback(SyntheticPlannerOp.on_msg)
+        input_streams.add_completion_callback(SyntheticPlannerOp.on_watermark)
+        return [DataStream(name='{}_output'.format(op_name))]
+
+    def process(self, capture_time, timestamp):
+        super(SyntheticPlannerOp, self).process(capture_time, timestamp)
+        self._latencies.append(time.time() - capture_time)
+        self._ticks.append(timestamp.coordinates[0])
+
+    def on_watermark(self, msg):
+        super(SyntheticPlannerOp, self).on_watermark(msg)
+        if msg.timestamp >= self._last_timestamp:
+            write_result(self._result_dir, self.name, {
+                'latencies': self._latencies,
+                'ticks': self._ticks
+            })
+
+
+def load_profile(path=''):
+    """Returns the default load profile, with the entries of the JSON file
+    at path, if any."""
+    profile = copy.deepcopy(DEFAULT_PROFILE)
+    if path:
+        with open(path) as f:
+            _update(profile, json.load(f))
+    return profile
+
+
+def _update(profile, overrides):
+    for (key, value) in overrides.items():
+        if isinstance(value, dict) and isinstance(profile.get(key), dict):
+            _update(profile[key], value)
+        else:
+            profile[key] = value
+
+
+class PylotGraphBuilder(object):
+    """Adds the operators of the pylot benchmark to a graph, with synthetic
+    sensors and operators configured by a load profile."""
+
+    def __init__(self, graph, profile, scale, result_dir):
+        self._graph = graph
+        self._profile = profile
+        self._scale = scale
+        self._result_dir = result_dir
+        self._num_ticks = int(profile['duration_s'] * profile['base_rate_hz'])
+        self._start_time = time.time() + profile['startup_s']
+
+    def build(self):
+        tracker_ops = []
+        planner_inputs = []
+        for location in self._profile['front_cameras']:
+            (tracker_op, detector_ops) = self._add_camera_graph(
+                location,
+                ['traffic_light_det', 'traffic_sign_det', 'intersection_det'],
+                lanes=True)
+            tracker_ops.append(tracker_op)
+            planner_inputs.extend(detector_ops)
+        for location in self._profile['side_cameras']:
+            (tracker_op, detector_ops) = self._add_camera_graph(
+                location, ['traffic_light_det', 'intersection_det'],
+                lanes=True)
+            tracker_ops.append(tracker_op)
+            planner_inputs.extend(detector_ops)
+        for location in self._profile['rear_cameras']:
+            (tracker_op, _) = self._add_camera_graph(location, [], lanes=False)
+            tracker_ops.append(tracker_op)
+
+        lidar_op = self._add_sensor('lidar', 'lidar')
+        gps_op = self._add_sensor('gps', 'GPS')
+        imu_op = self._add_sensor('imu', 'IMU')
+        short_radar_ops = [
+            self._add_sensor('radar', 'short_radar_' + location) for location
+            in ['front_left', 'front_right', 'rear_left', 'rear_right']
+        ]
+        long_radar_op = self._add_sensor('radar', 'long_radar')
+        depth_camera_ops = [
+            self._add_sensor('depth_camera', 'depth_camera_' + location)
+            for location in self._profile['front_cameras']
+        ]
+        slam_op = self._add_op('slam', 'SLAM',
+                               [lidar_op, long_radar_op, gps_op, imu_op])
+        fusion_op = self._add_op('fusion', 'fusion',
+                                 [slam_op, lidar_op] + tracker_ops +
+                                 short_radar_ops + depth_camera_ops)
+        prediction_op = self._add_op('prediction', 'prediction', tracker_ops)
+        mission_planner_op = self._add_op('mission_planner', 'mission_planner',
+                                          [slam_op])
+        motion_planner_op = self._graph.add(
+            SyntheticPlannerOp,
+            name='motion_planner',
+            init_args=dict(self._op_args('motion_planner', 'motion_planner'),
+                           result_dir=self._result_dir,
+                           num_ticks=self._num_ticks),
+            setup_args={'op_name': 'motion_planner'},
+            _fusible=False)
+        self._graph.connect([mission_planner_op, fusion_op, prediction_op] +
+                            planner_inputs, [motion_planner_op])
+
+    def _add_camera_graph(self, location, detectors, lanes):
+        camera_op = self._add_sensor('camera', 'camera_' + location)
+        obj_det_op = self._add_op('obj_det', 'obj_det_' + location,
+                                  [camera_op])
+        tracker_op = self._add_op('obj_tracker', 'obj_tracker_' + location,
+                                  [camera_op, obj_det_op])
+        detector_ops = [
+            self._add_op(detector, '{}_{}'.format(detector, location),
+                         [camera_op]) for detector in detectors
+        ]
+        if lanes:
+            segmentation_op = self._add_op('segmentation',
+                                           'segmentation_' + location,
+                                           [camera_op])
+            detector_ops.append(
+                self._add_op('lane_det', 'lane_det_' + location,
+                             [segmentation_op]))
+        return (tracker_op, detector_ops)
+
+    def _add_sensor(self, sensor, name):
+        sensor_profile = self._profile['sensors'][sensor]
+        return self._graph.add(
+            SyntheticSensorOp,
+            name=name,
+            init_args={
+                'start_time': self._start_time,
+                'base_rate_hz': self._profile['base_rate_hz'],
+                'num_ticks': self._num_ticks,
+                'rate_hz': sensor_profile['rate_hz'],
+                'shape': sensor_profile['shape'],
+                'dtype': sensor_profile['dtype'],
+            },
+            setup_args={'op_name': name})
+
+    def _add_op(self, op_type, name, input_ops):
+        op_id = self._graph.add(SyntheticOp,
+                                name=name,
+                                init_args=self._op_args(op_type, name),
+                                setup_args={'op_name': name})
+        self._graph.connect(input_ops, [op_id])
+        return op_id
+
+    def _op_args(self, op_type, name):
+        spec = self._profile['operators'][op_type]
+        return {
+            'service_time': spec,
+            'scale': self._scale,
+            'seed': self._profile['seed'],
+            'busy_wait': self._profile['busy_wait'],
+            'output_bytes': spec.get('output_bytes', 1024),
+        }
+
+
+def run(framework, profile, scale, timeout=None):
+    """Runs the synthetic pylot graph with service times scaled by scale.
+
+    Returns:
+        (dict): A result entry with the end-to-end latencies of the
+        timestamps, and the fraction of the timestamps which missed the
+        deadline or were not planned.
+    """
+
+    def build_graph(graph, result_dir):
+        PylotGraphBuilder(graph, profile, scale, result_dir).build()
+
+    if timeout is None:
+        timeout = 2 * profile['duration_s'] + profile['startup_s'] + 60
+    result = run_graph(build_graph, framework, 1, timeout)['motion_planner']
+    latencies_ms = np.array(result['latencies']) * 1000
+    num_frames = _num_frame_ticks(profile)
+    num_missed = (int((latencies_ms > profile['deadline_ms']).sum()) +
+                  num_frames - len(latencies_ms))
+    metrics = summarize(latencies_ms, 'latency_ms')
+    metrics.update({
+        'deadline_miss_rate': num_missed / float(num_frames),
+        'num_timestamps': len(latencies_ms),
+    })
+    return make_result(
+        'synthetic_pylot', framework, {
+            'scale': scale,
+            'duration_s': profile['duration_s'],
+            'deadline_ms': profile['deadline_ms'],
+            'num_cameras': len(profile['front_cameras']) +
+            len(profile['side_cameras']) + len(profile['rear_cameras']),
+        }, metrics, {'latency_ms': latencies_ms})
+
+
+def _num_frame_ticks(profile):
+    """Returns the number of base ticks at which a sensor captures a
+    frame, i.e., the number of timestamps the planner processes."""
+    num_ticks = int(profile['duration_s'] * profile['base_rate_hz'])
+    ticks = set()
+    for sensor in profile['sensors'].values():
+        ticks.update(
+            range(
+                0, num_ticks,
+                max(1,
+                    int(round(profile['base_rate_hz'] / sensor['rate_hz'])))))
+    return len(ticks)
+
+
+def main(argv):
+    profile = load_profile(FLAGS.load_profile)
+    results = []
+    for scale in FLAGS.load_scales:
+        logger.info(
+            'Running the synthetic pylot graph with scale {}'.format(scale))
+        results.append(run(FLAGS.framework, profile, float(scale)))
+    output_report(results)
+
+
+if __name__ == '__main__':
+    app.run(main)
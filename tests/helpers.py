@@ -0,0 +1,68 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from erdos.data_stream import DataStream
+from erdos.message import Message
+from erdos.op import Op
+from erdos.timestamp import Timestamp
+
+
+class SourceOp(Op):
+    """Sends the integers 0 to num_messages - 1, with timestamps [value]."""
+
+    def __init__(self, name, num_messages=10, stream_name='numbers'):
+        super(SourceOp, self).__init__(name)
+        self._num_messages = num_messages
+        self._stream_name = stream_name
+
+    @staticmethod
+    def setup_streams(input_streams, stream_name='numbers'):
+        return [DataStream(data_type=int, name=stream_name)]
+
+    def execute(self):
+        output_stream = self.get_output_stream(self._stream_name)
+        for value in range(self._num_messages):
+            output_stream.send(Message(value, Timestamp(coordinates=[value])))
+
+
+class SinkOp(Op):
+    """Appends the (stream name, data) tuples of the messages it receives
+    to received, if it is set."""
+
+    def __init__(self, name, received=None):
+        super(SinkOp, self).__init__(name)
+        self._received = received
+
+    @staticmethod
+    def setup_streams(input_streams):
+        input_streams.add_callback(SinkOp.on_msg)
+        return []
+
+    def on_msg(self, msg):
+        if self._received is not None:
+            self._received.append((msg.stream_name, msg.data))
+
+
+def add_source(graph, name, num_messages, stream_name='numbers'):
+    """Adds a `SourceOp` to graph, and returns its id."""
+    return graph.add(SourceOp,
+                     name=name,
+                     init_args={
+                         'num_messages': num_messages,
+                         'stream_name': stream_name
+                     },
+                     setup_args={'stream_name': stream_name})
+
+
+def add_source_and_sink(graph, prefix, num_messages, sink_cls=SinkOp):
+    """Connects a `SourceOp` named <prefix>_source to a sink named
+    <prefix>_sink, which is not fused so that messages cross the executor.
+
+    Returns:
+        (str, str): The ids of the source and the sink.
+    """
+    source = add_source(graph, '{}_source'.format(prefix), num_messages)
+    sink = graph.add(sink_cls, name='{}_sink'.format(prefix), _fusible=False)
+    graph.connect([source], [sink])
+    return (source, sink)
@@ -1,7 +1,18 @@
 #!/bin/bash
 
 # General test
-python -m pytest -v tests/test_graph_uses.py
+python -m pytest -v tests/test_graph_uses.py tests/test_local_executor.py \
+    tests/test_shared_memory.py tests/test_timestamp.py tests/test_message.py \
+    tests/test_watermark_tracker.py tests/test_progress_tracker.py \
+    tests/test_graph_refinement.py tests/test_graph_plan_cache.py \
+    tests/test_fusion.py tests/test_credits.py tests/test_input_queue.py \
+    tests/test_deadline.py tests/test_periodic_scheduler.py \
+    tests/test_deadline_queue.py tests/test_parallel_callbacks.py \
+    tests/test_metrics.py tests/test_event_log.py \
+    tests/test_tracing.py tests/test_critical_path.py \
+    tests/test_runtime_benchmark.py tests/test_result_store.py \
+    tests/test_synthetic_pylot.py tests/test_recording.py \
+    tests/test_ray_output_data_stream.py
 
 # Test ROS
 python tests/communication_pattern_test.py --framework=ros --case=1-1
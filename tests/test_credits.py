@@ -0,0 +1,223 @@
+from __future__ import print_function
+
+import threading
+import time
+
+import pytest
+from absl import flags
+
+from erdos.credits import CreditGate, DeferredCredit
+from erdos.data_stream import DataStream
+from erdos.graph import Graph
+from erdos.message import Message
+from erdos.message import WatermarkMessage
+from erdos.op import Op
+from erdos.timestamp import Timestamp
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+NUM_MESSAGES = 50
+
+
+def test_drop_once_credits_run_out():
+    gate = CreditGate(2, 'drop')
+    assert gate.acquire('a')
+    assert gate.acquire('b')
+    assert not gate.acquire('c')
+    gate.release()
+    assert gate.acquire('d')
+    stats = gate.get_stats()
+    assert stats['in_flight'] == 2
+    assert stats['max_in_flight'] == 2
+    assert stats['dropped'] == 1
+
+
+def test_coalesce_keeps_latest_message():
+    gate = CreditGate(1, 'coalesce')
+    assert gate.acquire('a')
+    assert not gate.acquire('b')
+    assert not gate.acquire('c')
+    assert gate.num_coalesced == 1
+    # The pending message is sent before the watermark.
+    assert gate.take_pending() == 'c'
+    assert gate.take_pending() is None
+    assert gate.num_in_flight == 2
+    gate.release(2)
+    assert gate.acquire('d')
+    assert gate.num_coalesced == 1
+
+
+def test_block_waits_for_release():
+    gate = CreditGate(1)
+    assert gate.acquire('a')
+    assert not gate.acquire('b')
+    assert not gate.wait(timeout=0.01)
+    releaser = threading.Timer(0.01, gate.release)
+    releaser.start()
+    assert gate.wait()
+    assert gate.acquire('b')
+    assert gate.blocked_time > 0
+
+
+def test_unexpected_policy():
+    with pytest.raises(ValueError):
+        CreditGate(1, 'latest')
+
+
+def test_batches_never_drop():
+    gate = CreditGate(1, 'drop')
+    assert gate.try_acquire()
+    assert not gate.has_credit()
+    assert not gate.try_acquire()
+    assert gate.num_dropped == 0
+    gate.release()
+    assert gate.has_credit()
+
+
+def test_deferred_credit():
+    released = []
+    credit = DeferredCredit(lambda: released.append(True))
+    assert credit.end_call()
+    assert released == []
+
+    credit = DeferredCredit(lambda: released.append(True))
+    credit.hold()
+    credit.hold()
+    credit.done()
+    # The sender must wait for the deferred message.
+    assert not credit.end_call()
+    assert released == []
+    credit.done()
+    assert released == [True]
+
+
+class SourceOp(Op):
+
+    def __init__(self, name, labels):
+        super(SourceOp, self).__init__(name)
+
+    @staticmethod
+    def setup_streams(input_streams, labels):
+        return [DataStream(data_type=int, name='numbers', labels=labels)]
+
+    def execute(self):
+        output_stream = self.get_output_stream('numbers')
+        timestamp = Timestamp(coordinates=[1])
+        for value in range(NUM_MESSAGES):
+            output_stream.send(Message(value, timestamp))
+        output_stream.send(WatermarkMessage(timestamp))
+
+
+class SlowSinkOp(Op):
+
+    def __init__(self, name, values):
+        super(SlowSinkOp, self).__init__(name)
+        self._values = values
+
+    @staticmethod
+    def setup_streams(input_streams):
+        input_streams.add_callback(SlowSinkOp.on_msg)
+        return []
+
+    def on_msg(self, msg):
+        time.sleep(0.001)
+        self._values.append(msg.data)
+
+
+def run_graph(labels):
+    values = []
+    graph = Graph(name='credits')
+    source = graph.add(SourceOp,
+                       name='source',
+                       init_args={'labels': labels},
+                       setup_args={'labels': labels})
+    sink = graph.add(SlowSinkOp, name='sink', init_args={'values': values})
+    graph.connect([source], [sink])
+    graph.execute('local')
+    stats = graph.op_handles[source].executor_handle.get_output_stream_stats()
+    return (values, stats['numbers']['credits']['sink'])
+
+
+def test_local_block():
+    (values, stats) = run_graph({'credits': '2', 'backpressure': 'block'})
+    assert values == list(range(NUM_MESSAGES))
+    assert stats['max_in_flight'] == 2
+    assert stats['in_flight'] == 0
+    assert stats['blocked_time'] > 0
+
+
+def test_local_drop():
+    (values, stats) = run_graph({'credits': '2', 'backpressure': 'drop'})
+    assert stats['dropped'] > 0
+    assert len(values) + stats['dropped'] == NUM_MESSAGES
+    assert values == sorted(values)
+
+
+def test_local_coalesce():
+    (values, stats) = run_graph({'credits': '2', 'backpressure': 'coalesce'})
+    assert stats['coalesced'] > 0
+    assert len(values) + stats['coalesced'] == NUM_MESSAGES
+    # The latest message is sent before the watermark.
+    assert values[-1] == NUM_MESSAGES - 1
+
+
+class TimestampedSourceOp(Op):
+
+    def __init__(self, name):
+        super(TimestampedSourceOp, self).__init__(name)
+
+    @staticmethod
+    def setup_streams(input_streams, labels):
+        return [DataStream(data_type=int, name='numbers', labels=labels)]
+
+    def execute(self):
+        output_stream = self.get_output_stream('numbers')
+        for value in range(NUM_MESSAGES):
+            timestamp = Timestamp(coordinates=[value])
+            output_stream.send(Message(value, timestamp))
+            output_stream.send(WatermarkMessage(timestamp))
+
+
+class ConcurrencySinkOp(Op):
+    """Records the largest number of its callbacks that ran at once."""
+
+    def __init__(self, name, max_running):
+        super(ConcurrencySinkOp, self).__init__(name)
+        self._max_running = max_running
+        self._running = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def setup_streams(input_streams):
+        input_streams.add_callback(ConcurrencySinkOp.on_msg)
+        return []
+
+    def on_msg(self, msg):
+        with self._lock:
+            self._running += 1
+            self._max_running[0] = max(self._max_running[0], self._running)
+        time.sleep(0.002)
+        with self._lock:
+            self._running -= 1
+
+
+def test_local_credits_bound_parallel_callbacks():
+    max_running = [0]
+    graph = Graph(name='parallel_credits')
+    source = graph.add(TimestampedSourceOp,
+                       name='source',
+                       setup_args={'labels': {
+                           'credits': '2'
+                       }})
+    sink = graph.add(ConcurrencySinkOp,
+                     name='sink',
+                     init_args={'max_running': max_running},
+                     _parallelism=4)
+    graph.connect([source], [sink])
+    graph.execute('local')
+    stats = graph.op_handles[source].executor_handle.get_output_stream_stats()
+    # Credits return once the callbacks complete, not once they are
+    # submitted to the parallel runner.
+    assert max_running[0] == 2
+    assert stats['numbers']['credits']['sink']['in_flight'] == 0
@@ -0,0 +1,236 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import time
+
+from absl import flags
+
+from erdos.critical_path import CriticalPaths, Hops, TraceEvents, analyze
+from erdos.critical_path import format_report, load_trace
+from erdos.data_stream import DataStream
+from erdos.graph import Graph
+from erdos.logging_op import LoggingOp
+from erdos.message import Message
+from erdos.op import Op
+from tests.helpers import SinkOp, SourceOp, add_source
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+NUM_MESSAGES = 5
+
+
+def _metadata(pid, name):
+    return {
+        'name': 'process_name',
+        'ph': 'M',
+        'pid': pid,
+        'args': {
+            'name': name
+        }
+    }
+
+
+def _event(category, pid, stream, coordinates, ts, dur=None):
+    event = {
+        'name': '{} {}'.format(category, stream),
+        'cat': category,
+        'ph': 'i' if dur is None else 'X',
+        'ts': ts,
+        'pid': pid,
+        'tid': 1,
+        'args': {
+            'timestamp': coordinates,
+            'stream_uid': stream
+        },
+    }
+    if dur is not None:
+        event['dur'] = dur
+    return event
+
+
+def _join_events(coordinates, offset, left_delay):
+    """Two sources send to a join operator, which sends to a sink once it
+    received both inputs. The left input arrives left_delay us late."""
+    return [
+        _event('send', 1, 'left', coordinates, offset, 10),
+        _event('receive', 3, 'left', coordinates, offset + left_delay),
+        _event('dequeue', 3, 'left', coordinates, offset + left_delay + 20),
+        _event('callback', 3, 'left', coordinates, offset + left_delay + 20,
+               30),
+        _event('send', 2, 'right', coordinates, offset, 10),
+        _event('receive', 3, 'right', coordinates, offset + 100),
+        _event('dequeue', 3, 'right', coordinates, offset + 100),
+        _event('callback', 3, 'right', coordinates, offset + 100, 50),
+        # The join sends once both inputs were processed.
+        _event('send', 3, 'joined', coordinates,
+               offset + max(left_delay + 50, 150) + 40, 10),
+        _event('receive', 4, 'joined', coordinates,
+               offset + max(left_delay + 50, 150) + 100),
+        _event('dequeue', 4, 'joined', coordinates,
+               offset + max(left_delay + 50, 150) + 100),
+        _event('callback', 4, 'joined', coordinates,
+               offset + max(left_delay + 50, 150) + 100, 200),
+    ]
+
+
+def _join_trace_events():
+    events = [
+        _metadata(1, 'left_source'),
+        _metadata(2, 'right_source'),
+        _metadata(3, 'join'),
+        _metadata(4, 'sink')
+    ]
+    # The left input is on the critical path of the first timestamp, and
+    # the right input on the second.
+    events += _join_events([0], 0, 500)
+    events += _join_events([1], 10000, 10)
+    return events
+
+
+def _join_trace():
+    return TraceEvents(_join_trace_events())
+
+
+def test_hops_break_down_deliveries():
+    events = _join_trace()
+    hops = Hops(events)
+    assert len(hops) == 6
+    left = [
+        i for i in range(len(hops)) if
+        events.stream_uids[hops.stream[i]] == 'left' and hops.timestamp[i] == 0
+    ][0]
+    assert hops.transfer[left] == 500
+    assert hops.queueing[left] == 20
+    assert hops.processing[left] == 30
+
+
+def test_critical_path_follows_latest_input():
+    events = _join_trace()
+    paths = CriticalPaths(Hops(events))
+    assert list(
+        paths.latency) == [500 + 50 + 40 + 60 + 200, 150 + 40 + 60 + 200]
+    charged = {}
+    for i in range(len(paths.op)):
+        charged.setdefault(int(paths.timestamp[i]),
+                           []).append(events.op_names[paths.op[i]])
+    assert sorted(charged[0]) == ['join', 'sink']
+    # The charges add up to the latency.
+    for timestamp in range(2):
+        mask = paths.timestamp == timestamp
+        total = (paths.transfer[mask] + paths.queueing[mask] +
+                 paths.processing[mask] + paths.wait[mask]).sum()
+        assert total == paths.latency[timestamp]
+    # The join waited 40 us between its last callback and its send.
+    join = events.op_names.index('join')
+    assert list(paths.wait[paths.op == join]) == [40, 40]
+
+
+def test_trace_parts_are_streamed(tmpdir):
+    trace_file = os.path.join(str(tmpdir), 'trace.json')
+    events = list(_join_trace_events())
+    # Processes may be named after their first events.
+    metadata = [event for event in events if event['ph'] == 'M']
+    with open('{}.1.jsonl'.format(trace_file), 'w') as f:
+        for event in [event
+                      for event in events if event['ph'] != 'M'] + metadata:
+            f.write(json.dumps(event) + '\n')
+    events = load_trace(trace_file)
+    assert sorted(
+        events.op_names) == ['join', 'left_source', 'right_source', 'sink']
+    assert len(Hops(events)) == 6
+
+
+def test_report():
+    report = analyze(_join_trace())
+    assert report['num_timestamps'] == 2
+    assert report['operators']['sink']['on_critical_path'] == 2
+    assert report['operators']['sink']['processing_ms']['p50'] == 0.2
+    assert len(report['hops']) == 3
+    assert 'join -> sink (joined)' in format_report(report)
+
+
+class SlowOp(Op):
+
+    @staticmethod
+    def setup_streams(input_streams):
+        input_streams.add_callback(SlowOp.on_msg)
+        return [DataStream(data_type=int, name='detections')]
+
+    def on_msg(self, msg):
+        time.sleep(0.01)
+        self.get_output_stream('detections').send(
+            Message(msg.data, msg.timestamp))
+
+
+def test_analyze_local_graph_trace(tmpdir):
+    trace_file = os.path.join(str(tmpdir), 'trace.json')
+    FLAGS.trace_file = trace_file
+    FLAGS.trace_sample_rate = 1
+    try:
+        graph = Graph(name='critical_path')
+        source = add_source(graph, 'critical_path_source', NUM_MESSAGES,
+                            'frames')
+        slow = graph.add(SlowOp, name='critical_path_slow', _fusible=False)
+        sink = graph.add(SinkOp, name='critical_path_sink', _fusible=False)
+        graph.connect([source], [slow])
+        graph.connect([slow], [sink])
+        graph.execute('local')
+    finally:
+        FLAGS.trace_file = ''
+        FLAGS.trace_sample_rate = 0.01
+
+    report = analyze(load_trace(trace_file))
+    assert report['num_timestamps'] == NUM_MESSAGES
+    slow_stats = report['operators']['critical_path_slow']
+    assert slow_stats['on_critical_path'] == NUM_MESSAGES
+    assert slow_stats['processing_ms']['p50'] >= 10
+    assert slow_stats['latency_share'] > 0.5
+
+
+class LoggingSourceOp(SourceOp, LoggingOp):
+    pass
+
+
+class LoggingSlowOp(SlowOp, LoggingOp):
+    pass
+
+
+class LoggingSinkOp(SinkOp, LoggingOp):
+    pass
+
+
+def test_analyze_event_logs(tmpdir, monkeypatch):
+    # Logging operators write their logs to files named after them.
+    monkeypatch.chdir(str(tmpdir))
+    graph = Graph(name='critical_path')
+    source = graph.add(LoggingSourceOp,
+                       name='logged_source',
+                       init_args={
+                           'num_messages': NUM_MESSAGES,
+                           'stream_name': 'frames'
+                       },
+                       setup_args={'stream_name': 'frames'},
+                       _fusible=False)
+    slow = graph.add(LoggingSlowOp, name='logged_slow', _fusible=False)
+    sink = graph.add(LoggingSinkOp, name='logged_sink', _fusible=False)
+    graph.connect([source], [slow])
+    graph.connect([slow], [sink])
+    graph.execute('local')
+    for op_id in (source, slow, sink):
+        graph.op_handles[op_id].executor_handle._op.flush()
+
+    events = TraceEvents.from_event_logs(
+        ['logged_source', 'logged_slow', 'logged_sink'])
+    assert events.num_timestamps == NUM_MESSAGES
+    assert sorted(events.stream_names) == ['detections', 'frames']
+    report = analyze(events)
+    assert report['num_timestamps'] == NUM_MESSAGES
+    slow_stats = report['operators']['logged_slow']
+    assert slow_stats['on_critical_path'] == NUM_MESSAGES
+    # The slow operator is charged until it sends the detections.
+    assert slow_stats['processing_ms']['p50'] >= 10
+    assert len(report['hops']) == 2
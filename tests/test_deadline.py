@@ -0,0 +1,76 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+import time
+
+from erdos.deadline_scheduler import DeadlineScheduler
+from erdos.op import Op
+from erdos.utils import deadline
+
+
+def test_timers_fire_in_deadline_order():
+    scheduler = DeadlineScheduler()
+    fired = []
+    done = threading.Event()
+    now = time.time()
+    scheduler.arm(now + 0.03, lambda: done.set())
+    scheduler.arm(now + 0.02, lambda: fired.append(2))
+    scheduler.arm(now + 0.01, lambda: fired.append(1))
+    assert done.wait(1)
+    assert fired == [1, 2]
+
+
+def test_cancelled_timer_does_not_fire():
+    scheduler = DeadlineScheduler()
+    fired = []
+    done = threading.Event()
+    timer = scheduler.arm(time.time() + 0.01, lambda: fired.append(1))
+    assert scheduler.cancel(timer)
+    assert not scheduler.cancel(timer)
+    scheduler.arm(time.time() + 0.02, lambda: done.set())
+    assert done.wait(1)
+    assert fired == []
+    assert timer.fired_time is None
+
+
+def test_cancelled_timers_are_compacted():
+    scheduler = DeadlineScheduler()
+    for _ in range(1000):
+        scheduler.cancel(scheduler.arm(time.time() + 60, lambda: None))
+    assert len(scheduler._heap) < 64
+
+
+class DeadlineOp(Op):
+
+    def __init__(self, name):
+        super(DeadlineOp, self).__init__(name)
+        self.num_misses = 0
+
+    @staticmethod
+    def setup_streams(input_streams):
+        return []
+
+    @deadline(10, 'on_deadline_miss')
+    def on_msg(self, duration):
+        time.sleep(duration)
+        return duration
+
+    def on_deadline_miss(self):
+        self.num_misses += 1
+
+
+def test_deadline_decorator():
+    op = DeadlineOp('deadline_op')
+    num_threads = threading.active_count()
+    for _ in range(20):
+        assert op.on_msg(0) == 0
+    # The deadlines are fired by a single thread.
+    assert threading.active_count() <= num_threads + 1
+    assert op.on_msg(0.05) == 0.05
+    assert op.num_misses == 1
+    slacks = list(op.deadline_slacks['on_msg'])
+    assert len(slacks) == 21
+    assert all(slack > 0 for slack in slacks[:-1])
+    assert slacks[-1] < -0.03
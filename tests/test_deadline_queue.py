@@ -0,0 +1,130 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import pytest
+from absl import flags
+
+from erdos.data_stream import DataStream
+from erdos.deadline_queue import DeadlineQueue
+from erdos.graph import Graph
+from erdos.message import Message
+from erdos.message import WatermarkMessage
+from erdos.op import Op
+from erdos.timestamp import Timestamp
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+NUM_FRAMES = 20
+
+
+def test_lanes_are_popped_by_earliest_deadline():
+    queue = DeadlineQueue({'camera': 1.0, 'control': 0.01})
+    queue.append('frame_1', 'camera')
+    queue.append('frame_2', 'camera')
+    queue.append('control_1', 'control')
+    queue.append('tick')
+    queue.append('control_2', 'control')
+    assert len(queue) == 5
+    assert [queue.popleft() for _ in range(5)
+            ] == ['control_1', 'control_2', 'frame_1', 'frame_2', 'tick']
+    assert not queue
+    with pytest.raises(IndexError):
+        queue.popleft()
+
+
+def test_lane_keeps_arrival_order():
+    queue = DeadlineQueue({'camera': 1.0})
+    queue.append('frame', 'camera')
+    queue.append('watermark', 'camera')
+    queue.append('tick')
+    assert [queue.popleft()
+            for _ in range(3)] == ['frame', 'watermark', 'tick']
+
+
+def test_default_budget():
+    queue = DeadlineQueue({'camera': 1.0}, default_budget=0)
+    queue.append('frame', 'camera')
+    queue.append('tick')
+    queue.append('notify')
+    assert [queue.popleft() for _ in range(3)] == ['tick', 'notify', 'frame']
+
+
+class SensorsOp(Op):
+
+    def __init__(self, name):
+        super(SensorsOp, self).__init__(name)
+
+    @staticmethod
+    def setup_streams(input_streams):
+        return [
+            DataStream(data_type=int, name='camera'),
+            DataStream(data_type=int, name='control')
+        ]
+
+    def execute(self):
+        timestamp = Timestamp(coordinates=[1])
+        for frame in range(NUM_FRAMES):
+            self.get_output_stream('camera').send(Message(frame, timestamp))
+        self.get_output_stream('control').send(Message(-1, timestamp))
+        for output_stream in self.output_streams.values():
+            output_stream.send(WatermarkMessage(timestamp))
+
+
+class AgentOp(Op):
+
+    def __init__(self, name, events):
+        super(AgentOp, self).__init__(name)
+        self._events = events
+
+    @staticmethod
+    def setup_streams(input_streams, edf):
+        camera_streams = input_streams.filter_name('camera')
+        control_streams = input_streams.filter_name('control')
+        if edf:
+            camera_streams.set_latency_budget(1000)
+            control_streams.set_latency_budget(1)
+        camera_streams.add_callback(AgentOp.on_camera_frame)
+        control_streams.add_callback(AgentOp.on_control_update)
+        input_streams.add_completion_callback(AgentOp.on_watermark)
+        return []
+
+    def on_camera_frame(self, msg):
+        time.sleep(0.002)
+        self._events.append(msg.data)
+
+    def on_control_update(self, msg):
+        self._events.append('control')
+
+    def on_watermark(self, msg):
+        self._events.append('watermark')
+
+
+def run_graph(edf):
+    events = []
+    graph = Graph(name='edf')
+    sensors = graph.add(SensorsOp, name='sensors')
+    agent = graph.add(AgentOp,
+                      name='agent',
+                      init_args={'events': events},
+                      setup_args={'edf': edf})
+    graph.connect([sensors], [agent])
+    graph.execute('local')
+    return events
+
+
+def test_local_edf_runs_urgent_callbacks_first():
+    events = run_graph(edf=True)
+    assert events.index('control') < NUM_FRAMES // 2
+    frames = [event for event in events if isinstance(event, int)]
+    assert frames == list(range(NUM_FRAMES))
+    # The low watermark only advances once both streams completed.
+    assert events[-1] == 'watermark'
+
+
+def test_local_fifo_without_budgets():
+    events = run_graph(edf=False)
+    assert events.index('control') == NUM_FRAMES
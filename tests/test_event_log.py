@@ -0,0 +1,119 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+from absl import flags
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from erdos.event_log import RECORD, EventLog, EventLogReader, get_log_files
+from erdos.graph import Graph
+from erdos.logging_op import LoggingOp
+from tests.helpers import SinkOp, add_source_and_sink
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+NUM_MESSAGES = 5
+
+
+def test_records_round_trip(tmpdir):
+    prefix = os.path.join(str(tmpdir), 'camera')
+    event_log = EventLog(prefix)
+    op_id = event_log.register_op('camera')
+    send_id = event_log.register_event('send')
+    receive_id = event_log.register_event('receive')
+    event_log.append(op_id, send_id, (1, 2), 1.5)
+    event_log.append(op_id, receive_id, (1, 2, 3, 4, 5), 2.5)
+    event_log.close()
+
+    reader = EventLogReader(prefix)
+    records = list(reader.read())
+    assert [record[:4] for record in records] == [
+        ('camera', 'send', (1, 2), 1.5),
+        # Coordinates are truncated to MAX_COORDS, and flagged.
+        ('camera', 'receive', (1, 2, 3, 4, Ellipsis), 2.5),
+    ]
+    assert records[0][4] <= records[1][4]
+    assert event_log.num_truncated == 1
+
+    array = reader.to_numpy()
+    assert list(array['event_id']) == [send_id, receive_id]
+    assert list(array['coords'][0][:array['num_coords'][0]]) == [1, 2]
+    assert list(array['num_coords']) == [2, 5]
+
+    csv_file = StringIO()
+    reader.to_csv(csv_file)
+    lines = csv_file.getvalue().splitlines()
+    assert lines[0] == 'op,event,timestamp,processing_time,monotonic_ns'
+    assert lines[1].startswith('camera,send,"[1, 2]",1.5,')
+    assert lines[2].startswith('camera,receive,"[1, 2, 3, 4, ...]",2.5,')
+
+
+def test_files_rotate_and_names_persist(tmpdir):
+    prefix = os.path.join(str(tmpdir), 'lidar')
+    event_log = EventLog(prefix, capacity=4, max_file_bytes=RECORD.size)
+    op_id = event_log.register_op('lidar')
+    event_id = event_log.register_event('send')
+    for index in range(3):
+        event_log.append(op_id, event_id, (index, ), 0)
+        event_log.flush()
+    event_log.close()
+    # Reopening the log continues it in a new file, with the same ids.
+    event_log = EventLog(prefix)
+    assert event_log.register_event('receive') == event_id + 1
+    assert event_log.register_event('send') == event_id
+    event_log.append(op_id, event_id, (3, ), 0)
+    event_log.close()
+
+    assert len(get_log_files(prefix)) == 5
+    assert [record[2] for record in EventLogReader(prefix).read()] == [(0, ),
+                                                                       (1, ),
+                                                                       (2, ),
+                                                                       (3, )]
+
+
+def test_events_are_dropped_when_writer_falls_behind(tmpdir):
+    event_log = EventLog(os.path.join(str(tmpdir), 'gps'),
+                         capacity=4,
+                         flush_period=None)
+    op_id = event_log.register_op('gps')
+    event_id = event_log.register_event('send')
+    # Block the writer.
+    with event_log._file_lock:
+        for index in range(10):
+            event_log.append(op_id, event_id, (index, ), 0)
+    event_log.close()
+    assert event_log.num_dropped == 6
+    assert len(list(EventLogReader(event_log.prefix).read())) == 4
+
+
+class LoggingSinkOp(LoggingOp, SinkOp):
+    pass
+
+
+def test_logging_op_logs_untimestamped_messages(tmpdir):
+    op = LoggingOp(os.path.join(str(tmpdir), 'untimestamped'))
+    op.log_event(1.5, None, 'send')
+    op.flush()
+    assert [record[1:4] for record in EventLogReader(op.name).read()
+            ] == [('send', (), 1.5)]
+
+
+def test_logging_op_logs_received_messages(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    graph = Graph(name='event_log')
+    (_, sink) = add_source_and_sink(graph, 'event_log', NUM_MESSAGES,
+                                    LoggingSinkOp)
+    graph.execute('local')
+    graph.op_handles[sink].executor_handle._op.flush()
+
+    records = list(EventLogReader('event_log_sink').read())
+    assert [record[:3] for record in records
+            ] == [('event_log_sink', 'receive numbers', (value, ))
+                  for value in range(NUM_MESSAGES)]
@@ -0,0 +1,236 @@
+from __future__ import print_function
+
+import pytest
+from absl import flags
+
+from erdos.data_stream import DataStream
+from erdos.fusion import FusedOp
+from erdos.graph import Graph
+from erdos.message import Message
+from erdos.message import WatermarkMessage
+from erdos.op import Op
+from erdos.operators import MapOp
+from erdos.operators import NoopOp
+from erdos.operators import WhereOp
+from erdos.timestamp import Timestamp
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+NUM_BATCHES = 4
+BATCH_SIZE = 10
+
+
+@pytest.fixture(autouse=True)
+def fuse_operators():
+    FLAGS.fuse_operators = True
+    try:
+        yield
+    finally:
+        FLAGS.fuse_operators = False
+
+
+class SourceOp(Op):
+
+    def __init__(self, name):
+        super(SourceOp, self).__init__(name)
+
+    @staticmethod
+    def setup_streams(input_streams):
+        return [DataStream(data_type=int, name='numbers')]
+
+    def execute(self):
+        output_stream = self.get_output_stream('numbers')
+        for batch in range(1, NUM_BATCHES + 1):
+            timestamp = Timestamp(coordinates=[batch])
+            for value in range(BATCH_SIZE):
+                output_stream.send(Message(value, timestamp))
+            output_stream.send(WatermarkMessage(timestamp))
+
+
+class BatchSumOp(Op):
+    """Sums the messages of each timestamp, and sends the sum once the
+    timestamp completes."""
+
+    def __init__(self, name):
+        super(BatchSumOp, self).__init__(name)
+        self._window = {}
+
+    @staticmethod
+    def setup_streams(input_streams):
+        input_streams.add_callback(BatchSumOp.on_msg)
+        input_streams.add_completion_callback(BatchSumOp.on_watermark)
+        return [DataStream(data_type=int, name='sums')]
+
+    def on_msg(self, msg):
+        batch = msg.timestamp.coordinates[0]
+        self._window[batch] = self._window.get(batch, 0) + msg.data
+
+    def on_watermark(self, msg):
+        batch = msg.timestamp.coordinates[0]
+        output_stream = self.get_output_stream('sums')
+        output_stream.send(Message(self._window.pop(batch, 0), msg.timestamp))
+        output_stream.send(WatermarkMessage(msg.timestamp))
+
+
+class CollectOp(Op):
+
+    def __init__(self, name, results):
+        super(CollectOp, self).__init__(name)
+        self._results = results
+        self._values = []
+
+    @staticmethod
+    def setup_streams(input_streams):
+        input_streams.add_callback(CollectOp.on_msg)
+        input_streams.add_completion_callback(CollectOp.on_watermark)
+        return []
+
+    def on_msg(self, msg):
+        self._values.append(msg.data)
+
+    def on_watermark(self, msg):
+        self._results.append((msg.timestamp.coordinates[0], self._values))
+        self._values = []
+
+
+def build_graph(results, fusible=True):
+    graph = Graph(name='fusion')
+    source = graph.add(SourceOp, name='source')
+    square = graph.add(MapOp,
+                       name='square',
+                       init_args={
+                           'output_stream_name': 'squares',
+                           'map_lambda': lambda msg: msg.data * msg.data
+                       },
+                       setup_args={'output_stream_name': 'squares'},
+                       _fusible=fusible)
+    even = graph.add(WhereOp,
+                     name='even',
+                     init_args={
+                         'output_stream_name': 'even',
+                         'where_lambda': lambda msg: msg.data % 2 == 0
+                     },
+                     setup_args={'output_stream_name': 'even'})
+    forward = graph.add(NoopOp, name='forward')
+    batch_sum = graph.add(BatchSumOp, name='batch_sum')
+    sink = graph.add(CollectOp, name='sink', init_args={'results': results})
+    graph.connect([source], [square])
+    graph.connect([square], [even])
+    graph.connect([even], [forward])
+    graph.connect([forward], [batch_sum])
+    graph.connect([batch_sum], [sink])
+    return graph
+
+
+def get_fused_op_ids(graph):
+    return sorted(op_id for op_id, handle in graph.op_handles.items()
+                  if handle.op_cls is FusedOp)
+
+
+def test_chain_is_fused():
+    results = []
+    graph = build_graph(results)
+    graph.execute('local')
+
+    # The source runs its own execute method, so it is not fused.
+    assert get_fused_op_ids(graph) == ['fusion/square_fused']
+    fused_handle = graph.op_handles['fusion/square_fused']
+    assert [handle.name for handle in fused_handle.init_args['op_handles']
+            ] == ['square', 'even', 'forward', 'batch_sum', 'sink']
+    # Completion callbacks run once per timestamp along the chain.
+    expected = sum(value * value for value in range(0, BATCH_SIZE, 2))
+    assert results == [(batch, [expected])
+                       for batch in range(1, NUM_BATCHES + 1)]
+
+
+def test_fusion_can_be_disabled_per_operator():
+    results = []
+    graph = build_graph(results, fusible=False)
+    graph.execute('local')
+
+    assert get_fused_op_ids(graph) == ['fusion/even_fused']
+    assert 'fusion/square' in graph.op_handles
+    expected = sum(value * value for value in range(0, BATCH_SIZE, 2))
+    assert results == [(batch, [expected])
+                       for batch in range(1, NUM_BATCHES + 1)]
+
+
+def test_fan_out_is_not_fused():
+    results_1 = []
+    results_2 = []
+    graph = Graph(name='fan_out')
+    source = graph.add(SourceOp, name='source')
+    forward = graph.add(NoopOp, name='forward')
+    sink_1 = graph.add(CollectOp,
+                       name='sink_1',
+                       init_args={'results': results_1})
+    sink_2 = graph.add(CollectOp,
+                       name='sink_2',
+                       init_args={'results': results_2})
+    graph.connect([source], [forward])
+    graph.connect([forward], [sink_1, sink_2])
+    graph.execute('local')
+
+    assert get_fused_op_ids(graph) == []
+    assert results_1 == results_2
+    assert len(results_1) == NUM_BATCHES
+
+
+class CheckpointedCollectOp(CollectOp):
+
+    def __init__(self,
+                 name,
+                 results,
+                 checkpoint_enable=True,
+                 checkpoint_freq=1):
+        super(CheckpointedCollectOp, self).__init__(name, results)
+        self._checkpoint_enable = checkpoint_enable
+        self._checkpoint_freq = checkpoint_freq
+
+    @staticmethod
+    def setup_streams(input_streams):
+        input_streams.add_callback(CheckpointedCollectOp.on_msg)
+        input_streams.add_completion_callback(
+            CheckpointedCollectOp.on_watermark)
+        return []
+
+
+def test_checkpointing_operators_are_not_fused():
+    graph = Graph(name='checkpoint')
+    source = graph.add(SourceOp, name='source')
+    forward = graph.add(NoopOp, name='forward')
+    sink = graph.add(CheckpointedCollectOp,
+                     name='sink',
+                     init_args={'results': []})
+    graph.connect([source], [forward])
+    graph.connect([forward], [sink])
+    graph._flatten_subgraphs()
+    graph._build_refined_op_graph()
+    (forward_handle, sink_handle) = (graph.op_handles[forward],
+                                     graph.op_handles[sink])
+    # The constructor enables checkpointing by default.
+    assert not graph._can_fuse(forward_handle, sink_handle)
+    sink_handle.init_args['checkpoint_enable'] = False
+    assert graph._can_fuse(forward_handle, sink_handle)
+
+
+def test_flag_credits_and_batching_prevent_fusion():
+    graph = Graph(name='flag_defaults')
+    source = graph.add(SourceOp, name='source')
+    forward = graph.add(NoopOp, name='forward')
+    sink = graph.add(CollectOp, name='sink', init_args={'results': []})
+    graph.connect([source], [forward])
+    graph.connect([forward], [sink])
+    graph._flatten_subgraphs()
+    graph._build_refined_op_graph()
+    (forward_handle, sink_handle) = (graph.op_handles[forward],
+                                     graph.op_handles[sink])
+    assert graph._can_fuse(forward_handle, sink_handle)
+    for (flag, value) in [('stream_credits', 4), ('ray_batch_size', 32)]:
+        default = getattr(FLAGS, flag)
+        setattr(FLAGS, flag, value)
+        try:
+            assert not graph._can_fuse(forward_handle, sink_handle)
+        finally:
+            setattr(FLAGS, flag, default)
@@ -0,0 +1,142 @@
+from __future__ import print_function
+
+import os
+import pickle
+
+from absl import flags
+
+import erdos
+
+from erdos import graph_plan_cache
+from erdos.graph import Graph
+from erdos.graph_plan_cache import CallbackRef
+from erdos.graph_plan_cache import GraphPlanCache
+from erdos.op import Op
+from tests.helpers import SinkOp, add_source
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+
+class ConfiguredOp(Op):
+
+    @staticmethod
+    def setup_streams(input_streams, config=None):
+        return []
+
+
+def run_graph(received, num_sinks=1):
+    graph = Graph(name='cached')
+    source = add_source(graph, 'source', 3)
+    sinks = [
+        graph.add(SinkOp,
+                  name='sink_{}'.format(index),
+                  init_args={'received': received})
+        for index in range(num_sinks)
+    ]
+    graph.connect([source], sinks)
+    graph.execute('local')
+    return graph
+
+
+def test_unchanged_graph_loads_plan(tmpdir):
+    FLAGS.graph_cache_dir = str(tmpdir)
+    try:
+        values = []
+        graph = run_graph(values)
+        assert 'refine' in graph.startup_timings
+        assert 'store_plan' in graph.startup_timings
+        assert len(os.listdir(str(tmpdir))) == 1
+
+        cached_values = []
+        graph = run_graph(cached_values)
+        assert 'refine' not in graph.startup_timings
+        assert 'load_plan' in graph.startup_timings
+        assert sorted(cached_values) == sorted(values) == [('numbers', 0),
+                                                           ('numbers', 1),
+                                                           ('numbers', 2)]
+
+        # Changing the graph invalidates the plan.
+        graph = run_graph([], num_sinks=2)
+        assert 'refine' in graph.startup_timings
+        assert len(os.listdir(str(tmpdir))) == 2
+    finally:
+        FLAGS.graph_cache_dir = ''
+
+
+def test_plan_store_and_load(tmpdir, monkeypatch):
+    cache = GraphPlanCache(str(tmpdir))
+    assert cache.load('missing') is None
+    assert cache.store('key', {'streams': {}})
+    assert cache.load('key') == {'streams': {}}
+    # Plans that cannot be pickled are not cached.
+    assert not cache.store('lambda', {'streams': lambda: None})
+    assert cache.load('lambda') is None
+    # Plans stored by other versions are ignored.
+    monkeypatch.setattr(graph_plan_cache, 'PLAN_VERSION',
+                        graph_plan_cache.PLAN_VERSION + 1)
+    assert cache.load('key') is None
+
+
+def test_plan_stores_callback_refs():
+    graph = Graph(name='cached')
+    source = add_source(graph, 'source', 3)
+    sink = graph.add(SinkOp, name='sink')
+    graph.connect([source], [sink])
+    graph._flatten_subgraphs()
+    graph._build_refined_op_graph()
+    plan = pickle.loads(pickle.dumps(graph._get_plan()))
+    (input_streams, _) = plan['streams'][sink]
+    [callback] = input_streams[0].callbacks
+    assert isinstance(callback, CallbackRef)
+    assert (callback.op_cls, callback.name) == (SinkOp, 'on_msg')
+    # The plan holds copies, and the graph keeps its callbacks.
+    assert graph.op_handles[sink].input_streams[0].callbacks == set(
+        [SinkOp.on_msg])
+    assert graph._load_plan(plan)
+    assert graph.op_handles[sink].input_streams[0].callbacks == set(
+        [SinkOp.on_msg])
+
+
+def test_key_depends_on_versions_and_base_classes(monkeypatch):
+    graph = Graph(name='cached')
+    source = add_source(graph, 'source', 3)
+    sink = graph.add(SinkOp, name='sink')
+    graph.connect([source], [sink])
+    cache = GraphPlanCache('')
+    key = cache.get_key(graph.op_handles)
+    assert cache.get_key(graph.op_handles) == key
+
+    get_source = graph_plan_cache._get_source
+    monkeypatch.setattr(
+        graph_plan_cache, '_get_source', lambda obj: 'changed'
+        if obj is Op else get_source(obj))
+    assert cache.get_key(graph.op_handles) != key
+    monkeypatch.undo()
+
+    monkeypatch.setattr(erdos, '__version__', 'next')
+    assert cache.get_key(graph.op_handles) != key
+
+
+def test_key_of_unstable_setup_args(tmpdir):
+    assert graph_plan_cache._stable_repr({
+        'sizes': (1, 2.5),
+        'names': set(['b', 'a']),
+        'op_cls': SinkOp
+    }) == graph_plan_cache._stable_repr({
+        'op_cls': SinkOp,
+        'names': set(['a', 'b']),
+        'sizes': (1, 2.5)
+    })
+    graph = Graph(name='cached')
+    graph.add(ConfiguredOp, name='op', setup_args={'config': object()})
+    assert GraphPlanCache(str(tmpdir)).get_key(graph.op_handles) is None
+
+    # Graphs whose keys are not stable are not cached.
+    FLAGS.graph_cache_dir = str(tmpdir)
+    try:
+        graph.execute('local')
+        assert 'refine' in graph.startup_timings
+        assert os.listdir(str(tmpdir)) == []
+    finally:
+        FLAGS.graph_cache_dir = ''
@@ -0,0 +1,69 @@
+from __future__ import print_function
+
+from erdos.data_stream import DataStream
+from erdos.graph import Graph
+from erdos.op import Op
+from erdos.operators import NoopOp
+
+
+class SourceOp(Op):
+
+    @staticmethod
+    def setup_streams(input_streams):
+        return [DataStream(data_type=int, name='numbers')]
+
+
+class SinkOp(Op):
+
+    def on_msg(self, msg):
+        pass
+
+    @staticmethod
+    def setup_streams(input_streams):
+        input_streams.add_callback(SinkOp.on_msg)
+        return [
+            DataStream(data_type=int,
+                       name='sink_{}'.format(len(input_streams)))
+        ]
+
+
+def input_uids(graph, op_id):
+    return sorted(stream.uid
+                  for stream in graph.op_handles[op_id].input_streams)
+
+
+def test_streams_propagate_through_forwarding_ops():
+    graph = Graph(name='chain')
+    previous = graph.add(SourceOp, name='source')
+    for index in range(5):
+        op_id = graph.add(NoopOp, name='forward_{}'.format(index))
+        graph.connect([previous], [op_id])
+        previous = op_id
+    sink = graph.add(SinkOp, name='sink')
+    graph.connect([previous], [sink])
+    graph._build_refined_op_graph()
+
+    assert input_uids(graph, sink) == ['chain/forward_4/numbers']
+    # The callbacks are registered on the sink's copies of the streams.
+    for stream in graph.op_handles[sink].input_streams:
+        assert stream.callbacks == set([SinkOp.on_msg])
+    for stream in graph.op_handles[previous].output_streams:
+        assert stream.callbacks == set()
+
+
+def test_cycles_converge():
+    graph = Graph(name='cycle')
+    source = graph.add(SourceOp, name='source')
+    sink_1 = graph.add(SinkOp, name='sink_1')
+    sink_2 = graph.add(SinkOp, name='sink_2')
+    graph.connect([source], [sink_1])
+    graph.connect([sink_1], [sink_2])
+    graph.connect([sink_2], [sink_1])
+    graph._build_refined_op_graph()
+
+    assert input_uids(
+        graph, sink_1) == ['cycle/sink_2/sink_1', 'cycle/source/numbers']
+    assert input_uids(graph, sink_2) == ['cycle/sink_1/sink_2']
+    for op_id in [sink_1, sink_2]:
+        for stream in graph.op_handles[op_id].input_streams:
+            assert stream.callbacks == set([SinkOp.on_msg])
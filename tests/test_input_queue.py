@@ -0,0 +1,176 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import pytest
+from absl import flags
+
+from erdos.data_stream import DataStream
+from erdos.fusion import FusedOp
+from erdos.graph import Graph
+from erdos.input_queue import InputQueue
+from erdos.message import Message
+from erdos.message import WatermarkMessage
+from erdos.op import Op
+from erdos.operators import NoopOp
+from erdos.timestamp import Timestamp
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+NUM_MESSAGES = 50
+
+
+def test_latest_keeps_watermarks():
+    queue = InputQueue('latest')
+    assert queue.put('a') == []
+    assert queue.put('w', is_watermark=True) == []
+    assert queue.put('b') == ['a']
+    assert queue.put('c') == ['b']
+    assert queue.pop() == ('w', True)
+    assert queue.pop() == ('c', False)
+    assert queue.pop() is None
+    assert queue.get_stats() == {'received': 3, 'dropped': 2, 'queued': 0}
+
+
+def test_drop_oldest():
+    queue = InputQueue('drop_oldest', max_queue=2)
+    for item in ['a', 'b', 'c', 'd']:
+        queue.put(item)
+    assert queue.pop() == ('c', False)
+    assert queue.pop() == ('d', False)
+    assert queue.num_dropped == 2
+
+
+def test_every_nth():
+    queue = InputQueue('every_nth', nth=3)
+    dropped = []
+    for item in range(7):
+        dropped += queue.put(item)
+    assert dropped == [1, 2, 4, 5]
+    assert [queue.pop()[0] for _ in range(3)] == [0, 3, 6]
+
+
+def test_drains_are_not_scheduled_for_dropped_messages():
+    queue = InputQueue('latest')
+    queue.put('a')
+    assert queue.schedule_drain()
+    queue.put('b')
+    assert not queue.schedule_drain()
+    assert queue.drain() == ('b', False)
+    assert queue.drain() is None
+    queue.put('c')
+    assert queue.schedule_drain()
+
+
+def test_from_labels():
+    assert InputQueue.from_labels({}) is None
+    queue = InputQueue.from_labels({'max_queue': '4'})
+    assert queue.policy == 'drop_oldest'
+    assert queue.max_queue == 4
+    with pytest.raises(ValueError):
+        InputQueue.from_labels({'queue_policy': 'block'})
+
+
+class SourceOp(Op):
+
+    def __init__(self, name):
+        super(SourceOp, self).__init__(name)
+
+    @staticmethod
+    def setup_streams(input_streams):
+        return [DataStream(data_type=int, name='numbers')]
+
+    def execute(self):
+        output_stream = self.get_output_stream('numbers')
+        timestamp = Timestamp(coordinates=[1])
+        for value in range(NUM_MESSAGES):
+            output_stream.send(Message(value, timestamp))
+        output_stream.send(WatermarkMessage(timestamp))
+
+
+class SlowSinkOp(Op):
+
+    def __init__(self, name, values):
+        super(SlowSinkOp, self).__init__(name)
+        self._values = values
+
+    @staticmethod
+    def setup_streams(input_streams, labels):
+        for input_stream in input_streams:
+            input_stream.labels.update(labels)
+        input_streams.add_callback(SlowSinkOp.on_msg)
+        input_streams.add_completion_callback(SlowSinkOp.on_watermark)
+        return []
+
+    def on_msg(self, msg):
+        time.sleep(0.001)
+        self._values.append(msg.data)
+
+    def on_watermark(self, msg):
+        self._values.append('watermark')
+
+
+def run_graph(labels):
+    values = []
+    graph = Graph(name='input_queue')
+    source = graph.add(SourceOp, name='source')
+    sink = graph.add(SlowSinkOp,
+                     name='sink',
+                     init_args={'values': values},
+                     setup_args={'labels': labels})
+    graph.connect([source], [sink])
+    graph.execute('local')
+    stats = graph.op_handles[sink].executor_handle.get_input_stream_stats()
+    return (values, stats['numbers'])
+
+
+def test_local_latest():
+    (values, stats) = run_graph({'queue_policy': 'latest'})
+    assert stats['received'] == NUM_MESSAGES
+    assert stats['dropped'] > 0
+    assert len(values) - 1 + stats['dropped'] == NUM_MESSAGES
+    assert values[-2:] == [NUM_MESSAGES - 1, 'watermark']
+
+
+def test_local_drop_oldest():
+    (values, stats) = run_graph({
+        'queue_policy': 'drop_oldest',
+        'max_queue': '5'
+    })
+    assert len(values) - 1 + stats['dropped'] == NUM_MESSAGES
+    assert values[:-1] == sorted(values[:-1])
+    assert values[-6:] == list(range(NUM_MESSAGES - 5,
+                                     NUM_MESSAGES)) + ['watermark']
+
+
+def test_local_every_nth():
+    (values, stats) = run_graph({'queue_policy': 'every_nth', 'nth': '10'})
+    assert values == [0, 10, 20, 30, 40, 'watermark']
+    assert stats['dropped'] == NUM_MESSAGES - 5
+
+
+def test_queued_streams_are_not_fused():
+    values = []
+    graph = Graph(name='input_queue_fusion')
+    source = graph.add(SourceOp, name='source')
+    forward = graph.add(NoopOp, name='forward')
+    sink = graph.add(SlowSinkOp,
+                     name='sink',
+                     init_args={'values': values},
+                     setup_args={'labels': {
+                         'queue_policy': 'latest'
+                     }})
+    graph.connect([source], [forward])
+    graph.connect([forward], [sink])
+    FLAGS.fuse_operators = True
+    try:
+        graph.execute('local')
+    finally:
+        FLAGS.fuse_operators = False
+
+    assert not any(handle.op_cls is FusedOp
+                   for handle in graph.op_handles.values())
+    assert values[-2:] == [NUM_MESSAGES - 1, 'watermark']
@@ -0,0 +1,179 @@
+from __future__ import print_function
+
+import time
+
+from absl import flags
+
+from erdos.data_stream import DataStream
+from erdos.graph import Graph
+from erdos.message import Message
+from erdos.message import WatermarkMessage
+from erdos.op import Op
+from erdos.operators import MapOp
+from erdos.timestamp import Timestamp
+from erdos.utils import frequency
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+NUM_BATCHES = 5
+BATCH_SIZE = 10
+
+
+class SourceOp(Op):
+
+    def __init__(self, name, output_stream_name):
+        super(SourceOp, self).__init__(name)
+        self._output_stream_name = output_stream_name
+
+    @staticmethod
+    def setup_streams(input_streams, output_stream_name):
+        return [DataStream(data_type=int, name=output_stream_name)]
+
+    def execute(self):
+        output_stream = self.get_output_stream(self._output_stream_name)
+        for batch in range(1, NUM_BATCHES + 1):
+            timestamp = Timestamp(coordinates=[batch])
+            for value in range(BATCH_SIZE):
+                output_stream.send(Message(value, timestamp))
+            output_stream.send(WatermarkMessage(timestamp))
+
+
+class SumOp(Op):
+
+    def __init__(self, name, sums):
+        super(SumOp, self).__init__(name)
+        self._window = {}
+        self._sums = sums
+
+    @staticmethod
+    def setup_streams(input_streams):
+        input_streams.add_callback(SumOp.on_msg)
+        input_streams.add_completion_callback(SumOp.on_watermark)
+        return []
+
+    def on_msg(self, msg):
+        batch = msg.timestamp.coordinates[0]
+        self._window[batch] = self._window.get(batch, 0) + msg.data
+
+    def on_watermark(self, msg):
+        batch = msg.timestamp.coordinates[0]
+        self._sums.append((batch, self._window.pop(batch, 0)))
+
+
+def test_local_pipeline():
+    sums = []
+    graph = Graph(name="local_pipeline")
+    source = graph.add(SourceOp,
+                       name='source',
+                       init_args={'output_stream_name': 'numbers'},
+                       setup_args={'output_stream_name': 'numbers'})
+    square = graph.add(MapOp,
+                       name='square',
+                       init_args={
+                           'output_stream_name': 'squares',
+                           'map_lambda': lambda msg: msg.data * msg.data
+                       },
+                       setup_args={'output_stream_name': 'squares'})
+    sink = graph.add(SumOp, name='sink', init_args={'sums': sums})
+    graph.connect([source], [square])
+    graph.connect([square], [sink])
+    graph.execute('local')
+
+    expected = sum(value * value for value in range(BATCH_SIZE))
+    assert sums == [(batch, expected) for batch in range(1, NUM_BATCHES + 1)]
+
+
+def test_local_watermarks_wait_for_all_streams():
+    sums = []
+    graph = Graph(name="local_fan_in")
+    source_1 = graph.add(SourceOp,
+                         name='source_1',
+                         init_args={'output_stream_name': 'numbers_1'},
+                         setup_args={'output_stream_name': 'numbers_1'})
+    source_2 = graph.add(SourceOp,
+                         name='source_2',
+                         init_args={'output_stream_name': 'numbers_2'},
+                         setup_args={'output_stream_name': 'numbers_2'})
+    sink = graph.add(SumOp, name='sink', init_args={'sums': sums})
+    graph.connect([source_1, source_2], [sink])
+    graph.execute('local')
+
+    # Completion callbacks only run once both streams reached a timestamp,
+    # and hence see the messages of both sources.
+    expected = 2 * sum(range(BATCH_SIZE))
+    assert sums == [(batch, expected) for batch in range(1, NUM_BATCHES + 1)]
+
+
+class TickOp(Op):
+
+    def __init__(self, name):
+        super(TickOp, self).__init__(name)
+        self._count = 0
+
+    @staticmethod
+    def setup_streams(input_streams):
+        return [DataStream(data_type=int, name='ticks')]
+
+    @frequency(100)
+    def tick(self):
+        self.get_output_stream('ticks').send(
+            Message(self._count, Timestamp(coordinates=[self._count])))
+        self._count += 1
+
+    def execute(self):
+        self.tick()
+
+
+class StopAfterOp(Op):
+
+    def __init__(self, name, graph, ticks, num_ticks):
+        super(StopAfterOp, self).__init__(name)
+        self._graph = graph
+        self._ticks = ticks
+        self._num_ticks = num_ticks
+
+    @staticmethod
+    def setup_streams(input_streams):
+        input_streams.add_callback(StopAfterOp.on_tick)
+        return []
+
+    def on_tick(self, msg):
+        self._ticks.append(msg.data)
+        if len(self._ticks) == self._num_ticks:
+            self._graph.stop()
+
+
+def _add_periodic_graph(graph, ticks, num_ticks=None):
+    tick = graph.add(TickOp, name='tick')
+    sink = graph.add(StopAfterOp,
+                     name='stop_after',
+                     init_args={
+                         'graph': graph,
+                         'ticks': ticks,
+                         'num_ticks': num_ticks
+                     },
+                     _fusible=False)
+    graph.connect([tick], [sink])
+
+
+def test_local_periodic_graph_times_out():
+    ticks = []
+    graph = Graph(name='local_periodic_timeout')
+    _add_periodic_graph(graph, ticks)
+    start_time = time.time()
+    graph.execute('local', timeout=0.5)
+    assert time.time() - start_time < 5
+    assert len(ticks) > 0
+    num_ticks = len(ticks)
+    # The periodic method stopped with the graph.
+    time.sleep(0.1)
+    assert len(ticks) == num_ticks
+
+
+def test_local_periodic_graph_stops():
+    ticks = []
+    graph = Graph(name='local_periodic_stop')
+    _add_periodic_graph(graph, ticks, num_ticks=5)
+    graph.execute('local', timeout=30)
+    assert ticks[:5] == list(range(5))
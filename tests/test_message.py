@@ -0,0 +1,83 @@
+from __future__ import print_function
+
+import copy
+import pickle
+
+import pytest
+
+from erdos.message import DeferredData
+from erdos.message import Message
+from erdos.message import WatermarkMessage
+from erdos.timestamp import Timestamp
+
+
+class TaggedMessage(Message):
+
+    def __init__(self, data, timestamp, tag):
+        super(TaggedMessage, self).__init__(data, timestamp)
+        self.tag = tag
+
+
+def round_trip(msg):
+    return pickle.loads(pickle.dumps(msg, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def test_message_round_trip_with_stream_id():
+    msg = Message({'speed': 10}, Timestamp(coordinates=[3, 1]))
+    msg.stream_name = 'can_bus'
+    msg.stream_uid = 'default/carla/can_bus'
+    msg.stream_id = 5
+    received = round_trip(msg)
+    assert received.data == {'speed': 10}
+    assert received.timestamp == Timestamp(coordinates=[3, 1])
+    assert received.stream_id == 5
+    # The stream name and uid are restored from the stream id on receipt.
+    assert received.stream_name is None and received.stream_uid is None
+
+
+def test_message_round_trip_without_stream_id():
+    received = round_trip(
+        Message('data', Timestamp(coordinates=[1]), stream_name='camera'))
+    assert received.stream_name == 'camera'
+    assert received.stream_id is None
+    assert round_trip(Message('data', None)).timestamp is None
+
+
+def test_watermark_and_subclass_round_trip():
+    watermark = round_trip(WatermarkMessage(Timestamp(coordinates=[2])))
+    assert isinstance(watermark, WatermarkMessage)
+    assert watermark.data is None
+    assert watermark.timestamp == Timestamp(coordinates=[2])
+
+    tagged = round_trip(TaggedMessage(1, Timestamp(coordinates=[0]), 'a'))
+    assert isinstance(tagged, TaggedMessage)
+    assert tagged.tag == 'a'
+    assert copy.copy(tagged).tag == 'a'
+
+
+def test_message_has_no_dict():
+    msg = Message(1, Timestamp(coordinates=[1]))
+    with pytest.raises(AttributeError):
+        msg.unknown_attribute = 1
+    copied = copy.copy(msg)
+    assert copied is not msg and copied.data == 1
+
+
+class CountingData(DeferredData):
+    num_resolved = 0
+
+    def resolve(self):
+        CountingData.num_resolved += 1
+        return 'payload'
+
+
+def test_deferred_data_is_resolved_on_first_access():
+    msg = round_trip(Message(CountingData(), Timestamp(coordinates=[1])))
+    copied = copy.copy(msg)
+    str(msg)
+    assert CountingData.num_resolved == 0
+    assert msg.data == 'payload'
+    assert msg.data == 'payload'
+    assert CountingData.num_resolved == 1
+    # Copies made before the access resolve the payload separately.
+    assert isinstance(copied._data, CountingData)
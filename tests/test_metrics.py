@@ -0,0 +1,100 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import random
+import socket
+
+from absl import flags
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+from erdos.graph import Graph
+from erdos.metrics import Histogram, MetricsExporter, MetricsRegistry
+from erdos.metrics import get_registry, to_prometheus_text
+from tests.helpers import add_source_and_sink
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+NUM_MESSAGES = 10
+
+
+def test_histogram_percentiles_are_accurate():
+    histogram = Histogram()
+    values = [random.uniform(0.01, 1000) for _ in range(10000)]
+    for value in values:
+        histogram.record(value)
+    values.sort()
+    for quantile in [0.5, 0.9, 0.99]:
+        expected = values[int(quantile * len(values)) - 1]
+        assert abs(histogram.percentile(quantile) - expected) <= \
+            0.02 * expected
+    assert histogram.percentile(1) == max(values)
+    assert histogram.count == len(values)
+
+
+def test_histogram_records_zero():
+    histogram = Histogram()
+    histogram.record(0)
+    histogram.record(2)
+    assert histogram.percentile(0.5) == 0
+    assert histogram.percentile(1) == 2
+
+
+def test_registry_snapshot_and_prometheus_text():
+    registry = MetricsRegistry()
+    registry.counter('sent_total', op='camera').inc(3)
+    assert registry.counter('sent_total', op='camera').value == 3
+    registry.gauge('depth', op='camera').set(7)
+    registry.histogram('duration_ms', op='camera').record(5)
+    snapshot = registry.snapshot()
+    assert len(snapshot) == 3
+    json.dumps(snapshot)
+    text = to_prometheus_text(snapshot)
+    assert '# TYPE sent_total counter' in text
+    assert 'sent_total{op="camera"} 3' in text
+    assert 'depth{op="camera"} 7' in text
+    assert 'duration_ms_count{op="camera"} 1' in text
+    assert 'duration_ms{op="camera",quantile="0.5"}' in text
+
+
+def test_exporter_writes_file_and_serves_http(tmpdir):
+    registry = MetricsRegistry()
+    registry.counter('sent_total', op='camera').inc()
+    sock = socket.socket()
+    sock.bind(('', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    file_path = os.path.join(str(tmpdir), 'metrics.json')
+    exporter = MetricsExporter(registry.snapshot, file_path, port)
+    exporter.start()
+    try:
+        body = urlopen('http://localhost:{}/metrics'.format(port)).read()
+        assert b'sent_total{op="camera"} 1' in body
+    finally:
+        exporter.stop()
+    with open(file_path) as f:
+        assert json.load(f)[0]['name'] == 'sent_total'
+
+
+def test_local_executor_records_metrics():
+    graph = Graph(name='metrics')
+    add_source_and_sink(graph, 'metrics', NUM_MESSAGES)
+    graph.execute('local')
+
+    registry = get_registry()
+    labels = {'op': 'metrics_sink', 'stream': 'numbers', 'kind': 'message'}
+    assert registry.counter('erdos_callbacks_total',
+                            **labels).value == NUM_MESSAGES
+    assert registry.histogram('erdos_callback_duration_ms',
+                              **labels).count == NUM_MESSAGES
+    assert registry.counter('erdos_messages_sent_total',
+                            op='metrics_source',
+                            stream='numbers').value == NUM_MESSAGES
+    assert registry.gauge('erdos_mailbox_depth', op='metrics_sink').value == 0
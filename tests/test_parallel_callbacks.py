@@ -0,0 +1,136 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+import time
+
+from absl import flags
+
+from erdos.data_stream import DataStream
+from erdos.graph import Graph
+from erdos.message import Message
+from erdos.message import WatermarkMessage
+from erdos.op import Op
+from erdos.parallel_callbacks import ParallelCallbackRunner
+from erdos.timestamp import Timestamp
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+NUM_TIMESTAMPS = 16
+CALLBACK_DURATION = 0.02
+
+
+class CollectStream(object):
+
+    def __init__(self):
+        self.msgs = []
+
+    def send(self, msg):
+        self.msgs.append(msg)
+
+
+def test_messages_are_sent_in_timestamp_order():
+    stream = CollectStream()
+    done = threading.Event()
+    runner = ParallelCallbackRunner('test', 4)
+
+    def callback(index):
+        # Earlier timestamps take longer.
+        time.sleep(0.001 * (8 - index))
+        runner.send(stream, index)
+
+    for index in range(8):
+        runner.submit(Timestamp(coordinates=[index]),
+                      lambda index=index: callback(index))
+    runner.submit_watermark(Timestamp(coordinates=[3]),
+                            lambda: runner.send(stream, 'watermark 3'))
+    runner.submit_watermark(Timestamp(coordinates=[7]), done.set)
+    assert done.wait(1)
+    assert stream.msgs == [0, 1, 2, 3, 'watermark 3', 4, 5, 6, 7]
+
+
+def test_callbacks_for_a_timestamp_run_in_order():
+    stream = CollectStream()
+    done = threading.Event()
+    runner = ParallelCallbackRunner('test', 4)
+    timestamp = Timestamp(coordinates=[1])
+    for index in range(10):
+        runner.submit(timestamp,
+                      lambda index=index: runner.send(stream, index))
+    runner.submit_watermark(timestamp, done.set)
+    assert done.wait(1)
+    assert stream.msgs == list(range(10))
+
+
+class SourceOp(Op):
+
+    def __init__(self, name):
+        super(SourceOp, self).__init__(name)
+
+    @staticmethod
+    def setup_streams(input_streams):
+        return [DataStream(data_type=int, name='frames')]
+
+    def execute(self):
+        output_stream = self.get_output_stream('frames')
+        for index in range(NUM_TIMESTAMPS):
+            timestamp = Timestamp(coordinates=[index])
+            output_stream.send(Message(index, timestamp))
+            output_stream.send(WatermarkMessage(timestamp))
+
+
+class SlowSquareOp(Op):
+
+    def __init__(self, name):
+        super(SlowSquareOp, self).__init__(name)
+
+    @staticmethod
+    def setup_streams(input_streams):
+        input_streams.add_callback(SlowSquareOp.on_msg)
+        return [DataStream(data_type=int, name='squares')]
+
+    def on_msg(self, msg):
+        time.sleep(CALLBACK_DURATION)
+        self.get_output_stream('squares').send(
+            Message(msg.data * msg.data, msg.timestamp))
+
+
+class CollectOp(Op):
+
+    def __init__(self, name, events):
+        super(CollectOp, self).__init__(name)
+        self._events = events
+
+    @staticmethod
+    def setup_streams(input_streams):
+        input_streams.add_callback(CollectOp.on_msg)
+        input_streams.add_completion_callback(CollectOp.on_watermark)
+        return []
+
+    def on_msg(self, msg):
+        self._events.append(msg.data)
+
+    def on_watermark(self, msg):
+        self._events.append('watermark {}'.format(
+            msg.timestamp.coordinates[0]))
+
+
+def test_local_parallel_callbacks():
+    events = []
+    graph = Graph(name='parallel')
+    source = graph.add(SourceOp, name='source')
+    square = graph.add(SlowSquareOp, name='square', _parallelism=4)
+    sink = graph.add(CollectOp, name='sink', init_args={'events': events})
+    graph.connect([source], [square])
+    graph.connect([square], [sink])
+    start_time = time.time()
+    graph.execute('local')
+    duration = time.time() - start_time
+
+    expected = []
+    for index in range(NUM_TIMESTAMPS):
+        expected += [index * index, 'watermark {}'.format(index)]
+    assert events == expected
+    assert duration < NUM_TIMESTAMPS * CALLBACK_DURATION / 2
@@ -0,0 +1,86 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+import time
+
+import pytest
+
+from erdos.periodic_scheduler import PeriodicScheduler, PeriodicTask
+
+RATE = 100
+
+
+def run_task(overrun, func, duration=0.2):
+    """Runs a task that is dispatched in a thread, as executors do."""
+    scheduled_times = []
+
+    def dispatch(task, scheduled_time):
+        scheduled_times.append(scheduled_time)
+        thread = threading.Thread(target=task.run, args=(scheduled_time, ))
+        thread.daemon = True
+        thread.start()
+
+    scheduler = PeriodicScheduler()
+    task = PeriodicTask('task', RATE, func, dispatch, overrun)
+    scheduler.add_task(task)
+    time.sleep(duration)
+    scheduler.remove_task(task)
+    # Wait for the runs to finish.
+    time.sleep(0.1)
+    return (task, scheduled_times)
+
+
+def test_ticks_do_not_drift():
+    (task, scheduled_times) = run_task('catch_up', lambda: None)
+    assert abs(len(scheduled_times) - 0.2 * RATE) <= 2
+    start_time = task._start_time
+    for index, scheduled_time in enumerate(scheduled_times, 1):
+        assert scheduled_time == pytest.approx(start_time +
+                                               index * task.period)
+    stats = task.get_stats()
+    assert stats['runs'] == len(scheduled_times)
+    assert sum(stats['jitter_histogram'].values()) == stats['runs']
+
+
+def test_catch_up_runs_every_tick():
+    running = []
+    overlaps = []
+
+    def func():
+        overlaps.append(len(running))
+        running.append(None)
+        time.sleep(0.012)
+        running.pop()
+
+    (task, scheduled_times) = run_task('catch_up', func)
+    assert task.num_runs == len(scheduled_times)
+    assert task.num_runs >= 10
+    # The runs of late ticks are not queued up concurrently, and no tick is
+    # skipped.
+    assert not any(overlaps)
+    start_time = task._start_time
+    for index, scheduled_time in enumerate(scheduled_times, 1):
+        assert scheduled_time == pytest.approx(start_time +
+                                               index * task.period)
+
+
+def test_skip_drops_overrun_ticks():
+    (task, scheduled_times) = run_task('skip', lambda: time.sleep(0.035))
+    assert task.num_skipped > 0
+    assert task.num_runs == len(scheduled_times)
+    assert abs(task.num_runs + task.num_skipped - 0.2 * RATE) <= 2
+
+
+def test_coalesce_runs_once_previous_run_finishes():
+    (task, scheduled_times) = run_task('coalesce', lambda: time.sleep(0.035))
+    assert task.num_coalesced > 0
+    # Runs start back to back, so there are more than with skip.
+    assert task.num_runs >= 5
+    assert task.get_stats()['max_jitter_ms'] > 1
+
+
+def test_unexpected_policy():
+    with pytest.raises(ValueError):
+        PeriodicTask('task', RATE, None, None, 'block')
@@ -0,0 +1,142 @@
+from __future__ import print_function
+
+import pytest
+from absl import flags
+
+from erdos.data_stream import DataStream
+from erdos.graph import Graph
+from erdos.message import Message
+from erdos.message import WatermarkMessage
+from erdos.op import Op
+from erdos.progress_tracker import ProgressTracker
+from erdos.timestamp import Timestamp
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+NUM_BATCHES = 5
+BATCH_SIZE = 10
+
+
+def ts(coordinate):
+    return Timestamp(coordinates=[coordinate])
+
+
+class Endpoint(object):
+
+    def __init__(self):
+        self.batches = []
+
+    def on_notify_batch(self, timestamps):
+        self.batches.append(timestamps)
+
+
+def test_notifications_wait_for_all_endpoints():
+    tracker = ProgressTracker()
+    detector = Endpoint()
+    tracker.register_endpoint('detector', detector)
+    tracker.register_endpoint('tracker', Endpoint())
+    tracker.notify_at('detector', ts(1))
+    tracker.complete_time('detector', ts(1))
+    assert detector.batches == []
+    tracker.complete_time('tracker', ts(1))
+    assert detector.batches == [[ts(1)]]
+    assert tracker.get_frontier() == ts(1)
+
+
+def test_satisfied_notifications_are_batched():
+    tracker = ProgressTracker()
+    detector = Endpoint()
+    planner = Endpoint()
+    tracker.register_endpoint('detector', detector)
+    tracker.register_endpoint('planner', planner)
+    tracker.register_endpoint('source', Endpoint(), tracks_progress=False)
+    for coordinate in [3, 1, 2, 5]:
+        tracker.notify_at('detector', ts(coordinate))
+    tracker.notify_at('planner', ts(2))
+    # Duplicate notifications are only delivered once.
+    tracker.notify_at('planner', ts(2))
+    tracker.complete_time('planner', ts(4))
+    tracker.complete_time('detector', ts(3))
+    assert detector.batches == [[ts(1), ts(2), ts(3)]]
+    assert planner.batches == [[ts(2)]]
+    tracker.complete_time('detector', ts(4))
+    assert detector.batches == [[ts(1), ts(2), ts(3)]]
+    tracker.complete_time('detector', ts(5))
+    tracker.complete_time('planner', ts(5))
+    assert detector.batches == [[ts(1), ts(2), ts(3)], [ts(5)]]
+
+
+def test_notify_at_completed_timestamp():
+    tracker = ProgressTracker()
+    detector = Endpoint()
+    tracker.register_endpoint('detector', detector)
+    tracker.complete_time('detector', ts(2))
+    # Completions that do not advance the endpoint are ignored.
+    tracker.complete_time('detector', ts(1))
+    tracker.notify_at('detector', ts(1))
+    assert detector.batches == [[ts(1)]]
+
+
+class SourceOp(Op):
+
+    def __init__(self, name):
+        super(SourceOp, self).__init__(name)
+
+    @staticmethod
+    def setup_streams(input_streams):
+        return [DataStream(data_type=int, name='numbers')]
+
+    def execute(self):
+        output_stream = self.get_output_stream('numbers')
+        for batch in range(1, NUM_BATCHES + 1):
+            timestamp = Timestamp(coordinates=[batch])
+            for value in range(BATCH_SIZE):
+                output_stream.send(Message(value, timestamp))
+            output_stream.send(WatermarkMessage(timestamp))
+
+
+class NotifiedSumOp(Op):
+
+    def __init__(self, name, sums):
+        super(NotifiedSumOp, self).__init__(name)
+        self._window = {}
+        self._sums = sums
+
+    @staticmethod
+    def setup_streams(input_streams):
+        input_streams.add_callback(NotifiedSumOp.on_msg)
+        return []
+
+    def on_msg(self, msg):
+        batch = msg.timestamp.coordinates[0]
+        if batch not in self._window:
+            self._window[batch] = 0
+            self.notify_at(msg.timestamp)
+        self._window[batch] += msg.data
+
+    def on_notify(self, timestamp):
+        batch = timestamp.coordinates[0]
+        self._sums.append((batch, self._window.pop(batch)))
+
+
+def test_local_notifications():
+    sums = []
+    graph = Graph(name="local_notifications")
+    source = graph.add(SourceOp, name='source')
+    sink = graph.add(NotifiedSumOp, name='sink', init_args={'sums': sums})
+    graph.connect([source], [sink])
+    graph.execute('local')
+
+    expected = sum(range(BATCH_SIZE))
+    assert sums == [(batch, expected) for batch in range(1, NUM_BATCHES + 1)]
+
+
+def test_ros_notifications_are_rejected():
+    graph = Graph(name="ros_notifications")
+    source = graph.add(SourceOp, name='source')
+    sink = graph.add(NotifiedSumOp, name='sink', init_args={'sums': []})
+    graph.connect([source], [sink])
+    graph.framework = 'ros'
+    with pytest.raises(NotImplementedError):
+        graph._create_progress_tracker()
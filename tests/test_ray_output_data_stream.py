@@ -0,0 +1,261 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import pytest
+from absl import flags
+
+from erdos.data_stream import DataStream
+from erdos.deadline_queue import DeadlineQueue
+from erdos.message import Message
+from erdos.message import WatermarkMessage
+from erdos.timestamp import Timestamp
+
+ray = pytest.importorskip('ray')
+
+from erdos.ray.payload_ref import PayloadRef  # noqa: E402
+from erdos.ray.ray_operator import RayOperator  # noqa: E402
+from erdos.ray.ray_output_data_stream import RayOutputDataStream  # noqa: E402
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+
+class FakeRemoteMethod(object):
+
+    def __init__(self):
+        self.calls = []
+        # If set, calls return an object id of the result.
+        self.result = None
+
+    def remote(self, *args):
+        self.calls.append(args)
+        if self.result is not None:
+            return ray.put(self.result)
+
+
+class FakeActorHandle(object):
+    """Records the remote calls an output stream makes."""
+
+    def __init__(self):
+        self.on_msg = FakeRemoteMethod()
+        self.on_completion_msg = FakeRemoteMethod()
+        self.on_msg_batch = FakeRemoteMethod()
+        self.get_released_credits = FakeRemoteMethod()
+
+
+class FakeOp(object):
+    name = 'batching_op'
+
+    def log_event(self, processing_time, timestamp, log_message=None):
+        pass
+
+
+def _output_stream(num_dependants=1, **labels):
+    handles = [FakeActorHandle() for _ in range(num_dependants)]
+    stream = RayOutputDataStream(
+        FakeOp(), handles,
+        DataStream(data_type=int,
+                   name='numbers',
+                   labels=labels,
+                   uid='batching_op/numbers',
+                   id=0))
+    stream.setup()
+    return (stream, handles)
+
+
+def _batches(handle):
+    return [[msg.data for msg in call[0]]
+            for call in handle.on_msg_batch.calls]
+
+
+def test_batch_flushes_once_full():
+    (stream, [handle]) = _output_stream(batch_size='3',
+                                        batch_timeout_ms='10000')
+    for value in range(7):
+        stream.send(Message(value, Timestamp(coordinates=[value])))
+    assert _batches(handle) == [[0, 1, 2], [3, 4, 5]]
+    stream.flush()
+    assert _batches(handle) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert handle.on_msg.calls == []
+
+
+def test_batch_flushes_after_timeout():
+    (stream, [handle]) = _output_stream(batch_size='100',
+                                        batch_timeout_ms='10')
+    stream.send(Message(1, Timestamp(coordinates=[1])))
+    deadline = time.time() + 5
+    while not handle.on_msg_batch.calls and time.time() < deadline:
+        time.sleep(0.01)
+    assert _batches(handle) == [[1]]
+
+
+def test_watermark_flushes_batch():
+    (stream, [handle]) = _output_stream(batch_size='100',
+                                        batch_timeout_ms='10000')
+    stream.send(Message(1, Timestamp(coordinates=[1])))
+    stream.send(WatermarkMessage(Timestamp(coordinates=[1])))
+    [(batch, )] = handle.on_msg_batch.calls
+    assert batch[0].data == 1
+    assert isinstance(batch[1], WatermarkMessage)
+
+
+def test_batch_holds_copies():
+    (stream, [handle]) = _output_stream(batch_size='2',
+                                        batch_timeout_ms='10000')
+    msg = Message(1, Timestamp(coordinates=[1]))
+    stream.send(msg)
+    # The operator reuses the message.
+    msg.data = 2
+    msg.timestamp = Timestamp(coordinates=[2])
+    stream.send(msg)
+    [(batch, )] = handle.on_msg_batch.calls
+    assert [m.data for m in batch] == [1, 2]
+    assert batch[0].timestamp == Timestamp(coordinates=[1])
+
+
+def _actor_class(actor_cls):
+    """Returns the class wrapped by a Ray actor class."""
+    metadata = getattr(actor_cls, '__ray_metadata__', None)
+    if metadata is not None:
+        return metadata.modified_class
+    return actor_cls._modified_class
+
+
+def _call(method_name, actor, *args):
+    """Calls a method of RayOperator on another actor."""
+    method = getattr(_actor_class(RayOperator), method_name)
+    # Unbound methods only accept instances of their class on Python 2.
+    return getattr(method, '__func__', method)(actor, *args)
+
+
+class RecordingActor(object):
+    """Records the messages RayOperator dispatches, in earliest deadline
+    first order if latency_budgets is set."""
+
+    def __init__(self, latency_budgets=None):
+        self.received = []
+        self._deadline_queue = None
+        if latency_budgets:
+            self._deadline_queue = DeadlineQueue(latency_budgets)
+
+    def _receive_msg(self, msg, credit=None):
+        _call('_dispatch', self, self._record_msg, msg)
+
+    def _receive_completion_msg(self, msg):
+        _call('_dispatch', self, self._record_watermark, msg)
+
+    def _drain_deadline_queue(self):
+        _call('_drain_deadline_queue', self)
+
+    def _record_msg(self, msg):
+        self.received.append(('msg', msg.data))
+
+    def _record_watermark(self, msg):
+        self.received.append(('watermark', msg.timestamp.coordinates[0]))
+
+
+def test_on_msg_batch_dispatches_in_order():
+    actor = RecordingActor()
+    batch = [
+        Message(1, Timestamp(coordinates=[1])),
+        WatermarkMessage(Timestamp(coordinates=[1])),
+        Message(2, Timestamp(coordinates=[2])),
+        Message(3, Timestamp(coordinates=[2])),
+        WatermarkMessage(Timestamp(coordinates=[2])),
+    ]
+    _call('on_msg_batch', actor, batch)
+    assert actor.received == [('msg', 1), ('watermark', 1), ('msg', 2),
+                              ('msg', 3), ('watermark', 2)]
+
+
+def test_on_msg_batch_runs_earliest_deadline_first():
+    actor = RecordingActor({'camera': 1.0, 'control': 0.001})
+    batch = []
+    for (data, stream_uid) in [('frame', 'camera'), ('control', 'control'),
+                               ('frame_watermark', 'camera')]:
+        msg = Message(data, Timestamp(coordinates=[1]))
+        msg.stream_uid = stream_uid
+        batch.append(msg)
+    _call('on_msg_batch', actor, batch)
+    # The batch is processed within the call, without calls to the actor.
+    assert actor.received == [('msg', 'control'), ('msg', 'frame'),
+                              ('msg', 'frame_watermark')]
+    assert not actor._deadline_queue
+
+
+@pytest.fixture
+def ray_local_mode():
+    ray.init(local_mode=True)
+    yield
+    ray.shutdown()
+
+
+def test_large_payloads_are_sent_by_reference(ray_local_mode):
+    (stream, handles) = _output_stream(num_dependants=3, put_min_bytes='100')
+    stream.send(Message(b'x' * 10, Timestamp(coordinates=[1])))
+    payload = b'x' * 1000
+    stream.send(Message(payload, Timestamp(coordinates=[2])))
+    assert stream.num_refs_sent == 1
+    assert stream.bytes_saved == 2 * len(payload)
+    for handle in handles:
+        [(small, ), (large, )] = handle.on_msg.calls
+        assert small.data == b'x' * 10
+        assert isinstance(large._data, PayloadRef)
+        assert large._data.size == len(payload)
+    # The payload is fetched on the first access.
+    assert large.data == payload
+    assert large._data == payload
+
+
+def test_payloads_of_single_dependant_are_sent_by_value(ray_local_mode):
+    (stream, [handle]) = _output_stream(put_min_bytes='100')
+    stream.send(Message(b'x' * 1000, Timestamp(coordinates=[1])))
+    assert stream.num_refs_sent == 0
+    assert stream.bytes_saved == 0
+    assert not isinstance(handle.on_msg.calls[0][0]._data, PayloadRef)
+
+
+def _send(stream, values):
+    for value in values:
+        stream.send(Message(value, Timestamp(coordinates=[value])))
+
+
+def test_credits_return_once_calls_ran_callbacks(ray_local_mode):
+    (stream, [handle]) = _output_stream(credits='2', backpressure='drop')
+    handle.on_msg.result = True
+    _send(stream, range(5))
+    assert [msg.data for (msg, _) in handle.on_msg.calls] == list(range(5))
+    assert all(credited for (_, credited) in handle.on_msg.calls)
+    assert handle.get_released_credits.calls == []
+
+
+def test_deferred_credits_return_once_callbacks_ran(ray_local_mode):
+    (stream, [handle]) = _output_stream(credits='2', backpressure='drop')
+    # The receiver queues the messages, and runs their callbacks later.
+    handle.on_msg.result = False
+    handle.get_released_credits.result = 0
+    _send(stream, range(4))
+    assert [msg.data for (msg, _) in handle.on_msg.calls] == [0, 1]
+    assert stream.get_credit_stats()['0']['dropped'] == 2
+    assert set(handle.get_released_credits.calls) == set([
+        ('batching_op/numbers', )
+    ])
+    # The callbacks of both messages ran.
+    handle.get_released_credits.result = 2
+    _send(stream, range(4, 7))
+    assert [msg.data for (msg, _) in handle.on_msg.calls] == [0, 1, 4, 5]
+    assert stream.get_credit_stats()['0']['in_flight'] == 2
+
+
+def test_batches_consume_credits(ray_local_mode):
+    (stream, [handle]) = _output_stream(credits='1',
+                                        batch_size='2',
+                                        batch_timeout_ms='10000')
+    handle.on_msg_batch.result = True
+    _send(stream, range(4))
+    assert _batches(handle) == [[0, 1], [2, 3]]
+    assert all(credited for (_, credited) in handle.on_msg_batch.calls)
+    assert stream.get_credit_stats()['0']['dropped'] == 0
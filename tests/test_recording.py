@@ -0,0 +1,254 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import pickle
+import time
+
+from absl import flags
+
+import erdos.message
+import erdos.recording
+import erdos.timestamp
+import erdos.utils
+from erdos.data_stream import DataStream
+from erdos.graph import Graph
+from erdos.message import Message
+from erdos.op import Op
+from erdos.operators import RecordOp, ReplayOp
+from erdos.recording import RecordingReader, RecordingWriter
+from erdos.timestamp import Timestamp
+from tests.helpers import SinkOp
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+NUM_MESSAGES = 100
+STREAMS = [(int, 'camera'), (str, 'lidar')]
+
+
+def _write_recording(path, **kwargs):
+    writer = RecordingWriter(path, STREAMS, **kwargs)
+    for value in range(NUM_MESSAGES):
+        timestamp = Timestamp(coordinates=[value])
+        writer.write('camera', Message(value, timestamp))
+        writer.write('lidar', Message(str(value), timestamp))
+    return writer
+
+
+def _values(messages):
+    return [(stream_name, msg.data) for (stream_name, msg) in messages]
+
+
+def _count_block_reads(monkeypatch):
+    reads = []
+    read_block = erdos.recording._read_block
+
+    def counting_read_block(f):
+        (kind, data) = read_block(f)
+        reads.append(kind)
+        return (kind, data)
+
+    monkeypatch.setattr(erdos.recording, '_read_block', counting_read_block)
+    return reads
+
+
+def test_round_trip(tmpdir, monkeypatch):
+    for compress in [False, True]:
+        path = os.path.join(str(tmpdir), 'recording_{}.erdos'.format(compress))
+        _write_recording(path, chunk_size=200, compress=compress).close()
+        reader = RecordingReader(path)
+        assert reader.streams == STREAMS
+        assert len(reader.chunks) > 10
+        assert reader.num_messages == 2 * NUM_MESSAGES
+        messages = list(reader.read())
+        assert _values(messages) == [
+            (name, value) for v in range(NUM_MESSAGES)
+            for (name, value) in [('camera', v), ('lidar', str(v))]
+        ]
+        assert messages[3][1].timestamp == Timestamp(coordinates=[1])
+
+        reads = _count_block_reads(monkeypatch)
+        messages = list(
+            reader.read(start_timestamp=[90], stream_names=['lidar']))
+        assert _values(messages) == [('lidar', str(v)) for v in range(90, 100)]
+        # Only the chunks with timestamps from 90 are read.
+        num_chunks = len([
+            chunk for chunk in reader.chunks if chunk.max_coordinates >= (90, )
+        ])
+        assert num_chunks < len(reader.chunks) / 5
+        assert reads.count(erdos.recording.DATA_BLOCK) == num_chunks
+        monkeypatch.undo()
+
+
+def test_compression_shrinks_chunks(tmpdir):
+    path = os.path.join(str(tmpdir), 'plain.erdos')
+    _write_recording(path).close()
+    compressed_path = os.path.join(str(tmpdir), 'compressed.erdos')
+    _write_recording(compressed_path, compress=True).close()
+    assert os.path.getsize(compressed_path) < os.path.getsize(path) / 2
+
+
+def test_unclosed_recording(tmpdir):
+    path = os.path.join(str(tmpdir), 'recording.erdos')
+    writer = _write_recording(path, chunk_size=200)
+    writer.flush()
+    # The process died while it wrote a chunk.
+    with open(path, 'ab') as f:
+        f.write(b'DATA\x00\xff\xff')
+    reader = RecordingReader(path)
+    assert reader.num_messages == 2 * NUM_MESSAGES
+    assert _values(
+        reader.read(start_timestamp=Timestamp(coordinates=[99]))) == [
+            ('camera', 99), ('lidar', '99')
+        ]
+    writer.close()
+
+
+def test_former_format(tmpdir):
+    path = os.path.join(str(tmpdir), 'recording.erdos')
+    with open(path, 'wb') as f:
+        pickle.dump(STREAMS, f)
+        for value in range(NUM_MESSAGES):
+            pickle.dump(
+                ('camera', Message(value, Timestamp(coordinates=[value]))), f)
+    reader = RecordingReader(path)
+    assert reader.streams == STREAMS
+    assert reader.chunks is None
+    assert _values(reader.read(start_timestamp=[98])) == [('camera', 98),
+                                                          ('camera', 99)]
+
+
+def _former_class(module, name):
+    """Returns a class which pickles as the class name of module, with its
+    attributes in its __dict__, as the classes of the first RecordOp."""
+    return type(name, (object, ), {'__module__': module.__name__})
+
+
+def _former_object(cls, **attributes):
+    obj = cls()
+    obj.__dict__.update(attributes)
+    return obj
+
+
+def test_first_format(tmpdir, monkeypatch):
+    # The first RecordOp pickled bare messages, without their stream name.
+    former_timestamp = _former_class(erdos.timestamp, 'Timestamp')
+    former_message = _former_class(erdos.message, 'Message')
+    monkeypatch.setattr(erdos.timestamp, 'Timestamp', former_timestamp)
+    monkeypatch.setattr(erdos.message, 'Message', former_message)
+    path = os.path.join(str(tmpdir), 'recording.erdos')
+    with open(path, 'wb') as f:
+        pickle.dump(STREAMS, f)
+        for value in range(NUM_MESSAGES):
+            timestamp = _former_object(former_timestamp, coordinates=[value])
+            for (data, stream_name) in [(value, 'camera'),
+                                        (str(value), 'lidar')]:
+                pickle.dump(
+                    _former_object(former_message,
+                                   data=data,
+                                   timestamp=timestamp,
+                                   stream_name=stream_name), f)
+    monkeypatch.undo()
+    reader = RecordingReader(path)
+    assert reader.streams == STREAMS
+    assert reader.num_messages == 2 * NUM_MESSAGES
+    messages = list(reader.read(start_timestamp=[98], stream_names=['lidar']))
+    assert _values(messages) == [('lidar', '98'), ('lidar', '99')]
+    assert isinstance(messages[0][1], Message)
+    assert messages[0][1].timestamp == Timestamp(coordinates=[98])
+    assert hash(messages[0][1].timestamp) == hash(Timestamp(coordinates=[98]))
+
+
+def test_untimestamped_messages(tmpdir):
+    path = os.path.join(str(tmpdir), 'recording.erdos')
+    writer = RecordingWriter(path, STREAMS)
+    writer.write('lidar', Message('calibration', None))
+    writer.write('camera', Message(1, Timestamp(coordinates=[1])))
+    writer.close()
+    reader = RecordingReader(path)
+    assert reader.chunks[0].min_coordinates == ()
+    messages = list(reader.read())
+    assert _values(messages) == [('lidar', 'calibration'), ('camera', 1)]
+    assert messages[0][1].timestamp is None
+    # Messages without timestamp precede every start timestamp.
+    assert _values(reader.read(start_timestamp=[0])) == [('camera', 1)]
+
+
+def test_flush_interval(tmpdir):
+    path = os.path.join(str(tmpdir), 'recording.erdos')
+    writer = RecordingWriter(path, STREAMS, flush_interval=0.05)
+    writer.write('camera', Message(0, Timestamp(coordinates=[0])))
+    writer.flush_if_due()
+    assert RecordingReader(path).num_messages == 0
+    time.sleep(0.05)
+    writer.flush_if_due()
+    # The chunk is readable before the writer closes.
+    assert RecordingReader(path).num_messages == 1
+    time.sleep(0.05)
+    writer.write('camera', Message(1, Timestamp(coordinates=[1])))
+    # The second message waits for its own interval.
+    assert RecordingReader(path).num_messages == 1
+    time.sleep(0.05)
+    writer.write('camera', Message(2, Timestamp(coordinates=[2])))
+    assert RecordingReader(path).num_messages == 3
+    writer.close()
+
+
+class SourceOp(Op):
+
+    @staticmethod
+    def setup_streams(input_streams):
+        return [
+            DataStream(data_type=int, name='camera'),
+            DataStream(data_type=str, name='lidar')
+        ]
+
+    def execute(self):
+        for value in range(NUM_MESSAGES):
+            timestamp = Timestamp(coordinates=[value])
+            self.get_output_stream('camera').send(Message(value, timestamp))
+            self.get_output_stream('lidar').send(Message(
+                str(value), timestamp))
+
+
+def test_record_and_replay(tmpdir):
+    path = os.path.join(str(tmpdir), 'recording.erdos')
+    graph = Graph(name='record')
+    source = graph.add(SourceOp, name='record_source')
+    record = graph.add(RecordOp,
+                       name='record',
+                       init_args={
+                           'filename': path,
+                           'chunk_size': 100,
+                           'compress': True
+                       },
+                       setup_args={'filter': None},
+                       _fusible=False)
+    graph.connect([source], [record])
+    graph.execute('local')
+    # Closes the recording, as the process' exit would.
+    erdos.utils.close_open_writers()
+    assert RecordingReader(path).num_messages == 2 * NUM_MESSAGES
+
+    graph = Graph(name='replay')
+    replay = graph.add(ReplayOp,
+                       name='replay',
+                       init_args={
+                           'filename': path,
+                           'start_timestamp': [95],
+                           'streams': ['camera']
+                       },
+                       setup_args={
+                           'filename': path,
+                           'streams': ['camera']
+                       })
+    received = []
+    sink = graph.add(SinkOp,
+                     name='replay_sink',
+                     init_args={'received': received},
+                     _fusible=False)
+    graph.connect([replay], [sink])
+    graph.execute('local')
+    assert sorted(received) == [('camera', value) for value in range(95, 100)]
@@ -0,0 +1,118 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+from absl import flags
+import numpy as np
+
+from tests.benchmark.harness import make_result, run_graph_for, trace_result
+from tests.benchmark.result_store import (IMPROVEMENT, INSUFFICIENT,
+                                          REGRESSION, UNCHANGED, ResultStore,
+                                          compare, comparison_status,
+                                          format_comparison, mann_whitney_u,
+                                          min_p_value)
+from tests.benchmark.runtime_benchmark import MIN_REPETITIONS
+from tests.helpers import add_source_and_sink
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+NUM_MESSAGES = 20
+
+
+def test_mann_whitney_u():
+    # Exact p-values of samples without ties.
+    assert mann_whitney_u([1, 2, 3], [4, 5, 6]) == (0, 0.1)
+    (u, p_value) = mann_whitney_u([1, 2, 4, 5], [3, 6, 7, 8])
+    assert u == 2
+    assert abs(p_value - 8 / 70.0) < 1e-9
+    assert min_p_value(3, 3) == 0.1
+    assert min_p_value(5, 5) < 0.01
+    assert min_p_value(MIN_REPETITIONS - 1, MIN_REPETITIONS - 1) >= 0.05
+    assert min_p_value(MIN_REPETITIONS, MIN_REPETITIONS) < 0.05
+    assert FLAGS.benchmark_repetitions >= MIN_REPETITIONS
+    # Normal approximation.
+    assert mann_whitney_u([1] * 30, [1] * 30)[1] == 1
+    random = np.random.RandomState(0)
+    same = mann_whitney_u(random.randn(100), random.randn(100))[1]
+    shifted = mann_whitney_u(random.randn(100), random.randn(100) + 1)[1]
+    assert same > 0.05
+    assert shifted < 1e-6
+
+
+def _report(results):
+    return {'environment': {'python': '3'}, 'results': results}
+
+
+def _result(benchmark, metric, samples):
+    return make_result(benchmark, 'local', {'num_msgs': 10}, {},
+                       {metric: samples})
+
+
+def test_compare():
+    random = np.random.RandomState(0)
+    latencies = random.uniform(100, 110, 50)
+    baseline = _report([
+        _result('latency', 'latency_us', latencies),
+        _result('slower', 'latency_us', latencies),
+        _result('throughput', 'msgs_per_s', latencies),
+        _result('few', 'latency_us', [100, 101, 102]),
+        _result('unmatched', 'latency_us', latencies),
+    ])
+    candidate = _report([
+        _result('latency', 'latency_us', latencies + 3),
+        _result('slower', 'latency_us', latencies * 1.5),
+        _result('throughput', 'msgs_per_s', latencies * 1.5),
+        _result('few', 'latency_us', [200, 201, 202]),
+    ])
+    rows = compare(baseline, candidate)
+    statuses = dict((row['benchmark'], row['status']) for row in rows)
+    assert statuses == {
+        'latency': UNCHANGED,
+        'slower': REGRESSION,
+        'throughput': IMPROVEMENT,
+        'few': INSUFFICIENT,
+    }
+    row = [row for row in rows if row['benchmark'] == 'slower'][0]
+    assert abs(row['change'] - 0.5) < 1e-9
+    assert row['p_value'] < 1e-6
+    # The 3% slowdown is significant, but below the threshold.
+    rows = compare(baseline, candidate, metric_thresholds={'latency_us': 0})
+    assert rows[0]['status'] == REGRESSION
+    table = format_comparison(rows).splitlines()
+    assert len(table) == 5
+    assert table[0].split()[0] == 'benchmark'
+    assert '+50.0%' in table[2]
+    assert comparison_status(rows) == 1
+    rows = [row for row in rows if row['status'] != REGRESSION]
+    assert comparison_status(rows) == 2
+    rows = [row for row in rows if row['status'] != INSUFFICIENT]
+    assert comparison_status(rows) == 0
+
+
+def test_store(tmpdir):
+    store = ResultStore(os.path.join(str(tmpdir), 'results'))
+    assert store.list_runs() == []
+    first = store.save(_report([]), label='base line')
+    second = store.save(_report([]), label='base line')
+    assert first.endswith('-base_line')
+    assert store.list_runs() == [first, second]
+    assert store.load('latest')['run_id'] == second
+    assert store.load(first)['label'] == 'base line'
+    path = os.path.join(str(tmpdir), 'results', '{}.json'.format(first))
+    assert store.load(path)['run_id'] == first
+
+
+def _build_graph(graph):
+    add_source_and_sink(graph, 'store', NUM_MESSAGES)
+
+
+def test_trace_result(tmpdir):
+    trace_file = os.path.join(str(tmpdir), 'trace.json')
+    trace_events = run_graph_for(_build_graph, 'local', 10, trace_file)
+    result = trace_result('trace', 'local', {}, trace_events)
+    assert len(result['samples']['latency_us']) == NUM_MESSAGES
+    assert len(result['samples']['store_sink_processing_us']) == NUM_MESSAGES
+    assert result['metrics']['latency_us_p50'] > 0
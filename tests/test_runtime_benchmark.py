@@ -0,0 +1,73 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+
+from absl import flags
+
+from tests.benchmark import runtime_benchmark
+from tests.benchmark.harness import SCHEMA_VERSION, write_report
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+
+def _check_results(results, benchmark, metric):
+    assert results
+    for result in results:
+        assert result['benchmark'] == benchmark
+        assert result['metrics']['{}_p50'.format(metric)] > 0
+        assert result['samples'][metric]
+
+
+def test_local_benchmarks():
+    _check_results(runtime_benchmark.single_hop_latency('local', 20, 0.0001),
+                   'single_hop_latency', 'latency_us')
+    results = runtime_benchmark.fan_out_throughput('local', 20, [1, 3], 1)
+    assert [result['params']['num_sinks'] for result in results] == [1, 3]
+    _check_results(results, 'fan_out_throughput', 'msgs_per_s')
+    _check_results(runtime_benchmark.fan_in_throughput('local', 20, [3], 1),
+                   'fan_in_throughput', 'msgs_per_s')
+    _check_results(runtime_benchmark.watermark_cost('local', 20, [1, 4], 1),
+                   'watermark_cost', 'us_per_timestamp')
+    results = runtime_benchmark.ping_pong('local', 10)
+    assert len(results[0]['samples']['round_trip_us']) == 10
+    _check_results(results, 'ping_pong', 'round_trip_us')
+    _check_results(runtime_benchmark.payload_bandwidth('local', 3, [0.5], 1),
+                   'payload_bandwidth', 'mb_per_s')
+    results = runtime_benchmark.batched_throughput('local', 20, [1, 4], 1)
+    assert [result['params']['batch_size'] for result in results] == [1, 4]
+    _check_results(results, 'batched_throughput', 'msgs_per_s')
+
+
+def test_edf_latency():
+    results = runtime_benchmark.edf_latency('local', 20, frame_processing_ms=1)
+    assert [result['params']['edf'] for result in results] == [False, True]
+    _check_results(results, 'edf_latency', 'control_latency_us')
+    for result in results:
+        assert len(result['samples']['control_latency_us']) == 20
+        assert len(result['samples']['camera_latency_us']) == 32
+
+
+def test_report(tmpdir):
+    results = runtime_benchmark.graph_build([22], 2, compare_legacy=True)
+    assert [result['params']['refinement']
+            for result in results] == ['worklist', 'legacy']
+    _check_results(results, 'graph_build', 'ms')
+    tracker_results = runtime_benchmark.watermark_tracker([1, 4], 10, 2)
+    _check_results(tracker_results, 'watermark_tracker', 'ns_per_watermark')
+    results.extend(tracker_results)
+    timestamp_results = runtime_benchmark.timestamp_workload(4, 10, 2)
+    assert [result['params']['timestamp']
+            for result in timestamp_results] == ['list', 'tuple']
+    _check_results(timestamp_results, 'timestamp_workload', 'ns_per_watermark')
+    results.extend(timestamp_results)
+    output_path = os.path.join(str(tmpdir), 'results.json')
+    write_report(results, output_path)
+    with open(output_path) as f:
+        report = json.load(f)
+    assert report['schema_version'] == SCHEMA_VERSION
+    assert report['environment']['num_cpus'] > 0
+    assert report['results'] == results
@@ -0,0 +1,107 @@
+from __future__ import print_function
+
+import pickle
+
+import pytest
+
+from erdos.message import Message
+from erdos.ros.shared_memory import SharedMemoryHandle
+from erdos.ros.shared_memory import SharedMemoryReader
+from erdos.ros.shared_memory import SharedMemoryWriter
+from erdos.timestamp import Timestamp
+
+np = pytest.importorskip('numpy')
+
+
+def test_shared_memory_round_trip():
+    writer = SharedMemoryWriter('graph/camera/frames',
+                                ring_size=2,
+                                min_bytes=1024)
+    reader = SharedMemoryReader()
+    frame = np.arange(600 * 800 * 4, dtype=np.uint8).reshape((600, 800, 4))
+    msg = Message(frame, Timestamp(coordinates=[1]))
+    try:
+        assert writer.can_write(msg)
+        header = pickle.loads(pickle.dumps(writer.write(msg)))
+        assert isinstance(header.data, SharedMemoryHandle)
+        assert msg.data is frame
+
+        received = reader.read(header)
+        assert np.array_equal(received.data, frame)
+        assert not received.data.flags.writeable
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_shared_memory_small_payloads_are_pickled():
+    writer = SharedMemoryWriter('graph/imu/data', min_bytes=1024)
+    try:
+        assert not writer.can_write(Message(np.zeros(4), None))
+        assert not writer.can_write(Message('data', None))
+    finally:
+        writer.close()
+
+
+def test_shared_memory_unread_slot_is_not_overwritten():
+    writer = SharedMemoryWriter('graph/depth/frames', ring_size=1, min_bytes=1)
+    reader = SharedMemoryReader()
+    try:
+        first = writer.write(Message(np.zeros(16), Timestamp(coordinates=[1])),
+                             num_receivers=2)
+        # The message is in flight, so the payload must be pickled.
+        assert writer.write(Message(np.ones(16), None)) is None
+        handle = first.data
+        assert np.array_equal(reader.read(first).data, np.zeros(16))
+        reader.release(handle)
+        assert writer.write(Message(np.ones(16), None)) is None
+        # The second receiver discards the message without reading it.
+        reader.discard(handle)
+        second = writer.write(Message(np.ones(16), Timestamp(coordinates=[2])))
+        assert np.array_equal(reader.read(second).data, np.ones(16))
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_shared_memory_removed_slot_is_dropped():
+    writer = SharedMemoryWriter('graph/radar/points', ring_size=1, min_bytes=1)
+    reader = SharedMemoryReader()
+    try:
+        header = writer.write(Message(np.zeros(16),
+                                      Timestamp(coordinates=[1])))
+        writer.close()
+        assert reader.read(header) is None
+        reader.discard(header.data)
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_shared_memory_slots_in_use_are_not_overwritten():
+    writer = SharedMemoryWriter('graph/lidar/points', ring_size=2, min_bytes=1)
+    reader = SharedMemoryReader()
+    try:
+        first = writer.write(Message(np.zeros(16), Timestamp(coordinates=[1])))
+        handle = first.data
+        received = reader.read(first)
+        # The writer skips the slot the reader uses.
+        for value in range(2, 5):
+            header = writer.write(
+                Message(np.full(16, value), Timestamp(coordinates=[value])))
+            assert header.data.path != handle.path
+            second_handle = header.data
+            assert np.array_equal(reader.read(header).data, np.full(16, value))
+            if value < 4:
+                reader.release(second_handle)
+        assert np.array_equal(received.data, np.zeros(16))
+        # Both slots are in use, so the payload must be pickled.
+        assert writer.write(Message(np.ones(16), None)) is None
+        reader.release(handle)
+        reader.release(second_handle)
+        header = writer.write(Message(np.ones(16), Timestamp(coordinates=[5])))
+        assert header.data.path == handle.path
+        assert np.array_equal(reader.read(header).data, np.ones(16))
+    finally:
+        reader.close()
+        writer.close()
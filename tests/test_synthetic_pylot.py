@@ -0,0 +1,82 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+
+from absl import flags
+import numpy as np
+import pytest
+
+from tests.benchmark.synthetic_pylot import ServiceTime, load_profile, run
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+
+def test_service_times():
+    for (spec, mean) in [
+        ({
+            'distribution': 'constant',
+            'mean_ms': 2
+        }, 2),
+        ({
+            'distribution': 'uniform',
+            'min_ms': 1,
+            'max_ms': 3
+        }, 2),
+        ({
+            'distribution': 'normal',
+            'mean_ms': 2,
+            'stddev_ms': 0.1
+        }, 2),
+        ({
+            'distribution': 'lognormal',
+            'mean_ms': 2,
+            'stddev_ms': 1
+        }, 2),
+        ({
+            'distribution': 'exponential',
+            'mean_ms': 2
+        }, 2),
+    ]:
+        service_time = ServiceTime(spec, scale=2)
+        samples = [service_time.sample() for _ in range(20000)]
+        assert abs(np.mean(samples) - 2 * mean / 1000.0) < 1e-4
+    with pytest.raises(ValueError):
+        ServiceTime({'distribution': 'gamma'})
+
+
+def test_load_profile(tmpdir):
+    path = os.path.join(str(tmpdir), 'profile.json')
+    with open(path, 'w') as f:
+        json.dump({'duration_s': 1, 'sensors': {'camera': {'rate_hz': 5}}}, f)
+    profile = load_profile(path)
+    assert profile['duration_s'] == 1
+    assert profile['sensors']['camera']['rate_hz'] == 5
+    assert profile['sensors']['camera']['dtype'] == 'uint8'
+    assert load_profile()['duration_s'] != 1
+
+
+def _small_profile(deadline_ms):
+    profile = load_profile()
+    profile.update({
+        'duration_s': 1,
+        'startup_s': 0.2,
+        'deadline_ms': deadline_ms,
+        'front_cameras': ['front'],
+    })
+    for sensor in profile['sensors'].values():
+        sensor['shape'] = [16]
+    return profile
+
+
+def test_local_run():
+    result = run('local', _small_profile(1000), 0.1)
+    # Sensors capture frames at every base tick.
+    assert result['metrics']['num_timestamps'] == 20
+    assert result['metrics']['deadline_miss_rate'] == 0
+    assert len(result['samples']['latency_ms']) == 20
+    result = run('local', _small_profile(0.001), 0.1)
+    assert result['metrics']['deadline_miss_rate'] == 1
@@ -0,0 +1,107 @@
+from __future__ import print_function
+
+import copy
+import heapq
+import pickle
+import threading
+
+import pytest
+
+from erdos.timestamp import Timestamp
+
+
+def test_timestamp_ordering():
+    t1 = Timestamp(coordinates=[1, 2])
+    t2 = Timestamp(coordinates=[1, 3])
+    t3 = Timestamp(coordinates=[2, 0])
+    assert t1 < t2 < t3
+    assert t1 <= Timestamp(coordinates=[1, 2]) <= t2
+    assert t3 > t2 and t3 >= t3
+    assert t1 == Timestamp(coordinates=(1, 2))
+    assert t1 != t2
+    assert Timestamp(coordinates=[1]) != t1
+    with pytest.raises(Exception):
+        Timestamp(coordinates=[1]) < t1
+    heap = [t3, t1, t2]
+    heapq.heapify(heap)
+    assert heapq.heappop(heap) == t1
+
+
+def test_timestamp_hash_and_copy():
+    t1 = Timestamp(coordinates=[4, 2])
+    t2 = Timestamp(t1)
+    assert t1 == t2 and hash(t1) == hash(t2)
+    assert t2.coordinates == (4, 2)
+    assert {t1: 'a'}[Timestamp(coordinates=[4, 2])] == 'a'
+    assert copy.deepcopy(t1) == t1
+    assert str(t1) == '[4, 2]'
+
+
+def test_timestamp_is_immutable():
+    timestamp = Timestamp(coordinates=[1])
+    with pytest.raises(AttributeError):
+        timestamp.coordinates = (2, )
+    with pytest.raises(AttributeError):
+        timestamp.other = 1
+
+
+def test_timestamp_pickle():
+    timestamp = Timestamp(coordinates=[7, 3])
+    unpickled = pickle.loads(
+        pickle.dumps(timestamp, protocol=pickle.HIGHEST_PROTOCOL))
+    assert unpickled == timestamp
+    assert hash(unpickled) == hash(timestamp)
+
+
+def test_timestamp_intern():
+    assert Timestamp.intern([5]) is Timestamp.intern((5, ))
+    assert Timestamp.intern([5]) == Timestamp(coordinates=[5])
+
+
+def test_timestamp_intern_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(Timestamp, '_max_interned', 2)
+    monkeypatch.setattr(Timestamp, '_interned', type(Timestamp._interned)())
+    first = Timestamp.intern([1])
+    second = Timestamp.intern([2])
+    assert Timestamp.intern([1]) is first
+    Timestamp.intern([3])
+    # [2] was the least recently used timestamp.
+    assert Timestamp.intern([1]) is first
+    assert Timestamp.intern([2]) is not second
+    assert len(Timestamp._interned) == 2
+
+
+def test_timestamp_intern_is_thread_safe(monkeypatch):
+    monkeypatch.setattr(Timestamp, '_max_interned', 8)
+    monkeypatch.setattr(Timestamp, '_interned', type(Timestamp._interned)())
+    errors = []
+
+    def intern():
+        try:
+            for coordinate in range(2000):
+                assert Timestamp.intern([coordinate % 16
+                                         ]).coordinates == (coordinate % 16, )
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=intern) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(Timestamp._interned) == 8
+
+
+class FrameTimestamp(Timestamp):
+    __slots__ = ()
+
+
+def test_timestamp_subclasses_pickle_and_intern():
+    timestamp = FrameTimestamp.intern([7])
+    assert type(timestamp) is FrameTimestamp
+    assert Timestamp.intern([7]) is not timestamp
+    unpickled = pickle.loads(
+        pickle.dumps(timestamp, protocol=pickle.HIGHEST_PROTOCOL))
+    assert type(unpickled) is FrameTimestamp
+    assert unpickled == timestamp
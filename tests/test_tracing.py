@@ -0,0 +1,82 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+
+from absl import flags
+
+from erdos.graph import Graph
+from erdos.timestamp import Timestamp
+from erdos.tracing import Tracer, get_trace_parts
+from erdos.utils import close_open_writers
+from tests.helpers import add_source_and_sink
+
+FLAGS = flags.FLAGS
+FLAGS.mark_as_parsed()
+
+NUM_MESSAGES = 5
+
+
+def test_sampling_is_deterministic(tmpdir):
+    trace_file = os.path.join(str(tmpdir), 'trace.json')
+    tracer = Tracer(trace_file, 0.1)
+    other_tracer = Tracer(trace_file, 0.1)
+    timestamps = [Timestamp(coordinates=[i, 0]) for i in range(10000)]
+    sampled = [tracer.is_sampled(timestamp) for timestamp in timestamps]
+    assert sampled == [
+        other_tracer.is_sampled(timestamp) for timestamp in timestamps
+    ]
+    assert 800 < sum(sampled) < 1200
+    assert not tracer.is_sampled(None)
+    tracer.close()
+    other_tracer.close()
+    tracer = Tracer(trace_file, 1)
+    assert all(tracer.is_sampled(timestamp) for timestamp in timestamps)
+    tracer.close()
+
+
+def test_open_tracers_are_closed(tmpdir):
+    trace_file = os.path.join(str(tmpdir), 'trace.json')
+    # Without periodic writes, events are only written once closed.
+    tracer = Tracer(trace_file, 1, flush_period=None)
+    tracer.add_event({'name': 'event', 'ph': 'i'})
+    assert get_trace_parts(trace_file) == []
+    # Processes which exit with os._exit close their writers explicitly.
+    close_open_writers()
+    [path] = get_trace_parts(trace_file)
+    with open(path) as f:
+        assert [json.loads(line)['name'] for line in f] == ['event']
+    tracer.close()
+
+
+def test_local_graph_writes_chrome_trace(tmpdir):
+    trace_file = os.path.join(str(tmpdir), 'trace.json')
+    FLAGS.trace_file = trace_file
+    FLAGS.trace_sample_rate = 1
+    try:
+        graph = Graph(name='tracing')
+        add_source_and_sink(graph, 'tracing', NUM_MESSAGES)
+        graph.execute('local')
+    finally:
+        FLAGS.trace_file = ''
+        FLAGS.trace_sample_rate = 0.01
+
+    assert len(get_trace_parts(trace_file)) == 1
+    with open(trace_file) as f:
+        events = json.load(f)['traceEvents']
+    op_names = dict((event['pid'], event['args']['name']) for event in events
+                    if event['ph'] == 'M')
+    assert set(op_names.values()) >= set(['tracing_source', 'tracing_sink'])
+    for value in range(NUM_MESSAGES):
+        lifecycle = [
+            (op_names[event['pid']], event['cat']) for event in events
+            if event['ph'] != 'M' and event['args']['timestamp'] == [value]
+        ]
+        for event in [('tracing_source', 'send'), ('tracing_sink', 'receive'),
+                      ('tracing_sink', 'dequeue'),
+                      ('tracing_sink', 'callback')]:
+            assert event in lifecycle
+    spans = [event for event in events if event['ph'] == 'X']
+    assert all(span['dur'] >= 0 for span in spans)
@@ -0,0 +1,68 @@
+from __future__ import print_function
+
+import pytest
+
+from erdos.timestamp import Timestamp
+from erdos.watermark_tracker import WatermarkTracker
+
+
+def ts(coordinate):
+    return Timestamp(coordinates=[coordinate])
+
+
+def test_low_watermark_waits_for_all_streams():
+    tracker = WatermarkTracker()
+    tracker.add_stream('camera')
+    tracker.add_stream('lidar')
+    assert tracker.update('camera', ts(1)) is None
+    assert tracker.update('camera', ts(2)) is None
+    assert tracker.update('lidar', ts(1)) == ts(1)
+    assert tracker.update('lidar', ts(3)) == ts(2)
+    assert tracker.update('camera', ts(3)) == ts(3)
+    assert tracker.low_watermark == ts(3)
+    assert tracker.get_high_watermark('lidar') == ts(3)
+
+
+def test_low_watermark_only_advances():
+    tracker = WatermarkTracker()
+    tracker.add_stream('camera')
+    tracker.add_stream('lidar')
+    tracker.update('camera', ts(1))
+    assert tracker.update('lidar', ts(5)) == ts(1)
+    # The low watermark stays at 1 until camera advances.
+    assert tracker.update('lidar', ts(6)) is None
+    assert tracker.update('camera', ts(4)) == ts(4)
+
+
+def test_ignored_streams_do_not_hold_back_watermarks():
+    tracker = WatermarkTracker()
+    tracker.add_stream('camera')
+    tracker.add_stream('control', ignore_watermarks=True)
+    assert tracker.is_ignored('control')
+    assert tracker.update('control', ts(1)) is None
+    assert tracker.update('camera', ts(1)) == ts(1)
+
+
+def test_watermarks_must_increase():
+    tracker = WatermarkTracker()
+    tracker.add_stream('camera')
+    tracker.update('camera', ts(2))
+    with pytest.raises(Exception):
+        tracker.update('camera', ts(2))
+
+
+def test_reset_and_stale_entries():
+    tracker = WatermarkTracker()
+    for stream in ['a', 'b', 'c']:
+        tracker.add_stream(stream)
+    # A slow stream leaves stale entries of the fast streams on the heap.
+    for coordinate in range(1, 200):
+        tracker.update('a', ts(coordinate))
+        tracker.update('b', ts(coordinate))
+    assert tracker.update('c', ts(100)) == ts(100)
+    assert tracker.update('c', ts(300)) == ts(199)
+    tracker.reset(ts(50))
+    assert tracker.low_watermark == ts(50)
+    assert tracker.update('a', ts(51)) is None
+    tracker.update('b', ts(51))
+    assert tracker.update('c', ts(51)) == ts(51)